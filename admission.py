@@ -0,0 +1,237 @@
+"""Admission control for the inference routes: bounded concurrency, priority queues, per-user rate limits, load shedding"""
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class Rejected(Exception):
+    """A request turned away before doing any work; clients should retry after ``retry_after`` seconds.
+
+    ``reason`` is 'rate_limited' (the user's token bucket is empty),
+    'queue_full', 'slo' (the queue wait would exceed the SLO) or 'timeout'
+    (it did).
+    """
+
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ('klass', 'enqueued', 'wake', 'granted')
+
+    def __init__(self, klass, enqueued, wake):
+        self.klass = klass
+        self.enqueued = enqueued
+        self.wake = wake
+        self.granted = False
+
+
+class Ticket:
+    """A held slot; ``started`` is None for a slot that is given back unused"""
+    __slots__ = ('klass', 'started')
+
+    def __init__(self, klass, started):
+        self.klass = klass
+        self.started = started
+
+
+class AdmissionController:
+    """Lets at most ``max_concurrency`` requests run, and queues the rest by priority.
+
+    Each request belongs to a class: a user role, or 'bulk' for herd
+    screening. ``priorities`` maps classes to priorities. Priority 0 is
+    served first, and classes with the same priority share one FIFO order.
+    Unknown classes get the 'user' priority. ``class_limits`` caps how many
+    requests of a class may run at once, so bulk jobs cannot take every slot.
+    Each class may have ``queue_size`` requests waiting.
+
+    A request that would wait longer than ``queue_slo`` seconds is rejected
+    at once rather than left to time out. The wait is estimated from the
+    requests queued ahead of it and the recent time a request holds its
+    slot. A request that is queued anyway is rejected once it has waited
+    that long. Classes in ``class_limits`` have no SLO: they wait until a
+    slot is free. Every rejection carries a Retry-After: the estimated time
+    for the current queue to drain.
+
+    ``check_rate(user)`` takes a token from the user's bucket, which refills
+    at ``rate`` tokens a second up to ``burst``. A rate of 0 turns the limit off.
+
+    Threads use ``admit`` as a context manager, or ``acquire`` and
+    ``release``. Asyncio code awaits ``acquire_async`` and passes the
+    returned ticket to ``release``.
+    """
+
+    def __init__(self, max_concurrency=16, queue_size=64, queue_slo=1.0, priorities=None, class_limits=None,
+                 rate=0.0, burst=10, max_buckets=100000):
+        self.max_concurrency = max_concurrency
+        self.queue_size = queue_size
+        self.queue_slo = queue_slo
+        self.priorities = dict(priorities or {'admin': 0, 'user': 1, 'bulk': 2})
+        self.class_limits = dict(class_limits or {})
+        self.rate = rate
+        self.burst = burst
+        self.max_buckets = max_buckets
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._running = {}
+        self._queues = {}
+        self._buckets = {}
+        self._service_seconds = None
+        self._stats = {'admitted': 0, 'queued': 0, 'rate_limited': 0, 'queue_full': 0, 'slo': 0, 'timeout': 0}
+
+    def priority(self, klass):
+        return self.priorities.get(klass, self.priorities.get('user', 0))
+
+    def slo(self, klass):
+        return None if klass in self.class_limits else self.queue_slo
+
+    # Rate limits
+
+    def check_rate(self, user):
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            tokens, stamp = self._buckets.get(user, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - stamp) * self.rate)
+            if tokens < 1:
+                self._buckets[user] = (tokens, now)
+                self._stats['rate_limited'] += 1
+                raise Rejected('rate_limited', max(1, math.ceil((1 - tokens) / self.rate)))
+            self._buckets[user] = (tokens - 1, now)
+            if len(self._buckets) > self.max_buckets:
+                # A bucket idle long enough to have refilled is the same as no bucket
+                refill = self.burst / self.rate
+                self._buckets = {key: bucket for key, bucket in self._buckets.items() if now - bucket[1] < refill}
+
+    # Slots
+
+    @contextmanager
+    def admit(self, klass='user'):
+        """Hold a slot for the duration of the block; raises Rejected"""
+        ticket = self.acquire(klass)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def acquire(self, klass='user'):
+        """Block until a slot is free; returns the Ticket to ``release``, or raises Rejected"""
+        granted = threading.Event()
+        waiter = self._enter(klass, granted.set)
+        if waiter is not None and not granted.wait(self.slo(klass)):
+            rejected = self._abandon(waiter)
+            if rejected is not None:
+                raise rejected
+        return Ticket(klass, time.monotonic())
+
+    async def acquire_async(self, klass='user'):
+        """Wait for a slot without blocking the event loop; returns the Ticket to ``release``, or raises Rejected"""
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(None))
+
+        waiter = self._enter(klass, wake)
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(granted), self.slo(klass))
+            except asyncio.TimeoutError:
+                rejected = self._abandon(waiter)
+                if rejected is not None:
+                    raise rejected
+            except asyncio.CancelledError:
+                if self._abandon(waiter) is None:
+                    self.release(Ticket(klass, None))
+                raise
+        return Ticket(klass, time.monotonic())
+
+    def _enter(self, klass, wake):
+        """None when admitted at once, else the queued waiter; raises Rejected"""
+        with self._lock:
+            priority = self.priority(klass)
+            if not self._queued_ahead(priority) and self._has_slot(klass):
+                self._grant(klass)
+                return None
+            queue = self._queues.setdefault(klass, deque())
+            if len(queue) >= self.queue_size:
+                raise self._reject('queue_full')
+            if self.slo(klass) is not None and self._estimated_wait(self._queued_ahead(priority) + 1) > self.slo(klass):
+                raise self._reject('slo')
+            waiter = _Waiter(klass, time.monotonic(), wake)
+            queue.append(waiter)
+            self._stats['queued'] += 1
+            return waiter
+
+    def _queued_ahead(self, priority):
+        return sum(len(queue) for klass, queue in self._queues.items() if self.priority(klass) <= priority)
+
+    def _estimated_wait(self, position):
+        if self._service_seconds is None:
+            return 0.0
+        # Slots held by capped classes turn over on their own schedule
+        slots = self.max_concurrency - sum(self._running.get(klass, 0) for klass in self.class_limits)
+        return position * self._service_seconds / max(1, slots)
+
+    def _has_slot(self, klass):
+        limit = self.class_limits.get(klass)
+        return self._in_flight < self.max_concurrency and (limit is None or self._running.get(klass, 0) < limit)
+
+    def _grant(self, klass):
+        self._in_flight += 1
+        self._running[klass] = self._running.get(klass, 0) + 1
+        self._stats['admitted'] += 1
+
+    def _abandon(self, waiter):
+        """Take a waiter that gave up off its queue and return its Rejected; None if it was granted a slot meanwhile"""
+        with self._lock:
+            if waiter.granted:
+                return None
+            self._queues[waiter.klass].remove(waiter)
+            return self._reject('timeout')
+
+    def release(self, ticket):
+        with self._lock:
+            if ticket.started is not None and ticket.klass not in self.class_limits:
+                seconds = time.monotonic() - ticket.started
+                self._service_seconds = (seconds if self._service_seconds is None
+                                         else 0.9 * self._service_seconds + 0.1 * seconds)
+            self._in_flight -= 1
+            self._running[ticket.klass] -= 1
+            woken = self._dispatch()
+        for waiter in woken:
+            waiter.wake()
+
+    def _dispatch(self):
+        """Grant free slots to the longest-waiting requests of the best priority that may run"""
+        woken = []
+        while self._in_flight < self.max_concurrency:
+            heads = [(self.priority(klass), queue[0].enqueued, klass) for klass, queue in self._queues.items()
+                     if queue and self._has_slot(klass)]
+            if not heads:
+                break
+            waiter = self._queues[min(heads)[2]].popleft()
+            waiter.granted = True
+            self._grant(waiter.klass)
+            woken.append(waiter)
+        return woken
+
+    def _reject(self, reason):
+        self._stats[reason] += 1
+        waiting = sum(len(queue) for queue in self._queues.values())
+        return Rejected(reason, max(1, math.ceil(self._estimated_wait(waiting + 1))))
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, in_flight=self._in_flight, max_concurrency=self.max_concurrency,
+                        running=dict(self._running),
+                        waiting={klass: len(queue) for klass, queue in self._queues.items()},
+                        service_ms=round(self._service_seconds * 1000, 2) if self._service_seconds is not None else None,
+                        queue_slo=self.queue_slo, rate=self.rate, burst=self.burst)
+
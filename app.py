@@ -1,222 +1,289 @@
 import os
 import logging
-from datetime import datetime
+import threading
+import time
+import weakref
+
+_import_started = time.perf_counter()
+
+from concurrent.futures import TimeoutError as FuturesTimeout
+from contextlib import contextmanager
+from datetime import date, datetime
 from functools import wraps
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for, flash, send_file
-from werkzeug.security import generate_password_hash, check_password_hash
-import tensorflow as tf
+from flask import (Flask, Request, Response, g, render_template, request, jsonify, session, redirect, url_for, flash,
+                   send_file, send_from_directory, stream_with_context)
 import numpy as np
 from PIL import Image
 import json
 import io
-import base64
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image as RLImage
-from reportlab.lib.enums import TA_CENTER, TA_LEFT
+import uuid
+import queue
+import zipfile
+
+from admission import AdmissionController, Rejected
+from batching import InferenceBatcher, Routed, run_two_stage
+from config import Config
+from embeddings import EmbeddingIndex, SpecialistEmbedders
+from fused import FusedCascade
+from herd import HerdSummary, UploadLimitError, chunked, iter_uploads, ndjson
+from inference import (BACKENDS, IMG_SHAPE, CompiledModel, backend_quantization, compile_for_inference, load_tflite_backend,
+                       tflite_path)
+from image_store import NAME as IMAGE_NAME, ImageStore, digest_of
+from inference_server import InferenceClient
+from knowledge_base import KnowledgeBase
+from metrics import Metrics
+from model_registry import SpecialistRegistry, model_memory_bytes
+from model_versions import ModelReloader, ModelSet, ShadowRunner
+from prediction_cache import (MemoryTier, PredictionCache, SQLiteTier, content_key, files_fingerprint, perceptual_key,
+                              stream_content_key)
+from prediction_store import PredictionStore, next_cursor, sqlite_path
+from preprocessing import preprocess_image, preprocess_into
+from routing import RoutingPolicy
+from startup import LazyModule, Startup
+from tta import TestTimeAugmentation
+from uploads import PREVIEW_MODES, decode_upload, preview_source, save_upload, thumbnail_data_url
+from user_store import ROLES, SQLiteUserBackend, UserStore, valid_email
+
+tf = LazyModule('tensorflow')
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+class UploadRequest(Request):
+    """/predict_batch takes whole herds, so it gets its own upload size limit"""
+
+    @property
+    def max_content_length(self):
+        if self.endpoint == 'predict_batch':
+            return app.config['HERD_MAX_UPLOAD_MB'] * 1024 * 1024
+        return super().max_content_length
+
+
 app = Flask(__name__)
+app.request_class = UploadRequest
 app.config['SECRET_KEY'] = 'your-secret-key-change-in-production-2024'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
 
-# In-memory user database
-USERS_DB = {
-    'admin@cattle.com': {
-        'password': generate_password_hash('admin123'),
-        'name': 'Admin User',
-        'role': 'admin'
-    }
-}
+# Image returned with /predict results: a small JPEG 'thumbnail' (data URL), a 'url' to the original
+# streamed into UPLOAD_FOLDER, or 'none'. UPLOAD_FOLDER must not be under static/, which is served to anyone;
+# /uploads/<name> serves its files only to admins and users with a prediction of that image
+app.config['UPLOAD_PREVIEW'] = os.environ.get('UPLOAD_PREVIEW', 'thumbnail')
+app.config['UPLOAD_PREVIEW_SIZE'] = int(os.environ.get('UPLOAD_PREVIEW_SIZE', 320))
+app.config['UPLOAD_FOLDER'] = os.environ.get('UPLOAD_FOLDER', 'uploads')
+if app.config['UPLOAD_PREVIEW'] not in PREVIEW_MODES:
+    raise ValueError(f"UPLOAD_PREVIEW must be one of {', '.join(PREVIEW_MODES)}")
+# Each /predict upload is kept once in UPLOAD_FOLDER under its SHA-256 (in <ab>/<cd>/ shard directories) with
+# thumbnails for history pages and its 224x224 model input, which a later upload of the same image the
+# prediction cache no longer holds (e.g. after a model update) is predicted from without decoding it again
+app.config['IMAGE_STORE'] = os.environ.get('IMAGE_STORE', '1') == '1'
+app.config['IMAGE_THUMBNAIL_SIZES'] = tuple(int(size) for size in
+                                            os.environ.get('IMAGE_THUMBNAIL_SIZES', '96,320').split(',') if size.strip())
+app.config['IMAGE_THUMBNAIL_FORMATS'] = tuple(name.strip() for name in
+                                              os.environ.get('IMAGE_THUMBNAIL_FORMATS', 'webp,jpg').split(',')
+                                              if name.strip())
+app.config['IMAGE_THUMBNAIL_QUALITY'] = int(os.environ.get('IMAGE_THUMBNAIL_QUALITY', 80))
+
+# Medical info in /predict results: 'full' embeds the disease's knowledge base entry, 'key' returns only
+# medical_info_key for clients that fetch (and cache) /knowledge/<key>; ?medical_info= overrides per request
+MEDICAL_INFO_MODES = ('full', 'key')
+app.config['PREDICT_MEDICAL_INFO'] = os.environ.get('PREDICT_MEDICAL_INFO', 'full')
+app.config['KNOWLEDGE_MAX_AGE'] = int(os.environ.get('KNOWLEDGE_MAX_AGE', 86400))
+MEDICAL_INFO_ERROR = f"medical_info must be one of {', '.join(MEDICAL_INFO_MODES)}"
+if app.config['PREDICT_MEDICAL_INFO'] not in MEDICAL_INFO_MODES:
+    raise ValueError(f"PREDICT_MEDICAL_INFO must be one of {', '.join(MEDICAL_INFO_MODES)}")
+
+# Micro-batching of concurrent /predict requests
+app.config['INFERENCE_BATCHING'] = os.environ.get('INFERENCE_BATCHING', '1') == '1'
+app.config['BATCH_MAX_SIZE'] = int(os.environ.get('BATCH_MAX_SIZE', 16))
+app.config['BATCH_MAX_WAIT_MS'] = float(os.environ.get('BATCH_MAX_WAIT_MS', 5))
+app.config['BATCH_QUEUE_SIZE'] = int(os.environ.get('BATCH_QUEUE_SIZE', 256))
+
+# Serve through tf.function-compiled forward passes instead of model.predict()
+app.config['COMPILED_INFERENCE'] = os.environ.get('COMPILED_INFERENCE', '1') == '1'
+
+# Run a shared backbone once for the master and specialists whose backbone weights match
+app.config['FUSED_SERVING'] = os.environ.get('FUSED_SERVING', '0') == '1'
+
+# Load specialists on first use and evict idle ones beyond the memory budget (0 = unlimited)
+app.config['LAZY_SPECIALISTS'] = os.environ.get('LAZY_SPECIALISTS', '1') == '1'
+app.config['SPECIALIST_MEMORY_BUDGET_MB'] = float(os.environ.get('SPECIALIST_MEMORY_BUDGET_MB', 0))
+app.config['SPECIALIST_IDLE_SECONDS'] = float(os.environ.get('SPECIALIST_IDLE_SECONDS', 0))
+
+# Model files are polled every MODEL_RELOAD_INTERVAL seconds (0 = only on POST /admin/models/reload). A changed
+# set is loaded and warmed in the background and swapped in atomically; requests already running finish on the
+# old one. MODEL_SHADOW_DIR holds a candidate (files named as in models/, missing ones fall back to the serving
+# file) that replays MODEL_SHADOW_SAMPLE of single-image predictions off the request path to measure agreement
+# and latency. Both sets are resident while a new one loads or a candidate is shadowed.
+app.config['MODEL_RELOAD_INTERVAL'] = float(os.environ.get('MODEL_RELOAD_INTERVAL', 10))
+app.config['MODEL_SHADOW_DIR'] = os.environ.get('MODEL_SHADOW_DIR', '')
+app.config['MODEL_SHADOW_SAMPLE'] = float(os.environ.get('MODEL_SHADOW_SAMPLE', 0.05))
+app.config['MODEL_SHADOW_QUEUE_SIZE'] = int(os.environ.get('MODEL_SHADOW_QUEUE_SIZE', 64))
+
+# Cascade routing rules (empty = off): treat P(non_cattle) >= threshold as non-cattle without a specialist,
+# run the top-2 specialists when the two best body parts are within the margin, and let a tiny low-res
+# pre-filter model reject obvious non-cattle images before the master runs
+app.config['ROUTING_NON_CATTLE_THRESHOLD'] = float(os.environ.get('ROUTING_NON_CATTLE_THRESHOLD') or 0) or None
+app.config['ROUTING_TOP2_MARGIN'] = float(os.environ.get('ROUTING_TOP2_MARGIN') or 0) or None
+app.config['PREFILTER_MODEL_PATH'] = os.environ.get('PREFILTER_MODEL_PATH', '')
+app.config['PREFILTER_THRESHOLD'] = float(os.environ.get('PREFILTER_THRESHOLD', 0.95))
+
+# Test-time augmentation for /predict (TTA_VIEWS <= 1 = off): up to 8 flipped, cropped and rescaled views run
+# through the master and the routed specialist in one batch each, probabilities combined by TTA_AGGREGATION
+# (mean or geometric). TTA_SPECIALIST_VIEWS sets the view count per specialist, e.g. "udder=8,general_body=6";
+# with TTA_BELOW_CONFIDENCE set, only results whose single-pass confidence is below it are re-run with TTA
+app.config['TTA_VIEWS'] = int(os.environ.get('TTA_VIEWS', 0))
+app.config['TTA_SPECIALIST_VIEWS'] = {key: int(views) for key, views in (
+    item.split('=', 1) for item in os.environ.get('TTA_SPECIALIST_VIEWS', '').split(',') if '=' in item)}
+app.config['TTA_AGGREGATION'] = os.environ.get('TTA_AGGREGATION', 'mean')
+app.config['TTA_BELOW_CONFIDENCE'] = float(os.environ.get('TTA_BELOW_CONFIDENCE') or 0) or None
+
+# Inference backend: keras, tflite, tflite-float16, tflite-dynamic or tflite-int8.
+# MODEL_BACKENDS overrides it per model, e.g. "master=tflite-int8,udder=keras"
+app.config['INFERENCE_BACKEND'] = os.environ.get('INFERENCE_BACKEND', 'keras')
+app.config['MODEL_BACKENDS'] = dict(item.split('=', 1) for item in
+                                    os.environ.get('MODEL_BACKENDS', '').split(',') if '=' in item)
+app.config['TFLITE_NUM_THREADS'] = int(os.environ.get('TFLITE_NUM_THREADS', 0)) or None
+
+# Prediction cache keyed by upload hash; PREDICTION_CACHE_PATH='' keeps it in memory only
+app.config['PREDICTION_CACHE'] = os.environ.get('PREDICTION_CACHE', '1') == '1'
+app.config['PREDICTION_CACHE_PATH'] = os.environ.get('PREDICTION_CACHE_PATH', 'cache/predictions.sqlite')
+app.config['PREDICTION_CACHE_MAX_ENTRIES'] = int(os.environ.get('PREDICTION_CACHE_MAX_ENTRIES', 1024))
+app.config['PREDICTION_CACHE_DISK_MAX_ENTRIES'] = int(os.environ.get('PREDICTION_CACHE_DISK_MAX_ENTRIES', 100000))
+app.config['PREDICTION_CACHE_TTL'] = int(os.environ.get('PREDICTION_CACHE_TTL', 24 * 3600))
+app.config['PREDICTION_CACHE_PERCEPTUAL'] = os.environ.get('PREDICTION_CACHE_PERCEPTUAL', '0') == '1'
+app.config['PREDICTION_CACHE_HASH_MODELS'] = os.environ.get('PREDICTION_CACHE_HASH_MODELS', '0') == '1'
+
+# Prediction history database (SQLite file named by config.Config.SQLALCHEMY_DATABASE_URI)
+app.config['PREDICTION_DB_PATH'] = (os.environ.get('PREDICTION_DB_PATH') or
+                                    sqlite_path(Config.SQLALCHEMY_DATABASE_URI) or 'cattle_care.db')
+app.config['PREDICTION_WRITE_BATCH'] = int(os.environ.get('PREDICTION_WRITE_BATCH', 256))
+app.config['PREDICTION_FLUSH_INTERVAL'] = float(os.environ.get('PREDICTION_FLUSH_INTERVAL', 0.5))
+
+# Each logged two-stage prediction keeps its specialist's penultimate-layer embedding (float16, in EMBEDDING_DIR),
+# computed by a background writer; /similar/<prediction_id> searches them exactly up to EMBEDDING_EXACT_MAX
+# vectors per specialist and through EMBEDDING_PROBES lists of an inverted-file index beyond that
+app.config['EMBEDDINGS'] = os.environ.get('EMBEDDINGS', '1') == '1'
+app.config['EMBEDDING_DIR'] = os.environ.get('EMBEDDING_DIR', 'embeddings')
+app.config['EMBEDDING_EXACT_MAX'] = int(os.environ.get('EMBEDDING_EXACT_MAX', 20000))
+app.config['EMBEDDING_PROBES'] = int(os.environ.get('EMBEDDING_PROBES', 16))
+app.config['EMBEDDING_QUEUE_SIZE'] = int(os.environ.get('EMBEDDING_QUEUE_SIZE', 256))
+app.config['SIMILAR_MAX_RESULTS'] = int(os.environ.get('SIMILAR_MAX_RESULTS', 50))
+
+# Users and login sessions in SQLite shared by every worker, cached per process for USER_CACHE_TTL seconds.
+# PASSWORD_HASH_METHOD is a werkzeug method, e.g. 'pbkdf2:sha256:100000' (empty = werkzeug's default scrypt);
+# hashing runs on AUTH_WORKERS threads
+app.config['USER_DB_PATH'] = os.environ.get('USER_DB_PATH') or app.config['PREDICTION_DB_PATH']
+app.config['USER_CACHE_MAX_ENTRIES'] = int(os.environ.get('USER_CACHE_MAX_ENTRIES', 10000))
+app.config['USER_CACHE_TTL'] = float(os.environ.get('USER_CACHE_TTL', 30))
+app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', '')
+app.config['AUTH_WORKERS'] = int(os.environ.get('AUTH_WORKERS', 2))
+app.config['AUTH_TIMEOUT'] = float(os.environ.get('AUTH_TIMEOUT', 10))
+app.config['DASHBOARD_PAGE_SIZE'] = int(os.environ.get('DASHBOARD_PAGE_SIZE', 10))
+app.config['ADMIN_PAGE_SIZE'] = int(os.environ.get('ADMIN_PAGE_SIZE', 50))
+# Statistics on /admin and the /admin/analytics endpoints come from rollups kept as predictions are
+# written, covering the last ANALYTICS_DAYS days by default (at most ANALYTICS_MAX_DAYS)
+app.config['ANALYTICS_DAYS'] = int(os.environ.get('ANALYTICS_DAYS', 30))
+app.config['ANALYTICS_MAX_DAYS'] = int(os.environ.get('ANALYTICS_MAX_DAYS', 3660))
+
+# PDF reports render in REPORT_WORKERS processes (0 = one background thread) and are cached
+app.config['REPORT_WORKERS'] = int(os.environ.get('REPORT_WORKERS', 2))
+app.config['REPORT_CACHE_MAX_ENTRIES'] = int(os.environ.get('REPORT_CACHE_MAX_ENTRIES', 256))
+app.config['REPORT_CACHE_TTL'] = int(os.environ.get('REPORT_CACHE_TTL', 3600))
+app.config['REPORT_WAIT_SECONDS'] = float(os.environ.get('REPORT_WAIT_SECONDS', 30))
+
+# /predict_batch: images per cascade batch and per-request limits
+app.config['HERD_BATCH_SIZE'] = int(os.environ.get('HERD_BATCH_SIZE', 16))
+app.config['HERD_MAX_IMAGES'] = int(os.environ.get('HERD_MAX_IMAGES', 500))
+app.config['HERD_MAX_UPLOAD_MB'] = int(os.environ.get('HERD_MAX_UPLOAD_MB', 256))
+
+# Send inference to a shared inference_server.py pool (e.g. "unix:/tmp/cattle-inference.sock")
+# instead of loading the models into every web process. A host:port address needs INFERENCE_SERVER_AUTHKEY,
+# a secret shared with the server (there is no default)
+app.config['INFERENCE_SERVER'] = os.environ.get('INFERENCE_SERVER', '')
+app.config['INFERENCE_SERVER_AUTHKEY'] = os.environ.get('INFERENCE_SERVER_AUTHKEY', '')
+app.config['INFERENCE_SERVER_SLOTS'] = int(os.environ.get('INFERENCE_SERVER_SLOTS', 16))
+app.config['INFERENCE_SERVER_TIMEOUT'] = float(os.environ.get('INFERENCE_SERVER_TIMEOUT', 5))
+
+# Models load in a background thread while the web routes already serve (see /readyz).
+# WARMUP_BATCH_SIZES dummy batches run through every resident model before the app reports ready.
+app.config['WARMUP_BATCH_SIZES'] = tuple(int(size) for size in
+                                         os.environ.get('WARMUP_BATCH_SIZES', '1,16').split(',') if size.strip())
+app.config['STARTUP_RETRY_SECONDS'] = float(os.environ.get('STARTUP_RETRY_SECONDS', 10))
+
+# asgi.py (uvicorn asgi:app): /predict decode and inference run in ASGI_MAX_CONCURRENCY threads; requests
+# beyond ASGI_QUEUE_SIZE waiting for one get 503
+app.config['ASGI_MAX_CONCURRENCY'] = int(os.environ.get('ASGI_MAX_CONCURRENCY', 4))
+app.config['ASGI_QUEUE_SIZE'] = int(os.environ.get('ASGI_QUEUE_SIZE', 64))
+
+# Admission control in front of inference (/predict under Flask and asgi.py, /predict_batch chunks): at most
+# ADMISSION_MAX_CONCURRENCY requests run at once and the rest queue by the caller's role, lowest ADMISSION_PRIORITIES
+# value first. Herd screening chunks queue as 'bulk', at most ADMISSION_BULK_CONCURRENCY running. A request whose
+# estimated queue wait exceeds ADMISSION_QUEUE_SLO_MS (or that has waited that long) gets 503 with Retry-After;
+# beyond ADMISSION_QUEUE_SIZE waiting per role, too. ADMISSION_RATE caps /predict and /predict_batch requests per
+# second per user, with bursts of ADMISSION_BURST, answering 429 beyond it (0 = no per-user limit)
+app.config['ADMISSION_CONTROL'] = os.environ.get('ADMISSION_CONTROL', '1') == '1'
+app.config['ADMISSION_MAX_CONCURRENCY'] = int(os.environ.get('ADMISSION_MAX_CONCURRENCY', 16))
+app.config['ADMISSION_QUEUE_SIZE'] = int(os.environ.get('ADMISSION_QUEUE_SIZE', 64))
+app.config['ADMISSION_QUEUE_SLO_MS'] = float(os.environ.get('ADMISSION_QUEUE_SLO_MS', 2000))
+app.config['ADMISSION_PRIORITIES'] = {role.strip(): int(priority) for role, priority in
+                                      (item.split('=') for item in os.environ.get(
+                                          'ADMISSION_PRIORITIES', 'admin=0,vet=0,user=1,bulk=2').split(',')
+                                       if item.strip())}
+app.config['ADMISSION_BULK_CONCURRENCY'] = int(os.environ.get('ADMISSION_BULK_CONCURRENCY', 2))
+app.config['ADMISSION_RATE'] = float(os.environ.get('ADMISSION_RATE', 0))
+app.config['ADMISSION_BURST'] = int(os.environ.get('ADMISSION_BURST', 20))
+
+# Per-stage latency histograms and gauges at /metrics (Prometheus text format); off = no timing at all
+app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', '1') == '1'
+
+# Account created in an empty user database
+DEFAULT_ADMIN = {'email': 'admin@cattle.com', 'password': 'admin123', 'name': 'Admin User', 'role': 'admin'}
 
-# Session storage for predictions
-PREDICTIONS_LOG = []
+startup = Startup(retry_seconds=app.config['STARTUP_RETRY_SECONDS'])
+
+metrics = Metrics(enabled=app.config['METRICS_ENABLED'])
+STAGE_SECONDS = metrics.histogram('cattle_stage_seconds', 'Time spent in each prediction and report stage', ['stage'])
+SPECIALIST_SECONDS = metrics.histogram('cattle_specialist_seconds', 'Specialist forward pass time per batch',
+                                       ['body_part'])
+REQUEST_SECONDS = metrics.histogram('cattle_request_seconds', 'Time to response headers by endpoint', ['endpoint'])
+RESPONSES = metrics.counter('cattle_responses_total', 'Responses by endpoint and status code', ['endpoint', 'code'])
+
+# Prediction history, image store, embeddings, PDF report service and user store, created on first use
+# (get_prediction_store, get_image_store, get_embedding_index, get_report_service, get_user_store)
+prediction_store = None
+_prediction_store_lock = threading.Lock()
+image_store = None
+_image_store_lock = threading.Lock()
+embedding_index = None
+_embedding_index_lock = threading.Lock()
+report_service = None
+_report_service_lock = threading.Lock()
+user_store = None
+_user_store_lock = threading.Lock()
 
 # Global variables
-master_model = None
-master_config = None
-specialist_models = {}
-specialist_configs = {}
-
-# Disease Medical Information Database - COMPLETE FOR ALL 4 DISEASES
-DISEASE_INFO = {
-    'lumpy': {
-        'name': 'Lumpy Skin Disease (LSD)',
-        'severity': 'HIGH',
-        'description': 'Viral disease causing fever and skin nodules across the body',
-        'immediate_actions': [
-            'Isolate the affected animal IMMEDIATELY to prevent spread',
-            'Measure body temperature (normal: 38-39°C)',
-            'Provide clean, cool drinking water',
-            'Keep the animal in a shaded, fly-free area',
-            'Do NOT attempt to burst or drain nodules yourself'
-        ],
-        'first_aid': [
-            'Apply antiseptic solution (Betadine) around nodules',
-            'Give paracetamol (500mg per 100kg body weight) for fever',
-            'Provide soft, easy-to-eat feed if mouth is affected',
-            'Clean water should be available at all times'
-        ],
-        'emergency_signs': [
-            'Body temperature above 40°C (104°F)',
-            'Difficulty breathing or excessive drooling',
-            'Refusal to eat or drink for more than 12 hours',
-            'Swelling of limbs or udder',
-            'Nodules becoming infected or oozing pus'
-        ],
-        'medicines': [
-            {'name': 'Streptopenicillin', 'type': 'Antibiotic', 'brand': 'Terramycin/Penstrep'},
-            {'name': 'Meloxicam', 'type': 'Anti-inflammatory', 'brand': 'Melonex'},
-            {'name': 'AD3E Injection', 'type': 'Vitamin supplement', 'brand': 'Various'}
-        ],
-        'home_remedies': [
-            'Apply neem oil paste on nodules (antiseptic)',
-            'Turmeric powder mixed with coconut oil (anti-inflammatory)',
-            'Give jaggery water for energy (100g per day)',
-            'Feed crushed garlic cloves (5-6 daily) - natural antibiotic'
-        ],
-        'timeline': 'Incubation: 4-14 days | Acute phase: 7-14 days | Recovery: 4-6 weeks',
-        'prognosis': 'Good with proper care, but notifiable disease - report to authorities'
-    },
-    'mastitis': {
-        'name': 'Mastitis (Udder Infection)',
-        'severity': 'MEDIUM-HIGH',
-        'description': 'Bacterial infection of udder tissue causing inflammation and reduced milk production',
-        'immediate_actions': [
-            'Stop milking the affected quarter immediately',
-            'Milk out the affected quarter gently to remove infected milk',
-            'Apply cold water compress on swollen udder (15 mins)',
-            'Isolate milk from affected quarter - do NOT mix with other milk',
-            'Wash hands thoroughly before and after handling'
-        ],
-        'first_aid': [
-            'Gently massage udder with warm water (not hot)',
-            'Apply camphor oil or eucalyptus oil around udder',
-            'Give pain relief - paracetamol (500mg per 100kg)',
-            'Ensure the cow is lying on soft bedding',
-            'Increase milking frequency to 3-4 times daily'
-        ],
-        'emergency_signs': [
-            'Udder becomes very hot and hard',
-            'Bloody or watery milk with foul smell',
-            'Cow refuses to stand or walk',
-            'Body temperature above 40°C',
-            'Complete loss of milk production',
-            'Gangrene (black discoloration) of udder tissue'
-        ],
-        'medicines': [
-            {'name': 'Mastilone (Cloxacillin)', 'type': 'Intramammary antibiotic', 'brand': 'Mastilone/Mamyzin'},
-            {'name': 'Enrofloxacin', 'type': 'Systemic antibiotic', 'brand': 'Enrocin/Baytril'},
-            {'name': 'Meloxicam', 'type': 'Anti-inflammatory', 'brand': 'Various'},
-            {'name': 'Oxytocin 10IU', 'type': 'Milk letdown aid', 'brand': 'Oxytocin injection'}
-        ],
-        'home_remedies': [
-            'Apply hot fomentation with salt water (warm compress)',
-            'Turmeric paste application on udder surface',
-            'Feed fenugreek seeds (100g daily) - anti-inflammatory',
-            'Aloe vera gel application for soothing effect',
-            'Neem leaf decoction for washing udder'
-        ],
-        'timeline': 'Acute onset: 12-24 hours | Treatment: 5-7 days | Full recovery: 2-3 weeks',
-        'prognosis': 'Good if treated early | Chronic cases may require culling quarter'
-    },
-    'fmd': {
-        'name': 'Foot and Mouth Disease (FMD)',
-        'severity': 'VERY HIGH',
-        'description': 'Highly contagious viral disease causing blisters in mouth and on feet',
-        'immediate_actions': [
-            'ISOLATE IMMEDIATELY - FMD spreads very rapidly',
-            'Report to local veterinary authorities (MANDATORY)',
-            'Stop all animal movement on farm',
-            'Disinfect all equipment, boots, and clothes',
-            'Do NOT allow visitors to farm',
-            'Quarantine entire herd'
-        ],
-        'first_aid': [
-            'Rinse mouth with warm salt water (antiseptic)',
-            'Apply glycerin on mouth lesions for soothing',
-            'Clean feet with potassium permanganate solution',
-            'Apply Stockholm tar or copper sulfate on foot lesions',
-            'Provide soft, liquid feed - green fodder, gruel',
-            'Give plenty of clean drinking water'
-        ],
-        'emergency_signs': [
-            'High fever (40-41°C / 104-106°F)',
-            'Excessive drooling and frothing',
-            'Severe lameness - unable to stand',
-            'Blisters rupturing and becoming infected',
-            'Refusal to eat for more than 24 hours',
-            'Heart complications (sudden death in young calves)'
-        ],
-        'medicines': [
-            {'name': 'Oxytetracycline', 'type': 'Antibiotic (secondary infection)', 'brand': 'Terramycin LA'},
-            {'name': 'Penicillin-Streptomycin', 'type': 'Antibiotic', 'brand': 'Various'},
-            {'name': 'Flunixin', 'type': 'Anti-inflammatory', 'brand': 'Banamine'},
-            {'name': 'B-Complex', 'type': 'Vitamin supplement', 'brand': 'Various'}
-        ],
-        'home_remedies': [
-            'Rinse mouth with alum solution (antiseptic)',
-            'Apply honey on mouth lesions (healing)',
-            'Turmeric + coconut oil paste on foot lesions',
-            'Give buttermilk with rock salt (hydration)',
-            'Neem leaf decoction for foot bath'
-        ],
-        'timeline': 'Incubation: 2-14 days | Fever: 2-3 days | Blisters: 3-7 days | Recovery: 2-3 weeks',
-        'prognosis': 'FMD is viral - no cure, only supportive care | Vaccination is key prevention'
-    },
-    'tongue_disease': {
-        'name': 'Tongue Disease / Oral Lesions',
-        'severity': 'MEDIUM',
-        'description': 'Various conditions affecting tongue including ulcers, inflammation, and infections',
-        'immediate_actions': [
-            'Inspect mouth and tongue thoroughly for lesions',
-            'Check for foreign objects stuck in mouth',
-            'Rinse mouth with clean lukewarm water',
-            'Stop feeding dry, rough fodder immediately',
-            'Provide soft, moist feed only',
-            'Isolate if contagious disease suspected'
-        ],
-        'first_aid': [
-            'Rinse mouth with warm saline solution (1 tsp salt in 1L water)',
-            'Apply glycerin or honey on tongue lesions',
-            'Give soft green fodder or soaked feed',
-            'Offer lukewarm water (not cold)',
-            'Crush feed into small pieces',
-            'Give jaggery for energy and palatability'
-        ],
-        'emergency_signs': [
-            'Complete refusal to eat or drink',
-            'Severe swelling of tongue',
-            'Profuse drooling or frothing',
-            'Blue or black discoloration of tongue',
-            'High fever above 40°C',
-            'Difficulty breathing due to tongue swelling',
-            'Bleeding from mouth or tongue'
-        ],
-        'medicines': [
-            {'name': 'Betadine gargle', 'type': 'Oral antiseptic', 'brand': 'Betadine/Povidone-iodine'},
-            {'name': 'Amoxicillin', 'type': 'Antibiotic', 'brand': 'Various'},
-            {'name': 'Meloxicam', 'type': 'Anti-inflammatory', 'brand': 'Various'},
-            {'name': 'B-Complex', 'type': 'Vitamin supplement', 'brand': 'B-Complex injection'},
-            {'name': 'Orasep gel', 'type': 'Healing gel', 'brand': 'Orasep/Thrush gel'}
-        ],
-        'home_remedies': [
-            'Rinse with turmeric water (1 tsp in warm water) - antiseptic',
-            'Apply pure honey on lesions - healing properties',
-            'Alum powder mixed with glycerin - astringent',
-            'Tender coconut water for hydration and healing',
-            'Betel leaf paste application - antimicrobial',
-            'Feed soft banana or papaya - easy to swallow'
-        ],
-        'timeline': 'Onset: Gradual over 2-3 days | Acute phase: 3-7 days | Healing: 7-14 days | Full recovery: 2-3 weeks',
-        'prognosis': 'Good if treated within 48 hours | Advanced cases may NOT respond'
-    }
-}
+serving = None  # the ModelSet answering requests; replaced as a whole by activate_models
+model_reloader = None
+shadow = None
+shadow_reloader = None
+inference_batcher = None
+inference_client = None
+prediction_cache = None
+tta = None
+if app.config['TTA_VIEWS'] > 1:
+    tta = TestTimeAugmentation(app.config['TTA_VIEWS'], app.config['TTA_SPECIALIST_VIEWS'],
+                               app.config['TTA_AGGREGATION'], app.config['TTA_BELOW_CONFIDENCE'])
+admission = None
+if app.config['ADMISSION_CONTROL']:
+    admission = AdmissionController(app.config['ADMISSION_MAX_CONCURRENCY'], app.config['ADMISSION_QUEUE_SIZE'],
+                                    app.config['ADMISSION_QUEUE_SLO_MS'] / 1000, app.config['ADMISSION_PRIORITIES'],
+                                    {'bulk': app.config['ADMISSION_BULK_CONCURRENCY']},
+                                    app.config['ADMISSION_RATE'], app.config['ADMISSION_BURST'])
+
+# Disease medical information (knowledge_base.py merged with config.py), validated at import
+DISEASE_KEYS = ('lumpy', 'mastitis', 'fmd', 'tongue_disease')  # everything get_disease_key returns
+knowledge_base = KnowledgeBase.load(required=DISEASE_KEYS)
 
 # CORRECTED: Specialist model configuration with YOUR ACTUAL FILE PATHS
 SPECIALIST_MODELS = {
@@ -242,11 +309,40 @@ SPECIALIST_MODELS = {
     }
 }
 
+MASTER_MODEL_PATH = 'models/master_cattle_classifier.keras'
+MASTER_CONFIG_PATH = 'models/master_class_indices.json'
+
+def get_user_store():
+    global user_store
+    if user_store is None:
+        with _user_store_lock:
+            if user_store is None:
+                store = UserStore(SQLiteUserBackend(app.config['USER_DB_PATH']),
+                                  cache_entries=app.config['USER_CACHE_MAX_ENTRIES'],
+                                  cache_ttl=app.config['USER_CACHE_TTL'],
+                                  session_lifetime=app.permanent_session_lifetime.total_seconds(),
+                                  hash_method=app.config['PASSWORD_HASH_METHOD'],
+                                  hash_workers=app.config['AUTH_WORKERS'])
+                store.ensure_user(**DEFAULT_ADMIN)
+                store.purge_sessions()
+                user_store = store
+                logger.info(f"✅ Users and sessions at {app.config['USER_DB_PATH']}")
+    return user_store
+
+def current_user():
+    """The logged-in user, checked against the shared session store once per request"""
+    if 'user' not in g:
+        g.user = get_user_store().session_user(session.get('session_id'))
+        if g.user is None and 'user_email' in session:
+            # Logged out or expired in another worker
+            session.clear()
+    return g.user
+
 # Login required decorator
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if 'user_email' not in session:
+        if current_user() is None:
             flash('Please login to access this page', 'warning')
             return redirect(url_for('login'))
         return f(*args, **kwargs)
@@ -255,117 +351,179 @@ def login_required(f):
 def admin_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if 'user_email' not in session:
+        user = current_user()
+        if user is None:
             return redirect(url_for('login'))
-        user = USERS_DB.get(session['user_email'])
-        if not user or user.get('role') != 'admin':
+        if user.get('role') != 'admin':
             flash('Admin access required', 'danger')
             return redirect(url_for('dashboard'))
         return f(*args, **kwargs)
     return decorated_function
 
-def load_master_model():
-    global master_model, master_config
+def model_backend(model_key):
+    backend = app.config['MODEL_BACKENDS'].get(model_key, app.config['INFERENCE_BACKEND'])
+    if backend not in BACKENDS:
+        logger.warning(f"⚠️ Unknown backend '{backend}' for {model_key}, using keras")
+        return 'keras'
+    return backend
+
+def load_backend_model(model_key, model_path):
+    """Load the TFLite copy of a model when its backend asks for one, else None"""
+    backend = model_backend(model_key)
+    if backend == 'keras':
+        return None
+    model = load_tflite_backend(model_path, backend, num_threads=app.config['TFLITE_NUM_THREADS'])
+    if model is not None:
+        logger.info(f"⚡ {model_key}: serving {backend} backend")
+    return model
+
+def load_master_model(models):
     try:
-        master_path = 'models/master_cattle_classifier.keras'
-        config_path = 'models/master_class_indices.json'
+        master_path = models.path(MASTER_MODEL_PATH)
         
         if not os.path.exists(master_path):
             logger.error(f"❌ Master model not found: {master_path}")
             return False
         
         logger.info("🔄 Loading Master Model...")
-        master_model = tf.keras.models.load_model(master_path, compile=False)
-        master_model.compile(optimizer='adam', loss='categorical_crossentropy', metrics=['accuracy'])
-        
-        if os.path.exists(config_path):
-            with open(config_path, 'r') as f:
-                master_config = json.load(f)
-        else:
-            master_config = {'class_names': ['foot', 'general_body', 'non_cattle', 'tongue', 'udder']}
+        master_model = load_backend_model('master', master_path)
+        if master_model is None:
+            master_model = tf.keras.models.load_model(master_path, compile=False)
+            master_model.compile(optimizer='adam', loss='categorical_crossentropy', metrics=['accuracy'])
+            if app.config['COMPILED_INFERENCE']:
+                master_model = compile_for_inference(master_model)
+        models.master_model = master_model
         
-        logger.info(f"✅ Master Model loaded! Classes: {master_config['class_names']}")
+        load_master_config(models)
+        logger.info(f"✅ Master Model loaded! Classes: {models.master_config['class_names']}")
         return True
     except Exception as e:
         logger.error(f"❌ Error: {e}")
         return False
 
-def load_specialist_models():
-    """Load all specialist models with compatibility fixes"""
-    global specialist_models, specialist_configs
+def require_master_model(models):
+    if not load_master_model(models):
+        raise RuntimeError('Master model could not be loaded')
+
+def load_master_config(models):
+    config_path = models.path(MASTER_CONFIG_PATH)
+    if os.path.exists(config_path):
+        with open(config_path, 'r') as f:
+            models.master_config = json.load(f)
+    else:
+        models.master_config = {'class_names': ['foot', 'general_body', 'non_cattle', 'tongue', 'udder']}
+    models.routing_policy = RoutingPolicy(models.master_config['class_names'],
+                                          lambda body_part: models.specialists is not None and
+                                          body_part in models.specialists,
+                                          non_cattle_threshold=app.config['ROUTING_NON_CATTLE_THRESHOLD'],
+                                          top2_margin=app.config['ROUTING_TOP2_MARGIN'],
+                                          prefilter_threshold=app.config['PREFILTER_THRESHOLD'])
+    return models.master_config
+
+def load_prefilter_model(models):
+    """Attach the low-res non-cattle pre-filter to the routing policy when PREFILTER_MODEL_PATH is set"""
+    path = app.config['PREFILTER_MODEL_PATH']
+    if not path:
+        return None
+    path = models.path(path)
+    if not os.path.exists(path):
+        logger.warning(f"⚠️ Pre-filter model not found: {path}")
+        return None
+    model = load_keras_model(path)
+    if app.config['COMPILED_INFERENCE']:
+        model = compile_for_inference(model)
+    models.routing_policy.prefilter = model
+    logger.info(f"✅ Pre-filter loaded (rejects non-cattle at P >= {app.config['PREFILTER_THRESHOLD']})")
+    return model
+
+def load_keras_model(path):
+    """Load a Keras model with compatibility fixes for older saved files"""
+    # Handle different Keras versions
+    try:
+        model = tf.keras.models.load_model(path, compile=False)
+    except Exception as e:
+        if 'batch_shape' in str(e) or 'InputLayer' in str(e):
+            logger.warning(f"⚠️ Compatibility issue, trying custom_objects...")
+            from tensorflow.keras.layers import InputLayer
+            custom_objects = {'InputLayer': InputLayer}
+            model = tf.keras.models.load_model(
+                path, 
+                compile=False,
+                custom_objects=custom_objects
+            )
+        else:
+            raise e
     
-    loaded_count = 0
+    model.compile(
+        optimizer='adam',
+        loss='categorical_crossentropy',
+        metrics=['accuracy']
+    )
+    return model
+
+def load_specialist_model(models, model_key):
+    """Load one specialist model with compatibility fixes, plus its class mapping"""
+    info = SPECIALIST_MODELS[model_key]
+    logger.info(f"🔄 Loading {info['name']}...")
     
-    for model_key, info in SPECIALIST_MODELS.items():
-        try:
-            if not os.path.exists(info['path']):
-                logger.warning(f"⚠️ Specialist model not found: {info['path']}")
-                continue
-            
-            logger.info(f"🔄 Loading {info['name']}...")
-            
-            # Handle different Keras versions
-            try:
-                model = tf.keras.models.load_model(info['path'], compile=False)
-            except Exception as e:
-                if 'batch_shape' in str(e) or 'InputLayer' in str(e):
-                    logger.warning(f"⚠️ Compatibility issue, trying custom_objects...")
-                    from tensorflow.keras.layers import InputLayer
-                    custom_objects = {'InputLayer': InputLayer}
-                    model = tf.keras.models.load_model(
-                        info['path'], 
-                        compile=False,
-                        custom_objects=custom_objects
-                    )
-                else:
-                    raise e
-            
-            model.compile(
-                optimizer='adam',
-                loss='categorical_crossentropy',
-                metrics=['accuracy']
-            )
-            
-            specialist_models[model_key] = model
+    model = load_backend_model(model_key, models.path(info['path']))
+    if model is None:
+        model = load_keras_model(models.path(info['path']))
+        if app.config['COMPILED_INFERENCE']:
+            model = compile_for_inference(model)
+    
+    load_specialist_classes(models, model_key)
+    logger.info(f"✅ {info['name']} loaded!")
+    return model
+
+def load_specialist_classes(models, model_key):
+    """Fill models.specialist_configs[model_key] with the specialist's class names"""
+    info = SPECIALIST_MODELS[model_key]
+    specialist_configs = models.specialist_configs
+    if 'classes_file' in info:
+        classes_file = models.path(info['classes_file'])
+        if os.path.exists(classes_file):
+            with open(classes_file, 'r') as f:
+                class_data = json.load(f)
             
-            # Load class mapping
-            if 'classes_file' in info:
-                if os.path.exists(info['classes_file']):
-                    with open(info['classes_file'], 'r') as f:
-                        class_data = json.load(f)
-                    
-                    if 'class_names' in class_data:
-                        specialist_configs[model_key] = class_data['class_names']
-                    elif 'class_indices' in class_data:
-                        indices = class_data['class_indices']
-                        specialist_configs[model_key] = [None] * len(indices)
-                        for class_name, idx in indices.items():
-                            specialist_configs[model_key][idx] = class_name
-                    else:
-                        specialist_configs[model_key] = [None] * len(class_data)
-                        for class_name, idx in class_data.items():
-                            specialist_configs[model_key][idx] = class_name
-                else:
-                    specialist_configs[model_key] = info.get('classes', [])
+            if 'class_names' in class_data:
+                specialist_configs[model_key] = class_data['class_names']
+            elif 'class_indices' in class_data:
+                indices = class_data['class_indices']
+                specialist_configs[model_key] = [None] * len(indices)
+                for class_name, idx in indices.items():
+                    specialist_configs[model_key][idx] = class_name
             else:
-                specialist_configs[model_key] = info['classes']
-            
-            logger.info(f"✅ {info['name']} loaded!")
-            loaded_count += 1
-            
-        except Exception as e:
-            logger.error(f"❌ Error loading {info['name']}: {e}")
+                specialist_configs[model_key] = [None] * len(class_data)
+                for class_name, idx in class_data.items():
+                    specialist_configs[model_key][idx] = class_name
+        else:
+            specialist_configs[model_key] = info.get('classes', [])
+    else:
+        specialist_configs[model_key] = info['classes']
+    return specialist_configs[model_key]
+
+def load_specialist_models(models, preload=()):
+    """Register all specialist models; load them now unless lazy loading is enabled (then only ``preload``)"""
+    available = 0
+    for model_key, info in SPECIALIST_MODELS.items():
+        if not os.path.exists(models.path(info['path'])):
+            logger.warning(f"⚠️ Specialist model not found: {models.path(info['path'])}")
+            continue
+        models.specialists.register(model_key)
+        available += 1
     
+    if app.config['LAZY_SPECIALISTS']:
+        for model_key in preload:
+            if model_key in models.specialists:
+                models.specialists.get(model_key)
+        logger.info(f"\n✅ Registered {available}/{len(SPECIALIST_MODELS)} specialists (loaded on first use)")
+        return available > 0
+    
+    loaded_count = models.specialists.load_all()
     logger.info(f"\n✅ Loaded {loaded_count}/{len(SPECIALIST_MODELS)} specialists!")
     return loaded_count > 0
 
-def preprocess_image(image, target_size=(224, 224)):
-    if image.mode != 'RGB':
-        image = image.convert('RGB')
-    image = image.resize(target_size)
-    img_array = np.array(image) / 255.0
-    return np.expand_dims(img_array, axis=0)
-
 def get_disease_key(class_name):
     """Map predicted class to disease key for medical info"""
     class_lower = class_name.lower()
@@ -379,14 +537,22 @@ def get_disease_key(class_name):
         return 'tongue_disease'
     return None
 
-def predict_with_master(image):
-    processed_img = preprocess_image(image)
-    master_predictions = master_model.predict(processed_img, verbose=0)
-    body_part_idx = np.argmax(master_predictions[0])
-    body_part_confidence = float(np.max(master_predictions[0]))
-    body_part = master_config['class_names'][body_part_idx]
+def run_specialist(body_part, batch, models=None):
+    model = (models or serving).specialists[body_part]
+    with SPECIALIST_SECONDS.time(body_part):
+        return model.predict(batch, verbose=0)
+
+def build_prediction_result(master_row, specialist_row=None, models=None):
+    """Turn raw master/specialist probability rows from ``models`` (default: the serving set) into the /predict result"""
+    models = models or serving
+    master_config = models.master_config
+    body_part, body_part_confidence = models.routing_policy.body_part(master_row)
+    if isinstance(specialist_row, Routed):
+        # Top-2 routing kept the runner-up body part's specialist
+        body_part, specialist_row = specialist_row
+        body_part_confidence = float(master_row[master_config['class_names'].index(body_part)])
     
-    master_probabilities = {master_config['class_names'][i]: float(master_predictions[0][i])
+    master_probabilities = {master_config['class_names'][i]: float(master_row[i])
                            for i in range(len(master_config['class_names']))}
     
     if body_part == 'non_cattle':
@@ -399,28 +565,26 @@ def predict_with_master(image):
             'predicted_class': 'Not Cattle',
             'confidence': body_part_confidence,
             'status': 'WARNING',
-            'medical_info': None
+            'medical_info_key': None,
+            'model_version': models.version
         }
     
-    if body_part not in specialist_models:
+    if specialist_row is None:
         return {'success': False, 'error': f'No specialist for {body_part}'}
     
-    specialist_model = specialist_models[body_part]
-    class_names = specialist_configs[body_part]
+    class_names = models.specialist_configs[body_part]
     
-    specialist_predictions = specialist_model.predict(processed_img, verbose=0)
-    disease_idx = np.argmax(specialist_predictions[0])
-    disease_confidence = float(np.max(specialist_predictions[0]))
+    disease_idx = np.argmax(specialist_row)
+    disease_confidence = float(np.max(specialist_row))
     disease_class = class_names[disease_idx]
     
-    disease_probabilities = {class_names[i]: float(specialist_predictions[0][i])
+    disease_probabilities = {class_names[i]: float(specialist_row[i])
                             for i in range(len(class_names))}
     
     combined_confidence = (body_part_confidence * 0.3 + disease_confidence * 0.7)
     
-    # Get medical info
+    # Medical info is added from the knowledge base when the result is serialized
     disease_key = get_disease_key(disease_class)
-    medical_info = DISEASE_INFO.get(disease_key)
     
     is_healthy = 'healthy' in disease_class.lower() or 'normal' in disease_class.lower()
     is_non_cattle = 'non' in disease_class.lower()
@@ -444,80 +608,697 @@ def predict_with_master(image):
         'specialist_probabilities': disease_probabilities,
         'specialist_used': SPECIALIST_MODELS[body_part]['name'],
         'status': status,
-        'medical_info': medical_info
+        'medical_info_key': disease_key if disease_key in knowledge_base else None,
+        'model_version': models.version
     }
 
-def generate_pdf_report(prediction_data, user_info):
-    """Generate PDF report"""
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4)
-    story = []
-    styles = getSampleStyleSheet()
-    
-    # Title
-    title_style = ParagraphStyle('CustomTitle', parent=styles['Heading1'], fontSize=24,
-                                textColor=colors.HexColor('#2c3e50'), spaceAfter=30, alignment=TA_CENTER)
-    story.append(Paragraph("🐄 Cattle Disease Detection Report", title_style))
-    story.append(Spacer(1, 0.3*inch))
-    
-    # Report info
-    data = [
-        ['Report Generated:', datetime.now().strftime('%Y-%m-%d %H:%M:%S')],
-        ['User:', user_info['name']],
-        ['', ''],
-        ['DIAGNOSIS RESULTS', ''],
-        ['Body Part Detected:', prediction_data['body_part'].upper()],
-        ['Disease/Condition:', prediction_data['predicted_class']],
-        ['Confidence Level:', f"{prediction_data['confidence']*100:.2f}%"],
-        ['Status:', prediction_data['status']],
+def build_fused_cascade(models):
+    """Enable fused serving when the master backbone can be shared with any specialist"""
+    if not app.config['FUSED_SERVING'] or models.master_model is None:
+        return None
+    logger.info("🔄 Checking for shareable backbones...")
+    # With LAZY_SPECIALISTS each specialist is checked (and loaded) when images are first routed to it
+    models.fused_cascade = FusedCascade.build(models.master_model, models.specialists,
+                                              lambda key, batch: run_specialist(key, batch, models),
+                                              compiled=app.config['COMPILED_INFERENCE'],
+                                              lazy=app.config['LAZY_SPECIALISTS'])
+    if models.fused_cascade is None:
+        logger.warning("⚠️ Master backbone cannot be split, fused serving disabled")
+    elif app.config['LAZY_SPECIALISTS']:
+        logger.info("✅ Fused serving enabled (specialists join on first use)")
+    else:
+        logger.info(f"✅ Fused serving enabled for: {models.fused_cascade.fused_keys or 'none (all full passes)'}")
+    return models.fused_cascade
+
+def run_cascade(batch, models=None):
+    """Pre-filter, master and routed specialists over a batch, fused when a shared backbone is available"""
+    if inference_client is not None:
+        return inference_client.run(batch)
+    models = models or serving
+    return models.routing_policy.run(batch, lambda batch: run_models(batch, models))
+
+def run_serving(batch):
+    """run_cascade on the serving set for the inference batcher, which hands each image's rows back with the set"""
+    models = serving
+    return run_cascade(batch, models) + (models,)
+
+def run_models(batch, models):
+    if models.fused_cascade is not None:
+        with STAGE_SECONDS.time('fused_cascade'):
+            return models.fused_cascade.run(batch, models.routing_policy)
+    return run_two_stage(batch, lambda batch: run_master(batch, models),
+                         lambda key, batch: run_specialist(key, batch, models), models.routing_policy)
+
+def run_master(batch, models=None):
+    with STAGE_SECONDS.time('master'):
+        return (models or serving).master_model.predict(batch, verbose=0)
+
+def start_inference_batcher():
+    """Start the micro-batching worker that sits in front of the models"""
+    global inference_batcher
+    if not app.config['INFERENCE_BATCHING'] or serving is None or serving.master_model is None:
+        return None
+    if inference_batcher is None:
+        inference_batcher = InferenceBatcher(
+            run_serving,
+            max_batch_size=app.config['BATCH_MAX_SIZE'],
+            max_wait_ms=app.config['BATCH_MAX_WAIT_MS'],
+            max_queue_size=app.config['BATCH_QUEUE_SIZE']
+        )
+    inference_batcher.start()
+    logger.info(f"✅ Inference batching enabled (max batch {inference_batcher.max_batch_size}, "
+                f"max wait {app.config['BATCH_MAX_WAIT_MS']}ms)")
+    return inference_batcher
+
+def model_set_files(directory=None):
+    """model_files() as a set reading from ``directory`` first (see ModelSet.path) finds them"""
+    paths = model_files()
+    if directory is None:
+        return paths
+    candidates = [os.path.join(directory, os.path.basename(path)) for path in paths]
+    return [candidate if os.path.exists(candidate) else path for candidate, path in zip(candidates, paths)]
+
+def new_model_set(directory=None):
+    """An empty ModelSet for the model files as they are now (read from ``directory`` first for a candidate)"""
+    paths = model_set_files(directory)
+    files = files_fingerprint(paths)
+    version = files_fingerprint(paths, hash_contents=True) if app.config['PREDICTION_CACHE_HASH_MODELS'] else files
+    models = ModelSet(version, files, directory)
+    # The loader only holds the set weakly, so a replaced set is freed as soon as its last request ends
+    models_ref = weakref.ref(models)
+    models.specialists = SpecialistRegistry(
+        lambda model_key: load_specialist_model(models_ref(), model_key),
+        memory_budget_bytes=app.config['SPECIALIST_MEMORY_BUDGET_MB'] * 1024 * 1024,
+        idle_seconds=app.config['SPECIALIST_IDLE_SECONDS']
+    )
+    return models
+
+def model_set_phases(models, preload=()):
+    """(name, fn) steps that load and warm ``models``; startup times them one by one"""
+    return [
+        ('master_model', lambda: require_master_model(models)),
+        ('specialists', lambda: load_specialist_models(models, preload)),
+        ('prefilter', lambda: load_prefilter_model(models)),
+        ('fused_cascade', lambda: build_fused_cascade(models)),
+        ('warmup', lambda: warm_up_models(models))
     ]
+
+def load_model_set(directory=None):
+    """Load and warm a complete ModelSet off the request path, preloading the specialists serving has resident"""
+    models = new_model_set(directory)
+    preload = [key for key, _ in serving.specialists.items()] if serving is not None else ()
+    for name, step in model_set_phases(models, preload):
+        step()
+    return models
+
+def load_class_names(directory=None):
+    """A ModelSet with only the class names and routing rules, for a web process using the inference server"""
+    models = new_model_set(directory)
+    load_master_config(models)
+    for model_key in SPECIALIST_MODELS:
+        if os.path.exists(models.path(SPECIALIST_MODELS[model_key]['path'])):
+            models.specialists.register(model_key)
+        load_specialist_classes(models, model_key)
+    return models
+
+def activate_models(models):
+    """Serve ``models`` from the next request on; requests already running finish on the previous set"""
+    global serving
+    if models.loaded_at is None:
+        models.loaded_at = time.time()
+    previous, serving = serving, models
+    if previous is None:
+        logger.info(f"✅ Serving models {models.version}")
+        return models
+    logger.info(f"🔄 Now serving models {models.version} (was {previous.version})")
+    weakref.finalize(previous, logger.info, f"♻️ Released models {previous.version}")
+    if shadow is not None and shadow.candidate is not None and shadow.candidate.files == models.files:
+        logger.info(f"✅ Candidate {models.version} is now serving")
+    return models
+
+def start_model_reloader(load=load_model_set):
+    """Watch the model files and hot-swap a new set when they change (MODEL_RELOAD_INTERVAL)"""
+    global model_reloader
+    if model_reloader is None:
+        model_reloader = ModelReloader(lambda: files_fingerprint(model_files()), lambda: serving, load,
+                                       activate_models, interval=app.config['MODEL_RELOAD_INTERVAL'])
+    model_reloader.start()
+    if app.config['MODEL_RELOAD_INTERVAL'] > 0:
+        logger.info(f"✅ Watching model files every {app.config['MODEL_RELOAD_INTERVAL']:g}s")
+    return model_reloader
+
+def start_shadow():
+    """Load the MODEL_SHADOW_DIR candidate in the background and compare it on sampled traffic"""
+    global shadow
+    directory = app.config['MODEL_SHADOW_DIR']
+    if not directory or shadow is not None:
+        return shadow
+    if not os.path.isdir(directory):
+        logger.warning(f"⚠️ Shadow candidate directory not found: {directory}")
+        return None
+    global shadow_reloader
+    shadow = ShadowRunner(shadow_predict, sample_rate=app.config['MODEL_SHADOW_SAMPLE'],
+                          queue_size=app.config['MODEL_SHADOW_QUEUE_SIZE'])
+    shadow_reloader = ModelReloader(lambda: files_fingerprint(model_set_files(directory)), lambda: shadow.candidate,
+                                    lambda: load_model_set(directory),
+                                    lambda models: setattr(shadow, 'candidate', models),
+                                    interval=app.config['MODEL_RELOAD_INTERVAL'], name='shadow')
+    shadow_reloader.start()
+    return shadow
+
+def shadow_predict(batch, models):
+    """Candidate results for a batch the serving set already answered"""
+    master_out, specialist_rows, failures = run_cascade(batch, models)
+    return [None if i in failures else build_prediction_result(master_out[i], specialist_rows[i], models)
+            for i in range(len(batch))]
+
+def offer_shadow(tensor, result, seconds):
+    if shadow is not None:
+        shadow.offer(tensor, result, seconds)
+
+def serving_cascade(watch=True):
+    """Factory for inference_server.py workers: load every model into this process and return run_cascade.
+
+    With ``watch``, the worker also hot-reloads the models when their files change.
+    """
+    models = new_model_set()
+    for name, step in model_set_phases(models):
+        if name != 'warmup':
+            step()
+    activate_models(models)
+    if watch:
+        start_model_reloader()
+    return run_cascade
+
+def connect_inference_server():
+    """Use the shared inference server; this process then only needs the class names"""
+    global inference_client
+    if not app.config['INFERENCE_SERVER']:
+        return None
+    activate_models(load_class_names())
+    inference_client = InferenceClient(app.config['INFERENCE_SERVER'],
+                                       authkey=app.config['INFERENCE_SERVER_AUTHKEY'].encode(),
+                                       slots=app.config['INFERENCE_SERVER_SLOTS'],
+                                       slot_timeout=app.config['INFERENCE_SERVER_TIMEOUT'])
+    logger.info(f"✅ Connected to inference server at {app.config['INFERENCE_SERVER']}")
+    return inference_client
+
+def warm_up_models(models):
+    """Run dummy batches through every resident model so the first requests do not pay for tracing"""
+    sizes = app.config['WARMUP_BATCH_SIZES']
+    if not sizes or models.master_model is None:
+        return 0
+    resident = [('master', models.master_model)] + models.specialists.items()
+    if models.routing_policy.prefilter is not None:
+        resident.append(('prefilter', models.routing_policy.prefilter))
+    for model_key, model in resident:
+        if hasattr(model, 'warmup'):
+            model.warmup(sizes)
+        else:
+            for size in sizes:
+                model.predict(np.zeros((size,) + IMG_SHAPE, dtype=np.float32), verbose=0)
+    if models.fused_cascade is not None:
+        for size in sizes:
+            models.fused_cascade.run(np.zeros((size,) + IMG_SHAPE, dtype=np.float32), models.routing_policy)
+        models.routing_policy.reset()
+    logger.info(f"🔥 Warmed {len(resident)} models with batch sizes {list(sizes)}")
+    return len(resident)
+
+def startup_phases():
+    """(name, fn) steps run by the background loader, timed one by one"""
+    if app.config['INFERENCE_SERVER']:
+        phases = [('connect_inference_server', connect_inference_server),
+                  ('model_reloader', lambda: start_model_reloader(load_class_names))]
+    else:
+        models = new_model_set()
+        phases = ([('import_tensorflow', tf.load)] + model_set_phases(models) +
+                  [('activate', lambda: activate_models(models)), ('batcher', start_inference_batcher),
+                   ('model_reloader', start_model_reloader), ('shadow', start_shadow)])
+    return phases + [('prediction_cache', init_prediction_cache), ('embedding_index', get_embedding_index),
+                     ('report_service', get_report_service), ('user_store', get_user_store)]
+
+def start_background_loading():
+    if not startup.ready:
+        startup.start(startup_phases())
+    return startup
+
+def models_ready():
+    """True once startup has finished; starts the background loader on first use (e.g. under gunicorn)"""
+    return start_background_loading().ready
+
+def not_ready_response():
+    message = 'Models failed to load' if startup.state == 'failed' else 'Models are still loading, please retry shortly'
+    response = jsonify({'error': message, 'startup': startup.status()})
+    response.status_code = 503
+    response.headers['Retry-After'] = '5'
+    return response
+
+def check_rate(user_email):
+    """Take one request from the user's ADMISSION_RATE allowance; raises Rejected when it is used up"""
+    if admission is not None:
+        admission.check_rate(user_email)
+
+@contextmanager
+def admitted(klass):
+    """Hold an admission slot of class ``klass`` (a role, or 'bulk') for the block; raises Rejected"""
+    if admission is None:
+        yield
+        return
+    with STAGE_SECONDS.time('admission'):
+        ticket = admission.acquire(klass)
+    try:
+        yield
+    finally:
+        admission.release(ticket)
+
+def rejected_error(rejected):
+    """Error message and status code for a request turned away by admission control"""
+    if rejected.reason == 'rate_limited':
+        return 'Too many requests, please slow down', 429
+    return 'Server busy, please retry shortly', 503
+
+def rejected_response(rejected):
+    message, status_code = rejected_error(rejected)
+    response = jsonify({'error': message})
+    response.status_code = status_code
+    response.headers['Retry-After'] = str(rejected.retry_after)
+    return response
+
+def preprocess_timed(image, out):
+    with STAGE_SECONDS.time('preprocess'):
+        return preprocess_into(image, out)
+
+def predict_with_master(image, processed_img=None):
+    """/predict result for one image; with TTA on, augmented views decide all (or only low-confidence) images"""
+    # The inference server runs one view per request, so TTA needs the models in this process
+    if tta is None or inference_client is not None:
+        return predict_single(image, processed_img)
+    if tta.below_confidence is not None:
+        result = predict_single(image, processed_img)
+        if not result['success'] or result['confidence'] >= tta.below_confidence:
+            return result
+    return predict_with_tta(image)
+
+def predict_with_tta(image):
+    models = serving
+    with STAGE_SECONDS.time('tta'):
+        master_row, specialist_row, info = tta.run(image, lambda batch: run_master(batch, models),
+                                                   lambda key, batch: run_specialist(key, batch, models),
+                                                   models.routing_policy)
+    result = build_prediction_result(master_row, specialist_row, models)
+    if result['success']:
+        result['tta'] = info
+    return result
+
+def predict_single(image, processed_img=None):
+    if inference_client is not None:
+        if processed_img is None:
+            # Preprocess straight into the shared-memory slot the server reads
+            future = inference_client.submit_into(lambda out: preprocess_timed(image, out))
+        else:
+            future = inference_client.submit(processed_img[0])
+        with STAGE_SECONDS.time('inference'):
+            master_row, specialist_row = future.result()
+        return build_prediction_result(master_row, specialist_row)
     
-    table = Table(data, colWidths=[2.5*inch, 4*inch])
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3498db')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 12),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 3), (-1, 3), colors.HexColor('#e74c3c')),
-        ('TEXTCOLOR', (0, 3), (-1, 3), colors.whitesmoke),
-        ('FONTNAME', (0, 3), (-1, 3), 'Helvetica-Bold'),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-    
-    story.append(table)
-    story.append(Spacer(1, 0.5*inch))
-    
-    # Medical information
-    if prediction_data.get('medical_info'):
-        med_info = prediction_data['medical_info']
-        story.append(Paragraph("⚕️ MEDICAL RECOMMENDATIONS", styles['Heading2']))
-        story.append(Spacer(1, 0.2*inch))
-        
-        # Immediate actions
-        story.append(Paragraph("⚠️ IMMEDIATE ACTIONS:", styles['Heading3']))
-        for action in med_info['immediate_actions']:
-            story.append(Paragraph(f"• {action}", styles['Normal']))
-        story.append(Spacer(1, 0.2*inch))
-        
-        # Medicines
-        story.append(Paragraph("💊 RECOMMENDED MEDICINES:", styles['Heading3']))
-        for med in med_info['medicines']:
-            story.append(Paragraph(f"• {med['name']} ({med['type']}) - Brand: {med['brand']}", styles['Normal']))
-        story.append(Spacer(1, 0.2*inch))
-    
-    # Disclaimer
-    story.append(Spacer(1, 0.5*inch))
-    disclaimer_style = ParagraphStyle('Disclaimer', parent=styles['Normal'], fontSize=9,
-                                     textColor=colors.red, alignment=TA_CENTER)
-    story.append(Paragraph("⚠️ MEDICAL DISCLAIMER: This report is for informational purposes only. Always consult a licensed veterinarian for accurate diagnosis and treatment.", disclaimer_style))
-    
-    doc.build(story)
-    buffer.seek(0)
-    return buffer
+    if processed_img is None:
+        with STAGE_SECONDS.time('preprocess'):
+            processed_img = preprocess_image(image)
+    
+    started = time.perf_counter()
+    if inference_batcher is not None and inference_batcher.running:
+        with STAGE_SECONDS.time('inference'):
+            master_row, specialist_row, models = inference_batcher.submit(processed_img[0]).result()
+    else:
+        models = serving
+        with STAGE_SECONDS.time('inference'):
+            master_out, specialist_rows, failures = run_cascade(processed_img, models)
+        if 0 in failures:
+            raise failures[0]
+        master_row, specialist_row = master_out[0], specialist_rows[0]
+    result = build_prediction_result(master_row, specialist_row, models)
+    offer_shadow(processed_img[0], result, time.perf_counter() - started)
+    return result
+
+def model_files():
+    """Every file a model version is made of: a change to any of them is a new version"""
+    paths = [MASTER_MODEL_PATH, MASTER_CONFIG_PATH]
+    for model_key, info in SPECIALIST_MODELS.items():
+        paths.append(info['path'])
+        if 'classes_file' in info:
+            paths.append(info['classes_file'])
+    for model_key, path in [('master', MASTER_MODEL_PATH)] + [(k, i['path']) for k, i in SPECIALIST_MODELS.items()]:
+        backend = model_backend(model_key)
+        if backend != 'keras':
+            paths.append(tflite_path(path, backend_quantization(backend)))
+    if app.config['PREFILTER_MODEL_PATH']:
+        paths.append(app.config['PREFILTER_MODEL_PATH'])
+    return paths
+
+def routing_settings():
+    """The routing configuration results depend on besides the model files (cache salt, archive checkpoints)"""
+    return (f"routing={app.config['ROUTING_NON_CATTLE_THRESHOLD']}/{app.config['ROUTING_TOP2_MARGIN']}/"
+            f"{app.config['PREFILTER_MODEL_PATH']}/{app.config['PREFILTER_THRESHOLD']}")
+
+RESULT_FORMAT = '3'
+
+def init_prediction_cache():
+    global prediction_cache
+    if not app.config['PREDICTION_CACHE']:
+        return None
+    # RESULT_FORMAT: bump when cached result fields change
+    salt = (f"{RESULT_FORMAT}|{app.config['INFERENCE_BACKEND']}|{sorted(app.config['MODEL_BACKENDS'].items())}"
+            f"|{routing_settings()}")
+    if tta is not None:
+        salt += f"|tta={tta.views}/{sorted(tta.specialist_views.items())}/{tta.aggregation}/{tta.below_confidence}"
+    disk_tier = None
+    if app.config['PREDICTION_CACHE_PATH']:
+        disk_tier = SQLiteTier(app.config['PREDICTION_CACHE_PATH'],
+                               max_entries=app.config['PREDICTION_CACHE_DISK_MAX_ENTRIES'],
+                               ttl_seconds=app.config['PREDICTION_CACHE_TTL'])
+    prediction_cache = PredictionCache(
+        lambda: files_fingerprint([], salt=f"{salt}|{serving.version}"),
+        memory_tier=MemoryTier(max_entries=app.config['PREDICTION_CACHE_MAX_ENTRIES'],
+                               ttl_seconds=app.config['PREDICTION_CACHE_TTL']),
+        disk_tier=disk_tier
+    )
+    logger.info(f"✅ Prediction cache enabled (model version {prediction_cache.version})")
+    return prediction_cache
+
+def predict_upload(key, image):
+    """predict_with_master for an upload (``key`` = its content key), served from the prediction cache when possible"""
+    if prediction_cache is None:
+        return predict_with_master(image)
+    
+    keys = [key]
+    with STAGE_SECONDS.time('cache_lookup'):
+        result = prediction_cache.get(keys[0])
+    processed_img = None
+    if result is None and app.config['PREDICTION_CACHE_PERCEPTUAL']:
+        processed_img = preprocess_image(image)
+        keys.append(perceptual_key(processed_img))
+        result = prediction_cache.get(keys[1])
+        if result is not None:
+            prediction_cache.put(result, keys[0])
+    if result is not None:
+        result['cached'] = True
+        return result
+    
+    result = predict_with_master(image, processed_img)
+    if result['success']:
+        prediction_cache.put(result, *keys)
+    return result
+
+def get_prediction_store():
+    global prediction_store
+    if prediction_store is None:
+        with _prediction_store_lock:
+            if prediction_store is None:
+                prediction_store = PredictionStore(app.config['PREDICTION_DB_PATH'],
+                                                   batch_size=app.config['PREDICTION_WRITE_BATCH'],
+                                                   flush_interval=app.config['PREDICTION_FLUSH_INTERVAL'])
+                logger.info(f"✅ Prediction history at {app.config['PREDICTION_DB_PATH']}")
+    return prediction_store
+
+def log_prediction(result, user_email, user_name):
+    get_prediction_store().add({
+        'prediction_id': result['prediction_id'],
+        'user_email': user_email,
+        'user_name': user_name,
+        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'body_part': result['body_part'],
+        'diagnosis': result['predicted_class'],
+        'confidence': result['confidence'],
+        'status': result.get('status'),
+        'model_version': result.get('model_version'),
+        'image_key': result.get('image_key')
+    })
+
+def get_image_store():
+    """The upload image store, or None when IMAGE_STORE is off"""
+    global image_store
+    if image_store is None and app.config['IMAGE_STORE']:
+        with _image_store_lock:
+            if image_store is None:
+                # The preview size is always stored so /predict can return it without encoding
+                image_store = ImageStore(app.config['UPLOAD_FOLDER'],
+                                         thumbnail_sizes=app.config['IMAGE_THUMBNAIL_SIZES'] +
+                                                         (app.config['UPLOAD_PREVIEW_SIZE'],),
+                                         formats=app.config['IMAGE_THUMBNAIL_FORMATS'],
+                                         quality=app.config['IMAGE_THUMBNAIL_QUALITY'])
+                logger.info(f"✅ Storing uploads in {app.config['UPLOAD_FOLDER']}")
+                if os.path.isdir('static/uploads') and os.listdir('static/uploads'):
+                    logger.warning("⚠️ static/uploads (the old UPLOAD_FOLDER default) is served without a login: "
+                                   "move its files to UPLOAD_FOLDER or delete them")
+    return image_store
+
+def get_embedding_index():
+    """The embedding index, or None when EMBEDDINGS is off or the models live in an inference server"""
+    global embedding_index
+    if embedding_index is None and app.config['EMBEDDINGS'] and not app.config['INFERENCE_SERVER']:
+        with _embedding_index_lock:
+            if embedding_index is None:
+                # Index names change with the specialist file, so retrained weights start a fresh index
+                embedders = SpecialistEmbedders(
+                    lambda model_key: serving.specialists[model_key],
+                    lambda model_key: f"{model_key}-"
+                                      f"{files_fingerprint([serving.path(SPECIALIST_MODELS[model_key]['path'])])}",
+                    wrap=CompiledModel if app.config['COMPILED_INFERENCE'] else None)
+                embedding_index = EmbeddingIndex(app.config['EMBEDDING_DIR'], embedders,
+                                                 exact_max=app.config['EMBEDDING_EXACT_MAX'],
+                                                 probes=app.config['EMBEDDING_PROBES'],
+                                                 queue_size=app.config['EMBEDDING_QUEUE_SIZE'])
+                logger.info(f"✅ Prediction embeddings at {app.config['EMBEDDING_DIR']}")
+    return embedding_index
+
+def record_embedding(result, image):
+    """Queue a logged two-stage prediction for embedding by the specialist that made it"""
+    if result['stage'] == 'two_stage' and get_embedding_index() is not None:
+        embedding_index.add(result['prediction_id'], result['body_part'], image)
+
+def predict_images(uploads, batch):
+    """Results for a chunk of ``(filename, bytes)`` uploads, in order.
+
+    Cached uploads skip inference; the rest are decoded into ``batch`` (a
+    preallocated float32 buffer) and go through the cascade as one batch, so
+    each specialist runs once per body part present in the chunk.
+    """
+    results = [None] * len(uploads)
+    keys = [None] * len(uploads)
+    pending = []
+    for i, (filename, data) in enumerate(uploads):
+        if prediction_cache is not None:
+            keys[i] = content_key(data)
+            cached = prediction_cache.get(keys[i])
+            if cached is not None:
+                cached['cached'] = True
+                results[i] = cached
+                continue
+        try:
+            preprocess_timed(Image.open(io.BytesIO(data)), batch[len(pending)])
+            pending.append(i)
+        except Exception as e:
+            logger.warning(f"⚠️ Skipping unreadable upload {filename}: {e}")
+            results[i] = {'success': False, 'error': 'Invalid or unsupported image file'}
+    
+    if pending:
+        models = serving
+        with STAGE_SECONDS.time('inference'):
+            master_out, specialist_rows, failures = run_cascade(batch[:len(pending)], models)
+        for j, i in enumerate(pending):
+            if j in failures:
+                results[i] = {'success': False, 'error': str(failures[j])}
+                continue
+            results[i] = build_prediction_result(master_out[j], specialist_rows[j], models)
+            if results[i]['success'] and prediction_cache is not None:
+                prediction_cache.put(results[i], keys[i])
+    return results
+
+def predict_herd(files, user_email, user_name, full_medical_info=True):
+    """NDJSON lines: one per image as it is analyzed, then the herd summary"""
+    summary = HerdSummary()
+    started = time.perf_counter()
+    batch_size = app.config['HERD_BATCH_SIZE']
+    batch = np.empty((batch_size,) + IMG_SHAPE, dtype=np.float32)
+    index = 0
+    uploads = iter_uploads(files, max_images=app.config['HERD_MAX_IMAGES'],
+                           max_bytes=app.config['HERD_MAX_UPLOAD_MB'] * 1024 * 1024)
+    try:
+        for chunk in chunked(uploads, batch_size):
+            with admitted('bulk'):
+                results = predict_images(chunk, batch)
+            for (filename, data), result in zip(chunk, results):
+                if result['success']:
+                    result['prediction_id'] = uuid.uuid4().hex
+                    result['confidence_percent'] = f"{(result['confidence'] * 100):.2f}%"
+                    result['timestamp'] = datetime.now().isoformat()
+                    log_prediction(result, user_email, user_name)
+                    record_embedding(result, Image.open(io.BytesIO(data)))
+                summary.add(result)
+                yield knowledge_base.dumps({'index': index, 'filename': filename, **result}, full_medical_info) + b'\n'
+                index += 1
+    except (UploadLimitError, zipfile.BadZipFile) as e:
+        yield ndjson({'error': str(e)})
+    except Rejected as e:
+        yield ndjson({'error': rejected_error(e)[0], 'retry_after': e.retry_after})
+    except Exception as e:
+        logger.error(f"❌ Herd screening failed after {index} images: {e}")
+        yield ndjson({'error': str(e)})
+    yield ndjson({'summary': summary.to_dict(time.perf_counter() - started)})
+
+def page_cursor():
+    """?before=<id> cursor for paginated history views"""
+    return request.args.get('before', type=int)
+
+def page_limit(default):
+    return max(1, min(request.args.get('limit', default, type=int), app.config['ADMIN_PAGE_SIZE']))
+
+def analytics_days():
+    return max(1, min(request.args.get('days', app.config['ANALYTICS_DAYS'], type=int),
+                      app.config['ANALYTICS_MAX_DAYS']))
+
+def analytics_filters(*names):
+    """?since=&until= (YYYY-MM-DD) plus the named dimension filters; ValueError on a malformed date"""
+    filters = {name: request.args.get(name) or None for name in ('since', 'until') + names}
+    for name in ('since', 'until'):
+        if filters[name] is not None:
+            filters[name] = date.fromisoformat(filters[name]).isoformat()
+    return filters
+
+def report_input(data):
+    """A result posted back for a report, with its medical info taken from the knowledge base by key"""
+    if data.get('medical_info_key') in knowledge_base:
+        data = dict(data, medical_info=knowledge_base.get(data['medical_info_key']))
+    return data
+
+def get_report_service():
+    global report_service
+    if report_service is None:
+        with _report_service_lock:
+            if report_service is None:
+                # ReportLab is only imported once the first report is needed
+                from reports import ReportService
+                report_service = ReportService(workers=app.config['REPORT_WORKERS'],
+                                               cache_entries=app.config['REPORT_CACHE_MAX_ENTRIES'],
+                                               cache_ttl=app.config['REPORT_CACHE_TTL'])
+                logger.info(f"✅ Report service started ({app.config['REPORT_WORKERS']} workers)")
+    return report_service
+
+def generate_pdf_report(prediction_data, user_info):
+    """Generate PDF report (blocking; served from the report cache when possible)"""
+    with STAGE_SECONDS.time('report_submit'):
+        job = get_report_service().submit(prediction_data, user_info['name'], user_info['email'],
+                                          prediction_data.get('prediction_id'))
+    with STAGE_SECONDS.time('report_render'):
+        return io.BytesIO(job.result(timeout=app.config['REPORT_WAIT_SECONDS']))
+
+def report_job_json(job):
+    return {
+        'job_id': job.id,
+        'status': job.status,
+        'error': job.error,
+        'status_url': url_for('report_status', job_id=job.id),
+        'download_url': url_for('report_download', job_id=job.id)
+    }
+
+def register_metric_sources():
+    """Gauges read from the batcher, caches, model registry and report service when /metrics is scraped"""
+    metrics.gauge('cattle_ready', 'Whether startup has finished (1) or not (0)', lambda: int(startup.ready))
+    metrics.gauge('cattle_batcher_queue_depth', 'Preprocessed images waiting for the inference batcher',
+                  lambda: inference_batcher.queue_depth() if inference_batcher is not None else None)
+    metrics.gauge('cattle_batcher_batches_total', 'Batches run by the inference batcher',
+                  lambda: inference_batcher.stats()['batches'] if inference_batcher is not None else None,
+                  kind='counter')
+    metrics.gauge('cattle_inference_in_flight', 'Requests waiting on the inference server',
+                  lambda: inference_client.stats()['in_flight'] if inference_client is not None else None)
+    metrics.gauge('cattle_prediction_cache_lookups_total', 'Prediction cache lookups by result',
+                  lambda: pick(prediction_cache.stats(), ('memory_hits', 'disk_hits', 'misses'))
+                  if prediction_cache is not None else None, labelnames=['result'], kind='counter')
+    metrics.gauge('cattle_model_memory_bytes', 'Resident model weights by model', model_memory, labelnames=['model'])
+    metrics.gauge('cattle_specialist_events_total', 'Specialist registry loads, evictions, hits and misses',
+                  lambda: pick(serving.specialists.stats(), ('hits', 'misses', 'loads', 'load_failures', 'evictions'))
+                  if serving is not None else None,
+                  labelnames=['event'], kind='counter')
+    metrics.gauge('cattle_report_jobs_total', 'PDF report requests by outcome',
+                  lambda: pick(report_service.stats(), ('submitted', 'cache_hits', 'shared', 'rendered', 'failed'))
+                  if report_service is not None else None, labelnames=['outcome'], kind='counter')
+    metrics.gauge('cattle_report_render_seconds_total', 'Time spent rendering PDF reports',
+                  lambda: report_service.stats()['render_seconds'] if report_service is not None else None,
+                  kind='counter')
+    metrics.gauge('cattle_auth_events_total', 'Logins, failed logins, password rehashes and user/session cache lookups',
+                  lambda: {key: value for key, value in user_store.stats().items()
+                           if isinstance(value, int) and not key.startswith('cached_')}
+                  if user_store is not None else None, labelnames=['event'], kind='counter')
+    metrics.gauge('cattle_embedding_events_total', 'Prediction embeddings queued, stored, dropped and searched',
+                  lambda: pick(embedding_index.stats(), ('queued', 'embedded', 'dropped', 'failed', 'searches'))
+                  if embedding_index is not None else None, labelnames=['event'], kind='counter')
+    metrics.gauge('cattle_image_store_events_total', 'Uploads stored, repeat uploads and stored model input lookups',
+                  lambda: pick(image_store.stats(), ('stored', 'duplicates', 'input_hits', 'input_misses'))
+                  if image_store is not None else None, labelnames=['event'], kind='counter')
+    metrics.gauge('cattle_admission_in_flight', 'Requests holding an admission slot',
+                  lambda: admission.stats()['in_flight'] if admission is not None else None)
+    metrics.gauge('cattle_admission_queue_depth', 'Requests waiting for an admission slot by class',
+                  lambda: admission.stats()['waiting'] if admission is not None else None, labelnames=['class'])
+    metrics.gauge('cattle_admission_requests_total', 'Admission decisions: admitted, queued, and shed by reason',
+                  lambda: pick(admission.stats(), ('admitted', 'queued', 'rate_limited', 'queue_full', 'slo', 'timeout'))
+                  if admission is not None else None, labelnames=['outcome'], kind='counter')
+    metrics.gauge('cattle_routing_decisions_total', 'Cascade routing decisions by outcome',
+                  lambda: {key: value for key, value in serving.routing_policy.stats().items() if key != 'rules'}
+                  if serving is not None else None, labelnames=['decision'], kind='counter')
+    metrics.gauge('cattle_model_reloads_total', 'Model hot-reloads and failed reload attempts',
+                  lambda: pick(model_reloader.stats(), ('reloads', 'failures')) if model_reloader is not None else None,
+                  labelnames=['event'], kind='counter')
+    metrics.gauge('cattle_shadow_comparisons_total', 'Predictions replayed through the shadow candidate by outcome',
+                  lambda: pick(shadow.stats(), ('compared', 'agree_all', 'dropped', 'failed'))
+                  if shadow is not None else None, labelnames=['outcome'], kind='counter')
+    metrics.gauge('cattle_shadow_seconds_total', 'Inference time of the compared predictions, serving vs candidate',
+                  lambda: {'serving': shadow.stats()['primary_seconds'], 'candidate': shadow.stats()['candidate_seconds']}
+                  if shadow is not None else None, labelnames=['model'], kind='counter')
+
+def pick(stats, keys):
+    return {key: stats[key] for key in keys}
+
+def model_memory():
+    if serving is None:
+        return {}
+    memory = {key: entry['bytes'] for key, entry in serving.specialists.stats()['resident'].items()}
+    if serving.master_model is not None:
+        memory['master'] = model_memory_bytes(serving.master_model)
+    return memory
+
+register_metric_sources()
 
 # Routes
+@app.before_request
+def ensure_startup():
+    start_background_loading()
+    if metrics.enabled:
+        g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    if metrics.enabled and 'request_started' in g:
+        endpoint = request.endpoint or 'unmatched'
+        REQUEST_SECONDS.observe(time.perf_counter() - g.request_started, endpoint)
+        RESPONSES.inc(endpoint, str(response.status_code))
+    return response
+
+@app.route('/metrics')
+def metrics_endpoint():
+    if not metrics.enabled:
+        return jsonify({'error': 'Metrics are disabled'}), 404
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/healthz')
+def healthz():
+    """Liveness: the web process is up and answering"""
+    return jsonify({'status': 'ok'})
+
+@app.route('/readyz')
+def readyz():
+    """Readiness: 200 once models are loaded and warmed, 503 with startup progress until then"""
+    return jsonify(startup.status()), 200 if startup.ready else 503
+
 @app.route('/')
 def home():
     return render_template('home.html')
@@ -528,11 +1309,18 @@ def login():
         email = request.form.get('email')
         password = request.form.get('password')
         
-        user = USERS_DB.get(email)
-        if user and check_password_hash(user['password'], password):
+        store = get_user_store()
+        try:
+            user = store.authenticate(email, password or '', timeout=app.config['AUTH_TIMEOUT'])
+        except FuturesTimeout:
+            flash('Too many logins right now, please try again shortly', 'warning')
+            return render_template('login.html'), 503, {'Retry-After': '5'}
+        if user:
+            session.clear()
+            session['session_id'] = store.create_session(email)
             session['user_email'] = email
             session['user_name'] = user['name']
-            session['user_role'] = user.get('role', 'user')
+            session['user_role'] = user['role']
             flash('Login successful!', 'success')
             return redirect(url_for('dashboard'))
         else:
@@ -547,14 +1335,12 @@ def register():
         password = request.form.get('password')
         name = request.form.get('name')
         
-        if email in USERS_DB:
+        store = get_user_store()
+        if not valid_email(email):
+            flash('Please enter a valid email address', 'danger')
+        elif store.user(email) is not None or not store.register(email, password, name):
             flash('Email already registered', 'warning')
         else:
-            USERS_DB[email] = {
-                'password': generate_password_hash(password),
-                'name': name,
-                'role': 'user'
-            }
             flash('Registration successful! Please login.', 'success')
             return redirect(url_for('login'))
     
@@ -562,6 +1348,8 @@ def register():
 
 @app.route('/logout')
 def logout():
+    if session.get('session_id'):
+        get_user_store().end_session(session['session_id'])
     session.clear()
     flash('Logged out successfully', 'info')
     return redirect(url_for('home'))
@@ -569,8 +1357,17 @@ def logout():
 @app.route('/dashboard')
 @login_required
 def dashboard():
-    user_predictions = [p for p in PREDICTIONS_LOG if p['user_email'] == session['user_email']]
-    return render_template('dashboard.html', predictions=user_predictions[-10:])
+    store = get_prediction_store()
+    limit = app.config['DASHBOARD_PAGE_SIZE']
+    predictions = store.recent_for_user(session['user_email'], limit=limit, before=page_cursor())
+    summary = store.user_summary(session['user_email'])
+    return render_template('dashboard.html', predictions=predictions, total=summary['total'], summary=summary,
+                           next_cursor=next_cursor(predictions, limit))
+
+@app.route('/dashboard/summary')
+@login_required
+def dashboard_summary():
+    return jsonify(get_prediction_store().user_summary(session['user_email']))
 
 @app.route('/detect')
 @login_required
@@ -581,8 +1378,8 @@ def detect():
 @login_required
 def predict():
     try:
-        if master_model is None:
-            return jsonify({'error': 'System not ready'}), 500
+        if not models_ready():
+            return not_ready_response()
         
         if 'file' not in request.files:
             return jsonify({'error': 'No file uploaded'}), 400
@@ -590,43 +1387,210 @@ def predict():
         file = request.files['file']
         if file.filename == '':
             return jsonify({'error': 'No file selected'}), 400
+        full = full_medical_info(request.args.get('medical_info'))
+        if full is None:
+            return jsonify({'error': MEDICAL_INFO_ERROR}), 400
         
-        image = Image.open(file.stream)
-        
-        buffered = io.BytesIO()
-        image.save(buffered, format="JPEG")
-        img_str = base64.b64encode(buffered.getvalue()).decode()
-        
-        result = predict_with_master(image)
-        
-        if not result['success']:
-            return jsonify(result), 400
-        
-        result['image'] = f"data:image/jpeg;base64,{img_str}"
-        result['confidence_percent'] = f"{(result['confidence'] * 100):.2f}%"
-        result['timestamp'] = datetime.now().isoformat()
-        
-        # Log prediction
-        log_entry = {
-            'user_email': session['user_email'],
-            'user_name': session['user_name'],
-            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'body_part': result['body_part'],
-            'diagnosis': result['predicted_class'],
-            'confidence': result['confidence']
-        }
-        PREDICTIONS_LOG.append(log_entry)
+        check_rate(session['user_email'])
+        with admitted(current_user()['role']):
+            key, image = read_upload(file.stream)
+            result = predict_upload(key, image)
+            
+            if not result['success']:
+                return jsonify(result), 400
+            
+            finish_prediction(result, file.stream, key, image, session['user_email'], session['user_name'])
         
-        return jsonify(result)
+        with STAGE_SECONDS.time('serialize'):
+            return Response(knowledge_base.dumps(result, full), mimetype='application/json')
+    except Rejected as e:
+        return rejected_response(e)
+    except queue.Full:
+        return jsonify({'error': 'Server busy, please retry shortly'}), 503
     except Exception as e:
         logger.error(f"Error: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+def full_medical_info(mode):
+    """Whether results embed their medical info for a ?medical_info= value (default PREDICT_MEDICAL_INFO), None if unknown"""
+    mode = mode or app.config['PREDICT_MEDICAL_INFO']
+    return mode == 'full' if mode in MEDICAL_INFO_MODES else None
+
+def read_upload(stream):
+    """Content key and decoded image of a /predict upload (the stored model input if it was uploaded before)"""
+    with STAGE_SECONDS.time('hash'):
+        key = stream_content_key(stream)
+    store = get_image_store()
+    # TTA crops and rescales the full image, so it still needs the decode
+    if store is not None and tta is None:
+        with STAGE_SECONDS.time('stored_input'):
+            image = store.model_input(digest_of(key))
+        if image is not None:
+            return key, image
+    with STAGE_SECONDS.time('decode'):
+        image = decode_upload(stream)
+    return key, image
+
+def upload_preview_source(stream, image):
+    """What previews and stored thumbnails are cut from; never changes the model input"""
+    store = get_image_store()
+    preview_size = max((app.config['UPLOAD_PREVIEW_SIZE'],) + (store.thumbnail_sizes if store is not None else ()))
+    return preview_source(stream, image, preview_size)
+
+def finish_prediction(result, stream, key, image, user_email, user_name):
+    """Add the preview and per-request fields to a successful /predict result and log it"""
+    with STAGE_SECONDS.time('decode'):
+        source = upload_preview_source(stream, image)
+    with STAGE_SECONDS.time('store_image'):
+        digest = store_upload(stream, key, image, source)
+    if digest is not None:
+        result['image_key'] = digest
+    with STAGE_SECONDS.time('encode_preview'):
+        preview = upload_preview(stream, key, source, digest)
+    if preview is not None:
+        result['image'] = preview
+        if digest is None and app.config['UPLOAD_PREVIEW'] == 'url':
+            # Recorded with the prediction so /uploads can tell whose original it is
+            result['image_key'] = digest_of(key)
+    result['confidence_percent'] = f"{(result['confidence'] * 100):.2f}%"
+    result['timestamp'] = datetime.now().isoformat()
+    result['prediction_id'] = uuid.uuid4().hex
+    
+    with STAGE_SECONDS.time('history'):
+        log_prediction(result, user_email, user_name)
+    record_embedding(result, image)
+    return result
+
+def store_upload(stream, key, image, preview=None):
+    """Digest of the upload once it is in the image store; None when the store is off or the write failed"""
+    if get_image_store() is None:
+        return None
+    try:
+        return image_store.put(key, stream, image, preview)
+    except OSError as e:
+        logger.warning(f"⚠️ Could not store upload {key}: {e}")
+        return None
+
+def upload_preview(stream, key, image, digest=None):
+    if app.config['UPLOAD_PREVIEW'] == 'thumbnail':
+        if digest is not None:
+            preview = image_store.thumbnail_data_url(digest, app.config['UPLOAD_PREVIEW_SIZE'])
+            if preview is not None:
+                return preview
+        return thumbnail_data_url(image, app.config['UPLOAD_PREVIEW_SIZE'])
+    if app.config['UPLOAD_PREVIEW'] == 'url':
+        name = image_store.original_name(digest) if digest is not None else None
+        if name is None:
+            name = save_upload(stream, app.config['UPLOAD_FOLDER'], key, image.format)
+        return url_for('uploaded_image', filename=name)
+    return None
+
+@app.template_global()
+def stored_thumbnail(image_key):
+    """``{format: url}`` of the smallest stored thumbnail of an image, for <picture> sources in history tables"""
+    if not image_key or get_image_store() is None:
+        return {}
+    return {extension: url_for('uploaded_image', filename=image_store.thumbnail_name(image_key, extension=extension))
+            for extension in image_store.formats}
+
+@app.route('/similar/<prediction_id>')
+@login_required
+def similar_predictions(prediction_id):
+    """Past predictions whose specialist embeddings are closest to this one's (?k=, ?status= to filter)"""
+    store = get_prediction_store()
+    record = store.get(prediction_id)
+    if record is None or (record['user_email'] != session['user_email'] and current_user().get('role') != 'admin'):
+        return jsonify({'error': 'Prediction not found'}), 404
+    if get_embedding_index() is None:
+        return jsonify({'error': 'Similar-case search is disabled'}), 404
+    k = max(1, min(request.args.get('k', 10, type=int), app.config['SIMILAR_MAX_RESULTS']))
+    status = request.args.get('status')
+    
+    with STAGE_SECONDS.time('similar'):
+        # Over-fetch when filtering so a page of matches usually survives it
+        found = embedding_index.similar(prediction_id, k * 4 if status else k)
+        if found is None:
+            return jsonify({'error': 'No embedding for this prediction yet'}), 404
+        index, neighbours = found
+        records = store.get_many([neighbour for neighbour, _ in neighbours])
+    
+    results = []
+    for neighbour, similarity in neighbours:
+        match = records.get(neighbour)
+        if match is None or (status and match['status'] != status):
+            continue
+        results.append({'prediction_id': neighbour, 'similarity': round(similarity, 4), 'body_part': match['body_part'],
+                        'diagnosis': match['diagnosis'], 'status': match['status'],
+                        'confidence': match['confidence'], 'timestamp': match['timestamp']})
+        if len(results) == k:
+            break
+    return jsonify({'prediction_id': prediction_id, 'body_part': record['body_part'], 'diagnosis': record['diagnosis'],
+                    'index': index.name, 'search': index.mode, 'results': results})
+
+@app.route('/uploads/<filename>')
+@login_required
+def uploaded_image(filename):
+    """A stored upload, thumbnail or model input, for admins and users with a prediction of that image"""
+    match = IMAGE_NAME.match(filename)
+    if match is None or (current_user().get('role') != 'admin' and
+                         not get_prediction_store().has_image(match.group(1), session['user_email'])):
+        return jsonify({'error': 'Image not found'}), 404
+    # Content-addressed names never change meaning, so browsers may cache them for good
+    path = get_image_store().path(filename) if get_image_store() is not None else None
+    if path is None:
+        return send_from_directory(os.path.abspath(app.config['UPLOAD_FOLDER']), filename, max_age=365 * 24 * 3600)
+    response = send_file(os.path.abspath(path), max_age=365 * 24 * 3600)
+    # Behind the login, so only the user's browser keeps a copy, but it never needs to revalidate
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.immutable = True
+    return response
+
+@app.route('/knowledge')
+def knowledge_index():
+    """Name, severity and ETag of every knowledge base entry"""
+    return knowledge_response(*knowledge_base.index)
+
+@app.route('/knowledge/<disease_key>')
+def knowledge_entry(disease_key):
+    if disease_key not in knowledge_base:
+        return jsonify({'error': 'Unknown disease'}), 404
+    return knowledge_response(*knowledge_base.serialized(disease_key))
+
+def knowledge_response(body, etag):
+    # Pre-serialized bytes; browsers revalidate with If-None-Match after KNOWLEDGE_MAX_AGE and get a 304
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = app.config['KNOWLEDGE_MAX_AGE']
+    return response.make_conditional(request)
+
+@app.route('/predict_batch', methods=['POST'])
+@login_required
+def predict_batch():
+    """Herd screening: many images (or .zip archives) in one multipart request, streamed back as NDJSON"""
+    if not models_ready():
+        return not_ready_response()
+    
+    files = [f for f in request.files.getlist('files') + request.files.getlist('file') if f.filename]
+    if not files:
+        return jsonify({'error': 'No files uploaded'}), 400
+    full = full_medical_info(request.args.get('medical_info'))
+    if full is None:
+        return jsonify({'error': MEDICAL_INFO_ERROR}), 400
+    try:
+        check_rate(session['user_email'])
+    except Rejected as e:
+        return rejected_response(e)
+    
+    lines = predict_herd(files, session['user_email'], session['user_name'], full)
+    return Response(stream_with_context(lines), mimetype='application/x-ndjson')
+
 @app.route('/download_report', methods=['POST'])
 @login_required
 def download_report():
     try:
-        data = request.json
+        data = report_input(request.json)
         user_info = {'name': session['user_name'], 'email': session['user_email']}
         
         pdf_buffer = generate_pdf_report(data, user_info)
@@ -640,6 +1604,41 @@ def download_report():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/reports', methods=['POST'])
+@login_required
+def create_report():
+    data = request.get_json(silent=True)
+    if not data or any(field not in data for field in ('body_part', 'predicted_class', 'confidence', 'status')):
+        return jsonify({'error': 'Prediction result required'}), 400
+    data = report_input(data)
+    job = get_report_service().submit(data, session['user_name'], session['user_email'], data.get('prediction_id'))
+    return jsonify(report_job_json(job)), 202
+
+@app.route('/reports/<job_id>')
+@login_required
+def report_status(job_id):
+    job = get_report_service().job(job_id, owner=session['user_email'])
+    if job is None:
+        return jsonify({'error': 'Unknown report'}), 404
+    return jsonify(report_job_json(job))
+
+@app.route('/reports/<job_id>/download')
+@login_required
+def report_download(job_id):
+    job = get_report_service().job(job_id, owner=session['user_email'])
+    if job is None:
+        return jsonify({'error': 'Unknown report'}), 404
+    if job.status == 'pending':
+        return jsonify(report_job_json(job)), 202
+    if job.status == 'failed':
+        return jsonify(report_job_json(job)), 500
+    return send_file(
+        io.BytesIO(job.result()),
+        as_attachment=True,
+        download_name=f'cattle_report_{datetime.fromtimestamp(job.created).strftime("%Y%m%d_%H%M%S")}.pdf',
+        mimetype='application/pdf'
+    )
+
 @app.route('/about')
 def about():
     return render_template('about.html')
@@ -651,7 +1650,137 @@ def contact():
 @app.route('/admin')
 @admin_required
 def admin_panel():
-    return render_template('admin.html', predictions=PREDICTIONS_LOG[-50:], users=USERS_DB)
+    store = get_prediction_store()
+    limit = app.config['ADMIN_PAGE_SIZE']
+    predictions = store.recent(limit=limit, before=page_cursor())
+    activity = store.users_page(limit=limit, after=request.args.get('users_after'))
+    users = get_user_store()
+    analytics = store.summary(days=app.config['ANALYTICS_DAYS'])
+    return render_template('admin.html', predictions=predictions, total=analytics['total'], analytics=analytics,
+                           users=users.users(limit), user_total=users.count(), activity=activity,
+                           next_cursor=next_cursor(predictions, limit),
+                           next_users_cursor=next_cursor(activity, limit, key='user_email'), roles=ROLES)
+
+@app.route('/admin/users/role', methods=['POST'])
+@admin_required
+def admin_set_role():
+    """Give a user the 'user', 'vet' or 'admin' role; applies everywhere within USER_CACHE_TTL"""
+    email, role = request.form.get('email'), request.form.get('role')
+    if email == session.get('user_email'):
+        flash('You cannot change your own role', 'warning')
+    elif role not in ROLES:
+        flash(f'Unknown role: {role}', 'danger')
+    elif get_user_store().set_role(email, role):
+        flash(f'{email} is now {role}', 'success')
+    else:
+        flash(f'No user {email}', 'warning')
+    return redirect(url_for('admin_panel'))
+
+@app.route('/admin/analytics')
+@admin_required
+def admin_analytics():
+    until = request.args.get('until')
+    try:
+        return jsonify(get_prediction_store().summary(days=analytics_days(), until=until))
+    except ValueError:
+        return jsonify({'error': 'until must be YYYY-MM-DD'}), 400
+
+@app.route('/admin/analytics/daily')
+@admin_required
+def admin_analytics_daily():
+    try:
+        filters = analytics_filters('body_part', 'diagnosis', 'status')
+    except ValueError:
+        return jsonify({'error': 'since and until must be YYYY-MM-DD'}), 400
+    return jsonify({'filters': filters, 'days': get_prediction_store().daily(**filters)})
+
+@app.route('/admin/analytics/confidence')
+@admin_required
+def admin_analytics_confidence():
+    try:
+        filters = analytics_filters('body_part', 'status')
+    except ValueError:
+        return jsonify({'error': 'since and until must be YYYY-MM-DD'}), 400
+    counts = get_prediction_store().confidence_histogram(**filters)
+    return jsonify({'filters': filters, 'bucket_width': 1 / len(counts), 'counts': counts})
+
+@app.route('/admin/analytics/users')
+@admin_required
+def admin_analytics_users():
+    limit = page_limit(app.config['ADMIN_PAGE_SIZE'])
+    page = get_prediction_store().users_page(limit=limit, after=request.args.get('after'))
+    return jsonify({'users': page, 'next': next_cursor(page, limit, key='user_email')})
+
+@app.route('/admin/analytics/predictions')
+@admin_required
+def admin_analytics_predictions():
+    """Newest-first predictions, optionally filtered; ?before= takes the previous response's next"""
+    limit = page_limit(app.config['ADMIN_PAGE_SIZE'])
+    filters = {name: request.args.get(name) or None for name in ('body_part', 'diagnosis', 'status', 'user_email')}
+    page = get_prediction_store().filter(limit=limit, before=page_cursor(), **filters)
+    return jsonify({'predictions': page, 'next': next_cursor(page, limit)})
+
+@app.route('/admin/models')
+@admin_required
+def admin_models():
+    models = serving
+    return jsonify({
+        'serving': dict(models.describe(), registry=models.specialists.stats()) if models is not None else None,
+        'reloader': model_reloader.stats() if model_reloader is not None else None,
+        'shadow': dict(shadow.stats(), reloader=shadow_reloader.stats()) if shadow is not None else None
+    })
+
+@app.route('/admin/models/reload', methods=['POST'])
+@admin_required
+def admin_models_reload():
+    """Load the model files again now (e.g. after a failed reload or with MODEL_RELOAD_INTERVAL=0)"""
+    if model_reloader is None:
+        return jsonify({'error': 'Models are still loading'}), 503
+    model_reloader.reload()
+    return jsonify({'serving': serving.version, 'reloader': model_reloader.stats()}), 202
+
+@app.route('/admin/routing')
+@admin_required
+def admin_routing():
+    # With INFERENCE_SERVER set the decisions are made (and counted) in the server's workers
+    return jsonify(serving.routing_policy.stats() if serving is not None else {})
+
+@app.route('/admin/cache')
+@admin_required
+def admin_cache():
+    return jsonify(prediction_cache.stats() if prediction_cache is not None else {'enabled': False})
+
+@app.route('/admin/inference')
+@admin_required
+def admin_inference():
+    if inference_client is None:
+        return jsonify({'inference_server': None,
+                        'batcher': inference_batcher.stats() if inference_batcher is not None else None})
+    return jsonify({'inference_server': app.config['INFERENCE_SERVER'], 'client': inference_client.stats(),
+                    'server': inference_client.server_stats()})
+
+@app.route('/admin/embeddings')
+@admin_required
+def admin_embeddings():
+    index = get_embedding_index()
+    return jsonify(index.stats() if index is not None else {'enabled': False})
+
+@app.route('/admin/reports')
+@admin_required
+def admin_reports():
+    return jsonify(get_report_service().stats())
+
+@app.route('/admin/images')
+@admin_required
+def admin_images():
+    return jsonify(image_store.stats() if get_image_store() is not None else {'enabled': False})
+
+@app.route('/admin/admission')
+@admin_required
+def admin_admission():
+    return jsonify(admission.stats() if admission is not None else {'enabled': False})
+
+startup.record('imports', time.perf_counter() - _import_started)
 
 if __name__ == '__main__':
     os.makedirs('models', exist_ok=True)
@@ -663,10 +1792,9 @@ if __name__ == '__main__':
     print("🐄 CATTLE DISEASE DETECTION SYSTEM v3.0")
     print("="*60)
     
-    load_master_model()
-    load_specialist_models()
+    start_background_loading()
     
-    print("\n✅ System Ready!")
+    print("\n🔄 Models are loading in the background (GET /readyz for progress)")
     print("📍 http://localhost:5000")
     print("="*60)
     
@@ -0,0 +1,308 @@
+"""Asyncio (ASGI) entry point: /predict and /download_report without a blocked worker thread per request.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+
+The event loop reads uploads off the socket (python-multipart spools large
+files to disk), so slow mobile uploads cost no thread. Hashing, decoding,
+inference and the preview run in a pool of ASGI_MAX_CONCURRENCY threads
+once admission control lets the request in (the wait for it costs no
+thread either); PDF reports are awaited on the report service's future.
+When the client disconnects, the request stops at the next stage boundary
+and is logged with status 499. Every other route is the Flask app mounted as WSGI, so
+pages, login and sessions are shared with it.
+"""
+import asyncio
+import logging
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from datetime import datetime
+from functools import wraps
+
+from a2wsgi import WSGIMiddleware
+from itsdangerous import BadSignature
+from starlette.applications import Starlette
+from starlette.requests import ClientDisconnect, Request
+from starlette.responses import JSONResponse, RedirectResponse, Response
+from starlette.routing import Mount, Route
+
+import app as cattle_app
+from admission import Rejected
+from app import REQUEST_SECONDS, RESPONSES, STAGE_SECONDS, metrics, startup
+
+logger = logging.getLogger(__name__)
+
+flask_app = cattle_app.app
+
+# nginx's status for requests the client abandoned before the response
+CLIENT_CLOSED = 499
+
+
+class ClientDisconnected(Exception):
+    pass
+
+
+class Busy(Exception):
+    pass
+
+
+class BodyTooLarge(Exception):
+    pass
+
+
+def limit_body(request, max_bytes):
+    """The request, reading its body through a receive channel that raises BodyTooLarge past ``max_bytes``.
+
+    Content-Length is only a hint (chunked uploads have none); this counts
+    what actually arrives, before the multipart parser spools any of it.
+    """
+    received = 0
+
+    async def receive():
+        nonlocal received
+        message = await request.receive()
+        if message['type'] == 'http.request':
+            received += len(message.get('body', b''))
+            if received > max_bytes:
+                raise BodyTooLarge()
+        return message
+
+    return Request(request.scope, receive)
+
+
+async def wait_for_disconnect(request):
+    """Returns once the client has gone away; only call after the body has been read"""
+    while True:
+        message = await request.receive()
+        if message['type'] == 'http.disconnect':
+            return
+
+
+async def unless_disconnected(awaitable, disconnected):
+    task = asyncio.ensure_future(awaitable)
+    await asyncio.wait({task, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+    if not task.done():
+        task.cancel()
+        raise ClientDisconnected()
+    return task.result()
+
+
+class Offloader:
+    """Runs blocking stages in a thread pool, at most ``max_concurrency`` at once.
+
+    A stage whose client disconnects is abandoned, but keeps its slot until
+    its thread finishes, so the bound holds. With ``max_waiting`` stages
+    already queued for a slot, ``run`` raises Busy instead of queueing.
+    """
+
+    def __init__(self, max_concurrency=4, max_waiting=64):
+        self.max_concurrency = max_concurrency
+        self.max_waiting = max_waiting
+        self.executor = ThreadPoolExecutor(max_concurrency, thread_name_prefix='asgi-offload')
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._waiting = 0
+        self._stats = {'stages': 0, 'rejected': 0, 'cancelled': 0}
+
+    async def run(self, disconnected, fn, *args):
+        if self._waiting >= self.max_waiting:
+            self._stats['rejected'] += 1
+            raise Busy()
+        self._waiting += 1
+        try:
+            await unless_disconnected(self._slots.acquire(), disconnected)
+        except ClientDisconnected:
+            self._stats['cancelled'] += 1
+            raise
+        finally:
+            self._waiting -= 1
+
+        self._stats['stages'] += 1
+        work = asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        work.add_done_callback(lambda _: self._slots.release())
+        try:
+            return await unless_disconnected(asyncio.shield(work), disconnected)
+        except ClientDisconnected:
+            self._stats['cancelled'] += 1
+            raise
+
+    def stats(self):
+        return {**self._stats, 'waiting': self._waiting, 'max_concurrency': self.max_concurrency,
+                'max_waiting': self.max_waiting}
+
+
+offloader = Offloader(flask_app.config['ASGI_MAX_CONCURRENCY'], flask_app.config['ASGI_QUEUE_SIZE'])
+
+
+def session_user(request):
+    """The Flask session of a logged-in user (read from its signed cookie) if the session is still live, or None"""
+    cookie = request.cookies.get(flask_app.config['SESSION_COOKIE_NAME'])
+    if not cookie:
+        return None
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    try:
+        session = serializer.loads(cookie, max_age=int(flask_app.permanent_session_lifetime.total_seconds()))
+    except BadSignature:
+        return None
+    user = cattle_app.get_user_store().session_user(session.get('session_id'))
+    if user is None:
+        return None
+    # The stored role, so a role an admin changed since login applies without signing in again
+    session['user_role'] = user['role']
+    return session
+
+
+def error(message, status_code, headers=None):
+    return JSONResponse({'error': message}, status_code=status_code, headers=headers)
+
+
+def not_ready_response():
+    message = 'Models failed to load' if startup.state == 'failed' else 'Models are still loading, please retry shortly'
+    return JSONResponse({'error': message, 'startup': startup.status()}, status_code=503,
+                        headers={'Retry-After': '5'})
+
+
+def endpoint(name):
+    """Login check plus the request histogram and response counter the Flask routes get from their hooks"""
+    def decorator(handler):
+        @wraps(handler)
+        async def wrapper(request):
+            started = time.perf_counter()
+            user = session_user(request)
+            if user is None:
+                response = RedirectResponse('/login', status_code=302)
+            else:
+                response = await handler(limit_body(request, flask_app.config['MAX_CONTENT_LENGTH']), user)
+            if metrics.enabled:
+                REQUEST_SECONDS.observe(time.perf_counter() - started, name)
+                RESPONSES.inc(name, str(response.status_code))
+            return response
+        return wrapper
+    return decorator
+
+
+def finish_prediction(result, stream, key, image, user, base_url):
+    # url_for (UPLOAD_PREVIEW=url) needs a Flask request context
+    with flask_app.test_request_context(base_url=base_url):
+        return cattle_app.finish_prediction(result, stream, key, image, user['user_email'], user['user_name'])
+
+
+@endpoint('predict')
+async def predict(request, user):
+    if not cattle_app.models_ready():
+        return not_ready_response()
+    if int(request.headers.get('content-length') or 0) > flask_app.config['MAX_CONTENT_LENGTH']:
+        return error('Upload too large', 413)
+    full = cattle_app.full_medical_info(request.query_params.get('medical_info'))
+    if full is None:
+        return error(cattle_app.MEDICAL_INFO_ERROR, 400)
+
+    try:
+        with STAGE_SECONDS.time('read'):
+            form = await request.form(max_files=1, max_fields=16)
+    except ClientDisconnect:
+        return Response(status_code=CLIENT_CLOSED)
+    except BodyTooLarge:
+        return error('Upload too large', 413)
+    file = form.get('file')
+    if file is None or isinstance(file, str):
+        await form.close()
+        return error('No file uploaded', 400)
+    if not file.filename:
+        await form.close()
+        return error('No file selected', 400)
+
+    disconnected = asyncio.ensure_future(wait_for_disconnect(request))
+    ticket = None
+    try:
+        ticket = await admit(user)
+        key, image = await offloader.run(disconnected, cattle_app.read_upload, file.file)
+        result = await offloader.run(disconnected, cattle_app.predict_upload, key, image)
+        if not result['success']:
+            return JSONResponse(result, status_code=400)
+        await offloader.run(disconnected, finish_prediction, result, file.file, key, image, user,
+                            str(request.base_url))
+        with STAGE_SECONDS.time('serialize'):
+            return Response(cattle_app.knowledge_base.dumps(result, full), media_type='application/json')
+    except ClientDisconnected:
+        return Response(status_code=CLIENT_CLOSED)
+    except Rejected as e:
+        message, status_code = cattle_app.rejected_error(e)
+        return error(message, status_code, {'Retry-After': str(e.retry_after)})
+    except (Busy, queue.Full):
+        return error('Server busy, please retry shortly', 503, {'Retry-After': '1'})
+    except Exception as e:
+        logger.error(f"Error: {str(e)}")
+        return error(str(e), 500)
+    finally:
+        if ticket is not None:
+            cattle_app.admission.release(ticket)
+        disconnected.cancel()
+        await form.close()
+
+
+async def admit(user):
+    """The user's admission ticket for /predict, awaited without holding a thread (None with admission off)"""
+    if cattle_app.admission is None:
+        return None
+    cattle_app.admission.check_rate(user['user_email'])
+    with STAGE_SECONDS.time('admission'):
+        return await cattle_app.admission.acquire_async(user.get('user_role', 'user'))
+
+
+@endpoint('download_report')
+async def download_report(request, user):
+    disconnected = None
+    try:
+        data = cattle_app.report_input(await request.json())
+        with STAGE_SECONDS.time('report_submit'):
+            job = cattle_app.get_report_service().submit(data, user['user_name'], user['user_email'],
+                                                         data.get('prediction_id'))
+        with STAGE_SECONDS.time('report_render'):
+            if job.pdf is not None:
+                pdf = job.pdf
+            else:
+                # Shielded: other requests may share the render, so leaving must not cancel it
+                disconnected = asyncio.ensure_future(wait_for_disconnect(request))
+                render = asyncio.wait_for(asyncio.shield(asyncio.wrap_future(job.future)),
+                                          flask_app.config['REPORT_WAIT_SECONDS'])
+                pdf = await unless_disconnected(render, disconnected)
+        filename = f'cattle_report_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf'
+        return Response(pdf, media_type='application/pdf',
+                        headers={'Content-Disposition': f'attachment; filename={filename}'})
+    except (ClientDisconnect, ClientDisconnected):
+        return Response(status_code=CLIENT_CLOSED)
+    except BodyTooLarge:
+        return error('Request too large', 413)
+    except Exception as e:
+        return error(str(e) or type(e).__name__, 500)
+    finally:
+        if disconnected is not None:
+            disconnected.cancel()
+
+
+async def asgi_stats(request):
+    user = session_user(request)
+    if user is None or user.get('user_role') != 'admin':
+        return RedirectResponse('/login', status_code=302)
+    return JSONResponse(offloader.stats())
+
+
+@asynccontextmanager
+async def lifespan(_):
+    cattle_app.start_background_loading()
+    yield
+    offloader.executor.shutdown(wait=False)
+
+
+metrics.gauge('cattle_asgi_stages_total', 'Blocking /predict stages run by the ASGI offloader by outcome',
+              lambda: {key: offloader.stats()[key] for key in ('stages', 'rejected', 'cancelled')},
+              labelnames=['outcome'], kind='counter')
+metrics.gauge('cattle_asgi_waiting', 'ASGI /predict stages waiting for a thread', lambda: offloader.stats()['waiting'])
+
+app = Starlette(routes=[
+    Route('/predict', predict, methods=['POST']),
+    Route('/download_report', download_report, methods=['POST']),
+    Route('/admin/asgi', asgi_stats),
+    Mount('/', WSGIMiddleware(flask_app)),
+], lifespan=lifespan)
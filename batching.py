@@ -0,0 +1,193 @@
+"""Micro-batching scheduler for the two-stage master/specialist cascade"""
+import logging
+import queue
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class Routed(namedtuple('Routed', 'body_part row')):
+    """Specialist row for a body part other than the master's top class (picked by top-2 routing)"""
+
+
+def route_groups(master_out, route):
+    """``{specialist key: [row indices]}`` plus ``{row index: keys}`` for rows routed to several specialists.
+
+    ``route(master_row)`` returns None (stop after stage one), a specialist
+    key, or a tuple of keys to run and then choose between with ``route.select``.
+    """
+    groups, multi = {}, {}
+    for i, row in enumerate(master_out):
+        keys = route(row)
+        if keys is None:
+            continue
+        if isinstance(keys, tuple):
+            multi[i] = keys
+        else:
+            keys = (keys,)
+        for key in keys:
+            groups.setdefault(key, []).append(i)
+    return groups, multi
+
+
+def run_groups(master_out, groups, multi, run_group, route):
+    """Run ``run_group(key, indices)`` once per specialist group; returns ``(specialist_rows, failures)``.
+
+    A row routed to several specialists fails only if all of them failed.
+    """
+    specialist_rows = [None] * len(master_out)
+    candidates = {i: {} for i in multi}
+    failures = {}
+    for key, indices in groups.items():
+        try:
+            out = np.asarray(run_group(key, indices))
+        except Exception as e:
+            logger.error(f"❌ Specialist '{key}' failed for batch of {len(indices)}: {e}")
+            for i in indices:
+                failures[i] = e
+            continue
+        for j, i in enumerate(indices):
+            if i in candidates:
+                candidates[i][key] = out[j]
+            else:
+                specialist_rows[i] = out[j]
+    for i, rows in candidates.items():
+        if rows:
+            specialist_rows[i] = route.select(master_out[i], rows)
+            failures.pop(i, None)
+    return specialist_rows, failures
+
+
+def run_two_stage(batch, master_predict, specialist_predict, route):
+    """Run the master over a whole batch, then each routed specialist once per body-part group.
+
+    Returns ``(master_out, specialist_rows, failures)`` where ``specialist_rows[i]``
+    is None for images the router stopped after stage one (a ``Routed`` when
+    the router chose between several specialists) and ``failures`` maps row
+    index to the exception raised by its specialist.
+    """
+    master_out = np.asarray(master_predict(batch))
+    groups, multi = route_groups(master_out, route)
+    specialist_rows, failures = run_groups(
+        master_out, groups, multi, lambda key, indices: specialist_predict(key, batch[indices]), route)
+    return master_out, specialist_rows, failures
+
+
+class InferenceBatcher:
+    """Gathers single-image requests into master batches on a background worker.
+
+    Callers ``submit`` one preprocessed (H, W, C) tensor and get a Future that
+    resolves to ``(master_row, specialist_row)``. The worker stacks up to
+    ``max_batch_size`` tensors (waiting at most ``max_wait_ms`` after the first
+    one arrives) and hands the batch to ``cascade``, a callable with the
+    ``run_two_stage`` contract, so each model runs once per batch. Anything
+    ``cascade`` returns after those three values (e.g. the model version that
+    ran the batch) is appended to every image's result.
+    """
+
+    def __init__(self, cascade, max_batch_size=16, max_wait_ms=5.0, max_queue_size=256):
+        self.cascade = cascade
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats = {'requests': 0, 'batches': 0, 'errors': 0}
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._worker, name='inference-batcher', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['avg_batch_size'] = stats['requests'] / stats['batches'] if stats['batches'] else 0.0
+        stats['queue_depth'] = self.queue_depth()
+        return stats
+
+    def submit(self, tensor):
+        """Queue one preprocessed image; raises queue.Full when the backlog is saturated"""
+        if not self.running:
+            raise RuntimeError('Inference batcher is not running')
+        future = Future()
+        self._queue.put_nowait((np.asarray(tensor, dtype=np.float32), future))
+        return future
+
+    def _worker(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            items = [item]
+            deadline = time.monotonic() + self.max_wait
+            while len(items) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    if remaining > 0:
+                        item = self._queue.get(timeout=remaining)
+                    else:
+                        item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                items.append(item)
+            try:
+                self._run_batch(items)
+            except Exception as e:
+                logger.error(f"❌ Batch failed: {e}")
+                for _, future in items:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _run_batch(self, items):
+        items = [(tensor, future) for tensor, future in items if future.set_running_or_notify_cancel()]
+        if not items:
+            return
+        futures = [future for _, future in items]
+        batch = np.stack([tensor for tensor, _ in items])
+
+        try:
+            master_out, specialist_rows, failures, *extra = self.cascade(batch)
+        except Exception as e:
+            self._count(len(futures), errors=len(futures))
+            for future in futures:
+                future.set_exception(e)
+            return
+
+        self._count(len(futures), errors=len(failures))
+        for i, future in enumerate(futures):
+            if i in failures:
+                future.set_exception(failures[i])
+            else:
+                future.set_result((master_out[i], specialist_rows[i], *extra))
+
+    def _count(self, requests, errors):
+        with self._lock:
+            self._stats['requests'] += requests
+            self._stats['batches'] += 1
+            self._stats['errors'] += errors
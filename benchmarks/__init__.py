@@ -0,0 +1 @@
+"""Performance benchmarks runnable without the real trained model files"""
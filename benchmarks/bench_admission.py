@@ -0,0 +1,117 @@
+"""Overload behaviour of admission control: tail latency and shed rate with and without it.
+
+    python -m benchmarks.bench_admission --capacity 16 --service-ms 50 --loads 0.5 1 2 3 --seconds 10
+
+A simulated inference service runs --capacity requests at a time, each
+sleeping for an exponentially distributed service time. Requests arrive
+open-loop (Poisson) at each --loads multiple of its capacity, so an
+overloaded server keeps receiving work as it would from real clients. The
+traffic is split between admin, user and bulk requests (--mix), and
+--heavy-share of the user requests come from one user. Without admission
+control every request waits for the service in arrival order. With it,
+requests go through ``AdmissionController.acquire_async`` (as in asgi.py)
+with the app's default priorities, bulk cap, queue SLO and per-user rate
+limit. For each class the table shows p50/p99 latency of the requests that
+were served, and the share shed with 503 or 429.
+"""
+import argparse
+import asyncio
+import time
+
+import numpy as np
+
+from admission import AdmissionController, Rejected
+from benchmarks.common import latency_summary
+
+PRIORITIES = {'admin': 0, 'vet': 0, 'user': 1, 'bulk': 2}
+
+
+def parse_mix(text):
+    mix = {klass: float(share) for klass, share in (item.split('=') for item in text.split(','))}
+    total = sum(mix.values())
+    return {klass: share / total for klass, share in mix.items()}
+
+
+async def run(load, controller, args, seed):
+    rng = np.random.default_rng(seed)
+    service = asyncio.Semaphore(args.capacity)
+    arrival_rate = load * args.capacity / (args.service_ms / 1000)
+    classes, shares = zip(*parse_mix(args.mix).items())
+    outcomes = []
+
+    async def request(klass, user, seconds):
+        started = time.perf_counter()
+        ticket = None
+        try:
+            if controller is not None:
+                controller.check_rate(user)
+                ticket = await controller.acquire_async(klass)
+            async with service:
+                await asyncio.sleep(seconds)
+            outcomes.append((klass, user, 'ok', time.perf_counter() - started))
+        except Rejected as e:
+            outcomes.append((klass, user, e.reason, time.perf_counter() - started))
+        finally:
+            if ticket is not None:
+                controller.release(ticket)
+
+    tasks = []
+    started = time.perf_counter()
+    arrival = started
+    while arrival < started + args.seconds:
+        arrival += rng.exponential(1 / arrival_rate)
+        await asyncio.sleep(max(0.0, arrival - time.perf_counter()))
+        klass = classes[rng.choice(len(classes), p=shares)]
+        user = ('heavy' if klass == 'user' and rng.random() < args.heavy_share
+                else f'{klass}{rng.integers(args.users)}')
+        seconds = rng.exponential(args.service_ms / 1000)
+        tasks.append(asyncio.ensure_future(request(klass, user, seconds)))
+    await asyncio.gather(*tasks)
+    return outcomes
+
+
+def report(load, label, outcomes):
+    for klass in sorted({outcome[0] for outcome in outcomes}, key=lambda klass: PRIORITIES.get(klass, 1)):
+        mine = [outcome for outcome in outcomes if outcome[0] == klass]
+        served = latency_summary([seconds for _, _, result, seconds in mine if result == 'ok'])
+        shed = [result for _, _, result, _ in mine if result != 'ok']
+        reasons = ', '.join(f"{reason} {shed.count(reason)}" for reason in sorted(set(shed)))
+        print(f"{load:5.1f}x  {label:<10}{klass:<7}{len(mine):7d}{served['p50_ms']:10.1f}ms{served['p99_ms']:10.1f}ms"
+              f"{len(shed) / len(mine):8.1%}  {reasons}")
+    heavy = [result for _, user, result, _ in outcomes if user == 'heavy']
+    if heavy and label == 'admission':
+        others = [result for klass, user, result, _ in outcomes if klass == 'user' and user != 'heavy']
+        print(f"{'':6}  {'':<10}{'':<7}{'':7}  heavy user: {heavy.count('rate_limited')}/{len(heavy)} rate limited, "
+              f"other users: {others.count('rate_limited')}/{len(others)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--capacity', type=int, default=16, help='requests the simulated service runs at once')
+    parser.add_argument('--service-ms', type=float, default=50, help='mean service time')
+    parser.add_argument('--loads', type=float, nargs='+', default=[0.5, 1, 2, 3], help='arrival rate / capacity')
+    parser.add_argument('--seconds', type=float, default=10, help='arrival period per run')
+    parser.add_argument('--mix', default='admin=0.1,user=0.8,bulk=0.1', help='class shares of the traffic')
+    parser.add_argument('--users', type=int, default=50, help='distinct users per class')
+    parser.add_argument('--heavy-share', type=float, default=0.3, help='share of user requests from one user')
+    parser.add_argument('--queue-size', type=int, default=64)
+    parser.add_argument('--slo-ms', type=float, default=500, help='queue wait SLO')
+    parser.add_argument('--bulk-concurrency', type=int, default=2)
+    parser.add_argument('--rate', type=float, default=20, help='requests/s per user (0 = no limit)')
+    parser.add_argument('--burst', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"capacity {args.capacity / (args.service_ms / 1000):.0f} requests/s "
+          f"({args.capacity} at a time, {args.service_ms:.0f}ms mean service)")
+    print(f"{'load':>6}  {'':<10}{'class':<7}{'sent':>7}{'p50':>12}{'p99':>12}{'shed':>8}  reasons")
+    for load in args.loads:
+        for label in ('none', 'admission'):
+            controller = None
+            if label == 'admission':
+                controller = AdmissionController(args.capacity, args.queue_size, args.slo_ms / 1000, PRIORITIES,
+                                                 {'bulk': args.bulk_concurrency}, args.rate, args.burst)
+            report(load, label, asyncio.run(run(load, controller, args, seed=int(load * 100))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""Admin statistics latency from the incremental rollups vs GROUP BY scans, up to millions of predictions.
+
+    python -m benchmarks.bench_analytics --sizes 100000 1000000 3000000 --per-day 2000
+
+Fills a temporary PredictionStore in steps with --per-day predictions a day,
+so history grows by days as it would in production. At each size it times
+what /admin shows: the all-time and --days window breakdowns, the confidence
+histogram, the first and a later page of users by activity and a filtered
+predictions page. Each is timed once from the rollups and once as the
+GROUP BY over the predictions table the page would need without them.
+Finally times the one-off backfill that builds the rollups for a database
+written before they existed.
+"""
+import argparse
+import os
+import tempfile
+from datetime import date, timedelta
+
+import numpy as np
+
+from benchmarks.bench_prediction_store import synthetic_entries
+from benchmarks.common import Timer, format_row, latency_summary
+from prediction_store import ALL_USERS, HISTOGRAM_BUCKETS, PredictionStore, next_cursor
+
+
+def time_query(fn, queries):
+    samples = []
+    for _ in range(queries):
+        with Timer() as t:
+            fn()
+        samples.append(t.elapsed)
+    return latency_summary(samples)
+
+
+def scan_summary(conn, since, until):
+    conn.execute('SELECT status, COUNT(*) FROM predictions GROUP BY status').fetchall()
+    conn.execute('SELECT body_part, diagnosis, status, COUNT(*), TOTAL(confidence) FROM predictions '
+                 'WHERE timestamp >= ? AND timestamp < ? GROUP BY 1, 2, 3', (since, until)).fetchall()
+    conn.execute('SELECT substr(timestamp, 1, 10), COUNT(*), TOTAL(confidence) FROM predictions '
+                 'WHERE timestamp >= ? AND timestamp < ? GROUP BY 1', (since, until)).fetchall()
+
+
+def scan_histogram(conn, since, until):
+    conn.execute(f'SELECT MAX(0, MIN(CAST(confidence * {HISTOGRAM_BUCKETS} AS INTEGER), {HISTOGRAM_BUCKETS - 1})), '
+                 f'COUNT(*) FROM predictions WHERE timestamp >= ? AND timestamp < ? GROUP BY 1',
+                 (since, until)).fetchall()
+
+
+def scan_users(conn, limit):
+    conn.execute('SELECT user_email, COUNT(*) AS total, MAX(timestamp) FROM predictions '
+                 'GROUP BY user_email ORDER BY total DESC, user_email LIMIT ?', (limit,)).fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100000, 1000000, 3000000])
+    parser.add_argument('--per-day', type=int, default=2000, help='synthetic predictions per day')
+    parser.add_argument('--days', type=int, default=30, help='window the breakdowns cover')
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('--scan-queries', type=int, default=5)
+    parser.add_argument('--limit', type=int, default=50)
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+    seconds_apart = 86400 / args.per_day
+
+    with tempfile.TemporaryDirectory(prefix='bench_analytics_') as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        store = PredictionStore(path)
+        conn = store._connection()
+        rows = 0
+        for size in sorted(args.sizes):
+            with Timer() as fill:
+                while rows < size:
+                    store.add_many(synthetic_entries(rows, min(50000, size - rows), args.users, rng, seconds_apart))
+                    rows += min(50000, size - rows)
+            last_day = conn.execute('SELECT MAX(day) FROM prediction_rollups').fetchone()[0]
+            until = date.fromisoformat(last_day)
+            since = (until - timedelta(days=args.days - 1)).isoformat()
+            scan_until = (until + timedelta(days=1)).isoformat()
+            db_mb = os.path.getsize(path) / 1e6
+            print(f"\n{rows} rows over {rows // args.per_day} days, {args.users} users "
+                  f"({db_mb:.0f}MB, filled in {fill.elapsed:.1f}s, {rows / fill.elapsed:,.0f} rows/s with rollups)")
+
+            first_page = store.users_page(limit=args.limit)
+            after = next_cursor(store.users_page(limit=args.limit, after=next_cursor(first_page, args.limit,
+                                                                                     'user_email')),
+                                args.limit, 'user_email')
+            timings = [
+                ('rollup summary', lambda: store.summary(days=args.days, until=last_day), args.queries),
+                ('scan summary', lambda: scan_summary(conn, since, scan_until), args.scan_queries),
+                ('rollup histogram', lambda: store.confidence_histogram(since, last_day), args.queries),
+                ('scan histogram', lambda: scan_histogram(conn, since, scan_until), args.scan_queries),
+                ('rollup users page 1', lambda: store.users_page(limit=args.limit), args.queries),
+                ('rollup users page 3', lambda: store.users_page(limit=args.limit, after=after), args.queries),
+                ('scan users page 1', lambda: scan_users(conn, args.limit), args.scan_queries),
+                ('filtered predictions page', lambda: store.filter(status='HEALTHY', limit=args.limit), args.queries),
+            ]
+            for label, fn, queries in timings:
+                print(format_row(label, time_query(fn, queries)))
+
+        store.flush()
+        conn.execute('DELETE FROM prediction_rollups')
+        with Timer() as backfill:
+            PredictionStore(path)
+        print(f"\nBackfilling rollups for {rows} existing rows took {backfill.elapsed:.1f}s "
+              f"(once, when a database from before the rollups is opened)")
+        assert store.count(ALL_USERS) == rows
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+"""Load test: the Flask ``app.run`` server vs ``uvicorn asgi:app`` at several ASGI_MAX_CONCURRENCY limits.
+
+    python -m benchmarks.bench_asgi --clients 16 --requests 200 --limits 1 4 16 --slow-clients 8
+
+Both servers run as subprocesses on the stand-in models in --workdir. Fast
+clients post /predict uploads back to back and are measured. --slow-clients
+upload at --slow-kbps alongside them, like phones on a farm connection, and
+are not measured. Reports throughput, p50/p95/p99 latency, non-200 responses
+and the server's peak thread count and RSS (each slow upload holds a Flask
+thread for its whole duration).
+"""
+import argparse
+import asyncio
+import io
+import itertools
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import httpx
+
+from benchmarks.bench_e2e import memory_bytes
+from benchmarks.common import latency_summary
+from benchmarks.standins import PHOTO_SIZES, synthetic_jpegs, write_model_dir
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FLASK_SERVER = "import app; app.start_background_loading(); app.app.run(host='127.0.0.1', port={port})"
+
+
+def start_server(kind, port, workdir, limit=None):
+    env = dict(os.environ, PYTHONPATH=REPO, PREDICTION_CACHE='0')
+    if kind == 'flask':
+        command = [sys.executable, '-c', FLASK_SERVER.format(port=port)]
+    else:
+        env['ASGI_MAX_CONCURRENCY'] = str(limit)
+        command = [sys.executable, '-m', 'uvicorn', 'asgi:app', '--port', str(port), '--log-level', 'warning']
+    return subprocess.Popen(command, cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_ready(base_url, timeout=300):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f'{base_url}/readyz').status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f'{base_url} did not become ready')
+
+
+class ProcessSampler:
+    """Peak thread count and RSS of a server process"""
+
+    def __init__(self, pid, interval=0.05):
+        self.pid = pid
+        self.interval = interval
+        self.peak_threads = 0
+        self.peak_rss = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak_threads = max(self.peak_threads, memory_bytes(self.pid, field='Threads:') // 1024)
+            self.peak_rss = max(self.peak_rss, memory_bytes(self.pid))
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+
+def encoded_upload(base_url, image):
+    """Multipart body and headers for one /predict upload"""
+    request = httpx.Request('POST', f'{base_url}/predict', files={'file': ('cow.jpg', io.BytesIO(image))})
+    return request.read(), {k: v for k, v in request.headers.items() if k.lower() in ('content-type', 'content-length')}
+
+
+async def slow_body(body, kbps, chunk_size=16 * 1024):
+    for start in range(0, len(body), chunk_size):
+        yield body[start:start + chunk_size]
+        await asyncio.sleep(chunk_size / (kbps * 1024))
+
+
+async def run_load(base_url, uploads, clients, requests, slow_clients, slow_kbps):
+    async with httpx.AsyncClient(base_url=base_url, timeout=120,
+                                 limits=httpx.Limits(max_connections=clients + slow_clients)) as client:
+        await client.post('/login', data={'email': 'admin@cattle.com', 'password': 'admin123'})
+        counter = itertools.count()
+        latencies, codes = [], {}
+        stop = asyncio.Event()
+
+        async def fast():
+            while next(counter) < requests:
+                body, headers = uploads[len(latencies) % len(uploads)]
+                start = time.perf_counter()
+                try:
+                    status = (await client.post('/predict', content=body, headers=headers)).status_code
+                except httpx.HTTPError:
+                    status = 'error'
+                codes[status] = codes.get(status, 0) + 1
+                if status == 200:
+                    latencies.append(time.perf_counter() - start)
+
+        async def slow():
+            while not stop.is_set():
+                body, headers = uploads[0]
+                try:
+                    await client.post('/predict', content=slow_body(body, slow_kbps), headers=headers)
+                except httpx.HTTPError:
+                    pass
+
+        background = [asyncio.create_task(slow()) for _ in range(slow_clients)]
+        start = time.perf_counter()
+        await asyncio.gather(*(fast() for _ in range(clients)))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        for task in background:
+            task.cancel()
+        await asyncio.gather(*background, return_exceptions=True)
+    return latencies, codes, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workdir', default='bench_workdir', help='stand-in models (shared with bench_e2e)')
+    parser.add_argument('--clients', type=int, default=16, help='concurrent measured clients')
+    parser.add_argument('--requests', type=int, default=200, help='measured requests per server')
+    parser.add_argument('--limits', type=int, nargs='+', default=[1, 4, 16], help='ASGI_MAX_CONCURRENCY values')
+    parser.add_argument('--slow-clients', type=int, default=32, help='background clients uploading slowly')
+    parser.add_argument('--slow-kbps', type=float, default=64)
+    parser.add_argument('--image-size', choices=sorted(PHOTO_SIZES), default='1080p')
+    parser.add_argument('--port', type=int, default=5091)
+    args = parser.parse_args()
+
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    workdir = os.path.abspath(args.workdir)
+    os.makedirs(workdir, exist_ok=True)
+    written = write_model_dir(workdir)
+    if written:
+        print(f"Wrote {len(written)} stand-in models to {workdir}")
+
+    base_url = f'http://127.0.0.1:{args.port}'
+    uploads = [encoded_upload(base_url, image) for image in synthetic_jpegs(8, PHOTO_SIZES[args.image_size])]
+    print(f"{args.clients} clients + {args.slow_clients} slow uploaders at {args.slow_kbps:g}KB/s, "
+          f"{args.image_size} JPEGs (~{len(uploads[0][0]) // 1024} KB), {os.cpu_count()} CPUs")
+
+    servers = [('flask app.run', 'flask', None)] + [(f'asgi limit={limit}', 'asgi', limit) for limit in args.limits]
+    for label, kind, limit in servers:
+        process = start_server(kind, args.port, workdir, limit)
+        try:
+            wait_ready(base_url)
+            asyncio.run(run_load(base_url, uploads, min(args.clients, 4), args.clients, 0, args.slow_kbps))
+            with ProcessSampler(process.pid) as sampler:
+                latencies, codes, elapsed = asyncio.run(run_load(base_url, uploads, args.clients, args.requests,
+                                                                 args.slow_clients, args.slow_kbps))
+        finally:
+            process.terminate()
+            process.wait()
+        summary = latency_summary(latencies)
+        others = {code: n for code, n in codes.items() if code != 200}
+        print(f"{label:<16} {len(latencies) / elapsed:7.1f} req/s  p50={summary['p50_ms']:8.1f}ms "
+              f"p95={summary['p95_ms']:8.1f}ms p99={summary['p99_ms']:8.1f}ms  threads={sampler.peak_threads:4d} "
+              f"rss={sampler.peak_rss / 1e6:7.1f}MB  non-200={others or 0}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+"""Logins/s and authenticated requests/s across worker processes sharing one SQLite user store.
+
+    python -m benchmarks.bench_auth --workers 4 --threads 4 --hash-methods scrypt pbkdf2:sha256:100000
+
+Each worker is a process importing the app and driving it with its own Flask
+test clients, like one gunicorn worker; all of them share USER_DB_PATH in a
+temporary directory. Before timing, the script checks that the workers agree:
+a user registered in one worker logs in from another, a session is accepted by
+every worker, and a logout in one worker is honoured by the others within
+USER_CACHE_TTL. Each password hash method is then timed with the user and
+session cache on and off (USER_CACHE_MAX_ENTRIES=0); authenticated requests
+are GET /dashboard with an empty prediction history.
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.common import latency_summary
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PASSWORD = 'bench-password'
+
+
+def logged_in(response):
+    return response.status_code == 302 and response.headers.get('Location', '').endswith('/dashboard')
+
+
+def run_threads(flask_app, emails, threads, duration, action):
+    """``action(client, email, state)`` in a loop on ``threads`` threads for ``duration`` seconds; latencies"""
+    latencies = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def loop(index):
+        client = flask_app.test_client()
+        email = emails[index % len(emails)]
+        samples = []
+        state = action.setup(client, email) if hasattr(action, 'setup') else None
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            if action(client, email, state):
+                samples.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(samples)
+
+    workers = [threading.Thread(target=loop, args=(i,)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return latencies
+
+
+def login_once(client, email, _):
+    return logged_in(client.post('/login', data={'email': email, 'password': PASSWORD}))
+
+
+class AuthenticatedGet:
+    def setup(self, client, email):
+        if not login_once(client, email, None):
+            raise RuntimeError(f'{email} could not log in')
+
+    def __call__(self, client, email, _):
+        return client.get('/dashboard').status_code == 200
+
+
+def worker(env, commands, results):
+    """Serve commands from the parent until None; runs in a spawned process"""
+    os.environ.update(env)
+    os.chdir(env['BENCH_WORKDIR'])
+    sys.path.insert(0, REPO)
+    import app as cattle_app
+
+    # No models in the workdir: the background startup the first request triggers fails once, as expected
+    logging.disable(logging.ERROR)
+    flask_app = cattle_app.app
+    client = flask_app.test_client()
+    cookie_name = flask_app.config['SESSION_COOKIE_NAME']
+    for command, args in iter(commands.get, None):
+        if command == 'register':
+            for email in args:
+                client.post('/register', data={'email': email, 'password': PASSWORD, 'name': email})
+            results.put(len(args))
+        elif command == 'login':
+            fresh = flask_app.test_client()
+            ok = login_once(fresh, args, None)
+            results.put(fresh.get_cookie(cookie_name).value if ok else None)
+        elif command == 'get':
+            fresh = flask_app.test_client()
+            fresh.set_cookie(cookie_name, args)
+            results.put(fresh.get('/dashboard').status_code)
+        elif command == 'logout':
+            fresh = flask_app.test_client()
+            fresh.set_cookie(cookie_name, args)
+            fresh.get('/logout')
+            results.put(True)
+        elif command in ('logins', 'requests'):
+            emails, threads, duration = args
+            action = login_once if command == 'logins' else AuthenticatedGet()
+            results.put(run_threads(flask_app, emails, threads, duration, action))
+
+
+class Workers:
+    """Worker processes sharing one user database, each answering commands in order"""
+
+    def __init__(self, count, workdir, env):
+        context = multiprocessing.get_context('spawn')
+        env = dict(env, BENCH_WORKDIR=workdir, PREDICTION_CACHE='0', STARTUP_RETRY_SECONDS='3600',
+                   PREDICTION_DB_PATH=os.path.join(workdir, 'predictions.db'))
+        self.channels = [(context.Queue(), context.Queue()) for _ in range(count)]
+        self.processes = [context.Process(target=worker, args=(env, commands, results), daemon=True)
+                          for commands, results in self.channels]
+        for process in self.processes:
+            process.start()
+
+    def call(self, index, command, args=None):
+        commands, results = self.channels[index]
+        commands.put((command, args))
+        return results.get()
+
+    def broadcast(self, command, args_for):
+        for index, (commands, _) in enumerate(self.channels):
+            commands.put((command, args_for(index)))
+        return [results.get() for _, results in self.channels]
+
+    def close(self):
+        for commands, _ in self.channels:
+            commands.put(None)
+        for process in self.processes:
+            process.join()
+
+
+def check_consistency(workdir, ttl):
+    """Registration, sessions and logout seen across two workers; prints and returns whether all passed"""
+    workers = Workers(2, workdir, {'USER_DB_PATH': os.path.join(workdir, 'consistency.db'),
+                                   'USER_CACHE_TTL': str(ttl), 'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:100000'})
+    try:
+        workers.call(0, 'register', ['fresh@bench.local'])
+        cookie = workers.call(1, 'login', 'fresh@bench.local')
+        checks = [('registered in worker 0, login in worker 1', cookie is not None)]
+        checks.append(('worker 1 session accepted by worker 0', cookie and workers.call(0, 'get', cookie) == 200))
+        workers.call(1, 'logout', cookie)
+        checks.append(('rejected by worker 1 right after its logout', workers.call(1, 'get', cookie) == 302))
+        time.sleep(ttl + 0.2)
+        checks.append((f'rejected by worker 0 within USER_CACHE_TTL={ttl:g}s', workers.call(0, 'get', cookie) == 302))
+    finally:
+        workers.close()
+    for label, passed in checks:
+        print(f"  {'ok  ' if passed else 'FAIL'} {label}")
+    return all(passed for _, passed in checks)
+
+
+def run_config(workdir, args, hash_method, cached):
+    label = f"{hash_method}-{'cached' if cached else 'uncached'}".replace(':', '_')
+    env = {'USER_DB_PATH': os.path.join(workdir, f'{label}.db'), 'PASSWORD_HASH_METHOD': hash_method,
+           'AUTH_WORKERS': str(args.auth_workers), 'USER_CACHE_MAX_ENTRIES': '10000' if cached else '0'}
+    workers = Workers(args.workers, workdir, env)
+    try:
+        emails = [f'user{i}@bench.local' for i in range(args.users)]
+        workers.broadcast('register', lambda index: emails[index::args.workers])
+        share = lambda index: emails[index::args.workers] or emails
+        workers.broadcast('logins', lambda index: (share(index), 1, 0.2))
+        logins = sum(workers.broadcast('logins', lambda index: (share(index), args.threads, args.duration)), [])
+        requests = sum(workers.broadcast('requests', lambda index: (share(index), args.threads, args.duration)), [])
+    finally:
+        workers.close()
+    return logins, requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4, help='worker processes')
+    parser.add_argument('--threads', type=int, default=4, help='request threads per worker')
+    parser.add_argument('--auth-workers', type=int, default=2, help='AUTH_WORKERS (hashing threads per worker)')
+    parser.add_argument('--hash-methods', nargs='+', default=['scrypt', 'pbkdf2:sha256:100000'])
+    parser.add_argument('--users', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=5, help='seconds per measurement')
+    parser.add_argument('--check-ttl', type=float, default=1, help='USER_CACHE_TTL for the consistency check')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='bench_auth_') as workdir:
+        print(f"Cross-worker consistency ({os.cpu_count()} CPUs):")
+        consistent = check_consistency(workdir, args.check_ttl)
+        print(f"\n{args.workers} workers x {args.threads} threads, AUTH_WORKERS={args.auth_workers}, "
+              f"{args.duration:g}s per measurement")
+        print(f"{'hash method':<24}{'cache':>7}{'logins/s':>10}{'p50':>9}{'p95':>9}"
+              f"{'auth req/s':>12}{'p50':>9}{'p95':>9}")
+        for hash_method in args.hash_methods:
+            for cached in (True, False):
+                logins, requests = run_config(workdir, args, hash_method, cached)
+                login_summary, request_summary = latency_summary(logins), latency_summary(requests)
+                print(f"{hash_method:<24}{'on' if cached else 'off':>7}{len(logins) / args.duration:10.1f}"
+                      f"{login_summary['p50_ms']:7.1f}ms{login_summary['p95_ms']:7.1f}ms"
+                      f"{len(requests) / args.duration:12.1f}{request_summary['p50_ms']:7.1f}ms"
+                      f"{request_summary['p95_ms']:7.1f}ms")
+    if not consistent:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
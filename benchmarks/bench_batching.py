@@ -0,0 +1,103 @@
+"""Throughput/latency of direct per-request predict() vs the InferenceBatcher.
+
+    python -m benchmarks.bench_batching --clients 16 --requests 20
+"""
+import argparse
+import functools
+import threading
+import time
+
+import numpy as np
+
+from batching import InferenceBatcher, run_two_stage
+from benchmarks.common import MASTER_CLASSES, Timer, build_standin_model, format_row, latency_summary, random_images
+
+
+def build_models():
+    master = build_standin_model(len(MASTER_CLASSES), seed=1)
+    specialists = {part: build_standin_model(3, seed=10 + i)
+                   for i, part in enumerate(MASTER_CLASSES) if part != 'non_cattle'}
+    return master, specialists
+
+
+def make_route(specialists):
+    def route(master_row):
+        part = MASTER_CLASSES[int(np.argmax(master_row))]
+        return part if part in specialists else None
+    return route
+
+
+def run_clients(clients, requests_per_client, images, handle):
+    latencies = []
+    lock = threading.Lock()
+
+    def client(cid):
+        local = []
+        for r in range(requests_per_client):
+            img = images[(cid * requests_per_client + r) % len(images)]
+            start = time.perf_counter()
+            handle(img)
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client, args=(c,)) for c in range(clients)]
+    with Timer() as t:
+        for th in threads:
+            th.start()
+        for th in threads:
+            th.join()
+    return latencies, t.elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=20, help='requests per client')
+    parser.add_argument('--max-batch-size', type=int, default=16)
+    parser.add_argument('--max-wait-ms', type=float, default=5.0)
+    args = parser.parse_args()
+
+    master, specialists = build_models()
+    route = make_route(specialists)
+    images = random_images(64)
+
+    # Warm both call paths so tracing is not counted
+    master.predict(images[:1], verbose=0)
+    for model in specialists.values():
+        model.predict(images[:1], verbose=0)
+
+    def direct(img):
+        batch = img[np.newaxis]
+        row = master.predict(batch, verbose=0)[0]
+        part = route(row)
+        if part is not None:
+            specialists[part].predict(batch, verbose=0)
+
+    cascade = functools.partial(
+        run_two_stage,
+        master_predict=lambda batch: master.predict(batch, verbose=0),
+        specialist_predict=lambda part, batch: specialists[part].predict(batch, verbose=0),
+        route=route,
+    )
+    batcher = InferenceBatcher(
+        cascade,
+        max_batch_size=args.max_batch_size,
+        max_wait_ms=args.max_wait_ms,
+    ).start()
+
+    def batched(img):
+        batcher.submit(img).result()
+
+    total = args.clients * args.requests
+    print(f"{args.clients} clients x {args.requests} requests, "
+          f"max_batch_size={args.max_batch_size}, max_wait_ms={args.max_wait_ms}")
+    for label, handle in (('direct predict()', direct), ('micro-batched', batched)):
+        latencies, elapsed = run_clients(args.clients, args.requests, images, handle)
+        print(format_row(label, latency_summary(latencies), f"throughput={total / elapsed:7.1f} img/s"))
+    batcher.stop()
+    print(f"batcher stats: {batcher.stats()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+"""Per-request latency of Keras model.predict() vs the compiled direct-call path.
+
+    python -m benchmarks.bench_compiled --iterations 200
+"""
+import argparse
+import time
+
+from benchmarks.common import Timer, build_standin_model, format_row, latency_summary, random_images
+from inference import CompiledModel
+
+
+def measure(fn, batch, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn(batch)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8])
+    args = parser.parse_args()
+
+    model = build_standin_model(5)
+    compiled = CompiledModel(model)
+    with Timer() as t:
+        compiled.warmup()
+    print(f"compiled warm-up: {t.elapsed * 1000:.0f}ms")
+
+    for size in args.batch_sizes:
+        batch = random_images(size)
+        model.predict(batch, verbose=0)
+        keras = latency_summary(measure(lambda b: model.predict(b, verbose=0), batch, args.iterations))
+        direct = latency_summary(measure(compiled.predict, batch, args.iterations))
+        print(format_row(f"model.predict() bs={size}", keras))
+        print(format_row(f"compiled bs={size}", direct,
+                         f"p50 speedup={keras['p50_ms'] / direct['p50_ms']:.1f}x"))
+
+
+if __name__ == '__main__':
+    main()
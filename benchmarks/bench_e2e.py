@@ -0,0 +1,288 @@
+"""End-to-end benchmark of the Flask app on stand-in MobileNetV2 models.
+
+Writes the stand-in models into --workdir (reused between runs), starts the
+app in-process and drives /predict (single), /predict_batch (batch) and
+/download_report (report) through Flask test clients at each --concurrency
+level. Reports throughput, p50/p95/p99 latency, peak RSS of the app process
+and peak PSS including report workers, writes them as JSON and compares
+against a baseline:
+
+    python -m benchmarks.bench_e2e --output bench_results.json --save-baseline benchmarks/baseline.json
+    python -m benchmarks.bench_e2e --output bench_results.json --baseline benchmarks/baseline.json
+
+Exits with status 1 when a result is more than --tolerance worse than the
+baseline (lower throughput or higher p95).
+"""
+import argparse
+import io
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+from benchmarks.common import latency_summary
+from benchmarks.standins import PHOTO_SIZES, synthetic_jpegs, write_model_dir
+
+SCENARIOS = ('single', 'batch', 'report')
+
+
+def memory_bytes(pid='self', path='status', field='VmRSS:'):
+    try:
+        with open(f'/proc/{pid}/{path}') as f:
+            for line in f:
+                if line.startswith(field):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def pss_bytes(pid='self'):
+    """Proportional set size: shared pages split between the processes mapping them (forked workers share most)"""
+    return memory_bytes(pid, 'smaps_rollup', 'Pss:') or memory_bytes(pid)
+
+
+def child_pids():
+    pids = []
+    for task in os.listdir('/proc/self/task'):
+        try:
+            with open(f'/proc/self/task/{task}/children') as f:
+                pids.extend(f.read().split())
+        except OSError:
+            pass
+    return pids
+
+
+class MemorySampler:
+    """Peak RSS of this process and peak PSS of this process plus its children (report workers)"""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak_rss = 0
+        self.peak_pss = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def sample(self):
+        self.peak_rss = max(self.peak_rss, memory_bytes())
+        self.peak_pss = max(self.peak_pss, pss_bytes() + sum(pss_bytes(pid) for pid in child_pids()))
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def __enter__(self):
+        self.sample()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.sample()
+        return False
+
+
+def logged_in_client(app_module):
+    client = app_module.app.test_client()
+    client.post('/login', data={'email': 'admin@cattle.com', 'password': 'admin123'})
+    return client
+
+
+def run_load(make_request, clients, requests):
+    """Closed loop: ``len(clients)`` threads issue ``requests`` calls in total.
+
+    Returns (latencies, errors, items, elapsed) where ``items`` sums what each
+    call reports (images for batch requests, 1 otherwise).
+    """
+    counter = itertools.count()
+    latencies, errors, items = [], [0], [0]
+    lock = threading.Lock()
+
+    def worker(client):
+        local, failed, done = [], 0, 0
+        while next(counter) < requests:
+            start = time.perf_counter()
+            try:
+                done += make_request(client)
+                local.append(time.perf_counter() - start)
+            except Exception:
+                failed += 1
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+            items[0] += done
+
+    threads = [threading.Thread(target=worker, args=(client,)) for client in clients]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies, errors[0], items[0], time.perf_counter() - start
+
+
+def scenario_requests(images, batch_images, report_body):
+    counter = itertools.count()
+
+    def single(client):
+        i = next(counter)
+        response = client.post('/predict', data={'file': (io.BytesIO(images[i % len(images)]), f'{i}.jpg')},
+                               content_type='multipart/form-data')
+        if response.status_code != 200:
+            raise RuntimeError(response.status_code)
+        return 1
+
+    def batch(client):
+        i = next(counter)
+        files = [(io.BytesIO(images[(i + j) % len(images)]), f'{j}.jpg') for j in range(batch_images)]
+        response = client.post('/predict_batch', data={'files': files}, content_type='multipart/form-data')
+        summary = json.loads(response.get_data(as_text=True).splitlines()[-1])['summary']
+        if response.status_code != 200 or summary['errors']:
+            raise RuntimeError(response.status_code)
+        return summary['images']
+
+    def report(client):
+        # A fresh prediction_id per request so the report cache never answers
+        response = client.post('/download_report', json={**report_body, 'prediction_id': uuid.uuid4().hex})
+        if response.status_code != 200:
+            raise RuntimeError(response.status_code)
+        return 1
+
+    return {'single': single, 'batch': batch, 'report': report}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout.strip()
+    except OSError:
+        return None
+
+
+def compare(results, baseline, tolerance):
+    """Print each result against the baseline; returns the list of regressions"""
+    previous = {(r['scenario'], r['concurrency']): r for r in baseline['results']}
+    regressions = []
+    for result in results['results']:
+        key = (result['scenario'], result['concurrency'])
+        base = previous.get(key)
+        if base is None:
+            continue
+        throughput = result['throughput'] / base['throughput'] - 1 if base['throughput'] else 0.0
+        p95 = result['p95_ms'] / base['p95_ms'] - 1 if base['p95_ms'] else 0.0
+        flag = ''
+        if throughput < -tolerance or p95 > tolerance:
+            flag = '  REGRESSION'
+            regressions.append(key)
+        print(f"{key[0]:<8} x{key[1]:<3} throughput {throughput * 100:+6.1f}%  p95 {p95 * 100:+6.1f}%{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workdir', default='bench_workdir', help='stand-in models and databases (reused)')
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8])
+    parser.add_argument('--requests', type=int, default=200, help='requests per scenario and concurrency level')
+    parser.add_argument('--batch-images', type=int, default=16, help='images per /predict_batch request')
+    parser.add_argument('--image-size', choices=sorted(PHOTO_SIZES), default='1080p')
+    parser.add_argument('--images', type=int, default=32, help='distinct synthetic photos')
+    parser.add_argument('--shared-backbone', action='store_true', help='stand-ins share backbone weights')
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--baseline', help='results JSON to compare against')
+    parser.add_argument('--save-baseline', help='also write the results here')
+    parser.add_argument('--tolerance', type=float, default=0.15)
+    args = parser.parse_args()
+
+    workdir = os.path.abspath(args.workdir)
+    output, save_baseline, baseline_path = (os.path.abspath(p) if p else None
+                                            for p in (args.output, args.save_baseline, args.baseline))
+    os.makedirs(workdir, exist_ok=True)
+    # Measure inference, not the prediction cache; keep the history database in the workdir
+    os.environ.setdefault('PREDICTION_CACHE', '0')
+    os.environ.setdefault('PREDICTION_DB_PATH', os.path.join(workdir, 'bench_history.db'))
+    written = write_model_dir(workdir, shared_backbone=args.shared_backbone)
+    if written:
+        print(f"Wrote {len(written)} stand-in models to {workdir}")
+    os.chdir(workdir)
+
+    import app as app_module
+
+    started = time.perf_counter()
+    app_module.start_background_loading().wait()
+    if not app_module.startup.ready:
+        sys.exit(f"App failed to start: {app_module.startup.status()}")
+    startup_seconds = time.perf_counter() - started
+
+    images = synthetic_jpegs(args.images, PHOTO_SIZES[args.image_size])
+    warm = logged_in_client(app_module)
+    report_body = warm.post('/predict', data={'file': (io.BytesIO(images[0]), 'warm.jpg')},
+                            content_type='multipart/form-data').get_json()
+    report_body.pop('image', None)
+    warm.post('/download_report', json=report_body)
+
+    results = {
+        'meta': {
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'image_size': args.image_size,
+            'image_bytes_mean': int(sum(map(len, images)) / len(images)),
+            'batch_images': args.batch_images,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'startup': {'seconds': round(startup_seconds, 3), 'phases': app_module.startup.status()['phases']},
+        'results': []
+    }
+    print(f"{os.cpu_count()} CPUs, {args.image_size} JPEGs (~{results['meta']['image_bytes_mean'] // 1024} KB), "
+          f"startup {startup_seconds:.2f}s")
+
+    for scenario in args.scenarios:
+        for concurrency in args.concurrency:
+            make_request = scenario_requests(images, args.batch_images, report_body)[scenario]
+            clients = [logged_in_client(app_module) for _ in range(concurrency)]
+            requests = max(args.requests // args.batch_images, concurrency) if scenario == 'batch' else args.requests
+            with MemorySampler() as memory:
+                latencies, errors, items, elapsed = run_load(make_request, clients, requests)
+            summary = latency_summary(latencies)
+            row = {
+                'scenario': scenario,
+                'concurrency': concurrency,
+                'requests': requests,
+                'errors': errors,
+                'throughput': round(items / elapsed, 2),
+                'throughput_unit': 'images/s' if scenario == 'batch' else 'requests/s',
+                'p50_ms': round(summary['p50_ms'], 2),
+                'p95_ms': round(summary['p95_ms'], 2),
+                'p99_ms': round(summary['p99_ms'], 2),
+                'mean_ms': round(summary['mean_ms'], 2),
+                'peak_rss_mb': round(memory.peak_rss / 1e6, 1),
+                'peak_pss_with_workers_mb': round(memory.peak_pss / 1e6, 1),
+            }
+            results['results'].append(row)
+            print(f"{scenario:<8} x{concurrency:<3} {row['throughput']:8.1f} {row['throughput_unit']:<11} "
+                  f"p50={row['p50_ms']:8.2f}ms p95={row['p95_ms']:8.2f}ms p99={row['p99_ms']:8.2f}ms "
+                  f"rss={row['peak_rss_mb']:7.1f}MB pss+workers={row['peak_pss_with_workers_mb']:7.1f}MB errors={errors}")
+
+    for path in filter(None, (output, save_baseline)):
+        with open(path, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {path}")
+
+    if baseline_path:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        print(f"Against baseline {args.baseline} (commit {baseline['meta'].get('commit')}):")
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
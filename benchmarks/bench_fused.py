@@ -0,0 +1,93 @@
+"""FLOPs and latency of fused (shared-backbone) serving vs two full passes.
+
+Builds small synthetic models: a master and two specialists sharing one
+backbone's weights, plus one specialist with its own backbone that must fall
+back to a full pass.
+
+    python -m benchmarks.bench_fused --batch-size 1
+"""
+import argparse
+
+import numpy as np
+import tensorflow as tf
+
+from benchmarks.common import IMG_SHAPE, MASTER_CLASSES, random_images
+from fused import FusedCascade
+from inference import CompiledModel
+
+
+def build_backbone(width=32, seed=0, name='backbone'):
+    tf.keras.utils.set_random_seed(seed)
+    inputs = tf.keras.Input(shape=IMG_SHAPE)
+    x = tf.keras.layers.Conv2D(width, 3, strides=2, padding='same', activation='relu')(inputs)
+    x = tf.keras.layers.DepthwiseConv2D(3, padding='same', activation='relu')(x)
+    x = tf.keras.layers.Conv2D(width * 2, 1, strides=2, activation='relu')(x)
+    x = tf.keras.layers.DepthwiseConv2D(3, padding='same', activation='relu')(x)
+    x = tf.keras.layers.Conv2D(width * 4, 1, strides=2, activation='relu')(x)
+    return tf.keras.Model(inputs, x, name=name)
+
+
+def build_classifier(backbone, num_classes, name, seed):
+    """MobileNet-style layout: nested base model followed by a pooled dense head"""
+    tf.keras.utils.set_random_seed(seed)
+    inputs = tf.keras.Input(shape=IMG_SHAPE)
+    x = backbone(inputs, training=False)
+    x = tf.keras.layers.GlobalAveragePooling2D()(x)
+    x = tf.keras.layers.Dropout(0.3)(x)
+    x = tf.keras.layers.Dense(64, activation='relu')(x)
+    outputs = tf.keras.layers.Dense(num_classes, activation='softmax')(x)
+    return tf.keras.Model(inputs, outputs, name=name)
+
+
+def clone_with_weights(model):
+    clone = tf.keras.models.clone_model(model)
+    clone.set_weights(model.get_weights())
+    return clone
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--batch-size', type=int, default=1)
+    parser.add_argument('--iterations', type=int, default=50)
+    args = parser.parse_args()
+
+    shared = build_backbone(seed=0)
+    master = build_classifier(shared, len(MASTER_CLASSES), 'master', seed=1)
+    specialists = {
+        'general_body': build_classifier(clone_with_weights(shared), 3, 'general_body', seed=2),
+        'foot': build_classifier(clone_with_weights(shared), 3, 'foot', seed=3),
+        'udder': build_classifier(build_backbone(seed=9, name='udder_backbone'), 3, 'udder', seed=4),
+    }
+    compiled = {key: CompiledModel(model) for key, model in specialists.items()}
+    compiled_master = CompiledModel(master)
+
+    def specialist_predict(key, batch):
+        return compiled[key].predict(batch)
+
+    cascade = FusedCascade.build(master, specialists, specialist_predict)
+    print(f"fused specialists: {cascade.fused_keys}")
+
+    report = cascade.flops_report(master, specialists)
+    print(f"backbone={report['backbone']:,} master_head={report['master_head']:,} "
+          f"master_full={report['master_full']:,} FLOPs")
+    for key, entry in report['specialists'].items():
+        if entry['fused']:
+            print(f"  {key:<13} head={entry['head']:,} two_stage={entry['two_stage_total']:,} "
+                  f"fused={entry['fused_total']:,} saved={entry['saved']:,} FLOPs")
+        else:
+            print(f"  {key:<13} full={entry['full']:,} FLOPs (fallback, no sharing)")
+
+    for key in specialists:
+        latency = cascade.latency_report(compiled_master.predict, lambda row, key=key: key,
+                                         batch_size=args.batch_size, iterations=args.iterations)
+        print(f"  {key:<13} two_pass={latency['two_pass_ms']:.2f}ms fused={latency['fused_ms']:.2f}ms "
+              f"saved={latency['saved_ms']:.2f}ms (median, batch={args.batch_size})")
+
+    batch = random_images(args.batch_size)
+    outputs = cascade.run(batch, lambda row: 'general_body')[1][0]
+    reference = specialists['general_body'](batch, training=False).numpy()[0]
+    print(f"max |fused - reference| = {np.max(np.abs(outputs - reference)):.2e}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""Upload image store: cost of storing an upload, and re-predicting from the stored model input vs decoding again.
+
+    python -m benchmarks.bench_image_store --images 20 --photo-sizes 720p 1080p 12mp
+
+For each photo size, writes --images synthetic JPEGs and times, per image:
+- decoding the upload and preprocessing it, as /predict does for a new image
+- loading the stored 224x224 input and preprocessing it, as /predict does for
+  an image it has stored but no longer has a cached result for
+- ImageStore.put for a new image (original, thumbnails and model input) and
+  for a repeat upload
+- the preview: encoding a thumbnail data URL vs reading the stored one
+It also checks that both inputs give identical model tensors, and reports the
+bytes stored per image.
+"""
+import argparse
+import io
+import os
+import tempfile
+
+import numpy as np
+
+from benchmarks.common import Timer, latency_summary
+from benchmarks.standins import PHOTO_SIZES, synthetic_jpegs
+from image_store import ImageStore
+from prediction_cache import content_key
+from preprocessing import preprocess_image
+from uploads import decode_upload, preview_source, thumbnail_data_url
+
+
+def timed(fn, items):
+    samples, results = [], []
+    for item in items:
+        with Timer() as t:
+            results.append(fn(item))
+        samples.append(t.elapsed)
+    return latency_summary(samples)['p50_ms'], results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--images', type=int, default=20)
+    parser.add_argument('--photo-sizes', nargs='+', choices=sorted(PHOTO_SIZES), default=['720p', '1080p', '12mp'])
+    parser.add_argument('--thumbnail-sizes', type=int, nargs='+', default=[96, 320])
+    parser.add_argument('--preview-size', type=int, default=320)
+    args = parser.parse_args()
+
+    print(f"{'photo':<7}{'decode+prep':>13}{'stored+prep':>13}{'put new':>10}{'put repeat':>12}"
+          f"{'encode preview':>16}{'stored preview':>16}{'KB stored':>11}")
+    for photo_size in args.photo_sizes:
+        uploads = synthetic_jpegs(args.images, size=PHOTO_SIZES[photo_size])
+        keys = [content_key(data) for data in uploads]
+        with tempfile.TemporaryDirectory(prefix='bench_image_store_') as root:
+            store = ImageStore(root, thumbnail_sizes=args.thumbnail_sizes + [args.preview_size])
+            decode_ms, images = timed(lambda data: decode_upload(io.BytesIO(data)), uploads)
+            prepped = [preprocess_image(image) for image in images]
+
+            def put(i):
+                stream = io.BytesIO(uploads[i])
+                return store.put(keys[i], stream, images[i], preview_source(stream, images[i], max(store.thumbnail_sizes)))
+
+            put_ms, digests = timed(put, range(len(uploads)))
+            repeat_ms, _ = timed(lambda i: store.put(keys[i], io.BytesIO(uploads[i]), images[i]), range(len(uploads)))
+            stored_ms, stored = timed(lambda digest: preprocess_image(store.model_input(digest)), digests)
+            encode_ms, _ = timed(lambda image: thumbnail_data_url(image, args.preview_size), images)
+            read_ms, _ = timed(lambda digest: store.thumbnail_data_url(digest, args.preview_size), digests)
+            identical = all(np.array_equal(a, b) for a, b in zip(prepped, stored))
+            stored_bytes = sum(os.path.getsize(os.path.join(directory, name))
+                               for directory, _, names in os.walk(root) for name in names)
+        # decode_ms covers the decode only; add the preprocess that follows it
+        prep_ms, _ = timed(preprocess_image, images)
+        print(f"{photo_size:<7}{decode_ms + prep_ms:11.2f}ms{stored_ms:11.2f}ms{put_ms:8.2f}ms{repeat_ms:10.2f}ms"
+              f"{encode_ms:14.2f}ms{read_ms:14.2f}ms{stored_bytes / len(uploads) / 1024:11.0f}"
+              f"{'' if identical else '  (inputs differ!)'}")
+
+
+if __name__ == '__main__':
+    main()
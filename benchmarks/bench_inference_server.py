@@ -0,0 +1,134 @@
+"""Load test: requests/s through the inference server as worker processes scale.
+
+Starts an InferenceServer with stand-in models for each --workers value and
+drives it from --client-processes web-worker stand-ins, each with --threads
+concurrent requests, for --seconds. The first row is the in-process
+InferenceBatcher that a single app.py process uses without the server.
+
+    python -m benchmarks.bench_inference_server --workers 1 2 4 --intra-op-threads 1
+"""
+import argparse
+import functools
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+
+from benchmarks.common import format_row, latency_summary, random_images
+
+
+def standin_cascade():
+    """InferenceServer factory: compiled stand-in master + specialists with the run_two_stage contract"""
+    from batching import run_two_stage
+    from benchmarks.bench_batching import build_models, make_route
+    from inference import compile_for_inference
+
+    master, specialists = build_models()
+    master = compile_for_inference(master, warmup_batch_sizes=(1, 16))
+    specialists = {part: compile_for_inference(model, warmup_batch_sizes=(1,)) for part, model in specialists.items()}
+    return functools.partial(
+        run_two_stage,
+        master_predict=lambda batch: master.predict(batch, verbose=0),
+        specialist_predict=lambda part, batch: specialists[part].predict(batch, verbose=0),
+        route=make_route(specialists),
+    )
+
+
+def drive(submit, threads, seconds, images):
+    """Closed-loop load from ``threads`` threads; returns (latencies, completed, rejected)"""
+    latencies, rejected = [], [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def loop(tid):
+        local, busy, i = [], 0, tid
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                submit(images[i % len(images)]).result()
+                local.append(time.perf_counter() - start)
+            except Exception:
+                busy += 1
+            i += threads
+        with lock:
+            latencies.extend(local)
+            rejected[0] += busy
+
+    workers = [threading.Thread(target=loop, args=(t,)) for t in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return latencies, len(latencies), rejected[0]
+
+
+def client_process(address, threads, seconds, results):
+    from inference_server import InferenceClient
+
+    client = InferenceClient(address, authkey=b'bench', slots=threads)
+    images = random_images(32, seed=os.getpid() % 1000)
+    results.put(drive(client.submit, threads, seconds, images))
+    client.close()
+
+
+def in_process(threads, seconds, results):
+    from batching import InferenceBatcher
+
+    batcher = InferenceBatcher(standin_cascade()).start()
+    results.put(drive(batcher.submit, threads, seconds, random_images(32)))
+    batcher.stop()
+
+
+def collect(processes, results, seconds):
+    latencies, completed, rejected = [], 0, 0
+    for _ in processes:
+        l, c, r = results.get()
+        latencies.extend(l)
+        completed += c
+        rejected += r
+    for p in processes:
+        p.join()
+    return latencies, completed / seconds, rejected
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--intra-op-threads', type=int, default=1)
+    parser.add_argument('--inter-op-threads', type=int, default=1)
+    parser.add_argument('--client-processes', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=8, help='concurrent requests per client process')
+    parser.add_argument('--seconds', type=float, default=10.0)
+    args = parser.parse_args()
+
+    from inference_server import InferenceServer
+
+    ctx = multiprocessing.get_context('spawn')
+    print(f"{os.cpu_count()} CPUs, {args.client_processes} client processes x {args.threads} threads, "
+          f"{args.seconds:.0f}s per run")
+
+    results = ctx.Queue()
+    proc = ctx.Process(target=in_process, args=(args.client_processes * args.threads, args.seconds, results))
+    proc.start()
+    latencies, rps, rejected = collect([proc], results, args.seconds)
+    print(format_row('in-process batcher', latency_summary(latencies), f"{rps:8.1f} req/s"))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for workers in args.workers:
+            address = f'unix:{os.path.join(tmp, f"bench-{workers}.sock")}'
+            server = InferenceServer(address, factory='benchmarks.bench_inference_server:standin_cascade',
+                                     workers=workers, intra_op_threads=args.intra_op_threads,
+                                     inter_op_threads=args.inter_op_threads, authkey=b'bench').start()
+            clients = [ctx.Process(target=client_process, args=(address, args.threads, args.seconds, results))
+                       for _ in range(args.client_processes)]
+            for c in clients:
+                c.start()
+            latencies, rps, rejected = collect(clients, results, args.seconds)
+            print(format_row(f'server, {workers} workers', latency_summary(latencies),
+                             f"{rps:8.1f} req/s rejected={rejected}"))
+            server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Size and serialization time of /predict responses: jsonify with embedded medical info vs spliced bytes vs key only.
+
+    python -m benchmarks.bench_knowledge --iterations 20000 --predictions 1000
+
+Results are built for every disease the specialists can report, shaped like
+a two-stage /predict result. ``jsonify`` is the previous path (the entry
+re-encoded per response); ``spliced`` embeds the knowledge base's
+pre-serialized bytes; ``key`` leaves the entry out for clients that fetch
+/knowledge/<key>. Each mode builds the Flask response, as the route does.
+Sizes are without the image preview, which is the same in every mode. The
+last table is the bytes a browser downloads for --predictions diagnoses in
+each mode, counting one /knowledge fetch per distinct disease (later ones
+are answered from its cache).
+"""
+import argparse
+import time
+import uuid
+from datetime import datetime
+
+from flask import Flask, Response, jsonify
+
+from knowledge_base import KnowledgeBase
+
+DISEASES = ('lumpy', 'mastitis', 'fmd', 'tongue_disease')
+
+
+def sample_result(disease_key, entry):
+    return {
+        'success': True, 'stage': 'two_stage', 'body_part': 'general_body', 'body_part_confidence': 0.913,
+        'master_probabilities': {'foot': 0.02, 'general_body': 0.913, 'non_cattle': 0.03, 'tongue': 0.017,
+                                 'udder': 0.02},
+        'predicted_class': entry['name'], 'confidence': 0.87, 'disease_confidence': 0.851,
+        'specialist_probabilities': {entry['name']: 0.851, 'Healthy Cow': 0.1, 'Not Cattle': 0.049},
+        'specialist_used': 'Cattle Disease Classifier', 'status': 'DISEASE', 'medical_info_key': disease_key,
+        'confidence_percent': '87.00%', 'timestamp': datetime.now().isoformat(), 'prediction_id': uuid.uuid4().hex,
+    }
+
+
+def per_call(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=20000)
+    parser.add_argument('--predictions', type=int, default=1000, help='diagnoses per browser session')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    knowledge_base = KnowledgeBase.load(required=DISEASES)
+    print(f"Knowledge base: {len(knowledge_base)} entries merged, validated and serialized in "
+          f"{(time.perf_counter() - start) * 1000:.2f}ms")
+
+    flask_app = Flask(__name__)
+    results = [sample_result(key, knowledge_base.get(key)) for key in DISEASES]
+    modes = {
+        'jsonify': lambda result: jsonify(dict(result, medical_info=knowledge_base.get(result['medical_info_key']))
+                                          ).get_data(),
+        'spliced': lambda result: Response(knowledge_base.dumps(result), mimetype='application/json').get_data(),
+        'key': lambda result: Response(knowledge_base.dumps(result, full=False),
+                                       mimetype='application/json').get_data(),
+    }
+
+    print(f"\n{'mode':<10}{'bytes':>8}{'us/response':>14}")
+    sizes = {}
+    with flask_app.app_context():
+        for mode, serialize in modes.items():
+            sizes[mode] = sum(len(serialize(result)) for result in results) / len(results)
+            cost = sum(per_call(lambda: serialize(result), args.iterations // len(results)) for result in results)
+            print(f"{mode:<10}{sizes[mode]:8.0f}{cost / len(results) * 1e6:14.1f}")
+
+    entry_bytes = sum(len(knowledge_base.serialized(key)[0]) for key in DISEASES)
+    print(f"\n{args.predictions} diagnoses across {len(DISEASES)} diseases:")
+    for mode in modes:
+        total = sizes[mode] * args.predictions + (entry_bytes if mode == 'key' else 0)
+        print(f"{mode:<10}{total / 1024:10.1f}KB")
+
+
+if __name__ == '__main__':
+    main()
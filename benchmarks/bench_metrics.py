@@ -0,0 +1,53 @@
+"""Cost of one instrumented stage: bare block vs metrics disabled vs enabled, single thread and contended.
+
+    python -m benchmarks.bench_metrics --iterations 1000000 --threads 8
+"""
+import argparse
+import threading
+import time
+
+from metrics import Metrics
+
+
+def per_call(fn, iterations, threads=1):
+    def loop():
+        for _ in range(iterations):
+            fn()
+
+    workers = [threading.Thread(target=loop) for _ in range(threads)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return (time.perf_counter() - start) / (iterations * threads)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=1000000)
+    parser.add_argument('--threads', type=int, default=8)
+    args = parser.parse_args()
+
+    registry = Metrics(enabled=False)
+    stage = registry.histogram('bench_stage_seconds', 'bench', ['stage'])
+
+    def bare():
+        pass
+
+    def timed():
+        with stage.time('preprocess'):
+            pass
+
+    baseline = per_call(bare, args.iterations)
+    print(f"{'bare block':<24} {baseline * 1e9:8.1f}ns")
+    for enabled in (False, True):
+        registry.enabled = enabled
+        label = 'enabled' if enabled else 'disabled'
+        for threads in (1, args.threads):
+            cost = per_call(timed, args.iterations // threads, threads)
+            print(f"{label + f', {threads} threads':<24} {cost * 1e9:8.1f}ns  (+{(cost - baseline) * 1e9:.1f}ns)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""Dashboard/admin query latency as the prediction history grows to 1M rows.
+
+Fills a temporary SQLite PredictionStore in steps and, at each size, times
+the /dashboard query (a user's newest page plus their total), a deep
+paginated page and the /admin page. The old in-memory list scan is timed
+alongside up to --list-max rows. Finally measures what add() costs the
+request thread and how fast the background writer drains.
+
+    python -m benchmarks.bench_prediction_store --sizes 10000 100000 1000000
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from benchmarks.common import Timer, format_row, latency_summary
+from prediction_store import PredictionStore
+
+BODY_PARTS = ('general_body', 'foot', 'udder', 'tongue', 'non_cattle')
+DIAGNOSES = ('Lumpy Skin Disease', 'Foot and Mouth Disease', 'Mastitis', 'Healthy', 'Not Cattle')
+STATUSES = ('DISEASE', 'DISEASE', 'DISEASE', 'HEALTHY', 'WARNING')
+
+
+def synthetic_entries(start, count, users, rng, seconds_apart=1):
+    """``count`` log entries continuing from row ``start``, ``seconds_apart`` seconds apart"""
+    epoch = datetime(2024, 1, 1)
+    user_idx = rng.integers(0, users, count)
+    kinds = rng.integers(0, len(BODY_PARTS), count)
+    confidence = rng.random(count)
+    for i in range(count):
+        kind = int(kinds[i])
+        yield {
+            'user_email': f'user{user_idx[i]}@farm.example',
+            'user_name': f'User {user_idx[i]}',
+            'timestamp': (epoch + timedelta(seconds=(start + i) * seconds_apart)).strftime('%Y-%m-%d %H:%M:%S'),
+            'body_part': BODY_PARTS[kind],
+            'diagnosis': DIAGNOSES[kind],
+            'confidence': float(confidence[i]),
+            'status': STATUSES[kind]
+        }
+
+
+def time_queries(fn, users, queries, rng):
+    samples = []
+    for user in rng.integers(0, users, queries):
+        with Timer() as t:
+            fn(f'user{user}@farm.example')
+        samples.append(t.elapsed)
+    return latency_summary(samples)
+
+
+def deep_page(store, email, pages=5, limit=10):
+    before = None
+    for _ in range(pages):
+        page = store.recent_for_user(email, limit=limit, before=before)
+        if len(page) < limit:
+            break
+        before = page[-1]['id']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--queries', type=int, default=300)
+    parser.add_argument('--list-max', type=int, default=100000,
+                        help='largest size at which to also time the old PREDICTIONS_LOG list scan')
+    parser.add_argument('--writes', type=int, default=20000)
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = PredictionStore(os.path.join(tmp, 'bench.db'))
+        legacy_log = []
+        rows = 0
+        for size in sorted(args.sizes):
+            with Timer() as fill:
+                while rows < size:
+                    chunk = list(synthetic_entries(rows, min(50000, size - rows), args.users, rng))
+                    store.add_many(chunk)
+                    if size <= args.list_max:
+                        legacy_log.extend(chunk)
+                    rows += len(chunk)
+            db_mb = os.path.getsize(store.path) / 1e6
+            print(f"\n{rows} rows, {args.users} users ({db_mb:.0f}MB on disk, filled in {fill.elapsed:.1f}s)")
+
+            def dashboard(email):
+                store.recent_for_user(email, limit=10)
+                store.count(email)
+
+            print(format_row('sqlite dashboard', time_queries(dashboard, args.users, args.queries, rng)))
+            print(format_row('sqlite dashboard page 5', time_queries(lambda e: deep_page(store, e), args.users,
+                                                                      args.queries, rng)))
+            print(format_row('sqlite admin', time_queries(lambda e: (store.recent(limit=50), store.count()),
+                                                          args.users, args.queries, rng)))
+            if len(legacy_log) == rows:
+                def list_scan(email):
+                    [p for p in legacy_log if p['user_email'] == email][-10:]
+
+                print(format_row('list scan dashboard', time_queries(list_scan, args.users,
+                                                                     max(10, args.queries // 30), rng)))
+        legacy_log.clear()
+
+        enqueue = []
+        with Timer() as drain:
+            for entry in synthetic_entries(rows, args.writes, args.users, rng):
+                start = time.perf_counter()
+                store.add(entry)
+                enqueue.append(time.perf_counter() - start)
+            store.flush(timeout=300)
+        print(f"\n{args.writes} async writes drained in {drain.elapsed:.2f}s "
+              f"({args.writes / drain.elapsed:,.0f} rows/s)")
+        print(format_row('add() on request thread', latency_summary(enqueue)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""Time and peak memory per image: legacy preprocess_image vs the preprocessing module.
+
+Generates synthetic 12MP (4000x3000) JPEGs on disk and runs each pipeline in
+a fresh child process so peak RSS is not polluted by the other pipeline.
+
+    python -m benchmarks.bench_preprocess --images 8
+"""
+import argparse
+import io
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+from PIL import Image
+
+from benchmarks.common import format_row, latency_summary
+
+
+def synthetic_jpeg(seed, size=(4000, 3000)):
+    """Smooth gradient plus noise so the JPEG has realistic entropy (~2-4MB)"""
+    rng = np.random.default_rng(seed)
+    w, h = size
+    x = np.linspace(0, 255, w, dtype=np.float32)
+    y = np.linspace(0, 255, h, dtype=np.float32)[:, None]
+    base = np.stack([x + 0 * y, y + 0 * x, (x + y) / 2], axis=-1)
+    noise = rng.normal(0, 20, (h, w, 3)).astype(np.float32)
+    pixels = np.clip(base + noise, 0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def legacy(path):
+    image = Image.open(path)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    image = image.resize((224, 224))
+    img_array = np.array(image) / 255.0
+    return np.expand_dims(img_array, axis=0)
+
+
+def single(path):
+    from preprocessing import preprocess_image
+    return preprocess_image(Image.open(path))
+
+
+def batched(paths):
+    from preprocessing import BatchPreprocessor
+    return BatchPreprocessor(len(paths))([Image.open(p) for p in paths])
+
+
+def peak_rss_kb():
+    """High-water RSS of this process image (VmHWM resets on exec, unlike ru_maxrss)"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_mode(mode, paths, queue):
+    baseline_rss = peak_rss_kb()
+    tracemalloc.start()
+    samples = []
+    if mode == 'batch':
+        start = time.perf_counter()
+        batched(paths)
+        samples = [(time.perf_counter() - start) / len(paths)] * len(paths)
+    else:
+        fn = legacy if mode == 'legacy' else single
+        for path in paths:
+            start = time.perf_counter()
+            fn(path)
+            samples.append(time.perf_counter() - start)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss_kb = peak_rss_kb() - baseline_rss
+    queue.put((samples, peak, rss_kb))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--images', type=int, default=8)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for i in range(args.images):
+            path = os.path.join(tmp, f'{i}.jpg')
+            with open(path, 'wb') as f:
+                f.write(synthetic_jpeg(i))
+            paths.append(path)
+        avg_mb = np.mean([os.path.getsize(p) for p in paths]) / 1e6
+        print(f"{args.images} synthetic 4000x3000 JPEGs, avg {avg_mb:.1f}MB each")
+
+        ctx = multiprocessing.get_context('spawn')
+        for mode in ('legacy', 'draft+in-place', 'batch'):
+            queue = ctx.Queue()
+            proc = ctx.Process(target=run_mode, args=('single' if mode == 'draft+in-place' else mode, paths, queue))
+            proc.start()
+            samples, peak, rss_kb = queue.get()
+            proc.join()
+            print(format_row(mode, latency_summary(samples),
+                             f"numpy peak={peak / 1e6:6.1f}MB rss growth={rss_kb / 1024:6.1f}MB"))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""PDF reports per second: per-call styles vs cached layout vs the pooled ReportService.
+
+Every report gets a distinct user name so the service's PDF cache never
+hits; a final pass resubmits the same reports to show the cached rate.
+
+    python -m benchmarks.bench_reports --reports 200 --workers 1 2 4
+"""
+import argparse
+import io
+import time
+
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.units import inch
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+from reports import DISCLAIMER, ReportService, render_report
+
+MEDICAL_INFO = {
+    'immediate_actions': [f'Immediate action number {i} for the affected animal' for i in range(5)],
+    'medicines': [{'name': f'Medicine {i}', 'type': 'Antibiotic', 'brand': f'Brand {i}'} for i in range(3)],
+}
+
+
+def prediction(i):
+    return {'body_part': 'udder', 'predicted_class': 'Mastitis', 'confidence': 0.5 + (i % 50) / 100,
+            'status': 'DISEASE', 'medical_info': MEDICAL_INFO}
+
+
+def legacy_report(prediction_data, user_name):
+    """The previous generate_pdf_report: styles and every flowable rebuilt per call"""
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4)
+    styles = getSampleStyleSheet()
+    title_style = ParagraphStyle('CustomTitle', parent=styles['Heading1'], fontSize=24,
+                                 textColor=colors.HexColor('#2c3e50'), spaceAfter=30, alignment=TA_CENTER)
+    story = [Paragraph("🐄 Cattle Disease Detection Report", title_style), Spacer(1, 0.3*inch)]
+    table = Table([['Report Generated:', '2024-01-01 00:00:00'], ['User:', user_name], ['', ''],
+                   ['DIAGNOSIS RESULTS', ''], ['Body Part Detected:', prediction_data['body_part'].upper()],
+                   ['Disease/Condition:', prediction_data['predicted_class']],
+                   ['Confidence Level:', f"{prediction_data['confidence']*100:.2f}%"],
+                   ['Status:', prediction_data['status']]], colWidths=[2.5*inch, 4*inch])
+    table.setStyle(TableStyle([('GRID', (0, 0), (-1, -1), 1, colors.black)]))
+    story += [table, Spacer(1, 0.5*inch), Paragraph("⚕️ MEDICAL RECOMMENDATIONS", styles['Heading2'])]
+    for action in prediction_data['medical_info']['immediate_actions']:
+        story.append(Paragraph(f"• {action}", styles['Normal']))
+    for med in prediction_data['medical_info']['medicines']:
+        story.append(Paragraph(f"• {med['name']} ({med['type']}) - Brand: {med['brand']}", styles['Normal']))
+    disclaimer_style = ParagraphStyle('Disclaimer', parent=styles['Normal'], fontSize=9,
+                                      textColor=colors.red, alignment=TA_CENTER)
+    story += [Spacer(1, 0.5*inch), Paragraph(DISCLAIMER, disclaimer_style)]
+    doc.build(story)
+    return buffer.getvalue()
+
+
+def rate(label, count, elapsed):
+    print(f"{label:<28} {count / elapsed:8.1f} reports/s  ({elapsed * 1000 / count:6.2f}ms each)")
+
+
+def run_service(service, count, offset=0):
+    start = time.perf_counter()
+    jobs = [service.submit(prediction(i), f'User {offset + i}', 'bench@farm.example') for i in range(count)]
+    for job in jobs:
+        job.result(timeout=300)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--reports', type=int, default=200)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    args = parser.parse_args()
+
+    for label, fn in (('legacy (styles per call)', legacy_report), ('cached layout', render_report)):
+        fn(prediction(0), 'warmup')
+        start = time.perf_counter()
+        for i in range(args.reports):
+            fn(prediction(i), f'User {i}')
+        rate(label, args.reports, time.perf_counter() - start)
+
+    for workers in [0] + args.workers:
+        service = ReportService(workers=workers)
+        # Start the worker processes and build their layout before timing
+        run_service(service, max(workers, 1) * 2, offset=-10000)
+        elapsed = run_service(service, args.reports)
+        rate(f'service, {workers} workers' if workers else 'service, 1 thread', args.reports, elapsed)
+        if workers == args.workers[-1]:
+            rate('service, cached', args.reports, run_service(service, args.reports))
+        service.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Similar-case query latency: exact search vs the IVF index over float16 embeddings, with recall.
+
+    python -m benchmarks.bench_similarity --sizes 100000 1000000 --probes 8 16 32 --queries 200
+
+For each size, writes that many synthetic 256-d specialist embeddings
+(non-negative like the ReLU layer they come from, drawn around --clusters
+centres) through ``VectorIndex.add``. Every query is a stored vector, as in
+/similar/<prediction_id>, with that row excluded. Exact search is timed
+first. The IVF lists are then trained, and each --probes setting is timed and
+scored for recall@k against the exact results. The insert rate is reported
+for both phases: before training, and after it, when each new row is also
+assigned to its list.
+"""
+import argparse
+import os
+import tempfile
+import time
+import uuid
+
+import numpy as np
+
+from benchmarks.common import latency_summary
+from embeddings import EmbeddingIndex
+
+DIM = 256
+
+
+def synthetic_embeddings(n, clusters, seed=0, chunk=100000):
+    """Chunks of ``n`` non-negative vectors scattered around ``clusters`` centres"""
+    rng = np.random.default_rng(seed)
+    centres = np.abs(rng.normal(size=(clusters, DIM))).astype(np.float32)
+    for start in range(0, n, chunk):
+        size = min(chunk, n - start)
+        points = centres[rng.integers(clusters, size=size)] + rng.normal(scale=0.6, size=(size, DIM))
+        yield np.maximum(points, 0).astype(np.float32)
+
+
+def insert(index, vectors):
+    start = time.perf_counter()
+    index.add([uuid.uuid4().hex for _ in range(len(vectors))], vectors)
+    return len(vectors) / (time.perf_counter() - start)
+
+
+def run_queries(index, rows, k):
+    latencies, results = [], []
+    for row in rows:
+        start = time.perf_counter()
+        found, _ = index.search(index.vector(row), k, exclude_row=row)
+        latencies.append(time.perf_counter() - start)
+        results.append(set(found.tolist()))
+    return latency_summary(latencies), results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--probes', type=int, nargs='+', default=[8, 16, 32])
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--clusters', type=int, default=2000, help='centres the synthetic embeddings scatter around')
+    parser.add_argument('--k', type=int, default=10)
+    args = parser.parse_args()
+
+    print(f"{'vectors':>9}  {'search':<14}{'p50':>10}{'p95':>10}{f'recall@{args.k}':>11}  notes")
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory(prefix='bench_similarity_') as workdir:
+            embeddings = EmbeddingIndex(workdir, embedder=lambda key: None, exact_max=size + 1)
+            index = embeddings.index('bench', DIM)
+            rates = [insert(index, vectors) for vectors in synthetic_embeddings(size, args.clusters)]
+            index.sync()
+            megabytes = os.path.getsize(index.path) / 1e6
+            rows = np.random.default_rng(1).choice(size, args.queries, replace=False)
+
+            exact, truth = run_queries(index, rows, args.k)
+            print(f"{size:9d}  {'exact':<14}{exact['p50_ms']:8.2f}ms{exact['p95_ms']:8.2f}ms{1:11.3f}  "
+                  f"{megabytes:.0f}MB float16, {np.mean(rates):,.0f} inserts/s")
+
+            start = time.perf_counter()
+            index.train(size)
+            trained = time.perf_counter() - start
+            start = time.perf_counter()
+            index.sync()
+            reload = time.perf_counter() - start
+            for probes in args.probes:
+                index.probes = probes
+                summary, found = run_queries(index, rows, args.k)
+                recall = np.mean([len(a & b) / max(1, len(a)) for a, b in zip(truth, found)])
+                note = (f"{int(np.sqrt(size))} lists trained in {trained:.1f}s, reloaded in {reload:.1f}s"
+                        if probes == args.probes[0] else '')
+                print(f"{'':9}  {f'ivf, {probes} probes':<14}{summary['p50_ms']:8.2f}ms{summary['p95_ms']:8.2f}ms"
+                      f"{recall:11.3f}  {note}")
+            extra = next(synthetic_embeddings(max(1000, size // 100), args.clusters, seed=2))
+            print(f"{'':9}  {'':<14}{'':>20}{'':>11}  "
+                  f"{insert(index, extra):,.0f} inserts/s with list assignment")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""Startup cost: time until app.py can answer a request, and first-batch latency with and without warm-up.
+
+Each import is timed in a fresh interpreter. The eager row imports
+TensorFlow and ReportLab up front, as app.py did before they were deferred.
+The warm-up rows time the first master batch of each size on a stand-in model.
+
+    python -m benchmarks.bench_startup --batch-sizes 1 16
+"""
+import argparse
+import subprocess
+import sys
+import time
+
+from benchmarks.common import build_standin_model, random_images
+
+IMPORT_SNIPPETS = {
+    'import app (deferred)': 'import app',
+    'import app (eager tf+reportlab)': 'import tensorflow, reportlab.platypus; import app',
+}
+
+
+def time_import(snippet, repeats):
+    best = None
+    for _ in range(repeats):
+        code = (f"import time; t = time.perf_counter(); {snippet}; "
+                f"c = app.app.test_client(); c.get('/healthz'); print(time.perf_counter() - t)")
+        out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+        elapsed = float(out.stdout.strip().splitlines()[-1])
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def first_batches(batch_sizes, warmup):
+    from inference import compile_for_inference
+
+    model = build_standin_model(5, seed=1)
+    start = time.perf_counter()
+    compiled = compile_for_inference(model, warmup_batch_sizes=batch_sizes if warmup else ())
+    load = time.perf_counter() - start
+    timings = []
+    for size in batch_sizes:
+        start = time.perf_counter()
+        compiled.predict(random_images(size))
+        timings.append(time.perf_counter() - start)
+    return load, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 16])
+    args = parser.parse_args()
+
+    for label, snippet in IMPORT_SNIPPETS.items():
+        print(f"{label:<34} first response after {time_import(snippet, args.repeats) * 1000:8.1f}ms")
+
+    for warmup in (False, True):
+        load, timings = first_batches(args.batch_sizes, warmup)
+        firsts = '  '.join(f"batch {size}: {t * 1000:7.1f}ms" for size, t in zip(args.batch_sizes, timings))
+        print(f"{'warm-up' if warmup else 'no warm-up':<34} load {load * 1000:7.1f}ms  first {firsts}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""Training input throughput: ImageDataGenerator.flow_from_directory vs the tf.data pipeline in training_data.
+
+    python -m benchmarks.bench_training_data --images 512 --photo-size 720p --batch-size 32
+
+Writes --images synthetic JPEGs into three class folders and times one epoch
+of augmented batches from each pipeline, without a model, so the numbers are
+the most images per second each pipeline can feed a training step. The
+generator uses the notebooks' settings (ImageDataGenerator needs SciPy for
+its transforms). The tf.data rows are the pipeline without a cache, the first
+and a later epoch with the in-memory cache, and a new run reading the on-disk
+cache an earlier run wrote.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.standins import PHOTO_SIZES, synthetic_jpegs
+from training_data import NOTEBOOK_AUGMENTATION, Augmentation, ImageFolder
+
+CLASSES = ('fmd', 'healthy', 'non_cattle')
+
+
+def write_images(root, n, size):
+    for i, jpeg in enumerate(synthetic_jpegs(n, size=size)):
+        folder = os.path.join(root, CLASSES[i % len(CLASSES)])
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, f'{i:05d}.jpg'), 'wb') as f:
+            f.write(jpeg)
+
+
+def epoch_rate(batches, steps=None):
+    """Images per second over one pass of ``batches``"""
+    start = time.perf_counter()
+    images = 0
+    for i, (x, _) in enumerate(batches):
+        images += len(x)
+        if steps is not None and i + 1 == steps:
+            break
+    return images / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--images', type=int, default=512)
+    parser.add_argument('--photo-size', choices=sorted(PHOTO_SIZES), default='720p')
+    parser.add_argument('--batch-size', type=int, default=32)
+    args = parser.parse_args()
+
+    from tensorflow.keras.preprocessing.image import ImageDataGenerator
+
+    with tempfile.TemporaryDirectory(prefix='bench_training_data_') as workdir:
+        data = os.path.join(workdir, 'data')
+        write_images(data, args.images, PHOTO_SIZES[args.photo_size])
+        augment = Augmentation(**NOTEBOOK_AUGMENTATION)
+        rates = {}
+
+        generator = ImageDataGenerator(rescale=1. / 255, fill_mode='nearest', **NOTEBOOK_AUGMENTATION)
+        flow = generator.flow_from_directory(data, target_size=(224, 224), batch_size=args.batch_size,
+                                             class_mode='categorical', shuffle=True)
+        rates['ImageDataGenerator'] = epoch_rate(flow, steps=len(flow))
+
+        rates['tf.data, no cache'] = epoch_rate(ImageFolder(data, batch_size=args.batch_size,
+                                                            augment=augment).dataset)
+        cached = ImageFolder(data, batch_size=args.batch_size, augment=augment, cache='memory').dataset
+        rates['tf.data, memory cache, epoch 1'] = epoch_rate(cached)
+        rates['tf.data, memory cache, epoch 2'] = epoch_rate(cached)
+        cache_dir = os.path.join(workdir, 'cache')
+        epoch_rate(ImageFolder(data, batch_size=args.batch_size, augment=augment, cache=cache_dir).dataset)
+        rates['tf.data, disk cache, next run'] = epoch_rate(
+            ImageFolder(data, batch_size=args.batch_size, augment=augment, cache=cache_dir).dataset)
+
+    baseline = rates['ImageDataGenerator']
+    print(f"\n{args.images} {args.photo_size} JPEGs, batch {args.batch_size}, {os.cpu_count()} CPUs")
+    print(f"{'pipeline':<34}{'img/s':>10}{'vs generator':>14}")
+    for label, rate in rates.items():
+        print(f"{label:<34}{rate:10.1f}{rate / baseline:13.2f}x")
+
+
+if __name__ == '__main__':
+    main()
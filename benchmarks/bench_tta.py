@@ -0,0 +1,79 @@
+"""Latency of test-time augmentation: K views batched into one pass per model vs K separate single-image calls.
+
+    python -m benchmarks.bench_tta --views 2 4 8 --iterations 20
+
+Uses a random-weight MobileNetV2 master and specialist (the notebooks'
+architecture) behind the compiled forward pass, routing every image to the
+specialist. Each row is per image and includes preprocessing the views from
+a 1080p photo decoded at draft scale, as /predict does.
+"""
+import argparse
+import io
+import time
+
+import numpy as np
+
+from benchmarks.common import MASTER_CLASSES, latency_summary
+from benchmarks.standins import build_mobilenet_standin, synthetic_jpegs
+from inference import CompiledModel
+from tta import VIEWS, TestTimeAugmentation, aggregate, augment_into
+from uploads import decode_upload
+
+
+def separate_calls(image, views, master, specialist):
+    """The unbatched alternative: each view preprocessed and run through both models on its own"""
+    view = np.empty((views, 224, 224, 3), dtype=np.float32)
+    augment_into(image, view)
+    master_out = [master.predict(view[i:i + 1], verbose=0)[0] for i in range(views)]
+    specialist_out = [specialist.predict(view[i:i + 1], verbose=0)[0] for i in range(views)]
+    return aggregate(master_out), aggregate(specialist_out)
+
+
+def timed(fn, iterations):
+    fn()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return latency_summary(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--views', type=int, nargs='+', default=[2, 4, 8], choices=range(2, len(VIEWS) + 1))
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--alpha', type=float, default=1.0, help='MobileNetV2 width of the stand-ins')
+    args = parser.parse_args()
+
+    master = CompiledModel(build_mobilenet_standin(len(MASTER_CLASSES), seed=0, alpha=args.alpha))
+    specialist = CompiledModel(build_mobilenet_standin(3, seed=1, alpha=args.alpha))
+    for model in (master, specialist):
+        model.warmup([1] + args.views)
+    image = decode_upload(io.BytesIO(synthetic_jpegs(1)[0]))
+    image.load()
+
+    def route(master_row):
+        return 'general_body'
+
+    def specialist_predict(key, batch):
+        return specialist.predict(batch, verbose=0)
+
+    single = timed(lambda: TestTimeAugmentation(1).run(image, master.predict, specialist_predict, route),
+                   args.iterations)
+    print(f"{'mode':<22}{'p50':>9}{'p95':>9}{'vs 1 view':>11}")
+    print(f"{'1 view':<22}{single['p50_ms']:7.1f}ms{single['p95_ms']:7.1f}ms{1:10.2f}x")
+    for views in args.views:
+        tta = TestTimeAugmentation(views)
+        rows = [
+            (f'{views} views batched', lambda: tta.run(image, master.predict, specialist_predict, route)),
+            (f'{views} separate calls', lambda: separate_calls(image, views, master, specialist)),
+        ]
+        for label, fn in rows:
+            summary = timed(fn, args.iterations)
+            print(f"{label:<22}{summary['p50_ms']:7.1f}ms{summary['p95_ms']:7.1f}ms"
+                  f"{summary['p50_ms'] / single['p50_ms']:10.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""Per-request peak memory and time of /predict upload handling: legacy full read + re-encode vs streaming.
+
+    python -m benchmarks.bench_upload_memory --image-size 12mp --requests 10 --max-mb 80
+
+Each path runs in a fresh process on multipart requests parsed by werkzeug
+(so large uploads are spooled to a temporary file, as in the app). Peak
+memory is VmHWM after resetting it with /proc/self/clear_refs, minus the RSS
+before the request; the worst request is reported. Exits with status 1 when
+the streaming path's peak exceeds --max-mb.
+"""
+import argparse
+import io
+import json
+import subprocess
+import sys
+import time
+
+from benchmarks.standins import PHOTO_SIZES, synthetic_jpegs
+
+PATHS = ('legacy', 'streaming')
+
+
+def status_kb(field):
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field):
+                return int(line.split()[1])
+    return 0
+
+
+def reset_peak():
+    """Reset VmHWM to the current RSS (Linux 4.0+)"""
+    with open('/proc/self/clear_refs', 'w') as f:
+        f.write('5')
+
+
+def multipart_request(data):
+    from werkzeug.test import EnvironBuilder
+    from werkzeug.wrappers import Request
+
+    environ = EnvironBuilder(method='POST', data={'file': (io.BytesIO(data), 'cow.jpg')}).get_environ()
+    return Request(environ)
+
+
+def legacy(file):
+    """The original /predict: whole upload in memory, full-resolution JPEG re-encode for the preview"""
+    import base64
+    import hashlib
+
+    from PIL import Image
+
+    from preprocessing import preprocess_image
+
+    data = file.read()
+    image = Image.open(io.BytesIO(data))
+    buffered = io.BytesIO()
+    image.save(buffered, format='JPEG')
+    preview = f"data:image/jpeg;base64,{base64.b64encode(buffered.getvalue()).decode()}"
+    'sha256:' + hashlib.sha256(data).hexdigest()
+    preprocess_image(image)
+    return len(preview)
+
+
+def streaming(file, preview_size=320):
+    """The current /predict: hashed in chunks, decoded once at draft scale, small thumbnail"""
+    from prediction_cache import stream_content_key
+    from preprocessing import preprocess_image
+    from uploads import decode_upload, preview_source, thumbnail_data_url
+
+    stream_content_key(file.stream)
+    image = decode_upload(file.stream)
+    preprocess_image(image)
+    return len(thumbnail_data_url(preview_source(file.stream, image, preview_size), preview_size))
+
+
+def measure(path, image_size, requests):
+    """Run one path in this process; returns per-request peaks (MB), times (ms) and the preview size"""
+    handle = {'legacy': legacy, 'streaming': streaming}[path]
+    # Imports only: a full-size warm-up would leave freed pages in RSS for the measured requests to reuse
+    handle(multipart_request(synthetic_jpegs(1, (320, 240))[0]).files['file'])
+    jpeg = synthetic_jpegs(1, PHOTO_SIZES[image_size])[0]
+    peaks, times = [], []
+    for _ in range(requests):
+        request = multipart_request(jpeg)
+        before = status_kb('VmRSS:')
+        reset_peak()
+        start = time.perf_counter()
+        preview_bytes = handle(request.files['file'])
+        times.append((time.perf_counter() - start) * 1000)
+        peaks.append((status_kb('VmHWM:') - before) / 1024)
+        request.close()
+    return {'path': path, 'upload_kb': len(jpeg) // 1024, 'preview_kb': preview_bytes // 1024,
+            'peak_mb': round(max(peaks), 1), 'mean_ms': round(sum(times) / len(times), 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--image-size', choices=sorted(PHOTO_SIZES), default='12mp')
+    parser.add_argument('--requests', type=int, default=10)
+    parser.add_argument('--max-mb', type=float, help='fail when the streaming peak exceeds this')
+    parser.add_argument('--path', choices=PATHS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.path:
+        print(json.dumps(measure(args.path, args.image_size, args.requests)))
+        return
+
+    results = {}
+    for path in PATHS:
+        output = subprocess.run([sys.executable, '-m', 'benchmarks.bench_upload_memory', '--path', path,
+                                 '--image-size', args.image_size, '--requests', str(args.requests)],
+                                capture_output=True, text=True, check=True).stdout
+        results[path] = row = json.loads(output.splitlines()[-1])
+        print(f"{path:<10} upload={row['upload_kb']:6d}KB preview={row['preview_kb']:6d}KB "
+              f"peak={row['peak_mb']:7.1f}MB mean={row['mean_ms']:7.1f}ms")
+
+    if args.max_mb is not None and results['streaming']['peak_mb'] > args.max_mb:
+        print(f"Streaming peak {results['streaming']['peak_mb']}MB exceeds --max-mb {args.max_mb}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""Shared helpers for the benchmark scripts"""
+import time
+
+import numpy as np
+
+MASTER_CLASSES = ['foot', 'general_body', 'non_cattle', 'tongue', 'udder']
+IMG_SHAPE = (224, 224, 3)
+
+
+def build_standin_model(num_classes, input_shape=IMG_SHAPE, width=16, seed=0):
+    """Small random-weight CNN with the same input/output contract as the real models"""
+    import tensorflow as tf
+
+    tf.keras.utils.set_random_seed(seed)
+    inputs = tf.keras.Input(shape=input_shape)
+    x = tf.keras.layers.Conv2D(width, 3, strides=2, activation='relu')(inputs)
+    x = tf.keras.layers.Conv2D(width * 2, 3, strides=2, activation='relu')(x)
+    x = tf.keras.layers.Conv2D(width * 4, 3, strides=2, activation='relu')(x)
+    x = tf.keras.layers.GlobalAveragePooling2D()(x)
+    outputs = tf.keras.layers.Dense(num_classes, activation='softmax')(x)
+    return tf.keras.Model(inputs, outputs)
+
+
+def random_images(n, shape=IMG_SHAPE, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.random((n,) + tuple(shape), dtype=np.float32)
+
+
+def latency_summary(samples):
+    """p50/p95/p99/mean in milliseconds for a list of durations in seconds"""
+    ms = np.asarray(samples, dtype=np.float64) * 1000.0
+    if ms.size == 0:
+        return {'count': 0, 'mean_ms': 0.0, 'p50_ms': 0.0, 'p95_ms': 0.0, 'p99_ms': 0.0}
+    return {
+        'count': int(ms.size),
+        'mean_ms': float(ms.mean()),
+        'p50_ms': float(np.percentile(ms, 50)),
+        'p95_ms': float(np.percentile(ms, 95)),
+        'p99_ms': float(np.percentile(ms, 99)),
+    }
+
+
+def format_row(label, summary, extra=''):
+    return (f"{label:<28} n={summary['count']:<6} mean={summary['mean_ms']:8.2f}ms "
+            f"p50={summary['p50_ms']:8.2f}ms p95={summary['p95_ms']:8.2f}ms "
+            f"p99={summary['p99_ms']:8.2f}ms {extra}")
+
+
+class Timer:
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+        return False
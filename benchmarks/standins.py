@@ -0,0 +1,101 @@
+"""Architecture-matched stand-ins for the trained models and synthetic cattle-photo-sized JPEGs.
+
+The real ``.keras``/``.h5`` files are not in the repository. ``write_model_dir``
+writes random-weight MobileNetV2 classifiers with the training notebooks'
+heads under the exact paths app.py loads (plus the class-index files), so the
+app and the benchmarks run unchanged against them.
+"""
+import io
+import json
+import os
+
+import numpy as np
+from PIL import Image
+
+from benchmarks.common import MASTER_CLASSES
+
+FOOT_CLASSES = {'NON CATTLE IMAGES': 0, 'fmd': 1, 'healthy': 2}
+TONGUE_CLASSES = ['diseased', 'non_cattle', 'normal']
+
+# Typical phone/trail-camera resolutions of uploaded cattle photos
+PHOTO_SIZES = {'720p': (1280, 720), '1080p': (1920, 1080), '12mp': (4000, 3000)}
+
+
+def build_mobilenet_standin(num_classes, seed=0, backbone_seed=None, alpha=1.0):
+    """MobileNetV2 (random weights) + the notebooks' GAP/Dense(512)/BN/Dense(256) head.
+
+    Models built with the same ``backbone_seed`` get identical backbone
+    weights, so FUSED_SERVING can share one backbone pass between them.
+    """
+    import tensorflow as tf
+
+    tf.keras.utils.set_random_seed(seed if backbone_seed is None else backbone_seed)
+    base = tf.keras.applications.MobileNetV2(input_shape=(224, 224, 3), include_top=False, weights=None, alpha=alpha)
+    base.trainable = False
+    tf.keras.utils.set_random_seed(seed)
+    return tf.keras.Sequential([
+        base,
+        tf.keras.layers.GlobalAveragePooling2D(),
+        tf.keras.layers.Dropout(0.3),
+        tf.keras.layers.Dense(512, activation='relu'),
+        tf.keras.layers.BatchNormalization(),
+        tf.keras.layers.Dropout(0.4),
+        tf.keras.layers.Dense(256, activation='relu'),
+        tf.keras.layers.Dropout(0.3),
+        tf.keras.layers.Dense(num_classes, activation='softmax')
+    ])
+
+
+def write_model_dir(root, shared_backbone=False, alpha=1.0, force=False):
+    """Write stand-ins for every model app.py loads under ``root``; existing files are kept unless ``force``"""
+    from app import MASTER_CONFIG_PATH, MASTER_MODEL_PATH, SPECIALIST_MODELS
+
+    backbone_seed = 0 if shared_backbone else None
+    models = [(MASTER_MODEL_PATH, len(MASTER_CLASSES))]
+    for info in SPECIALIST_MODELS.values():
+        models.append((info['path'], len(info.get('classes', [])) or 3))
+
+    written = []
+    for i, (path, num_classes) in enumerate(models):
+        path = os.path.join(root, path)
+        if os.path.exists(path) and not force:
+            continue
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        build_mobilenet_standin(num_classes, seed=i + 1, backbone_seed=backbone_seed, alpha=alpha).save(path)
+        written.append(path)
+
+    class_files = {
+        MASTER_CONFIG_PATH: {'class_indices': {name: i for i, name in enumerate(MASTER_CLASSES)},
+                             'class_names': MASTER_CLASSES, 'img_size': [224, 224],
+                             'num_classes': len(MASTER_CLASSES)},
+        SPECIALIST_MODELS['foot']['classes_file']: FOOT_CLASSES,
+        SPECIALIST_MODELS['tongue']['classes_file']: {
+            'class_indices': {name: i for i, name in enumerate(TONGUE_CLASSES)},
+            'class_names': TONGUE_CLASSES, 'img_size': [224, 224]},
+    }
+    for path, content in class_files.items():
+        path = os.path.join(root, path)
+        if not os.path.exists(path) or force:
+            with open(path, 'w') as f:
+                json.dump(content, f, indent=2)
+    return written
+
+
+def synthetic_photo(size=PHOTO_SIZES['1080p'], seed=0):
+    """Smooth colour fields plus sensor-like noise, so JPEG sizes and decode costs resemble real photos"""
+    rng = np.random.default_rng(seed)
+    width, height = size
+    coarse = rng.integers(40, 200, (9, 16, 3), dtype=np.uint8)
+    image = Image.fromarray(coarse).resize((width, height), Image.BICUBIC)
+    pixels = np.asarray(image, dtype=np.int16) + rng.integers(-12, 13, (height, width, 3), dtype=np.int16)
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+
+
+def synthetic_jpegs(n, size=PHOTO_SIZES['1080p'], quality=90, seed=0):
+    """``n`` distinct JPEG uploads (bytes) of the given pixel size"""
+    jpegs = []
+    for i in range(n):
+        buffer = io.BytesIO()
+        synthetic_photo(size, seed=seed + i).save(buffer, format='JPEG', quality=quality)
+        jpegs.append(buffer.getvalue())
+    return jpegs
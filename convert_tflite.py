@@ -0,0 +1,204 @@
+"""Convert the master and specialist models to TFLite and compare accuracy vs latency.
+
+    python convert_tflite.py --quantization float16 dynamic int8 --calibration-dir calib/
+    python convert_tflite.py --report-only --eval-dir field_photos/
+
+Converted files land in models/tflite/<stem>.<quantization>.tflite, where the
+server picks them up for INFERENCE_BACKEND / MODEL_BACKENDS=tflite-<quantization>.
+"""
+import argparse
+import json
+import logging
+import os
+import time
+
+import numpy as np
+import tensorflow as tf
+from PIL import Image
+
+import app as cattle_app
+from inference import TFLITE_DIR, TFLiteModel, tflite_path, unwrap
+
+logger = logging.getLogger(__name__)
+
+QUANTIZATIONS = ('float32', 'float16', 'dynamic', 'int8')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+
+def model_paths():
+    """Model key -> Keras file for the master and every specialist in SPECIALIST_MODELS"""
+    paths = {'master': cattle_app.MASTER_MODEL_PATH}
+    for key, info in cattle_app.SPECIALIST_MODELS.items():
+        paths[key] = info['path']
+    return paths
+
+
+def load_images(folder, limit=200):
+    """Preprocessed images (N, 224, 224, 3) plus the parent folder name of each as its label"""
+    files = []
+    for root, _, names in os.walk(folder):
+        for name in sorted(names):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                files.append(os.path.join(root, name))
+    files = sorted(files)[:limit]
+    images, labels = [], []
+    for path in files:
+        try:
+            with Image.open(path) as image:
+                images.append(cattle_app.preprocess_image(image)[0].astype(np.float32))
+            labels.append(os.path.basename(os.path.dirname(path)))
+        except Exception as e:
+            logger.warning(f"⚠️ Skipping {path}: {e}")
+    if not images:
+        raise ValueError(f'No readable images found in {folder}')
+    return np.stack(images), labels
+
+
+def convert(model, quantization, calibration=None):
+    """Return TFLite flatbuffer bytes for a Keras model"""
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if quantization == 'float16':
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantization == 'dynamic':
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    elif quantization == 'int8':
+        if calibration is None:
+            raise ValueError('int8 full-integer quantization needs --calibration-dir')
+
+        def representative_dataset():
+            for image in calibration:
+                yield [image[np.newaxis]]
+
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.int8
+        converter.inference_output_type = tf.int8
+    elif quantization != 'float32':
+        raise ValueError(f'Unknown quantization {quantization}')
+    return converter.convert()
+
+
+def median_latency_ms(predict, image, iterations):
+    predict(image)
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        predict(image)
+        samples.append(time.perf_counter() - start)
+    return float(np.median(samples)) * 1000.0
+
+
+def compare(model_key, keras_model, class_names, images, labels, quantizations, iterations=30):
+    """Accuracy/agreement and batch-1 latency for Keras vs each converted TFLite file"""
+    reference = keras_model.predict(images, verbose=0)
+    reference_top1 = reference.argmax(axis=1)
+    label_idx = np.array([class_names.index(l) if l in class_names else -1 for l in labels])
+    labelled = label_idx >= 0
+
+    def row(backend, probs, latency_ms, size_bytes):
+        top1 = probs.argmax(axis=1)
+        entry = {
+            'model': model_key,
+            'backend': backend,
+            'latency_ms': round(latency_ms, 3),
+            'size_mb': round(size_bytes / 1e6, 2),
+            'top1_agreement': float((top1 == reference_top1).mean()),
+            'max_abs_diff': float(np.abs(probs - reference).max()),
+            'accuracy': float((top1[labelled] == label_idx[labelled]).mean()) if labelled.any() else None
+        }
+        return entry
+
+    keras_path = model_paths()[model_key]
+    direct = cattle_app.compile_for_inference(keras_model, warmup_batch_sizes=())
+    rows = [row('keras', reference, median_latency_ms(direct.predict, images[:1], iterations),
+                os.path.getsize(keras_path))]
+    for quantization in quantizations:
+        path = tflite_path(keras_path, quantization)
+        if not os.path.exists(path):
+            continue
+        lite = TFLiteModel(path)
+        probs = np.concatenate([lite.predict(image[np.newaxis]) for image in images])
+        rows.append(row(f'tflite-{quantization}', probs, median_latency_ms(lite.predict, images[:1], iterations),
+                        os.path.getsize(path)))
+    return rows
+
+
+def load_reference(model_key):
+    """Raw Keras model plus class names, loaded the same way the server does"""
+    models = cattle_app.new_model_set()
+    if model_key == 'master':
+        cattle_app.require_master_model(models)
+        return unwrap(models.master_model), models.master_config['class_names']
+    # load_specialist_model also fills specialist_configs with the class names
+    model = unwrap(cattle_app.load_specialist_model(models, model_key))
+    return model, models.specialist_configs[model_key]
+
+
+def print_report(rows):
+    print(f"{'model':<14}{'backend':<17}{'latency':>10}{'size':>9}{'agree':>8}{'max|dp|':>9}{'acc':>7}")
+    for r in rows:
+        acc = f"{r['accuracy']:.3f}" if r['accuracy'] is not None else '-'
+        print(f"{r['model']:<14}{r['backend']:<17}{r['latency_ms']:>8.2f}ms{r['size_mb']:>7.2f}MB"
+              f"{r['top1_agreement']:>8.3f}{r['max_abs_diff']:>9.4f}{acc:>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--models', nargs='+', choices=list(model_paths()), default=list(model_paths()))
+    parser.add_argument('--quantization', nargs='+', choices=QUANTIZATIONS, default=['float16', 'dynamic'])
+    parser.add_argument('--calibration-dir', help='folder of representative images for int8 calibration')
+    parser.add_argument('--calibration-limit', type=int, default=200)
+    parser.add_argument('--eval-dir', help='images for the comparison report (defaults to the calibration set)')
+    parser.add_argument('--eval-limit', type=int, default=200)
+    parser.add_argument('--report', default=os.path.join(TFLITE_DIR, 'report.json'))
+    parser.add_argument('--report-only', action='store_true', help='skip conversion, only compare existing files')
+    args = parser.parse_args()
+
+    cattle_app.app.config['INFERENCE_BACKEND'] = 'keras'
+    cattle_app.app.config['MODEL_BACKENDS'] = {}
+
+    calibration = None
+    if args.calibration_dir:
+        calibration, _ = load_images(args.calibration_dir, args.calibration_limit)
+        logger.info(f"📷 {len(calibration)} calibration images")
+
+    if args.eval_dir:
+        images, labels = load_images(args.eval_dir, args.eval_limit)
+    elif calibration is not None:
+        images, labels = calibration[:args.eval_limit], [''] * min(len(calibration), args.eval_limit)
+    else:
+        images = np.random.default_rng(0).random((16, 224, 224, 3), dtype=np.float32)
+        labels = [''] * len(images)
+        logger.warning("⚠️ No --eval-dir/--calibration-dir, comparing on random images (agreement only)")
+
+    os.makedirs(TFLITE_DIR, exist_ok=True)
+    rows = []
+    for model_key in args.models:
+        keras_path = model_paths()[model_key]
+        if not os.path.exists(keras_path):
+            logger.warning(f"⚠️ {model_key}: {keras_path} not found, skipping")
+            continue
+        model, class_names = load_reference(model_key)
+        if not args.report_only:
+            for quantization in args.quantization:
+                try:
+                    data = convert(model, quantization, calibration)
+                except Exception as e:
+                    logger.error(f"❌ {model_key} {quantization}: {e}")
+                    continue
+                path = tflite_path(keras_path, quantization)
+                with open(path, 'wb') as f:
+                    f.write(data)
+                logger.info(f"✅ {model_key} → {path} ({len(data) / 1e6:.2f} MB)")
+        rows.extend(compare(model_key, model, class_names, images, labels, QUANTIZATIONS))
+
+    print_report(rows)
+    with open(args.report, 'w') as f:
+        json.dump(rows, f, indent=2)
+    logger.info(f"📝 Report written to {args.report}")
+
+
+if __name__ == '__main__':
+    main()
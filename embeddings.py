@@ -0,0 +1,475 @@
+"""Prediction embeddings: float16 memory-mapped vectors per specialist and nearest-neighbour search over them"""
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+import weakref
+
+import numpy as np
+
+from inference import IMG_SHAPE, unwrap
+from preprocessing import preprocess_into
+from startup import LazyModule
+
+tf = LazyModule('tensorflow')
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS vector_files (
+    name TEXT PRIMARY KEY,
+    dim INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS embeddings (
+    name TEXT NOT NULL,
+    row INTEGER NOT NULL,
+    prediction_id TEXT NOT NULL,
+    list INTEGER,
+    PRIMARY KEY (name, row)
+);
+CREATE INDEX IF NOT EXISTS idx_embeddings_prediction_id ON embeddings (prediction_id);
+CREATE TABLE IF NOT EXISTS ivf (
+    name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    trained_rows INTEGER NOT NULL,
+    centroids BLOB NOT NULL
+);
+"""
+
+# Re-train the IVF lists once an index has grown this many times past the rows it was trained on
+REFIT_GROWTH = 8
+# k-means sample per list when training
+SAMPLE_PER_LIST = 64
+# Rows converted to float32 at a time by exact search and list assignment
+CHUNK_ROWS = 65536
+
+
+def penultimate_model(model):
+    """Keras model from a classifier's input to the input of its last layer (the embedding); None for TFLite"""
+    model = unwrap(model)
+    if not isinstance(model, tf.keras.Model):
+        return None
+    try:
+        return tf.keras.Model(model.inputs, model.layers[-1].input, name=f'{model.name}_embedding')
+    except Exception as e:
+        logger.warning(f"⚠️ {model.name}: cannot take the penultimate layer ({e})")
+        return None
+
+
+def normalized(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def spherical_kmeans(points, lists, iterations=10, seed=0):
+    """Unit-length centroids of ``lists`` clusters of unit-length ``points`` (cosine k-means)"""
+    rng = np.random.default_rng(seed)
+    centroids = points[rng.choice(len(points), lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(points @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, points)
+        empty = ~sums.any(axis=1)
+        # Re-seed lists nobody picked with random points so every list stays in use
+        sums[empty] = points[rng.choice(len(points), int(empty.sum()), replace=False)]
+        centroids = normalized(sums)
+    return centroids
+
+
+class VectorIndex:
+    """One specialist model's embeddings: float16 rows in ``<name>.f16``, their prediction ids in SQLite.
+
+    Vectors are L2-normalized, so similarity is a dot product. Search is
+    exact up to ``exact_max`` rows; past that, the writer trains an IVF index
+    (~sqrt(n) k-means lists, re-trained after REFIT_GROWTH-fold growth) and
+    assigns every new row to its nearest list on insert, and a search scores
+    only the rows of the ``probes`` lists nearest the query. Appends are
+    serialized across processes by a SQLite write transaction. Other readers
+    pick up new rows, and a re-trained index, on their next search.
+    """
+
+    def __init__(self, directory, name, dim, connect, exact_max=20000, probes=16):
+        self.path = os.path.join(directory, f'{name}.f16')
+        self.name = name
+        self.dim = dim
+        self.exact_max = exact_max
+        self.probes = probes
+        self._connect = connect
+        self._lock = threading.Lock()
+        self._reset(None, None)
+
+    def _reset(self, version, centroids):
+        self._version = version
+        self._centroids = centroids
+        self.count = 0
+        self._vectors = None
+        # Inverted lists: rows sorted by list with offsets per list, plus rows added since they were built
+        self._order = np.empty(0, dtype=np.int64)
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._tail_rows, self._tail_lists = [], []
+
+    # Writes
+
+    def add(self, prediction_ids, vectors):
+        """Append rows for ``prediction_ids``; returns the first row number"""
+        vectors = normalized(vectors)
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            start = conn.execute('SELECT COALESCE(MAX(row) + 1, 0) FROM embeddings WHERE name = ?',
+                                 (self.name,)).fetchone()[0]
+            ivf = conn.execute('SELECT centroids FROM ivf WHERE name = ?', (self.name,)).fetchone()
+            lists = [None] * len(vectors)
+            if ivf is not None:
+                centroids = np.frombuffer(ivf[0], dtype=np.float32).reshape(-1, self.dim)
+                lists = np.argmax(vectors @ centroids.T, axis=1).tolist()
+            # Rows past ``start`` left by a writer that died before committing are overwritten
+            with open(self.path, 'r+b' if os.path.exists(self.path) else 'w+b') as f:
+                f.seek(start * self.dim * 2)
+                f.write(vectors.astype(np.float16).tobytes())
+            conn.executemany('INSERT INTO embeddings (name, row, prediction_id, list) VALUES (?, ?, ?, ?)',
+                             [(self.name, start + i, prediction_id, lists[i])
+                              for i, prediction_id in enumerate(prediction_ids)])
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return start
+
+    def maybe_train(self):
+        """Train (or re-train) the IVF lists when the index has outgrown exact search; True if it did"""
+        conn = self._connect()
+        count = conn.execute('SELECT COALESCE(MAX(row) + 1, 0) FROM embeddings WHERE name = ?',
+                             (self.name,)).fetchone()[0]
+        ivf = conn.execute('SELECT trained_rows FROM ivf WHERE name = ?', (self.name,)).fetchone()
+        if count < self.exact_max or (ivf is not None and count < ivf[0] * REFIT_GROWTH):
+            return False
+        self.train(count)
+        return True
+
+    def train(self, count, iterations=10, seed=0):
+        started = time.perf_counter()
+        vectors = np.memmap(self.path, dtype=np.float16, mode='r', shape=(count, self.dim))
+        lists = max(16, int(np.sqrt(count)))
+        rng = np.random.default_rng(seed)
+        sample = np.sort(rng.choice(count, min(count, lists * SAMPLE_PER_LIST), replace=False))
+        centroids = spherical_kmeans(vectors[sample].astype(np.float32), lists, iterations, seed)
+        assignment = self._assign(vectors, centroids)
+
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Rows other writers appended while the lists were trained
+            total = conn.execute('SELECT COALESCE(MAX(row) + 1, 0) FROM embeddings WHERE name = ?',
+                                 (self.name,)).fetchone()[0]
+            if total > count:
+                vectors = np.memmap(self.path, dtype=np.float16, mode='r', shape=(total, self.dim))
+                assignment = np.concatenate([assignment, self._assign(vectors[count:], centroids)])
+            conn.executemany('UPDATE embeddings SET list = ? WHERE name = ? AND row = ?',
+                             ((int(assigned), self.name, row) for row, assigned in enumerate(assignment)))
+            conn.execute('INSERT INTO ivf (name, version, trained_rows, centroids) VALUES (?, 1, ?, ?) '
+                         'ON CONFLICT(name) DO UPDATE SET version = version + 1, '
+                         'trained_rows = excluded.trained_rows, centroids = excluded.centroids',
+                         (self.name, total, centroids.astype(np.float32).tobytes()))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        logger.info(f"✅ Embedding index {self.name}: {lists} lists over {total} rows "
+                    f"in {time.perf_counter() - started:.1f}s")
+
+    @staticmethod
+    def _assign(vectors, centroids):
+        return np.concatenate([np.argmax(vectors[i:i + CHUNK_ROWS].astype(np.float32) @ centroids.T, axis=1)
+                               for i in range(0, len(vectors), CHUNK_ROWS)] or [np.empty(0, dtype=np.int64)])
+
+    # Reads
+
+    def sync(self):
+        """Map rows other writers appended and reload the IVF lists if they were re-trained"""
+        with self._lock:
+            conn = self._connect()
+            ivf = conn.execute('SELECT version, centroids FROM ivf WHERE name = ?', (self.name,)).fetchone()
+            version = ivf['version'] if ivf is not None else None
+            if version != self._version:
+                self._reset(version, None if ivf is None else
+                            np.frombuffer(ivf['centroids'], dtype=np.float32).reshape(-1, self.dim))
+            rows = conn.execute('SELECT row, COALESCE(list, -1) FROM embeddings WHERE name = ? AND row >= ? '
+                                'ORDER BY row', (self.name, self.count)).fetchall()
+            if not rows:
+                return self.count
+            rows = np.array(rows, dtype=np.int64)
+            if self._centroids is not None:
+                self._tail_rows.append(rows[:, 0])
+                self._tail_lists.append(rows[:, 1])
+            self.count = int(rows[-1, 0]) + 1
+            self._vectors = np.memmap(self.path, dtype=np.float16, mode='r', shape=(self.count, self.dim))
+            if self._centroids is not None and sum(map(len, self._tail_rows)) > max(1024, self.count // 20):
+                self._build_lists()
+            return self.count
+
+    def _build_lists(self):
+        rows = np.concatenate([self._order] + self._tail_rows)
+        lists = np.concatenate([np.repeat(np.arange(len(self._offsets) - 1) - 1, np.diff(self._offsets))]
+                               + self._tail_lists)
+        # Unassigned rows (-1) sort first and are always searched
+        order = np.argsort(lists, kind='stable')
+        self._order = rows[order]
+        self._offsets = np.concatenate([[0], np.cumsum(np.bincount(lists[order] + 1,
+                                                                   minlength=len(self._centroids) + 1))])
+        self._tail_rows, self._tail_lists = [], []
+
+    def _candidates(self, query):
+        """Rows to score for ``query``: all of them below exact_max, otherwise the nearest lists' rows"""
+        if self._centroids is None:
+            return None
+        if self._tail_rows:
+            self._build_lists()
+        nearest = np.argpartition(self._centroids @ query, -min(self.probes, len(self._centroids)))
+        nearest = nearest[-self.probes:] + 1  # list l's rows sit at offsets[l + 1]:offsets[l + 2]
+        parts = [self._order[self._offsets[0]:self._offsets[1]]]
+        parts += [self._order[self._offsets[l]:self._offsets[l + 1]] for l in nearest]
+        return np.sort(np.concatenate(parts))
+
+    def row_of(self, prediction_id):
+        row = self._connect().execute('SELECT row FROM embeddings WHERE name = ? AND prediction_id = ?',
+                                      (self.name, prediction_id)).fetchone()
+        return row[0] if row else None
+
+    def search(self, query, k=10, exclude_row=None):
+        """``(rows, similarities)`` of the ``k`` nearest rows to a normalized ``query``, best first"""
+        self.sync()
+        with self._lock:
+            vectors = self._vectors
+            if vectors is None:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+            candidates = self._candidates(query)
+        if candidates is None:
+            scores = np.concatenate([vectors[i:i + CHUNK_ROWS].astype(np.float32) @ query
+                                     for i in range(0, len(vectors), CHUNK_ROWS)])
+            candidates = np.arange(len(vectors))
+        else:
+            scores = vectors[candidates].astype(np.float32) @ query
+        if exclude_row is not None:
+            scores[candidates == exclude_row] = -np.inf
+        k = min(k, int(np.isfinite(scores).sum()))
+        best = np.argpartition(scores, -k)[-k:] if k else np.empty(0, dtype=np.int64)
+        best = best[np.argsort(-scores[best])]
+        return candidates[best], scores[best]
+
+    def vector(self, row):
+        if row >= self.count:
+            self.sync()
+        return self._vectors[row].astype(np.float32)
+
+    def prediction_ids(self, rows):
+        placeholders = ', '.join('?' * len(rows))
+        found = dict(self._connect().execute(
+            f'SELECT row, prediction_id FROM embeddings WHERE name = ? AND row IN ({placeholders})',
+            [self.name] + [int(row) for row in rows]).fetchall())
+        return [found.get(int(row)) for row in rows]
+
+    @property
+    def mode(self):
+        return 'exact' if self._centroids is None else 'ivf'
+
+
+class EmbeddingIndex:
+    """Embeds logged predictions in the background and answers nearest-neighbour queries over them.
+
+    ``embedder(key)`` returns ``(name, model)`` for a specialist, where
+    ``model.predict`` maps preprocessed images to embeddings and ``name``
+    changes with the model's weights, or None when the specialist cannot be
+    embedded. Each name gets its own VectorIndex, so embeddings from
+    different weights are never compared. ``add`` only enqueues, and drops
+    the image when the queue is full: embeddings are never worth slowing a
+    request down for.
+    """
+
+    def __init__(self, directory, embedder, exact_max=20000, probes=16, queue_size=256, batch_size=16,
+                 flush_interval=0.5):
+        self.directory = directory
+        self.embedder = embedder
+        self.exact_max = exact_max
+        self.probes = probes
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        os.makedirs(directory, exist_ok=True)
+        self.db_path = os.path.join(directory, 'embeddings.sqlite')
+        self._local = threading.local()
+        self._connection().executescript(SCHEMA)
+        self._indexes = {}
+        self._indexes_lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._pending = 0
+        self._pending_lock = threading.Condition()
+        self._stats = {'queued': 0, 'embedded': 0, 'dropped': 0, 'failed': 0, 'searches': 0, 'trained': 0,
+                       'embed_seconds': 0.0}
+        self._writer = threading.Thread(target=self._write_loop, name='embedding-writer', daemon=True)
+        self._writer.start()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False, timeout=60)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def index(self, name, dim=None):
+        """The VectorIndex for ``name``, registering it with ``dim`` dimensions if new; None if unknown"""
+        with self._indexes_lock:
+            index = self._indexes.get(name)
+            if index is None:
+                conn = self._connection()
+                row = conn.execute('SELECT dim FROM vector_files WHERE name = ?', (name,)).fetchone()
+                if row is None:
+                    if dim is None:
+                        return None
+                    conn.execute('INSERT OR IGNORE INTO vector_files (name, dim) VALUES (?, ?)', (name, dim))
+                else:
+                    dim = row['dim']
+                index = self._indexes[name] = VectorIndex(self.directory, name, dim, self._connection,
+                                                          self.exact_max, self.probes)
+            return index
+
+    # Writes
+
+    def add(self, prediction_id, key, image):
+        """Queue ``image`` (anything preprocess_into takes) for embedding; False when the queue was full"""
+        with self._pending_lock:
+            self._pending += 1
+        try:
+            self._queue.put_nowait((prediction_id, key, image))
+        except queue.Full:
+            with self._pending_lock:
+                self._pending -= 1
+                self._stats['dropped'] += 1
+            return False
+        self._stats['queued'] += 1
+        return True
+
+    def flush(self, timeout=30.0):
+        """Block until everything queued so far is embedded and stored"""
+        deadline = time.monotonic() + timeout
+        with self._pending_lock:
+            while self._pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._pending_lock.wait(remaining)
+        return True
+
+    def _write_loop(self):
+        batch = np.empty((self.batch_size,) + IMG_SHAPE, dtype=np.float32)
+        while True:
+            items = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(items) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    items.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            groups = {}
+            for item in items:
+                groups.setdefault(item[1], []).append(item)
+            for key, group in groups.items():
+                try:
+                    self._embed(key, group, batch)
+                except Exception as e:
+                    self._stats['failed'] += len(group)
+                    logger.error(f"❌ Failed to embed {len(group)} '{key}' predictions: {e}")
+            with self._pending_lock:
+                self._pending -= len(items)
+                self._pending_lock.notify_all()
+
+    def _embed(self, key, group, batch):
+        embedder = self.embedder(key)
+        if embedder is None:
+            return
+        name, model = embedder
+        started = time.perf_counter()
+        ids = []
+        for prediction_id, _, image in group:
+            try:
+                preprocess_into(image, batch[len(ids)])
+                ids.append(prediction_id)
+            except Exception as e:
+                self._stats['failed'] += 1
+                logger.warning(f"⚠️ Cannot embed prediction {prediction_id}: {e}")
+        if not ids:
+            return
+        vectors = np.asarray(model.predict(batch[:len(ids)], verbose=0)).reshape(len(ids), -1)
+        index = self.index(name, vectors.shape[1])
+        index.add(ids, vectors)
+        self._stats['embedded'] += len(ids)
+        self._stats['embed_seconds'] += time.perf_counter() - started
+        if index.maybe_train():
+            self._stats['trained'] += 1
+
+    # Reads
+
+    def locate(self, prediction_id):
+        """``(VectorIndex, row)`` holding a prediction's embedding, or None if it has none (yet)"""
+        row = self._connection().execute('SELECT name, row FROM embeddings WHERE prediction_id = ? '
+                                         'ORDER BY rowid DESC LIMIT 1', (prediction_id,)).fetchone()
+        if row is None:
+            return None
+        return self.index(row['name']), row['row']
+
+    def similar(self, prediction_id, k=10):
+        """``(index, [(prediction_id, similarity), ...])`` nearest first, or None without an embedding"""
+        located = self.locate(prediction_id)
+        if located is None:
+            return None
+        index, row = located
+        self._stats['searches'] += 1
+        rows, scores = index.search(index.vector(row), k, exclude_row=row)
+        return index, list(zip(index.prediction_ids(rows), (float(score) for score in scores)))
+
+    def stats(self):
+        stats = dict(self._stats, queue_depth=self._queue.qsize())
+        with self._indexes_lock:
+            indexes = dict(self._indexes)
+        conn = self._connection()
+        stats['indexes'] = {}
+        for name in indexes:
+            rows, trained = conn.execute('SELECT (SELECT COALESCE(MAX(row) + 1, 0) FROM embeddings WHERE name = ?), '
+                                         '(SELECT trained_rows FROM ivf WHERE name = ?)', (name, name)).fetchone()
+            stats['indexes'][name] = {'rows': rows, 'mode': 'exact' if trained is None else 'ivf',
+                                      'trained_rows': trained}
+        return stats
+
+
+class SpecialistEmbedders:
+    """``embedder(key)`` for EmbeddingIndex: the penultimate layer of each specialist ``specialist(key)`` returns.
+
+    The embedding model shares the specialist's layers and is rebuilt when
+    ``specialist(key)`` returns a different model (reloaded or a new version).
+    ``name_for(key)`` gives the index name (e.g. the key plus a fingerprint
+    of the model file).
+    """
+
+    def __init__(self, specialist, name_for, wrap=None):
+        self.specialist = specialist
+        self.name_for = name_for
+        self.wrap = wrap
+        self._built = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, key):
+        model = self.specialist(key)
+        with self._lock:
+            built = self._built.get(key)
+            if built is None or built[0]() is not model:
+                embedding_model = penultimate_model(model)
+                if embedding_model is not None and self.wrap is not None:
+                    embedding_model = self.wrap(embedding_model)
+                built = self._built[key] = (weakref.ref(model), self.name_for(key), embedding_model)
+        return None if built[2] is None else built[1:]
@@ -0,0 +1,173 @@
+"""Compare cascade routing policies on a labelled folder: specialist passes saved vs accuracy.
+
+    python evaluate_routing.py --eval-dir validation_images/
+    python evaluate_routing.py --eval-dir validation_images/ --train-prefilter models/prefilter.keras
+
+Images live in <master class>/<image> or <master class>/<specialist class>/<image>
+(e.g. foot/fmd/001.jpg, non_cattle/dog.jpg). The master, every specialist and the
+pre-filter run once over all images; each policy is then simulated on the saved
+outputs, so the report shows exactly what ROUTING_NON_CATTLE_THRESHOLD,
+ROUTING_TOP2_MARGIN and PREFILTER_THRESHOLD would change.
+"""
+import argparse
+import json
+import logging
+import os
+
+import numpy as np
+
+import app as cattle_app
+from convert_tflite import IMAGE_EXTENSIONS
+from routing import NON_CATTLE, RoutingPolicy, Routed, build_prefilter
+
+logger = logging.getLogger(__name__)
+
+
+def load_labelled_images(folder, limit=2000):
+    """Preprocessed images plus (body part, specialist class or None) labels from the folder layout"""
+    files = []
+    for root, _, names in os.walk(folder):
+        for name in sorted(names):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                files.append(os.path.relpath(os.path.join(root, name), folder))
+    files = sorted(files)[:limit]
+    images, labels = [], []
+    for path in files:
+        parts = path.split(os.sep)
+        try:
+            with cattle_app.Image.open(os.path.join(folder, path)) as image:
+                images.append(cattle_app.preprocess_image(image)[0])
+            labels.append((parts[0], parts[1] if len(parts) > 2 else None))
+        except Exception as e:
+            logger.warning(f"⚠️ Skipping {path}: {e}")
+    if not images:
+        raise ValueError(f'No readable images found in {folder}')
+    return np.stack(images), labels
+
+
+def predict_all(model, images, batch_size=32):
+    return np.concatenate([model.predict(images[i:i + batch_size], verbose=0)
+                           for i in range(0, len(images), batch_size)])
+
+
+def train_prefilter(images, labels, path, epochs=10):
+    """Fit the tiny pre-filter on non_cattle vs everything else and save it to ``path``"""
+    import tensorflow as tf
+
+    targets = np.array([1.0 if body_part == NON_CATTLE else 0.0 for body_part, _ in labels], dtype=np.float32)
+    if targets.min() == targets.max():
+        raise ValueError('--train-prefilter needs both non_cattle and cattle images')
+    model = build_prefilter()
+    model.compile(optimizer=tf.keras.optimizers.Adam(1e-3), loss='binary_crossentropy', metrics=['accuracy'])
+    # validation_split takes the last samples, and the images are sorted by class folder
+    order = np.random.default_rng(0).permutation(len(images))
+    model.fit(images[order], targets[order], epochs=epochs, batch_size=32, validation_split=0.2, verbose=2)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    model.save(path)
+    logger.info(f"✅ Pre-filter saved to {path}")
+    return model
+
+
+def simulate(name, class_names, master_out, specialist_out, prefilter_scores, labels,
+             non_cattle_threshold=None, top2_margin=None, prefilter_threshold=None):
+    """Route every image with one policy over the precomputed outputs; passes and accuracy"""
+    policy = RoutingPolicy(class_names, lambda body_part: body_part in specialist_out,
+                           non_cattle_threshold=non_cattle_threshold, top2_margin=top2_margin)
+    body_correct = disease_correct = disease_total = prefiltered = 0
+    for i, (master_row, (body_label, disease_label)) in enumerate(zip(master_out, labels)):
+        disease = None
+        if prefilter_threshold is not None and prefilter_scores[i] >= prefilter_threshold:
+            body_part = NON_CATTLE
+            prefiltered += 1
+        else:
+            body_part = policy.body_part(master_row)[0]
+            decision = policy(master_row)
+            if isinstance(decision, tuple):
+                selected = policy.select(master_row, {key: specialist_out[key][0][i] for key in decision})
+                if isinstance(selected, Routed):
+                    body_part = selected.body_part
+                decision = body_part
+            if decision is not None:
+                probabilities, specialist_classes = specialist_out[decision]
+                disease = specialist_classes[int(np.argmax(probabilities[i]))]
+        body_correct += body_part == body_label
+        if disease_label is not None:
+            disease_total += 1
+            disease_correct += disease == disease_label
+
+    stats = policy.stats()
+    return {
+        'policy': name,
+        'master_passes': len(labels) - prefiltered,
+        'specialist_passes': stats.get('specialist_passes', 0),
+        'body_part_accuracy': body_correct / len(labels),
+        'disease_accuracy': disease_correct / disease_total if disease_total else None,
+        'top2_switched': stats.get('top2_switched', 0),
+    }
+
+
+def print_report(rows, images):
+    baseline = rows[0]['specialist_passes'] or 1
+    print(f"{'policy':<28}{'master':>8}{'special.':>10}{'saved':>8}{'body acc':>10}{'disease acc':>13}")
+    for r in rows:
+        saved = 1 - r['specialist_passes'] / baseline
+        disease = f"{r['disease_accuracy']:.3f}" if r['disease_accuracy'] is not None else '-'
+        print(f"{r['policy']:<28}{r['master_passes']:>8}{r['specialist_passes']:>10}{saved * 100:>7.1f}%"
+              f"{r['body_part_accuracy']:>10.3f}{disease:>13}")
+    print(f"({images} images)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--eval-dir', required=True)
+    parser.add_argument('--limit', type=int, default=2000)
+    parser.add_argument('--non-cattle-thresholds', type=float, nargs='*', default=[0.3, 0.4, 0.5])
+    parser.add_argument('--top2-margins', type=float, nargs='*', default=[0.05, 0.1, 0.2])
+    parser.add_argument('--prefilter', default=os.environ.get('PREFILTER_MODEL_PATH', ''),
+                        help='pre-filter model to evaluate (default PREFILTER_MODEL_PATH)')
+    parser.add_argument('--prefilter-thresholds', type=float, nargs='*', default=[0.9, 0.95, 0.99])
+    parser.add_argument('--train-prefilter', metavar='PATH', help='train a pre-filter on --eval-dir and save it here')
+    parser.add_argument('--epochs', type=int, default=10)
+    parser.add_argument('--report', default='routing_report.json')
+    args = parser.parse_args()
+
+    images, labels = load_labelled_images(args.eval_dir, args.limit)
+    logger.info(f"📷 {len(images)} labelled images")
+
+    models = cattle_app.new_model_set()
+    cattle_app.require_master_model(models)
+    class_names = models.master_config['class_names']
+    master_out = predict_all(models.master_model, images)
+    specialist_out = {}
+    for key, info in cattle_app.SPECIALIST_MODELS.items():
+        if not os.path.exists(info['path']):
+            logger.warning(f"⚠️ {key}: {info['path']} not found, routed images count as unanswered")
+            continue
+        model = cattle_app.load_specialist_model(models, key)
+        specialist_out[key] = (predict_all(model, images), models.specialist_configs[key])
+
+    prefilter = None
+    if args.train_prefilter:
+        prefilter = train_prefilter(images, labels, args.train_prefilter, args.epochs)
+    elif args.prefilter:
+        prefilter = cattle_app.load_keras_model(args.prefilter)
+    prefilter_scores = predict_all(prefilter, images).reshape(len(images), -1)[:, -1] if prefilter else None
+
+    common = (class_names, master_out, specialist_out, prefilter_scores, labels)
+    rows = [simulate('baseline (argmax)', *common)]
+    for threshold in args.non_cattle_thresholds:
+        rows.append(simulate(f'non_cattle >= {threshold}', *common, non_cattle_threshold=threshold))
+    for margin in args.top2_margins:
+        rows.append(simulate(f'top-2 margin {margin}', *common, top2_margin=margin))
+    if prefilter is not None:
+        for threshold in args.prefilter_thresholds:
+            rows.append(simulate(f'pre-filter >= {threshold}', *common, prefilter_threshold=threshold))
+
+    print_report(rows, len(images))
+    with open(args.report, 'w') as f:
+        json.dump(rows, f, indent=2)
+    logger.info(f"📝 Report written to {args.report}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+"""Fused two-stage serving: run a shared backbone once for master and specialist heads"""
+import hashlib
+import logging
+import threading
+import time
+
+import numpy as np
+
+from batching import route_groups, run_groups, run_two_stage
+from inference import CompiledModel, IMG_SHAPE, unwrap
+from startup import LazyModule
+
+tf = LazyModule('tensorflow')
+
+logger = logging.getLogger(__name__)
+
+
+def split_backbone(model, input_shape=IMG_SHAPE, atol=1e-5):
+    """Split a classifier into (backbone, head) at the last spatial feature map.
+
+    Works for the MobileNetV2 layout used by every model here: either a nested
+    base model followed by a linear head, or a flat graph whose last rank-4
+    output feeds GlobalAveragePooling and Dense layers. The split is checked
+    numerically against the full model; returns None if the model cannot be
+    split cleanly.
+    """
+    model = unwrap(model)
+    if not isinstance(model, tf.keras.Model):
+        return None
+    layers = model.layers
+    split = None
+    for i, layer in enumerate(layers):
+        if isinstance(layer, tf.keras.Model):
+            split = i
+    if split is None:
+        for i, layer in enumerate(layers):
+            if isinstance(layer, tf.keras.layers.InputLayer):
+                continue
+            if len(layer.get_output_shape_at(-1)) == 4:
+                split = i
+    if split is None or split == len(layers) - 1:
+        return None
+
+    try:
+        backbone = tf.keras.Model(model.inputs, layers[split].get_output_at(-1), name=f'{model.name}_backbone')
+        features = tf.keras.Input(shape=backbone.output_shape[1:])
+        x = features
+        for layer in layers[split + 1:]:
+            x = layer(x)
+        head = tf.keras.Model(features, x, name=f'{model.name}_head')
+
+        probe = np.random.default_rng(0).random((2,) + tuple(input_shape), dtype=np.float32)
+        expected = model(probe, training=False).numpy()
+        actual = head(backbone(probe, training=False), training=False).numpy()
+        if not np.allclose(expected, actual, atol=atol):
+            logger.warning(f"⚠️ {model.name}: backbone/head split does not reproduce the model, not fusing")
+            return None
+    except Exception as e:
+        logger.warning(f"⚠️ {model.name}: cannot split backbone ({e})")
+        return None
+    return backbone, head
+
+
+def backbone_fingerprint(backbone):
+    """Hash of layer weight shapes and values; equal fingerprints mean the backbone can be shared"""
+    digest = hashlib.sha1()
+    for weight in backbone.weights:
+        value = weight.numpy()
+        digest.update(str(value.shape).encode())
+        digest.update(value.tobytes())
+    return digest.hexdigest()
+
+
+def count_flops(model, input_shape):
+    """Float operations for one forward pass of a single example"""
+    from tensorflow.python.framework.convert_to_constants import convert_variables_to_constants_v2
+
+    model = unwrap(model)
+    forward = tf.function(lambda x: model(x, training=False))
+    concrete = forward.get_concrete_function(tf.TensorSpec((1,) + tuple(input_shape), tf.float32))
+    frozen = convert_variables_to_constants_v2(concrete)
+    options = tf.compat.v1.profiler.ProfileOptionBuilder.float_operation()
+    options['output'] = 'none'
+    info = tf.compat.v1.profiler.profile(graph=frozen.graph, options=options)
+    return int(info.total_float_ops)
+
+
+class FusedCascade:
+    """Master + specialists served with one backbone pass where weights allow.
+
+    Specialists whose backbone fingerprint matches the master's get only their
+    head run on the master's features; any other specialist (different
+    fine-tuned weights, unsplittable graph) falls back to a full pass through
+    ``specialist_predict``. ``run`` follows the ``run_two_stage`` contract so it
+    can be used directly as the InferenceBatcher cascade.
+
+    Built ``lazy``, a specialist is checked the first time images are routed
+    to it, loading it through ``specialists`` (a SpecialistRegistry) like a
+    full pass would, so lazily loaded specialists stay unloaded until needed
+    and under the registry's memory budget. Only its head is kept.
+    """
+
+    def __init__(self, backbone, master_head, specialist_heads, specialist_predict, fingerprint=None,
+                 compiled=False, unchecked=None):
+        self.backbone = backbone
+        self.master_head = master_head
+        self.specialist_heads = specialist_heads
+        self.specialist_predict = specialist_predict
+        self.feature_shape = tuple(unwrap(backbone).output_shape[1:])
+        self.fingerprint = fingerprint
+        self.compiled = compiled
+        self._unchecked = dict(unchecked or {})  # key -> specialists mapping to load it from
+        self._check_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._stats = {'fused_rows': 0, 'fallback_rows': 0}
+
+    @classmethod
+    def build(cls, master, specialists, specialist_predict, compiled=True, lazy=False):
+        """Return a FusedCascade, or None when the master itself cannot be split"""
+        split = split_backbone(master)
+        if split is None:
+            return None
+        backbone, master_head = split
+        fingerprint = backbone_fingerprint(backbone)
+        feature_shape = tuple(backbone.output_shape[1:])
+        if compiled:
+            backbone = CompiledModel(backbone)
+            master_head = CompiledModel(master_head, input_shape=feature_shape)
+        cascade = cls(backbone, master_head, {}, specialist_predict, fingerprint, compiled,
+                      unchecked={key: specialists for key in specialists.keys()} if lazy else None)
+        if not lazy:
+            for key, model in specialists.items():
+                cascade.check(key, model)
+        return cascade
+
+    def check(self, key, model):
+        """Keep the specialist's head if its backbone is the master's; returns the head or None"""
+        specialist_split = split_backbone(model)
+        if specialist_split is None:
+            logger.info(f"↪️ {key}: not splittable, keeping full pass")
+            return None
+        if backbone_fingerprint(specialist_split[0]) != self.fingerprint:
+            logger.info(f"↪️ {key}: backbone weights differ from master, keeping full pass")
+            return None
+        head = specialist_split[1]
+        if self.compiled:
+            head = CompiledModel(head, input_shape=self.feature_shape)
+        self.specialist_heads[key] = head
+        logger.info(f"🔗 {key}: sharing master backbone")
+        return head
+
+    def head(self, key):
+        """The fused head for a specialist, checking it first if it has not been; None = full pass"""
+        if key in self._unchecked:
+            # One check per specialist, however many batcher threads route to it at once
+            with self._check_lock:
+                specialists = self._unchecked.get(key)
+                if specialists is not None:
+                    self.check(key, specialists[key])
+                    del self._unchecked[key]
+        return self.specialist_heads.get(key)
+
+    @property
+    def fused_keys(self):
+        return sorted(self.specialist_heads)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, fused=self.fused_keys, unchecked=sorted(self._unchecked))
+
+    def run(self, batch, route):
+        features = np.asarray(self.backbone.predict(batch))
+        master_out = np.asarray(self.master_head.predict(features))
+        groups, multi = route_groups(master_out, route)
+
+        def run_group(key, indices):
+            head = self.head(key)
+            with self._lock:
+                self._stats['fused_rows' if head is not None else 'fallback_rows'] += len(indices)
+            if head is not None:
+                return head.predict(features[indices])
+            return self.specialist_predict(key, batch[indices])
+
+        specialist_rows, failures = run_groups(master_out, groups, multi, run_group, route)
+        return master_out, specialist_rows, failures
+
+    def flops_report(self, master, specialists):
+        """Per-stage FLOPs for one image, fused vs two full passes"""
+        backbone_flops = count_flops(self.backbone, IMG_SHAPE)
+        master_head_flops = count_flops(self.master_head, self.feature_shape)
+        report = {
+            'backbone': backbone_flops,
+            'master_head': master_head_flops,
+            'master_full': count_flops(master, IMG_SHAPE),
+            'specialists': {}
+        }
+        for key, model in specialists.items():
+            full = count_flops(model, IMG_SHAPE)
+            entry = {'full': full, 'fused': key in self.specialist_heads}
+            if entry['fused']:
+                entry['head'] = count_flops(self.specialist_heads[key], self.feature_shape)
+                entry['two_stage_total'] = report['master_full'] + full
+                entry['fused_total'] = backbone_flops + master_head_flops + entry['head']
+                entry['saved'] = entry['two_stage_total'] - entry['fused_total']
+            report['specialists'][key] = entry
+        return report
+
+    def latency_report(self, master_predict, route, batch_size=1, iterations=50):
+        """Median wall time per batch for the fused path vs separate full passes"""
+        batch = np.random.default_rng(0).random((batch_size,) + IMG_SHAPE, dtype=np.float32)
+
+        def timed(fn):
+            fn()
+            samples = []
+            for _ in range(iterations):
+                start = time.perf_counter()
+                fn()
+                samples.append(time.perf_counter() - start)
+            return float(np.median(samples)) * 1000.0
+
+        fused_ms = timed(lambda: self.run(batch, route))
+        two_pass_ms = timed(lambda: run_two_stage(batch, master_predict, self.specialist_predict, route))
+        return {'fused_ms': fused_ms, 'two_pass_ms': two_pass_ms, 'saved_ms': two_pass_ms - fused_ms}
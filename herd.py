@@ -0,0 +1,102 @@
+"""Herd screening helpers for /predict_batch: upload expansion, chunking and the herd summary"""
+import json
+import os
+import zipfile
+from collections import Counter
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+ZIP_MIMETYPES = ('application/zip', 'application/x-zip-compressed')
+
+
+class UploadLimitError(ValueError):
+    pass
+
+
+def is_zip(storage):
+    return (storage.filename or '').lower().endswith('.zip') or storage.mimetype in ZIP_MIMETYPES
+
+
+def iter_uploads(files, max_images=500, max_bytes=512 * 1024 * 1024):
+    """Yield ``(filename, bytes)`` per uploaded image, expanding zip archives lazily.
+
+    Archive members are checked against the limits by their declared size
+    before being decompressed; non-image members and macOS metadata are skipped.
+    """
+    count = total = 0
+
+    def admit(name, size):
+        nonlocal count, total
+        count += 1
+        total += size
+        if count > max_images:
+            raise UploadLimitError(f'More than {max_images} images in one request')
+        if total > max_bytes:
+            raise UploadLimitError(f'Images exceed {max_bytes // (1024 * 1024)} MB uncompressed')
+
+    for storage in files:
+        if is_zip(storage):
+            with zipfile.ZipFile(storage.stream) as archive:
+                for info in archive.infolist():
+                    name = info.filename
+                    if (info.is_dir() or name.startswith('__MACOSX/') or os.path.basename(name).startswith('.')
+                            or not name.lower().endswith(IMAGE_EXTENSIONS)):
+                        continue
+                    admit(name, info.file_size)
+                    yield name, archive.read(info)
+        else:
+            data = storage.read()
+            admit(storage.filename, len(data))
+            yield storage.filename, data
+
+
+def chunked(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class HerdSummary:
+    """Running counts over the per-image results of one herd upload"""
+
+    def __init__(self):
+        self.images = 0
+        self.errors = 0
+        self.cached = 0
+        self.status = Counter()
+        self.diseases = Counter()
+        self.body_parts = Counter()
+
+    def add(self, result):
+        self.images += 1
+        if not result.get('success'):
+            self.errors += 1
+            return
+        self.cached += bool(result.get('cached'))
+        self.status[result['status']] += 1
+        self.body_parts[result['body_part']] += 1
+        if result['status'] == 'DISEASE':
+            self.diseases[result['predicted_class']] += 1
+
+    def to_dict(self, elapsed_seconds=None):
+        summary = {
+            'images': self.images,
+            'analyzed': self.images - self.errors,
+            'errors': self.errors,
+            'cached': self.cached,
+            'status': dict(self.status),
+            'diseases': dict(self.diseases.most_common()),
+            'body_parts': dict(self.body_parts)
+        }
+        if elapsed_seconds is not None:
+            summary['elapsed_seconds'] = round(elapsed_seconds, 3)
+            summary['images_per_second'] = round(self.images / elapsed_seconds, 2) if elapsed_seconds else None
+        return summary
+
+
+def ndjson(obj):
+    return json.dumps(obj) + '\n'
@@ -0,0 +1,157 @@
+"""Content-addressed upload storage: originals, thumbnails and model inputs sharded by SHA-256"""
+import base64
+import os
+import re
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+from PIL import Image
+
+from preprocessing import TARGET_SIZE, resize_rgb
+from uploads import EXTENSIONS
+
+# Pillow format, MIME type and save options by extension. WebP's method 2 encodes about twice as fast as the
+# default (4) for files a few percent larger, which matters since thumbnails are made on the request thread.
+THUMBNAIL_FORMATS = {'webp': ('WEBP', 'image/webp', {'method': 2}), 'jpg': ('JPEG', 'image/jpeg', {})}
+# <sha256>.<ext> (original), <sha256>-<size>.<webp|jpg> (thumbnail), <sha256>-input.npy (model input)
+NAME = re.compile(r'^([0-9a-f]{64})(?:-(\d+|input))?\.([a-z]+)$')
+
+
+def digest_of(key):
+    """'sha256:<hex>' content key -> '<hex>'"""
+    return key.split(':', 1)[-1]
+
+
+class ImageStore:
+    """Uploads saved once per content under ``root/<ab>/<cd>/``, the first four hex digits of their SHA-256.
+
+    ``put`` writes the original upload and derives, from the image already
+    decoded for the model, a thumbnail per ``thumbnail_sizes`` in each of
+    ``formats`` and the resized model input: the uint8 pixels preprocessing
+    produces, so predicting from them gives exactly the same result without
+    the decode and resize. The input is written last and marks the set
+    complete; a repeat upload of the same content costs one stat. Files are
+    written under temporary names and renamed, so readers never see a partial
+    file and two workers storing the same image at once are harmless.
+    Names without a shard directory (from before sharding) are still found.
+    """
+
+    def __init__(self, root, thumbnail_sizes=(96, 320), formats=('webp', 'jpg'), quality=80,
+                 target_size=TARGET_SIZE):
+        unknown = set(formats) - set(THUMBNAIL_FORMATS)
+        if unknown:
+            raise ValueError(f"Unknown thumbnail formats {sorted(unknown)} (use {', '.join(THUMBNAIL_FORMATS)})")
+        self.root = root
+        self.thumbnail_sizes = tuple(sorted(set(thumbnail_sizes)))
+        self.formats = tuple(formats)
+        self.quality = quality
+        self.target_size = tuple(target_size)
+        self._lock = threading.Lock()
+        self._stats = {'stored': 0, 'duplicates': 0, 'bytes_written': 0, 'input_hits': 0, 'input_misses': 0}
+
+    def directory(self, digest):
+        return os.path.join(self.root, digest[:2], digest[2:4])
+
+    def path(self, name):
+        """Path of a stored file by name, or None if there is none"""
+        match = NAME.match(name)
+        if match is None:
+            return None
+        for path in (os.path.join(self.directory(match.group(1)), name), os.path.join(self.root, name)):
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def contains(self, digest):
+        return os.path.exists(os.path.join(self.directory(digest), f'{digest}-input.npy'))
+
+    def original_name(self, digest):
+        """File name of the stored original, or None"""
+        directory = self.directory(digest)
+        try:
+            names = os.listdir(directory)
+        except FileNotFoundError:
+            return None
+        return next((name for name in names if name.startswith(f'{digest}.') and not name.endswith('.tmp')), None)
+
+    def put(self, key, stream, image, preview=None):
+        """Store an upload (its content key, spooled stream and decoded image) once; returns the digest.
+
+        Thumbnails are cut from ``preview`` when given (a larger decode, see
+        ``uploads.preview_source``); the model input always comes from ``image``.
+        """
+        digest = digest_of(key)
+        if self.contains(digest):
+            with self._lock:
+                self._stats['duplicates'] += 1
+            return digest
+        directory = self.directory(digest)
+        os.makedirs(directory, exist_ok=True)
+
+        def copy_original(f):
+            stream.seek(0)
+            shutil.copyfileobj(stream, f)
+
+        written = self._write(directory, f"{digest}.{EXTENSIONS.get(image.format, 'bin')}", copy_original)
+        rgb = image if image.mode == 'RGB' else image.convert('RGB')
+        thumbnail = preview if preview is not None else rgb
+        if thumbnail.mode != 'RGB':
+            thumbnail = thumbnail.convert('RGB')
+        # Largest first, each shrunk from the one before
+        for size in reversed(self.thumbnail_sizes):
+            thumbnail = thumbnail.copy()
+            thumbnail.thumbnail((size, size), Image.BICUBIC)
+            for extension in self.formats:
+                image_format, _, options = THUMBNAIL_FORMATS[extension]
+                written += self._write(directory, f'{digest}-{size}.{extension}', lambda f: thumbnail.save(
+                    f, format=image_format, quality=self.quality, **options))
+        pixels = np.asarray(resize_rgb(rgb, self.target_size))
+        written += self._write(directory, f'{digest}-input.npy', lambda f: np.save(f, pixels))
+        with self._lock:
+            self._stats['stored'] += 1
+            self._stats['bytes_written'] += written
+        return digest
+
+    def _write(self, directory, name, write):
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+                size = f.tell()
+            os.replace(tmp_path, os.path.join(directory, name))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return size
+
+    def model_input(self, digest):
+        """The stored model input as a target-size RGB image, or None when the image is not stored"""
+        try:
+            pixels = np.load(os.path.join(self.directory(digest), f'{digest}-input.npy'))
+        except FileNotFoundError:
+            with self._lock:
+                self._stats['input_misses'] += 1
+            return None
+        with self._lock:
+            self._stats['input_hits'] += 1
+        return Image.fromarray(pixels)
+
+    def thumbnail_name(self, digest, size=None, extension=None):
+        """Name of a stored thumbnail: ``size`` defaults to the smallest, ``extension`` to the first format"""
+        return f'{digest}-{size or self.thumbnail_sizes[0]}.{extension or self.formats[0]}'
+
+    def thumbnail_data_url(self, digest, size):
+        """``data:`` URL of a stored thumbnail (JPEG when stored), or None when there is none of that size"""
+        extension = 'jpg' if 'jpg' in self.formats else self.formats[0]
+        path = self.path(self.thumbnail_name(digest, size, extension))
+        if path is None:
+            return None
+        with open(path, 'rb') as f:
+            return f"data:{THUMBNAIL_FORMATS[extension][1]};base64,{base64.b64encode(f.read()).decode()}"
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, root=self.root, thumbnail_sizes=list(self.thumbnail_sizes),
+                        formats=list(self.formats))
@@ -0,0 +1,155 @@
+"""Inference backends: compiled Keras forward passes and TFLite interpreters"""
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+from startup import LazyModule
+
+tf = LazyModule('tensorflow')
+
+logger = logging.getLogger(__name__)
+
+IMG_SHAPE = (224, 224, 3)
+
+# Backend names accepted by INFERENCE_BACKEND / MODEL_BACKENDS
+BACKENDS = ('keras', 'tflite', 'tflite-float16', 'tflite-dynamic', 'tflite-int8')
+TFLITE_DIR = 'models/tflite'
+
+
+def unwrap(model):
+    """Return the raw Keras model behind a CompiledModel (or the model itself)"""
+    return getattr(model, 'model', model)
+
+
+def tflite_path(model_path, quantization='float32', tflite_dir=TFLITE_DIR):
+    """Where the converted copy of a .keras/.h5 model lives, e.g. models/tflite/foo.int8.tflite"""
+    stem = os.path.splitext(os.path.basename(model_path))[0]
+    return os.path.join(tflite_dir, f'{stem}.{quantization}.tflite')
+
+
+def backend_quantization(backend):
+    """'tflite-int8' -> 'int8', 'tflite' -> 'float32'"""
+    return backend.split('-', 1)[1] if '-' in backend else 'float32'
+
+
+class CompiledModel:
+    """Keras model behind a tf.function forward pass with a fixed input signature.
+
+    ``model.predict()`` builds a data adapter and callback list on every call,
+    which dominates latency for single images. This wrapper traces the forward
+    pass once for a (None, 224, 224, 3) float32 input, so any batch size reuses
+    the same graph. ``predict(batch, verbose=0)`` keeps the Keras call shape so
+    it can replace the model wherever ``.predict`` is used.
+    """
+
+    def __init__(self, model, input_shape=IMG_SHAPE):
+        self.model = model
+        self.input_shape = tuple(input_shape)
+        signature = [tf.TensorSpec(shape=(None,) + self.input_shape, dtype=tf.float32)]
+        self._forward = tf.function(self._call, input_signature=signature)
+
+    def _call(self, batch):
+        return self.model(batch, training=False)
+
+    def predict(self, batch, verbose=0):
+        batch = np.asarray(batch, dtype=np.float32)
+        if batch.ndim == len(self.input_shape):
+            batch = batch[np.newaxis]
+        return self._forward(batch).numpy()
+
+    __call__ = predict
+
+    def warmup(self, batch_sizes=(1,)):
+        """Trace the graph and run dummy batches so the first real request is not slow"""
+        start = time.perf_counter()
+        for size in batch_sizes:
+            self.predict(np.zeros((size,) + self.input_shape, dtype=np.float32))
+        elapsed = time.perf_counter() - start
+        logger.info(f"🔥 Warmed {self.model.name} in {elapsed * 1000:.0f}ms")
+        return elapsed
+
+    def __getattr__(self, name):
+        if name == 'model':
+            raise AttributeError(name)
+        # Fall through to the wrapped Keras model (layers, summary, count_params, ...)
+        return getattr(self.model, name)
+
+
+def compile_for_inference(model, warmup_batch_sizes=(1,)):
+    compiled = CompiledModel(model)
+    if warmup_batch_sizes:
+        compiled.warmup(warmup_batch_sizes)
+    return compiled
+
+
+class TFLiteModel:
+    """TFLite interpreter with the same predict(batch, verbose=0) contract as CompiledModel.
+
+    Quantized (int8/uint8) inputs and outputs are converted from/to float32
+    using the tensor's scale and zero point, so callers keep passing
+    preprocessed [0, 1] images. The interpreter is not thread-safe, so calls
+    are serialized; batch size changes resize the input tensor in place.
+    """
+
+    def __init__(self, path, num_threads=None):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.memory_bytes = os.path.getsize(path)
+        self._interpreter = tf.lite.Interpreter(model_path=path, num_threads=num_threads)
+        self._lock = threading.Lock()
+        self._batch_size = None
+        self._resize(1)
+        self.input_shape = tuple(self._input['shape'][1:])
+
+    def _resize(self, batch_size):
+        index = self._interpreter.get_input_details()[0]['index']
+        shape = [batch_size] + list(self._interpreter.get_input_details()[0]['shape'][1:])
+        self._interpreter.resize_tensor_input(index, shape)
+        self._interpreter.allocate_tensors()
+        self._input = self._interpreter.get_input_details()[0]
+        self._output = self._interpreter.get_output_details()[0]
+        self._batch_size = batch_size
+
+    def predict(self, batch, verbose=0):
+        batch = np.asarray(batch, dtype=np.float32)
+        if batch.ndim == 3:
+            batch = batch[np.newaxis]
+        with self._lock:
+            if batch.shape[0] != self._batch_size:
+                self._resize(batch.shape[0])
+            dtype = self._input['dtype']
+            if dtype in (np.int8, np.uint8):
+                scale, zero_point = self._input['quantization']
+                info = np.iinfo(dtype)
+                batch = np.clip(np.round(batch / scale + zero_point), info.min, info.max).astype(dtype)
+            self._interpreter.set_tensor(self._input['index'], batch)
+            self._interpreter.invoke()
+            out = self._interpreter.get_tensor(self._output['index'])
+            if self._output['dtype'] in (np.int8, np.uint8):
+                scale, zero_point = self._output['quantization']
+                out = (out.astype(np.float32) - zero_point) * scale
+        return out
+
+    __call__ = predict
+
+    def warmup(self, batch_sizes=(1,)):
+        start = time.perf_counter()
+        for size in batch_sizes:
+            self.predict(np.zeros((size,) + self.input_shape, dtype=np.float32))
+        elapsed = time.perf_counter() - start
+        logger.info(f"🔥 Warmed {self.name} in {elapsed * 1000:.0f}ms")
+        return elapsed
+
+
+def load_tflite_backend(model_path, backend, num_threads=None):
+    """Load the converted TFLite copy of a model for ``backend``; None when it has not been converted"""
+    path = tflite_path(model_path, backend_quantization(backend))
+    if not os.path.exists(path):
+        logger.warning(f"⚠️ {path} not found (run convert_tflite.py), falling back to Keras")
+        return None
+    model = TFLiteModel(path, num_threads=num_threads)
+    model.warmup()
+    return model
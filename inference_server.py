@@ -0,0 +1,530 @@
+"""Dedicated inference process pool shared by the web workers, fed through shared memory.
+
+    python inference_server.py --address unix:/tmp/cattle-inference.sock --workers 4 --intra-op-threads 2
+
+Each worker process loads the models once (``--factory``, default
+``app:serving_cascade``) and micro-batches requests from every connected web
+process. A web process (``InferenceClient``) owns two shared-memory slabs:
+preprocessed (224, 224, 3) float32 tensors are written straight into an
+input slot, only ``(request id, slot)`` crosses the socket, and the worker
+writes the probability vectors back into the matching output slot. Both the
+client's slots and the server's request queue are bounded; when either is
+exhausted the request fails fast with ``ServerBusy`` instead of queueing.
+"""
+import argparse
+import atexit
+import importlib
+import itertools
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future
+from multiprocessing import connection, resource_tracker, shared_memory
+
+import numpy as np
+
+from batching import Routed
+from inference import IMG_SHAPE
+
+logger = logging.getLogger(__name__)
+
+# Probability vectors per output slot: master in [:MAX_CLASSES], specialist in [MAX_CLASSES:]
+MAX_CLASSES = 64
+OUT_WIDTH = 2 * MAX_CLASSES
+IMG_BYTES = int(np.prod(IMG_SHAPE)) * 4
+
+
+class ServerBusy(queue.Full):
+    """No free slot or the server's request queue is full; retry later"""
+
+
+def parse_address(address):
+    """'unix:/path.sock' -> '/path.sock'; 'host:port' -> (host, port)"""
+    if address.startswith('unix:'):
+        return address[len('unix:'):]
+    host, port = address.rsplit(':', 1)
+    return host, int(port)
+
+
+def checked_authkey(address, authkey):
+    """The authkey for a parsed address (None = no handshake); ValueError for host:port without one.
+
+    Connections unpickle whatever they receive, so without a key anyone who
+    can reach a TCP port could run code in the server. A unix socket is
+    guarded by its file permissions.
+    """
+    if not authkey and not isinstance(address, str):
+        raise ValueError('A host:port inference server address needs a secret INFERENCE_SERVER_AUTHKEY '
+                         '(or use a unix: socket)')
+    return authkey or None
+
+
+def load_factory(path):
+    module, name = path.split(':')
+    return getattr(importlib.import_module(module), name)
+
+
+def attach_segment(name):
+    """Open a client's segment without letting this process's resource tracker unlink it on exit"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # Python < 3.13 always registers; unregistering instead would break a tracker
+        register = resource_tracker.register  # shared with the client (e.g. both spawned by one parent)
+        resource_tracker.register = lambda name, rtype: None
+        try:
+            return shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+
+
+class SegmentCache:
+    """Worker-side views onto client segments, closing the least recently used beyond ``capacity``"""
+
+    def __init__(self, capacity=64):
+        self.capacity = capacity
+        self._segments = OrderedDict()
+
+    def views(self, in_name, out_name, slots):
+        entry = self._segments.get(in_name)
+        if entry is None:
+            shm_in = attach_segment(in_name)
+            try:
+                shm_out = attach_segment(out_name)
+            except Exception:
+                shm_in.close()
+                raise
+            inputs = np.ndarray((slots,) + IMG_SHAPE, dtype=np.float32, buffer=shm_in.buf)
+            outputs = np.ndarray((slots, OUT_WIDTH), dtype=np.float32, buffer=shm_out.buf)
+            entry = self._segments[in_name] = (inputs, outputs, shm_in, shm_out)
+            while len(self._segments) > self.capacity:
+                self._close(next(iter(self._segments)))
+        self._segments.move_to_end(in_name)
+        return entry[0], entry[1]
+
+    def drop(self, in_name):
+        if in_name in self._segments:
+            self._close(in_name)
+
+    def _close(self, in_name):
+        old_in, old_out, old_shm_in, old_shm_out = self._segments.pop(in_name)
+        del old_in, old_out
+        for shm in (old_shm_in, old_shm_out):
+            try:
+                shm.close()
+            except BufferError:  # a view is still referenced; the mapping closes once it is collected
+                pass
+
+
+def configure_threads(intra_op_threads, inter_op_threads):
+    """Must run before TensorFlow executes anything in this process"""
+    if intra_op_threads:
+        os.environ.setdefault('TFLITE_NUM_THREADS', str(intra_op_threads))
+    import tensorflow as tf
+    if intra_op_threads:
+        tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+    if inter_op_threads:
+        tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+
+
+def worker_main(factory_path, requests, replies, intra_op_threads, inter_op_threads, max_batch_size, max_wait):
+    try:
+        configure_threads(intra_op_threads, inter_op_threads)
+        cascade = load_factory(factory_path)()
+    except Exception as e:
+        replies.put(('failed', os.getpid(), str(e)))
+        return
+    segments = SegmentCache()
+    batch = np.empty((max_batch_size,) + IMG_SHAPE, dtype=np.float32)
+    replies.put(('ready', os.getpid()))
+
+    stopping = False
+    while not stopping:
+        item = requests.get()
+        if item is None:
+            break
+        items = [item]
+        deadline = time.monotonic() + max_wait
+        while len(items) < max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = requests.get(timeout=remaining) if remaining > 0 else requests.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                stopping = True
+                break
+            items.append(item)
+
+        attached = []
+        for client_id, request_id, slot, in_name, out_name, slots in items:
+            # A client that exited (or restarted after a hot reload) has unlinked its segments while its
+            # requests were still queued; fail those requests rather than the worker
+            try:
+                inputs, out = segments.views(in_name, out_name, slots)
+                batch[len(attached)] = inputs[slot]
+            except Exception as e:
+                logger.warning(f"⚠️ Could not read request {request_id}: {e}")
+                segments.drop(in_name)
+                replies.put(('done', client_id, request_id, 0, 0, None, str(e)))
+                continue
+            attached.append((client_id, request_id, slot, out))
+        if not attached:
+            continue
+        try:
+            master_out, specialist_rows, failures = cascade(batch[:len(attached)])
+        except Exception as e:
+            logger.error(f"❌ Inference batch of {len(attached)} failed: {e}")
+            for client_id, request_id, *_ in attached:
+                replies.put(('done', client_id, request_id, 0, 0, None, str(e)))
+            continue
+
+        for n, (client_id, request_id, slot, out) in enumerate(attached):
+            if n in failures:
+                replies.put(('done', client_id, request_id, 0, 0, None, str(failures[n])))
+                continue
+            try:
+                master_row, specialist_row = master_out[n], specialist_rows[n]
+                out[slot, :len(master_row)] = master_row
+                specialist_len, routed_part = -1, None
+                if isinstance(specialist_row, Routed):
+                    routed_part, specialist_row = specialist_row
+                if specialist_row is not None:
+                    specialist_len = len(specialist_row)
+                    out[slot, MAX_CLASSES:MAX_CLASSES + specialist_len] = specialist_row
+            except Exception as e:
+                replies.put(('done', client_id, request_id, 0, 0, None, str(e)))
+                continue
+            replies.put(('done', client_id, request_id, len(master_row), specialist_len, routed_part, None))
+
+
+class InferenceServer:
+    """Accepts web-process clients and fans their requests out to the worker processes"""
+
+    def __init__(self, address, factory='app:serving_cascade', workers=2, intra_op_threads=0, inter_op_threads=0,
+                 max_batch_size=16, max_wait_ms=5.0, queue_size=256, authkey=None):
+        self.address = parse_address(address) if isinstance(address, str) else address
+        self.authkey = checked_authkey(self.address, authkey)
+        self.factory = factory
+        self.workers = workers
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        ctx = multiprocessing.get_context('spawn')
+        self._ctx = ctx
+        self._requests = ctx.Queue(maxsize=queue_size)
+        self._replies = ctx.Queue()
+        self._processes = []
+        self._clients = {}  # client id -> (connection, send lock)
+        self._lock = threading.Lock()
+        self._listener = None
+        self._stats = {'requests': 0, 'rejected': 0, 'errors': 0, 'clients': 0}
+
+    def start(self, ready_timeout=300):
+        for i in range(self.workers):
+            process = self._ctx.Process(
+                target=worker_main, name=f'inference-worker-{i}', daemon=True,
+                args=(self.factory, self._requests, self._replies, self.intra_op_threads, self.inter_op_threads,
+                      self.max_batch_size, self.max_wait))
+            process.start()
+            self._processes.append(process)
+        for _ in range(self.workers):
+            message = self._replies.get(timeout=ready_timeout)
+            if message[0] == 'failed':
+                self.stop()
+                raise RuntimeError(f'Inference worker {message[1]} failed to load models: {message[2]}')
+            logger.info(f"✅ Inference worker {message[1]} ready")
+
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.unlink(self.address)
+        self._listener = connection.Listener(self.address, authkey=self.authkey)
+        threading.Thread(target=self._route_replies, name='inference-replies', daemon=True).start()
+        threading.Thread(target=self._accept, name='inference-accept', daemon=True).start()
+        logger.info(f"🚀 Inference server listening on {self._listener.address} with {self.workers} workers")
+        return self
+
+    def stop(self):
+        for _ in self._processes:
+            self._requests.put(None)
+        for process in self._processes:
+            process.join(10)
+        if self._listener is not None:
+            self._listener.close()
+
+    def serve_forever(self):
+        self.start()
+        try:
+            while all(p.is_alive() for p in self._processes):
+                time.sleep(1)
+            logger.error("❌ An inference worker exited, shutting down")
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['workers'] = sum(p.is_alive() for p in self._processes)
+        try:
+            stats['queue_depth'] = self._requests.qsize()
+        except NotImplementedError:  # macOS
+            stats['queue_depth'] = None
+        return stats
+
+    def _accept(self):
+        while True:
+            try:
+                conn = self._listener.accept()
+            except OSError:
+                return
+            except Exception as e:
+                logger.warning(f"⚠️ Rejected inference client: {e}")
+                continue
+            threading.Thread(target=self._serve_client, args=(conn,), daemon=True).start()
+
+    def _send(self, client_id, message):
+        client = self._clients.get(client_id)
+        if client is None:
+            return
+        conn, send_lock = client
+        try:
+            with send_lock:
+                conn.send(message)
+        except OSError:
+            pass
+
+    def _serve_client(self, conn):
+        client_id = uuid.uuid4().hex
+        try:
+            kind, in_name, out_name, slots = conn.recv()
+            if kind != 'attach':
+                raise ValueError(f'expected attach, got {kind}')
+            with self._lock:
+                self._clients[client_id] = (conn, threading.Lock())
+                self._stats['clients'] += 1
+            while True:
+                message = conn.recv()
+                if message[0] == 'infer':
+                    _, request_id, slot = message
+                    try:
+                        self._requests.put_nowait((client_id, request_id, slot, in_name, out_name, slots))
+                    except queue.Full:
+                        with self._lock:
+                            self._stats['rejected'] += 1
+                        self._send(client_id, ('busy', request_id))
+                        continue
+                    with self._lock:
+                        self._stats['requests'] += 1
+                elif message[0] == 'stats':
+                    self._send(client_id, ('stats', message[1], self.stats()))
+        except (EOFError, OSError):
+            pass
+        except Exception as e:
+            logger.error(f"❌ Inference client error: {e}")
+        finally:
+            with self._lock:
+                self._clients.pop(client_id, None)
+                self._stats['clients'] -= 1
+            conn.close()
+
+    def _route_replies(self):
+        while True:
+            _, client_id, request_id, master_len, specialist_len, routed_part, error = self._replies.get()
+            if error is not None:
+                with self._lock:
+                    self._stats['errors'] += 1
+            self._send(client_id, ('done', request_id, master_len, specialist_len, routed_part, error))
+
+
+class InferenceClient:
+    """Web-process side of the inference server with the InferenceBatcher interface.
+
+    ``submit(tensor)`` returns a Future resolving to ``(master_row,
+    specialist_row)``; ``submit_into(fill)`` lets the caller preprocess
+    directly into the shared slot; ``run(batch)`` has the ``run_two_stage``
+    contract. Raises ``ServerBusy`` when no slot frees up within
+    ``slot_timeout`` seconds or the server's queue is full.
+    """
+
+    def __init__(self, address, authkey=None, slots=16, slot_timeout=5.0):
+        self.slots = slots
+        self.slot_timeout = slot_timeout
+        address = parse_address(address) if isinstance(address, str) else address
+        # Connect first so an unreachable server leaves no shared memory behind
+        self._conn = connection.Client(address, authkey=checked_authkey(address, authkey))
+        self._shm_in = shared_memory.SharedMemory(create=True, size=slots * IMG_BYTES)
+        self._shm_out = shared_memory.SharedMemory(create=True, size=slots * OUT_WIDTH * 4)
+        self.inputs = np.ndarray((slots,) + IMG_SHAPE, dtype=np.float32, buffer=self._shm_in.buf)
+        self.outputs = np.ndarray((slots, OUT_WIDTH), dtype=np.float32, buffer=self._shm_out.buf)
+        self._conn.send(('attach', self._shm_in.name, self._shm_out.name, slots))
+        self._send_lock = threading.Lock()
+        self._free = queue.Queue()
+        for slot in range(slots):
+            self._free.put(slot)
+        self._ids = itertools.count()
+        self._pending = {}  # request id -> (slot, future)
+        self._lock = threading.Lock()
+        self._stats = {'requests': 0, 'busy': 0, 'errors': 0}
+        self._closed = False
+        self._reader = threading.Thread(target=self._read_replies, name='inference-client', daemon=True)
+        self._reader.start()
+        atexit.register(self.close)
+
+    @property
+    def running(self):
+        return not self._closed and self._reader.is_alive()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = len(self._pending)
+        stats['free_slots'] = self._free.qsize()
+        return stats
+
+    def server_stats(self, timeout=5.0):
+        future = self._track(None, next(self._ids), 'stats')
+        return future.result(timeout)
+
+    def _acquire(self):
+        try:
+            return self._free.get(timeout=self.slot_timeout)
+        except queue.Empty:
+            with self._lock:
+                self._stats['busy'] += 1
+            raise ServerBusy(f'No free inference slot within {self.slot_timeout}s')
+
+    def _track(self, slot, request_id, kind='infer'):
+        future = Future()
+        with self._lock:
+            self._pending[request_id] = (slot, future)
+        message = (kind, request_id, slot) if kind == 'infer' else (kind, request_id)
+        try:
+            with self._send_lock:
+                self._conn.send(message)
+        except OSError as e:
+            self._resolve(request_id, error=ConnectionError(f'Inference server unavailable: {e}'))
+        return future
+
+    def submit(self, tensor):
+        return self.submit_into(lambda out: np.copyto(out, tensor, casting='same_kind'))
+
+    def submit_into(self, fill):
+        if not self.running:
+            raise RuntimeError('Inference server connection is closed')
+        slot = self._acquire()
+        try:
+            fill(self.inputs[slot])
+        except Exception:
+            self._free.put(slot)
+            raise
+        with self._lock:
+            self._stats['requests'] += 1
+        return self._track(slot, next(self._ids))
+
+    def run(self, batch):
+        futures = [self.submit(row) for row in batch]
+        master_rows, specialist_rows, failures = [], [], {}
+        for i, future in enumerate(futures):
+            try:
+                master_row, specialist_row = future.result()
+            except Exception as e:
+                master_row, specialist_row = None, None
+                failures[i] = e
+            master_rows.append(master_row)
+            specialist_rows.append(specialist_row)
+        width = next((len(r) for r in master_rows if r is not None), 0)
+        master_out = np.stack([r if r is not None else np.zeros(width, np.float32) for r in master_rows])
+        return master_out, specialist_rows, failures
+
+    def _resolve(self, request_id, result=None, error=None):
+        with self._lock:
+            slot, future = self._pending.pop(request_id, (None, None))
+            if error is not None and slot is not None and not isinstance(error, ServerBusy):
+                self._stats['errors'] += 1
+        if future is None:
+            return
+        if slot is not None:
+            self._free.put(slot)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def _read_replies(self):
+        try:
+            while True:
+                message = self._conn.recv()
+                kind, request_id = message[0], message[1]
+                if kind == 'stats':
+                    self._resolve(request_id, result=message[2])
+                elif kind == 'busy':
+                    with self._lock:
+                        self._stats['busy'] += 1
+                    self._resolve(request_id, error=ServerBusy('Inference server queue is full'))
+                else:
+                    _, _, master_len, specialist_len, routed_part, error = message
+                    if error is not None:
+                        self._resolve(request_id, error=RuntimeError(error))
+                        continue
+                    with self._lock:
+                        slot = self._pending.get(request_id, (None, None))[0]
+                    if slot is None:
+                        continue
+                    master_row = self.outputs[slot, :master_len].copy()
+                    specialist_row = None
+                    if specialist_len >= 0:
+                        specialist_row = self.outputs[slot, MAX_CLASSES:MAX_CLASSES + specialist_len].copy()
+                    if routed_part is not None:
+                        specialist_row = Routed(routed_part, specialist_row)
+                    self._resolve(request_id, result=(master_row, specialist_row))
+        except (EOFError, OSError):
+            if not self._closed:
+                logger.error("❌ Lost connection to the inference server")
+        finally:
+            self._closed = True
+            with self._lock:
+                pending = list(self._pending)
+            for request_id in pending:
+                self._resolve(request_id, error=ConnectionError('Inference server connection closed'))
+
+    def close(self):
+        if self.inputs is None:
+            return
+        self._closed = True
+        self._conn.close()
+        self._reader.join(5)
+        self.inputs = self.outputs = None
+        for shm in (self._shm_in, self._shm_out):
+            shm.close()
+            shm.unlink()
+        atexit.unregister(self.close)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--address', default=os.environ.get('INFERENCE_SERVER', 'unix:/tmp/cattle-inference.sock'))
+    parser.add_argument('--factory', default='app:serving_cascade',
+                        help='module:function returning a cascade with the run_two_stage contract')
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument('--intra-op-threads', type=int, default=0, help='per worker; 0 = TensorFlow default')
+    parser.add_argument('--inter-op-threads', type=int, default=0, help='per worker; 0 = TensorFlow default')
+    parser.add_argument('--max-batch-size', type=int, default=16)
+    parser.add_argument('--max-wait-ms', type=float, default=5.0)
+    parser.add_argument('--queue-size', type=int, default=256)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    InferenceServer(args.address, factory=args.factory, workers=args.workers,
+                    intra_op_threads=args.intra_op_threads, inter_op_threads=args.inter_op_threads,
+                    max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms, queue_size=args.queue_size,
+                    authkey=os.environ.get('INFERENCE_SERVER_AUTHKEY', '').encode()).serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,316 @@
+"""Disease knowledge base: medical info merged from this module and config.py, validated and serialized once"""
+import hashlib
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Disease Medical Information Database - COMPLETE FOR ALL 4 DISEASES
+DISEASE_INFO = {
+    'lumpy': {
+        'name': 'Lumpy Skin Disease (LSD)',
+        'severity': 'HIGH',
+        'description': 'Viral disease causing fever and skin nodules across the body',
+        'immediate_actions': [
+            'Isolate the affected animal IMMEDIATELY to prevent spread',
+            'Measure body temperature (normal: 38-39°C)',
+            'Provide clean, cool drinking water',
+            'Keep the animal in a shaded, fly-free area',
+            'Do NOT attempt to burst or drain nodules yourself'
+        ],
+        'first_aid': [
+            'Apply antiseptic solution (Betadine) around nodules',
+            'Give paracetamol (500mg per 100kg body weight) for fever',
+            'Provide soft, easy-to-eat feed if mouth is affected',
+            'Clean water should be available at all times'
+        ],
+        'emergency_signs': [
+            'Body temperature above 40°C (104°F)',
+            'Difficulty breathing or excessive drooling',
+            'Refusal to eat or drink for more than 12 hours',
+            'Swelling of limbs or udder',
+            'Nodules becoming infected or oozing pus'
+        ],
+        'medicines': [
+            {'name': 'Streptopenicillin', 'type': 'Antibiotic', 'brand': 'Terramycin/Penstrep'},
+            {'name': 'Meloxicam', 'type': 'Anti-inflammatory', 'brand': 'Melonex'},
+            {'name': 'AD3E Injection', 'type': 'Vitamin supplement', 'brand': 'Various'}
+        ],
+        'home_remedies': [
+            'Apply neem oil paste on nodules (antiseptic)',
+            'Turmeric powder mixed with coconut oil (anti-inflammatory)',
+            'Give jaggery water for energy (100g per day)',
+            'Feed crushed garlic cloves (5-6 daily) - natural antibiotic'
+        ],
+        'timeline': 'Incubation: 4-14 days | Acute phase: 7-14 days | Recovery: 4-6 weeks',
+        'prognosis': 'Good with proper care, but notifiable disease - report to authorities'
+    },
+    'mastitis': {
+        'name': 'Mastitis (Udder Infection)',
+        'severity': 'MEDIUM-HIGH',
+        'description': 'Bacterial infection of udder tissue causing inflammation and reduced milk production',
+        'immediate_actions': [
+            'Stop milking the affected quarter immediately',
+            'Milk out the affected quarter gently to remove infected milk',
+            'Apply cold water compress on swollen udder (15 mins)',
+            'Isolate milk from affected quarter - do NOT mix with other milk',
+            'Wash hands thoroughly before and after handling'
+        ],
+        'first_aid': [
+            'Gently massage udder with warm water (not hot)',
+            'Apply camphor oil or eucalyptus oil around udder',
+            'Give pain relief - paracetamol (500mg per 100kg)',
+            'Ensure the cow is lying on soft bedding',
+            'Increase milking frequency to 3-4 times daily'
+        ],
+        'emergency_signs': [
+            'Udder becomes very hot and hard',
+            'Bloody or watery milk with foul smell',
+            'Cow refuses to stand or walk',
+            'Body temperature above 40°C',
+            'Complete loss of milk production',
+            'Gangrene (black discoloration) of udder tissue'
+        ],
+        'medicines': [
+            {'name': 'Mastilone (Cloxacillin)', 'type': 'Intramammary antibiotic', 'brand': 'Mastilone/Mamyzin'},
+            {'name': 'Enrofloxacin', 'type': 'Systemic antibiotic', 'brand': 'Enrocin/Baytril'},
+            {'name': 'Meloxicam', 'type': 'Anti-inflammatory', 'brand': 'Various'},
+            {'name': 'Oxytocin 10IU', 'type': 'Milk letdown aid', 'brand': 'Oxytocin injection'}
+        ],
+        'home_remedies': [
+            'Apply hot fomentation with salt water (warm compress)',
+            'Turmeric paste application on udder surface',
+            'Feed fenugreek seeds (100g daily) - anti-inflammatory',
+            'Aloe vera gel application for soothing effect',
+            'Neem leaf decoction for washing udder'
+        ],
+        'timeline': 'Acute onset: 12-24 hours | Treatment: 5-7 days | Full recovery: 2-3 weeks',
+        'prognosis': 'Good if treated early | Chronic cases may require culling quarter'
+    },
+    'fmd': {
+        'name': 'Foot and Mouth Disease (FMD)',
+        'severity': 'VERY HIGH',
+        'description': 'Highly contagious viral disease causing blisters in mouth and on feet',
+        'immediate_actions': [
+            'ISOLATE IMMEDIATELY - FMD spreads very rapidly',
+            'Report to local veterinary authorities (MANDATORY)',
+            'Stop all animal movement on farm',
+            'Disinfect all equipment, boots, and clothes',
+            'Do NOT allow visitors to farm',
+            'Quarantine entire herd'
+        ],
+        'first_aid': [
+            'Rinse mouth with warm salt water (antiseptic)',
+            'Apply glycerin on mouth lesions for soothing',
+            'Clean feet with potassium permanganate solution',
+            'Apply Stockholm tar or copper sulfate on foot lesions',
+            'Provide soft, liquid feed - green fodder, gruel',
+            'Give plenty of clean drinking water'
+        ],
+        'emergency_signs': [
+            'High fever (40-41°C / 104-106°F)',
+            'Excessive drooling and frothing',
+            'Severe lameness - unable to stand',
+            'Blisters rupturing and becoming infected',
+            'Refusal to eat for more than 24 hours',
+            'Heart complications (sudden death in young calves)'
+        ],
+        'medicines': [
+            {'name': 'Oxytetracycline', 'type': 'Antibiotic (secondary infection)', 'brand': 'Terramycin LA'},
+            {'name': 'Penicillin-Streptomycin', 'type': 'Antibiotic', 'brand': 'Various'},
+            {'name': 'Flunixin', 'type': 'Anti-inflammatory', 'brand': 'Banamine'},
+            {'name': 'B-Complex', 'type': 'Vitamin supplement', 'brand': 'Various'}
+        ],
+        'home_remedies': [
+            'Rinse mouth with alum solution (antiseptic)',
+            'Apply honey on mouth lesions (healing)',
+            'Turmeric + coconut oil paste on foot lesions',
+            'Give buttermilk with rock salt (hydration)',
+            'Neem leaf decoction for foot bath'
+        ],
+        'timeline': 'Incubation: 2-14 days | Fever: 2-3 days | Blisters: 3-7 days | Recovery: 2-3 weeks',
+        'prognosis': 'FMD is viral - no cure, only supportive care | Vaccination is key prevention'
+    },
+    'tongue_disease': {
+        'name': 'Tongue Disease / Oral Lesions',
+        'severity': 'MEDIUM',
+        'description': 'Various conditions affecting tongue including ulcers, inflammation, and infections',
+        'immediate_actions': [
+            'Inspect mouth and tongue thoroughly for lesions',
+            'Check for foreign objects stuck in mouth',
+            'Rinse mouth with clean lukewarm water',
+            'Stop feeding dry, rough fodder immediately',
+            'Provide soft, moist feed only',
+            'Isolate if contagious disease suspected'
+        ],
+        'first_aid': [
+            'Rinse mouth with warm saline solution (1 tsp salt in 1L water)',
+            'Apply glycerin or honey on tongue lesions',
+            'Give soft green fodder or soaked feed',
+            'Offer lukewarm water (not cold)',
+            'Crush feed into small pieces',
+            'Give jaggery for energy and palatability'
+        ],
+        'emergency_signs': [
+            'Complete refusal to eat or drink',
+            'Severe swelling of tongue',
+            'Profuse drooling or frothing',
+            'Blue or black discoloration of tongue',
+            'High fever above 40°C',
+            'Difficulty breathing due to tongue swelling',
+            'Bleeding from mouth or tongue'
+        ],
+        'medicines': [
+            {'name': 'Betadine gargle', 'type': 'Oral antiseptic', 'brand': 'Betadine/Povidone-iodine'},
+            {'name': 'Amoxicillin', 'type': 'Antibiotic', 'brand': 'Various'},
+            {'name': 'Meloxicam', 'type': 'Anti-inflammatory', 'brand': 'Various'},
+            {'name': 'B-Complex', 'type': 'Vitamin supplement', 'brand': 'B-Complex injection'},
+            {'name': 'Orasep gel', 'type': 'Healing gel', 'brand': 'Orasep/Thrush gel'}
+        ],
+        'home_remedies': [
+            'Rinse with turmeric water (1 tsp in warm water) - antiseptic',
+            'Apply pure honey on lesions - healing properties',
+            'Alum powder mixed with glycerin - astringent',
+            'Tender coconut water for hydration and healing',
+            'Betel leaf paste application - antimicrobial',
+            'Feed soft banana or papaya - easy to swallow'
+        ],
+        'timeline': 'Onset: Gradual over 2-3 days | Acute phase: 3-7 days | Healing: 7-14 days | Full recovery: 2-3 weeks',
+        'prognosis': 'Good if treated within 48 hours | Advanced cases may NOT respond'
+    }
+}
+
+
+# config.Config.DISEASE_INFO names that differ from the keys above
+CONFIG_ALIASES = {
+    'Foot and Mouth Disease': 'fmd',
+    'Lumpy Skin Disease': 'lumpy',
+    'Healthy Cow': 'healthy',
+    'Not Cattle': 'non_cattle',
+}
+
+# Everything the result page and the PDF report show for a diagnosed disease
+TEXT_FIELDS = ('name', 'severity', 'description', 'timeline', 'prognosis')
+LIST_FIELDS = ('immediate_actions', 'first_aid', 'emergency_signs', 'home_remedies')
+MEDICINE_FIELDS = ('name', 'type', 'brand')
+# Sections only config.py has; added to entries that lack them
+REFERENCE_LIST_FIELDS = ('treatment_protocol', 'emergency_measures')
+
+
+class KnowledgeBaseError(ValueError):
+    pass
+
+
+def dumps(obj):
+    return json.dumps(obj, separators=(',', ':')).encode()
+
+
+def config_key(name):
+    return CONFIG_ALIASES.get(name, name.lower().replace(' ', '_'))
+
+
+def merge(primary, secondary):
+    """Entries of ``primary`` plus the sections and diseases only ``secondary`` (config.py's layout) has.
+
+    Where both define a field, ``primary`` wins; the keys of such entries
+    are returned as ``divergent`` when the values differ.
+    """
+    entries = {key: dict(entry) for key, entry in primary.items()}
+    divergent = []
+    for name, extra in secondary.items():
+        key = config_key(name)
+        entry = entries.setdefault(key, {'name': name})
+        for field, value in extra.items():
+            if field not in entry:
+                entry[field] = value
+            elif entry[field] != value and key not in divergent:
+                divergent.append(key)
+    return entries, divergent
+
+
+def validate(entries, required=()):
+    """Problems with ``entries``; ``required`` keys must have every section the result page shows"""
+    problems = [f'{key}: missing' for key in required if key not in entries]
+    for key, entry in entries.items():
+        complete = key in required
+        for field in TEXT_FIELDS:
+            value = entry.get(field)
+            if value is None and (complete or field in ('name', 'description')):
+                problems.append(f'{key}: {field} missing')
+            elif value is not None and (not isinstance(value, str) or not value.strip()):
+                problems.append(f'{key}: {field} must be non-empty text')
+        for field in LIST_FIELDS + REFERENCE_LIST_FIELDS:
+            value = entry.get(field)
+            if value is None:
+                if complete and field in LIST_FIELDS:
+                    problems.append(f'{key}: {field} missing')
+            elif not isinstance(value, list) or not value or not all(isinstance(v, str) and v for v in value):
+                problems.append(f'{key}: {field} must be a non-empty list of text')
+        medicines = entry.get('medicines')
+        if medicines is None:
+            if complete:
+                problems.append(f'{key}: medicines missing')
+        elif not isinstance(medicines, list) or not medicines or not all(
+                isinstance(m, dict) and all(isinstance(m.get(f), str) and m[f] for f in MEDICINE_FIELDS)
+                for m in medicines):
+            problems.append(f"{key}: medicines must list {', '.join(MEDICINE_FIELDS)} for each medicine")
+    return problems
+
+
+class KnowledgeBase:
+    """Validated disease entries, each serialized to JSON bytes (with an ETag) once.
+
+    ``/predict`` results carry ``medical_info_key``; ``dumps`` splices the
+    entry's bytes into the response instead of re-encoding it per request,
+    or leaves it out for clients that fetch ``/knowledge/<key>`` and let the
+    browser cache it.
+    """
+
+    def __init__(self, entries):
+        self.entries = entries
+        self._serialized = {}
+        index = {}
+        for key, entry in entries.items():
+            body = dumps(entry)
+            etag = hashlib.sha256(body).hexdigest()[:16]
+            self._serialized[key] = (body, etag)
+            index[key] = {'name': entry['name'], 'severity': entry.get('severity'), 'etag': etag}
+        body = dumps(index)
+        self.index = (body, hashlib.sha256(body).hexdigest()[:16])
+
+    @classmethod
+    def load(cls, primary=None, secondary=None, required=()):
+        """Merge this module's DISEASE_INFO with config.py's, raising KnowledgeBaseError if invalid"""
+        if primary is None:
+            primary = DISEASE_INFO
+        if secondary is None:
+            from config import Config
+            secondary = Config.DISEASE_INFO
+        entries, divergent = merge(primary, secondary)
+        problems = validate(entries, required)
+        if problems:
+            raise KnowledgeBaseError('Invalid disease knowledge base: ' + '; '.join(problems))
+        if divergent:
+            logger.info(f"ℹ️ config.py disease info differs for {', '.join(divergent)}; keeping the app's text")
+        return cls(entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def serialized(self, key):
+        """(JSON bytes, ETag) of one entry"""
+        return self._serialized[key]
+
+    def dumps(self, result, full=True):
+        """JSON bytes of a result; with ``full``, its ``medical_info_key`` entry is spliced in as ``medical_info``"""
+        body = dumps(result)
+        if not full or 'medical_info_key' not in result:
+            return body
+        serialized = self._serialized.get(result['medical_info_key'])
+        return body[:-1] + b',"medical_info":' + (serialized[0] if serialized else b'null') + b'}'
@@ -0,0 +1,162 @@
+"""On-demand specialist model registry with single-flight loading and LRU eviction"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+
+def model_memory_bytes(model):
+    """Resident size of a model's weights (variables dominate a Keras model's footprint)"""
+    if hasattr(model, 'memory_bytes'):
+        return model.memory_bytes
+    total = 0
+    for weight in getattr(model, 'weights', []):
+        total += int(weight.shape.num_elements() or 0) * weight.dtype.size
+    return total
+
+
+class SpecialistRegistry:
+    """Loads specialists the first time they are needed and evicts idle ones.
+
+    ``loader(key)`` must return the loaded model or raise. Concurrent first
+    requests for the same key share one in-flight load. After each load the
+    least-recently-used models are evicted until resident weights fit in
+    ``memory_budget_bytes`` (0 = unlimited); ``idle_seconds`` additionally
+    evicts models nobody has used for that long. Eviction only drops the
+    registry's reference, so a request already holding the model finishes.
+    """
+
+    def __init__(self, loader, memory_budget_bytes=0, idle_seconds=0):
+        self.loader = loader
+        self.memory_budget_bytes = int(memory_budget_bytes or 0)
+        self.idle_seconds = float(idle_seconds or 0)
+        self._known = set()
+        self._resident = OrderedDict()  # key -> (model, bytes, last_used)
+        self._loading = {}
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'loads': 0, 'load_failures': 0, 'evictions': 0}
+        self._load_seconds = {}
+
+    def register(self, key):
+        with self._lock:
+            self._known.add(key)
+
+    def __contains__(self, key):
+        return key in self._known
+
+    def __getitem__(self, key):
+        return self.get(key)
+
+    def __len__(self):
+        return len(self._resident)
+
+    def keys(self):
+        return sorted(self._known)
+
+    def items(self):
+        """Currently resident (key, model) pairs"""
+        with self._lock:
+            return [(key, entry[0]) for key, entry in self._resident.items()]
+
+    def get(self, key):
+        if key not in self._known:
+            raise KeyError(key)
+        with self._lock:
+            entry = self._resident.get(key)
+            if entry is not None:
+                self._resident[key] = (entry[0], entry[1], time.monotonic())
+                self._resident.move_to_end(key)
+                self._stats['hits'] += 1
+                if self.idle_seconds:
+                    self._evict_locked(keep=key)
+                return entry[0]
+            self._stats['misses'] += 1
+            future = self._loading.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._loading[key] = future
+
+        if not owner:
+            return future.result()
+
+        try:
+            start = time.perf_counter()
+            model = self.loader(key)
+            elapsed = time.perf_counter() - start
+            size = model_memory_bytes(model)
+        except Exception as e:
+            with self._lock:
+                self._stats['load_failures'] += 1
+                del self._loading[key]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            self._resident[key] = (model, size, time.monotonic())
+            self._stats['loads'] += 1
+            self._load_seconds[key] = elapsed
+            del self._loading[key]
+            evicted = self._evict_locked(keep=key)
+        future.set_result(model)
+        logger.info(f"📦 Loaded specialist '{key}' on demand ({size / 1e6:.1f} MB, {elapsed:.2f}s)")
+        for name in evicted:
+            logger.info(f"♻️ Evicted specialist '{name}'")
+        return model
+
+    def load_all(self):
+        """Eagerly load every registered specialist (skips ones that fail)"""
+        loaded = 0
+        for key in self.keys():
+            try:
+                self.get(key)
+                loaded += 1
+            except Exception as e:
+                logger.error(f"❌ Error loading specialist '{key}': {e}")
+        return loaded
+
+    def evict(self, key):
+        with self._lock:
+            if self._resident.pop(key, None) is None:
+                return False
+            self._stats['evictions'] += 1
+            return True
+
+    def evict_idle(self):
+        with self._lock:
+            return self._evict_locked()
+
+    def _evict_locked(self, keep=None):
+        evicted = []
+        if self.idle_seconds:
+            cutoff = time.monotonic() - self.idle_seconds
+            for key, (_, _, last_used) in list(self._resident.items()):
+                if key != keep and last_used < cutoff:
+                    evicted.append(key)
+        for key in evicted:
+            del self._resident[key]
+        if self.memory_budget_bytes:
+            total = sum(entry[1] for entry in self._resident.values())
+            for key in list(self._resident):
+                if total <= self.memory_budget_bytes:
+                    break
+                if key == keep:
+                    continue
+                total -= self._resident.pop(key)[1]
+                evicted.append(key)
+        self._stats['evictions'] += len(evicted)
+        return evicted
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['resident'] = {key: {'bytes': entry[1], 'idle_seconds': round(time.monotonic() - entry[2], 1)}
+                                 for key, entry in self._resident.items()}
+            stats['resident_bytes'] = sum(entry[1] for entry in self._resident.values())
+            stats['load_seconds'] = dict(self._load_seconds)
+            stats['memory_budget_bytes'] = self.memory_budget_bytes
+            stats['registered'] = sorted(self._known)
+        return stats
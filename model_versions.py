@@ -0,0 +1,267 @@
+"""Versioned model sets: background reloads swapped in atomically, and shadow comparison of a candidate"""
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Fields a candidate's result is compared on
+COMPARED_FIELDS = ('body_part', 'predicted_class', 'status')
+
+
+class ModelSet:
+    """One version of everything the cascade serves with.
+
+    A request takes the serving set once and uses it throughout, so a swap
+    never mixes two versions in one result and requests already running
+    finish on the set they started with. The old set is freed once the
+    last of them drops it. ``files`` is the mtime/size token of the model
+    files the set was loaded from. ``version`` is the token recorded on
+    results, and may hash the file contents instead. With ``directory`` set
+    (a shadow candidate), each model file is read from there when a file
+    of that name exists, and from its usual path otherwise.
+    """
+
+    def __init__(self, version, files, directory=None):
+        self.version = version
+        self.files = files
+        self.directory = directory
+        self.master_model = None
+        self.master_config = None
+        self.routing_policy = None
+        self.specialists = None
+        self.specialist_configs = {}
+        self.fused_cascade = None
+        self.loaded_at = None
+
+    def path(self, path):
+        if self.directory is None:
+            return path
+        candidate = os.path.join(self.directory, os.path.basename(path))
+        return candidate if os.path.exists(candidate) else path
+
+    def describe(self):
+        return {
+            'version': self.version,
+            'directory': self.directory,
+            'loaded_at': self.loaded_at,
+            'specialists': self.specialists.keys() if self.specialists is not None else [],
+            'fused': self.fused_cascade.stats() if self.fused_cascade is not None else None
+        }
+
+
+class ModelReloader:
+    """Polls a set of model files and loads a new ModelSet in the background when they change.
+
+    ``files()`` returns the current change token, ``current()`` the set being
+    served (or None), ``load()`` builds and warms a new set, and
+    ``activate(models)`` swaps it in. A change must stay the same for a whole
+    poll before it is loaded, so a file that is still being copied is not
+    picked up. If a load fails, the current set keeps serving, and that
+    token is not tried again until the files change once more. ``reload()``
+    wakes the poller to load now, even if the files are unchanged.
+    """
+
+    def __init__(self, files, current, load, activate, interval=10.0, name='models'):
+        self.files = files
+        self.current = current
+        self.load = load
+        self.activate = activate
+        self.interval = interval
+        self.name = name
+        self._pending = None
+        self._failed = None
+        self._force = False
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stats = {'checks': 0, 'reloads': 0, 'failures': 0, 'last_error': None, 'last_load_seconds': None}
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._poll_loop, name=f'{self.name}-reloader', daemon=True)
+            self._thread.start()
+        return self
+
+    def reload(self):
+        self._force = True
+        self._wake.set()
+
+    def _poll_loop(self):
+        while True:
+            try:
+                self.check()
+            except Exception as e:
+                logger.error(f"❌ {self.name}: reload check failed: {e}")
+            self._wake.wait(self.interval if self.interval > 0 else None)
+            self._wake.clear()
+
+    def check(self):
+        """One poll; True if a new set was activated"""
+        with self._lock:
+            self._stats['checks'] += 1
+            token = self.files()
+            current = self.current()
+            force, self._force = self._force, False
+            if not force:
+                if current is not None and token == current.files:
+                    self._pending = None
+                    return False
+                if token == self._failed:
+                    return False
+                if current is not None and token != self._pending:
+                    # Wait one more poll in case the files are still being written
+                    self._pending = token
+                    return False
+            self._pending = None
+            logger.info(f"🔄 {self.name}: loading model files {token}...")
+            started = time.perf_counter()
+            try:
+                models = self.load()
+            except Exception as e:
+                self._failed = token
+                self._stats['failures'] += 1
+                self._stats['last_error'] = str(e)
+                logger.error(f"❌ {self.name}: loading {token} failed, still serving "
+                             f"{current.version if current is not None else 'nothing'}: {e}")
+                return False
+            self._failed = None
+            self._stats['reloads'] += 1
+            self._stats['last_error'] = None
+            self._stats['last_load_seconds'] = round(time.perf_counter() - started, 3)
+            models.loaded_at = time.time()
+            self.activate(models)
+            return True
+
+    def stats(self):
+        return dict(self._stats, interval=self.interval, pending=self._pending, failed=self._failed)
+
+
+class ShadowRunner:
+    """Replays a sample of live predictions through a candidate ModelSet and compares the answers.
+
+    After the serving set answers, ``offer(tensor, result, seconds)`` passes
+    in the preprocessed image, the result and the serving inference time per
+    image. A ``sample_rate`` fraction of these is copied onto a bounded
+    queue. A background thread then runs them in small batches through
+    ``predict(batch, candidate)``, which returns one result dict, or None,
+    per image. Agreement is counted per COMPARED_FIELDS, and latency is
+    recorded for both sides. A summary is logged every ``log_every``
+    comparisons, and each disagreement at debug level. Nothing here ever
+    blocks a request: offers are dropped when the queue is full. The counters
+    reset whenever a new candidate is set.
+    """
+
+    def __init__(self, predict, sample_rate=0.05, queue_size=64, batch_size=8, window=1000, log_every=100):
+        self.predict = predict
+        self.sample_rate = sample_rate
+        self.batch_size = batch_size
+        self.window = window
+        self.log_every = log_every
+        self._candidate = None
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._reset()
+        self._thread = threading.Thread(target=self._worker, name='shadow-runner', daemon=True)
+        self._thread.start()
+
+    def _reset(self):
+        self._stats = {'sampled': 0, 'compared': 0, 'dropped': 0, 'failed': 0, 'agree_all': 0,
+                       'primary_seconds': 0.0, 'candidate_seconds': 0.0}
+        self._stats.update({f'agree_{field}': 0 for field in COMPARED_FIELDS})
+        self._latencies = {'primary': deque(maxlen=self.window), 'candidate': deque(maxlen=self.window)}
+
+    @property
+    def candidate(self):
+        return self._candidate
+
+    @candidate.setter
+    def candidate(self, models):
+        with self._lock:
+            self._candidate = models
+            self._reset()
+        logger.info(f"🔍 Shadowing candidate models {models.version} on {self.sample_rate:.0%} of predictions")
+
+    def offer(self, tensor, result, seconds):
+        if self._candidate is None or not result.get('success') or random.random() >= self.sample_rate:
+            return False
+        try:
+            self._queue.put_nowait((np.array(tensor, dtype=np.float32), result, seconds))
+        except queue.Full:
+            with self._lock:
+                self._stats['dropped'] += 1
+            return False
+        with self._lock:
+            self._stats['sampled'] += 1
+        return True
+
+    def _worker(self):
+        while True:
+            items = [self._queue.get()]
+            while len(items) < self.batch_size:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            candidate = self._candidate
+            try:
+                started = time.perf_counter()
+                results = self.predict(np.stack([tensor for tensor, _, _ in items]), candidate)
+                seconds = (time.perf_counter() - started) / len(items)
+            except Exception as e:
+                with self._lock:
+                    self._stats['failed'] += len(items)
+                logger.warning(f"⚠️ Shadow candidate {candidate.version} failed: {e}")
+                continue
+            for (_, primary, primary_seconds), result in zip(items, results):
+                self._compare(candidate, primary, primary_seconds, result, seconds)
+
+    def _compare(self, candidate, primary, primary_seconds, result, seconds):
+        with self._lock:
+            if candidate is not self._candidate:
+                return
+            if result is None or not result.get('success'):
+                self._stats['failed'] += 1
+                return
+            agreed = [field for field in COMPARED_FIELDS if primary.get(field) == result.get(field)]
+            self._stats['compared'] += 1
+            for field in agreed:
+                self._stats[f'agree_{field}'] += 1
+            self._stats['agree_all'] += len(agreed) == len(COMPARED_FIELDS)
+            self._stats['primary_seconds'] += primary_seconds
+            self._stats['candidate_seconds'] += seconds
+            self._latencies['primary'].append(primary_seconds)
+            self._latencies['candidate'].append(seconds)
+            compared, agree_all = self._stats['compared'], self._stats['agree_all']
+        if len(agreed) < len(COMPARED_FIELDS):
+            logger.debug(f"Shadow {candidate.version} disagrees with {primary.get('model_version')}: "
+                         f"{primary.get('body_part')}/{primary.get('predicted_class')} vs "
+                         f"{result.get('body_part')}/{result.get('predicted_class')}")
+        if compared % self.log_every == 0:
+            stats = self.stats()
+            logger.info(f"🔍 Shadow {candidate.version}: {agree_all / compared:.1%} agreement over {compared} "
+                        f"predictions, p50 {stats['candidate_ms']['p50']}ms vs {stats['primary_ms']['p50']}ms serving")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            latencies = {side: sorted(samples) for side, samples in self._latencies.items()}
+            candidate = self._candidate
+        compared = stats['compared']
+        stats['candidate'] = candidate.version if candidate is not None else None
+        stats['sample_rate'] = self.sample_rate
+        stats['queue_depth'] = self._queue.qsize()
+        stats['agreement'] = {field: round(stats[f'agree_{field}'] / compared, 4) if compared else None
+                              for field in COMPARED_FIELDS + ('all',)}
+        for side, samples in latencies.items():
+            stats[f'{side}_ms'] = {
+                'p50': round(samples[len(samples) // 2] * 1000, 2),
+                'p95': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 2)
+            } if samples else None
+        return stats
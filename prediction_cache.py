@@ -0,0 +1,263 @@
+"""Content-addressed prediction cache with an in-process tier and an SQLite tier"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Fields added by /predict for one request; never cached
+PER_REQUEST_FIELDS = ('image', 'timestamp', 'confidence_percent', 'cached', 'prediction_id')
+
+
+def content_key(data):
+    return 'sha256:' + hashlib.sha256(data).hexdigest()
+
+
+def stream_content_key(stream, chunk_size=1 << 20):
+    """content_key of a seekable file object, hashed in chunks and rewound afterwards"""
+    digest = hashlib.sha256()
+    stream.seek(0)
+    for chunk in iter(lambda: stream.read(chunk_size), b''):
+        digest.update(chunk)
+    stream.seek(0)
+    return 'sha256:' + digest.hexdigest()
+
+
+def perceptual_key(tensor):
+    """64-bit average hash of a preprocessed (H, W, 3) or (1, H, W, 3) image tensor.
+
+    Re-encoded or lightly recompressed copies of a photo decode to nearly the
+    same 224x224 tensor, so they share this key even though their bytes differ.
+    """
+    gray = np.asarray(tensor, dtype=np.float32).reshape(tensor.shape[-3:]).mean(axis=-1)
+    h, w = gray.shape
+    blocks = gray[:h - h % 8, :w - w % 8].reshape(8, h // 8, 8, w // 8).mean(axis=(1, 3))
+    bits = (blocks > blocks.mean()).ravel()
+    return 'ahash:' + f'{int("".join("1" if b else "0" for b in bits), 2):016x}'
+
+
+def files_fingerprint(paths, hash_contents=False, salt=''):
+    """Version token for a set of model files: changes when any file's mtime/size (or bytes) change"""
+    digest = hashlib.sha1(salt.encode())
+    for path in sorted(paths):
+        digest.update(path.encode())
+        try:
+            stat = os.stat(path)
+        except OSError:
+            digest.update(b'missing')
+            continue
+        digest.update(f'{stat.st_mtime_ns}:{stat.st_size}'.encode())
+        if hash_contents:
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+class MemoryTier:
+    """LRU of JSON strings bounded by entry count, total bytes and TTL"""
+
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024, ttl_seconds=3600):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # key -> (value, version, stored_at)
+        self._bytes = 0
+        self.evictions = 0
+
+    def get(self, key, version):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, entry_version, stored_at = entry
+        if entry_version != version or (self.ttl_seconds and time.time() - stored_at > self.ttl_seconds):
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key, value, version):
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (value, version, time.time())
+        self._bytes += len(value)
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def discard(self, key):
+        if key in self._entries:
+            self._remove(key)
+
+    def _remove(self, key):
+        value, _, _ = self._entries.pop(key)
+        self._bytes -= len(value)
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteTier:
+    """Disk tier shared across restarts and worker processes"""
+
+    def __init__(self, path, max_entries=100000, ttl_seconds=7 * 24 * 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.evictions = 0
+        self._writes = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS prediction_cache ('
+                           'key TEXT PRIMARY KEY, version TEXT NOT NULL, value TEXT NOT NULL, '
+                           'stored_at REAL NOT NULL, accessed_at REAL NOT NULL)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_prediction_cache_accessed '
+                           'ON prediction_cache (accessed_at)')
+
+    def get(self, key, version):
+        row = self._conn.execute('SELECT value, version, stored_at FROM prediction_cache WHERE key = ?',
+                                 (key,)).fetchone()
+        if row is None:
+            return None
+        value, entry_version, stored_at = row
+        now = time.time()
+        if entry_version != version or (self.ttl_seconds and now - stored_at > self.ttl_seconds):
+            self._conn.execute('DELETE FROM prediction_cache WHERE key = ?', (key,))
+            return None
+        self._conn.execute('UPDATE prediction_cache SET accessed_at = ? WHERE key = ?', (now, key))
+        return value
+
+    def put(self, key, value, version):
+        now = time.time()
+        self._conn.execute('INSERT OR REPLACE INTO prediction_cache VALUES (?, ?, ?, ?, ?)',
+                           (key, version, value, now, now))
+        self._writes += 1
+        if self._writes % 100 == 0:
+            self.trim()
+
+    def trim(self):
+        """Drop expired rows, then least-recently-accessed rows beyond max_entries"""
+        if self.ttl_seconds:
+            cur = self._conn.execute('DELETE FROM prediction_cache WHERE stored_at < ?',
+                                     (time.time() - self.ttl_seconds,))
+            self.evictions += cur.rowcount
+        count = self._conn.execute('SELECT COUNT(*) FROM prediction_cache').fetchone()[0]
+        if count > self.max_entries:
+            cur = self._conn.execute('DELETE FROM prediction_cache WHERE key IN (SELECT key FROM prediction_cache '
+                                     'ORDER BY accessed_at ASC LIMIT ?)', (count - self.max_entries,))
+            self.evictions += cur.rowcount
+
+    def clear(self):
+        self._conn.execute('DELETE FROM prediction_cache')
+
+    def invalidate(self, version):
+        cur = self._conn.execute('DELETE FROM prediction_cache WHERE version != ?', (version,))
+        return cur.rowcount
+
+    def __len__(self):
+        return self._conn.execute('SELECT COUNT(*) FROM prediction_cache').fetchone()[0]
+
+
+class PredictionCache:
+    """Result cache keyed by upload content, invalidated when the model files change.
+
+    ``version_source`` is a zero-argument callable returning the current model
+    version token (see ``files_fingerprint``); it is re-checked at most every
+    ``check_interval`` seconds, and a new token drops every older entry.
+    """
+
+    def __init__(self, version_source, memory_tier=None, disk_tier=None, check_interval=5.0):
+        self.version_source = version_source
+        self.memory = memory_tier
+        self.disk = disk_tier
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._version = version_source()
+        self._checked_at = time.monotonic()
+        self._stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'stores': 0, 'invalidations': 0}
+        if self.disk is not None:
+            # Entries written by a previous run against different model files
+            self.disk.invalidate(self._version)
+
+    @property
+    def version(self):
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            self._checked_at = now
+            current = self.version_source()
+            if current != self._version:
+                self._invalidate(current)
+        return self._version
+
+    def _invalidate(self, version):
+        with self._lock:
+            self._version = version
+            self._stats['invalidations'] += 1
+            if self.memory is not None:
+                self.memory.clear()
+            dropped = self.disk.invalidate(version) if self.disk is not None else 0
+        logger.info(f"♻️ Model files changed, prediction cache invalidated ({dropped} disk entries dropped)")
+
+    def get(self, key):
+        version = self.version
+        with self._lock:
+            value = self.memory.get(key, version) if self.memory is not None else None
+            if value is not None:
+                self._stats['memory_hits'] += 1
+                return json.loads(value)
+            if self.disk is not None:
+                value = self.disk.get(key, version)
+                if value is not None:
+                    self._stats['disk_hits'] += 1
+                    if self.memory is not None:
+                        self.memory.put(key, value, version)
+                    return json.loads(value)
+            self._stats['misses'] += 1
+        return None
+
+    def put(self, result, *keys):
+        value = json.dumps({k: v for k, v in result.items() if k not in PER_REQUEST_FIELDS})
+        version = self.version
+        with self._lock:
+            for key in keys:
+                if self.memory is not None:
+                    self.memory.put(key, value, version)
+                if self.disk is not None:
+                    self.disk.put(key, value, version)
+            self._stats['stores'] += 1
+
+    def clear(self):
+        with self._lock:
+            if self.memory is not None:
+                self.memory.clear()
+            if self.disk is not None:
+                self.disk.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+            stats['hit_rate'] = (stats['memory_hits'] + stats['disk_hits']) / lookups if lookups else 0.0
+            stats['version'] = self._version
+            if self.memory is not None:
+                stats['memory_entries'] = len(self.memory)
+                stats['memory_evictions'] = self.memory.evictions
+            if self.disk is not None:
+                stats['disk_entries'] = len(self.disk)
+                stats['disk_evictions'] = self.disk.evictions
+        return stats
@@ -0,0 +1,492 @@
+"""SQLite-backed prediction history with batched background writes, keyset pagination and incremental rollups"""
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from datetime import date, timedelta
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ('prediction_id', 'user_email', 'user_name', 'timestamp', 'body_part', 'diagnosis', 'confidence', 'status',
+           'model_version', 'image_key')
+USER_COLUMN = COLUMNS.index('user_email')
+
+PREDICTION_ID_COLUMN = COLUMNS.index('prediction_id')
+# Key of the all-users rows in prediction_totals and user_status_totals. Accounts must have an email
+# address (user_store.valid_email), and add() refuses it, so no user's totals can land on or read it.
+ALL_USERS = '*'
+
+# Confidence histograms split [0, 1] into this many equal buckets
+HISTOGRAM_BUCKETS = 20
+
+# Queued by a waiting reader: the writer commits what it has instead of waiting out flush_interval
+COMMIT_NOW = object()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS predictions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    prediction_id TEXT,
+    user_email TEXT NOT NULL,
+    user_name TEXT,
+    timestamp TEXT NOT NULL,
+    body_part TEXT,
+    diagnosis TEXT,
+    confidence REAL,
+    status TEXT,
+    model_version TEXT,
+    image_key TEXT
+);
+CREATE TABLE IF NOT EXISTS prediction_totals (
+    user_email TEXT PRIMARY KEY,
+    total INTEGER NOT NULL,
+    user_name TEXT,
+    last_timestamp TEXT
+);
+CREATE TABLE IF NOT EXISTS user_status_totals (
+    user_email TEXT NOT NULL,
+    status TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (user_email, status)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS prediction_rollups (
+    day TEXT NOT NULL,
+    body_part TEXT NOT NULL,
+    diagnosis TEXT NOT NULL,
+    status TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    confidence_sum REAL NOT NULL,
+    PRIMARY KEY (day, body_part, diagnosis, status)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS confidence_histogram (
+    day TEXT NOT NULL,
+    body_part TEXT NOT NULL,
+    status TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (day, body_part, status, bucket)
+) WITHOUT ROWID;
+"""
+
+INDEXES = """
+CREATE UNIQUE INDEX IF NOT EXISTS idx_predictions_prediction_id ON predictions (prediction_id);
+CREATE INDEX IF NOT EXISTS idx_predictions_user_time ON predictions (user_email, timestamp);
+CREATE INDEX IF NOT EXISTS idx_predictions_diagnosis ON predictions (diagnosis);
+CREATE INDEX IF NOT EXISTS idx_predictions_body_part ON predictions (body_part);
+CREATE INDEX IF NOT EXISTS idx_predictions_status ON predictions (status);
+CREATE INDEX IF NOT EXISTS idx_predictions_image_key ON predictions (image_key, user_email);
+CREATE INDEX IF NOT EXISTS idx_prediction_totals_rank ON prediction_totals (total DESC, user_email);
+"""
+
+# Rebuilds the rollups from the rows already stored (databases from before they existed).
+# Missing dimensions are stored as '' so they still have a primary key.
+BACKFILL = """
+DELETE FROM prediction_rollups;
+DELETE FROM confidence_histogram;
+DELETE FROM user_status_totals;
+INSERT INTO prediction_rollups (day, body_part, diagnosis, status, count, confidence_sum)
+    SELECT substr(timestamp, 1, 10), COALESCE(body_part, ''), COALESCE(diagnosis, ''), COALESCE(status, ''),
+           COUNT(*), TOTAL(confidence)
+    FROM predictions GROUP BY 1, 2, 3, 4;
+INSERT INTO confidence_histogram (day, body_part, status, bucket, count)
+    SELECT substr(timestamp, 1, 10), COALESCE(body_part, ''), COALESCE(status, ''),
+           MAX(0, MIN(CAST(confidence * {buckets} AS INTEGER), {buckets} - 1)), COUNT(*)
+    FROM predictions WHERE confidence IS NOT NULL GROUP BY 1, 2, 3, 4;
+INSERT INTO user_status_totals (user_email, status, count)
+    SELECT user_email, COALESCE(status, ''), COUNT(*) FROM predictions GROUP BY 1, 2;
+INSERT INTO user_status_totals (user_email, status, count)
+    SELECT '*', COALESCE(status, ''), COUNT(*) FROM predictions GROUP BY 2;
+UPDATE prediction_totals SET
+    user_name = (SELECT user_name FROM predictions p WHERE p.user_email = prediction_totals.user_email
+                 ORDER BY timestamp DESC, id DESC LIMIT 1),
+    last_timestamp = (SELECT MAX(timestamp) FROM predictions p WHERE p.user_email = prediction_totals.user_email)
+    WHERE user_email != '*';
+UPDATE prediction_totals SET last_timestamp = (SELECT MAX(timestamp) FROM predictions) WHERE user_email = '*';
+""".format(buckets=HISTOGRAM_BUCKETS)
+
+
+def histogram_bucket(confidence):
+    return max(0, min(int(confidence * HISTOGRAM_BUCKETS), HISTOGRAM_BUCKETS - 1))
+
+
+def sqlite_path(database_uri):
+    """'sqlite:///cattle_care.db' -> 'cattle_care.db'; None for non-SQLite URIs"""
+    if not database_uri.startswith('sqlite:///'):
+        return None
+    return database_uri[len('sqlite:///'):] or ':memory:'
+
+
+class PredictionStore:
+    """Prediction log persisted in SQLite.
+
+    ``add`` only enqueues; a writer thread commits queued rows in batches of up
+    to ``batch_size`` (waiting at most ``flush_interval`` seconds to fill one)
+    and keeps per-user totals alongside, so counts never scan the table.
+    The same transaction adds to the rollups: counts and confidence sums
+    per day x body part x diagnosis x status, a confidence histogram per day
+    x body part x status, and per-user counts by status. Statistics read
+    those instead of the predictions, so their cost depends on the number
+    of days asked for, not the number of predictions stored.
+    Readers use their own per-thread connections (WAL mode) and do not
+    wait for the writer, with two exceptions so a user sees their own
+    latest prediction: reads of one user's history or totals wait for that
+    user's queued rows, and ``get`` waits for its row if it is queued. A
+    waiting reader has the writer commit at once rather than at the end of
+    its batching window.
+    """
+
+    def __init__(self, path, batch_size=256, flush_interval=0.5):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        conn = self._connection()
+        conn.executescript(SCHEMA)
+        existing = {row['name'] for row in conn.execute('PRAGMA table_info(predictions)')}
+        for column in ('prediction_id', 'model_version', 'image_key'):
+            if column not in existing:
+                conn.execute(f'ALTER TABLE predictions ADD COLUMN {column} TEXT')
+        existing = {row['name'] for row in conn.execute('PRAGMA table_info(prediction_totals)')}
+        for column in ('user_name', 'last_timestamp'):
+            if column not in existing:
+                conn.execute(f'ALTER TABLE prediction_totals ADD COLUMN {column} TEXT')
+        conn.executescript(INDEXES)
+        self._backfill_rollups(conn)
+        self._queue = queue.Queue()
+        self._pending = 0
+        self._pending_users = {}
+        self._pending_ids = set()
+        self._pending_lock = threading.Condition()
+        self._writer = threading.Thread(target=self._write_loop, name='prediction-store-writer', daemon=True)
+        self._writer.start()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _backfill_rollups(self, conn):
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            needed = (conn.execute('SELECT 1 FROM prediction_rollups LIMIT 1').fetchone() is None
+                      and conn.execute('SELECT 1 FROM predictions LIMIT 1').fetchone() is not None)
+            if needed:
+                logger.info("🔄 Building prediction rollups from existing history...")
+                started = time.perf_counter()
+                for statement in BACKFILL.split(';'):
+                    if statement.strip():
+                        conn.execute(statement)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        if needed:
+            logger.info(f"✅ Prediction rollups built in {time.perf_counter() - started:.1f}s")
+
+    # Writes
+
+    def add(self, entry):
+        row = self._row(entry)
+        with self._pending_lock:
+            self._pending += 1
+            self._pending_users[row[USER_COLUMN]] = self._pending_users.get(row[USER_COLUMN], 0) + 1
+            if row[PREDICTION_ID_COLUMN] is not None:
+                self._pending_ids.add(row[PREDICTION_ID_COLUMN])
+        self._queue.put(row)
+
+    def add_many(self, entries):
+        """Synchronous bulk insert (imports, benchmarks)"""
+        self._write_batch(self._connection(), [self._row(e) for e in entries])
+
+    @staticmethod
+    def _row(entry):
+        if entry.get('user_email') == ALL_USERS:
+            raise ValueError(f'{ALL_USERS!r} is reserved for the all-users totals')
+        return tuple(entry.get(column) for column in COLUMNS)
+
+    def flush(self, timeout=5.0):
+        """Block until everything queued so far is committed"""
+        return self._wait(lambda: self._pending, timeout)
+
+    def _wait_for_user(self, user_email, timeout=5.0):
+        if user_email != ALL_USERS:
+            self._wait(lambda: self._pending_users.get(user_email), timeout)
+
+    def _wait(self, pending, timeout):
+        deadline = time.monotonic() + timeout
+        with self._pending_lock:
+            if not pending():
+                return True
+        self._queue.put(COMMIT_NOW)
+        with self._pending_lock:
+            while pending():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._pending_lock.wait(remaining)
+        return True
+
+    def _write_loop(self):
+        conn = self._connection()
+        while True:
+            row = self._queue.get()
+            if row is COMMIT_NOW:
+                continue
+            rows = [row]
+            deadline = time.monotonic() + self.flush_interval
+            while len(rows) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    row = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if row is COMMIT_NOW:
+                    break
+                rows.append(row)
+            try:
+                self._write_batch(conn, rows)
+            except Exception as e:
+                logger.error(f"❌ Failed to write {len(rows)} predictions: {e}")
+            with self._pending_lock:
+                self._pending -= len(rows)
+                for row in rows:
+                    user = row[USER_COLUMN]
+                    self._pending_users[user] -= 1
+                    if not self._pending_users[user]:
+                        del self._pending_users[user]
+                    self._pending_ids.discard(row[PREDICTION_ID_COLUMN])
+                self._pending_lock.notify_all()
+
+    def _write_batch(self, conn, rows):
+        totals, statuses, rollups, histogram = {}, {}, {}, {}
+        for row in rows:
+            entry = dict(zip(COLUMNS, row))
+            email, timestamp = entry['user_email'], entry['timestamp']
+            body_part, status = entry['body_part'] or '', entry['status'] or ''
+            confidence = entry['confidence']
+            for user, name in ((ALL_USERS, None), (email, entry['user_name'])):
+                count, _, last = totals.get(user, (0, None, ''))
+                # The batch is in arrival order, so the last row carries the current name
+                totals[user] = (count + 1, name, max(last, timestamp))
+                statuses[user, status] = statuses.get((user, status), 0) + 1
+            key = (timestamp[:10], body_part, entry['diagnosis'] or '', status)
+            count, confidence_sum = rollups.get(key, (0, 0.0))
+            rollups[key] = (count + 1, confidence_sum + (confidence or 0.0))
+            if confidence is not None:
+                key = (timestamp[:10], body_part, status, histogram_bucket(confidence))
+                histogram[key] = histogram.get(key, 0) + 1
+        conn.execute('BEGIN')
+        try:
+            conn.executemany(f'INSERT INTO predictions ({", ".join(COLUMNS)}) '
+                             f'VALUES ({", ".join("?" * len(COLUMNS))})', rows)
+            conn.executemany('INSERT INTO prediction_totals (user_email, total, user_name, last_timestamp) '
+                             'VALUES (?, ?, ?, ?) ON CONFLICT(user_email) DO UPDATE SET '
+                             'total = total + excluded.total, '
+                             'user_name = COALESCE(excluded.user_name, user_name), '
+                             'last_timestamp = MAX(COALESCE(last_timestamp, \'\'), excluded.last_timestamp)',
+                             [(user, *values) for user, values in totals.items()])
+            conn.executemany('INSERT INTO user_status_totals (user_email, status, count) VALUES (?, ?, ?) '
+                             'ON CONFLICT(user_email, status) DO UPDATE SET count = count + excluded.count',
+                             [(*key, count) for key, count in statuses.items()])
+            conn.executemany('INSERT INTO prediction_rollups '
+                             '(day, body_part, diagnosis, status, count, confidence_sum) VALUES (?, ?, ?, ?, ?, ?) '
+                             'ON CONFLICT(day, body_part, diagnosis, status) DO UPDATE SET '
+                             'count = count + excluded.count, confidence_sum = confidence_sum + excluded.confidence_sum',
+                             [(*key, *values) for key, values in rollups.items()])
+            conn.executemany('INSERT INTO confidence_histogram (day, body_part, status, bucket, count) '
+                             'VALUES (?, ?, ?, ?, ?) ON CONFLICT(day, body_part, status, bucket) DO UPDATE SET '
+                             'count = count + excluded.count',
+                             [(*key, count) for key, count in histogram.items()])
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    # Reads
+
+    def get(self, prediction_id):
+        self._wait(lambda: prediction_id in self._pending_ids, 5.0)
+        row = self._connection().execute('SELECT * FROM predictions WHERE prediction_id = ?',
+                                         (prediction_id,)).fetchone()
+        return dict(row) if row else None
+
+    def get_many(self, prediction_ids):
+        """``{prediction_id: record}`` for the ids that exist"""
+        prediction_ids = list(prediction_ids)
+        records = {}
+        # Stay under SQLite's default limit on bound parameters
+        for start in range(0, len(prediction_ids), 500):
+            chunk = prediction_ids[start:start + 500]
+            rows = self._connection().execute(
+                f"SELECT * FROM predictions WHERE prediction_id IN ({', '.join('?' * len(chunk))})", chunk)
+            records.update((row['prediction_id'], dict(row)) for row in rows)
+        return records
+
+    def has_image(self, image_key, user_email):
+        """Whether the user has a prediction of the stored image ``image_key``"""
+        self._wait_for_user(user_email)
+        return self._connection().execute('SELECT 1 FROM predictions WHERE image_key = ? AND user_email = ? LIMIT 1',
+                                          (image_key, user_email)).fetchone() is not None
+
+    def count(self, user_email=ALL_USERS):
+        self._wait_for_user(user_email)
+        row = self._connection().execute('SELECT total FROM prediction_totals WHERE user_email = ?',
+                                         (user_email,)).fetchone()
+        return row['total'] if row else 0
+
+    def recent_for_user(self, user_email, limit=10, before=None):
+        """Newest-first page of one user's predictions; ``before`` is the id cursor from the last page"""
+        self._wait_for_user(user_email)
+        if before is None:
+            rows = self._connection().execute(
+                'SELECT * FROM predictions WHERE user_email = ? '
+                'ORDER BY timestamp DESC, id DESC LIMIT ?', (user_email, limit))
+        else:
+            rows = self._connection().execute(
+                'SELECT * FROM predictions WHERE user_email = ? '
+                'AND (timestamp, id) < (SELECT timestamp, id FROM predictions WHERE id = ?) '
+                'ORDER BY timestamp DESC, id DESC LIMIT ?', (user_email, before, limit))
+        return [dict(row) for row in rows]
+
+    def recent(self, limit=50, before=None):
+        """Newest-first page across all users"""
+        if before is None:
+            rows = self._connection().execute('SELECT * FROM predictions ORDER BY id DESC LIMIT ?', (limit,))
+        else:
+            rows = self._connection().execute('SELECT * FROM predictions WHERE id < ? ORDER BY id DESC LIMIT ?',
+                                              (before, limit))
+        return [dict(row) for row in rows]
+
+    def filter(self, diagnosis=None, body_part=None, status=None, user_email=None, limit=50, before=None):
+        """Newest-first page of the predictions matching every filter given"""
+        clauses, params = [], []
+        for column, value in (('diagnosis', diagnosis), ('body_part', body_part), ('status', status),
+                              ('user_email', user_email)):
+            if value is not None:
+                clauses.append(f'{column} = ?')
+                params.append(value)
+        if before is not None:
+            clauses.append('id < ?')
+            params.append(before)
+        where = f'WHERE {" AND ".join(clauses)}' if clauses else ''
+        rows = self._connection().execute(f'SELECT * FROM predictions {where} ORDER BY id DESC LIMIT ?',
+                                          params + [limit])
+        return [dict(row) for row in rows]
+
+    # Rollups
+
+    def _rollup_where(self, since, until, **filters):
+        clauses, params = [], []
+        if since is not None:
+            clauses.append('day >= ?')
+            params.append(since)
+        if until is not None:
+            clauses.append('day <= ?')
+            params.append(until)
+        for column, value in filters.items():
+            if value is not None:
+                clauses.append(f'{column} = ?')
+                params.append(value)
+        return f'WHERE {" AND ".join(clauses)}' if clauses else '', params
+
+    def status_totals(self, user_email=ALL_USERS):
+        self._wait_for_user(user_email)
+        rows = self._connection().execute('SELECT status, count FROM user_status_totals WHERE user_email = ?',
+                                          (user_email,))
+        return {row['status']: row['count'] for row in rows}
+
+    def summary(self, days=30, until=None):
+        """All-time totals, and breakdowns of the ``days`` days up to ``until`` (YYYY-MM-DD, default today)"""
+        until = until or date.today().isoformat()
+        since = (date.fromisoformat(until) - timedelta(days=days - 1)).isoformat()
+        where, params = self._rollup_where(since, until)
+        rows = self._connection().execute(
+            f'SELECT body_part, diagnosis, status, SUM(count) AS count, SUM(confidence_sum) AS confidence_sum '
+            f'FROM prediction_rollups {where} GROUP BY body_part, diagnosis, status', params).fetchall()
+        breakdowns = {'body_part': {}, 'diagnosis': {}, 'status': {}}
+        for row in rows:
+            for column, counts in breakdowns.items():
+                counts[row[column]] = counts.get(row[column], 0) + row['count']
+        count = sum(row['count'] for row in rows)
+        return {
+            'total': self.count(),
+            'status_totals': self.status_totals(),
+            'since': since,
+            'until': until,
+            'count': count,
+            'mean_confidence': round(sum(row['confidence_sum'] for row in rows) / count, 4) if count else None,
+            'by_body_part': breakdowns['body_part'],
+            'by_diagnosis': breakdowns['diagnosis'],
+            'by_status': breakdowns['status'],
+            'daily': self.daily(since, until)
+        }
+
+    def daily(self, since=None, until=None, body_part=None, diagnosis=None, status=None):
+        """Count and mean confidence per day (days without predictions are left out)"""
+        where, params = self._rollup_where(since, until, body_part=body_part, diagnosis=diagnosis, status=status)
+        rows = self._connection().execute(
+            f'SELECT day, SUM(count) AS count, SUM(confidence_sum) AS confidence_sum '
+            f'FROM prediction_rollups {where} GROUP BY day ORDER BY day', params)
+        return [{'day': row['day'], 'count': row['count'],
+                 'mean_confidence': round(row['confidence_sum'] / row['count'], 4)} for row in rows]
+
+    def confidence_histogram(self, since=None, until=None, body_part=None, status=None):
+        """Prediction counts in each of the HISTOGRAM_BUCKETS confidence buckets, lowest first"""
+        where, params = self._rollup_where(since, until, body_part=body_part, status=status)
+        counts = [0] * HISTOGRAM_BUCKETS
+        for row in self._connection().execute(
+                f'SELECT bucket, SUM(count) AS count FROM confidence_histogram {where} GROUP BY bucket', params):
+            counts[row['bucket']] = row['count']
+        return counts
+
+    def users_page(self, limit=50, after=None):
+        """Users by prediction count, most first; ``after`` is the last email of the previous page.
+
+        Pages are keyset on (total, email), so a user whose total changes
+        between two page loads may move to a page that was already shown.
+        """
+        conn = self._connection()
+        if after is None:
+            rows = conn.execute(
+                'SELECT user_email, user_name, total, last_timestamp FROM prediction_totals '
+                'WHERE user_email != ? ORDER BY total DESC, user_email LIMIT ?', (ALL_USERS, limit))
+        else:
+            rows = conn.execute(
+                'SELECT user_email, user_name, total, last_timestamp FROM prediction_totals, '
+                '(SELECT total AS cursor_total FROM prediction_totals WHERE user_email = ?) '
+                'WHERE user_email != ? AND total <= cursor_total AND (total < cursor_total OR user_email > ?) '
+                'ORDER BY total DESC, user_email LIMIT ?', (after, ALL_USERS, after, limit))
+        page = [dict(row, by_status={}) for row in rows]
+        if page:
+            users = {user['user_email']: user for user in page}
+            for row in conn.execute(f'SELECT user_email, status, count FROM user_status_totals '
+                                    f'WHERE user_email IN ({", ".join("?" * len(users))})', list(users)):
+                users[row['user_email']]['by_status'][row['status']] = row['count']
+        return page
+
+    def user_summary(self, user_email):
+        self._wait_for_user(user_email)
+        row = self._connection().execute(
+            'SELECT user_name, total, last_timestamp FROM prediction_totals WHERE user_email = ?',
+            (user_email,)).fetchone()
+        return {
+            'user_email': user_email,
+            'user_name': row['user_name'] if row else None,
+            'total': row['total'] if row else 0,
+            'last_timestamp': row['last_timestamp'] if row else None,
+            'by_status': self.status_totals(user_email)
+        }
+
+
+def next_cursor(page, limit, key='id'):
+    """Cursor for the page after ``page``, or None when it was the last one"""
+    return page[-1][key] if len(page) == limit else None
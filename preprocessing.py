@@ -0,0 +1,77 @@
+"""Image preprocessing for the models: draft-mode decode and float32 output without temporaries"""
+import threading
+
+import numpy as np
+from PIL import Image
+
+TARGET_SIZE = (224, 224)
+
+
+def open_image(source, target_size=TARGET_SIZE):
+    """Open an image, asking the JPEG decoder to decode at a reduced scale when possible.
+
+    ``draft`` lets libjpeg do DCT-domain downscaling (1/2, 1/4, 1/8) while
+    keeping the result at least ``target_size``, so a 12MP photo decodes at
+    ~0.2MP instead of being fully decoded and then resized. It must be called
+    before the pixel data is loaded; images that are already loaded or are not
+    JPEGs are returned unchanged. Whether pixels are loaded is read from
+    ``tile`` (emptied by ``load``) rather than ``im``, which newer Pillow
+    versions turn into a property that asserts or loads.
+    """
+    image = source if isinstance(source, Image.Image) else Image.open(source)
+    if image.format == 'JPEG' and getattr(image, 'tile', None):
+        image.draft('RGB', target_size)
+    return image
+
+
+def resize_rgb(image, target_size=TARGET_SIZE, resample=Image.BICUBIC):
+    image = open_image(image, target_size)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    if image.size != tuple(target_size):
+        image = image.resize(target_size, resample)
+    return image
+
+
+def preprocess_into(image, out, target_size=TARGET_SIZE):
+    """Resize ``image`` and write it, scaled to [0, 1], into the float32 (H, W, 3) array ``out``"""
+    pixels = np.asarray(resize_rgb(image, target_size))
+    # float32 division is correctly rounded, so this matches float32(pixels / 255.0) exactly
+    np.divide(pixels, np.float32(255.0), out=out, dtype=np.float32, casting='unsafe')
+    return out
+
+
+def preprocess_image(image, target_size=TARGET_SIZE):
+    """Single image -> new (1, H, W, 3) float32 batch"""
+    out = np.empty((1, target_size[1], target_size[0], 3), dtype=np.float32)
+    preprocess_into(image, out[0], target_size)
+    return out
+
+
+class BatchPreprocessor:
+    """Preprocesses N images into a reusable, preallocated float32 batch buffer.
+
+    Each thread gets its own buffer, grown only when a larger batch arrives.
+    The returned array is a view into that buffer and is overwritten by the
+    thread's next call, so consume (or copy) it before preprocessing again.
+    """
+
+    def __init__(self, max_batch_size=16, target_size=TARGET_SIZE):
+        self.max_batch_size = max_batch_size
+        self.target_size = tuple(target_size)
+        self._local = threading.local()
+
+    def _buffer(self, n):
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None or buffer.shape[0] < n:
+            size = max(n, self.max_batch_size)
+            buffer = np.empty((size, self.target_size[1], self.target_size[0], 3), dtype=np.float32)
+            self._local.buffer = buffer
+        return buffer
+
+    def __call__(self, images):
+        images = list(images)
+        batch = self._buffer(len(images))[:len(images)]
+        for i, image in enumerate(images):
+            preprocess_into(image, batch[i], self.target_size)
+        return batch
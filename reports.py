@@ -0,0 +1,286 @@
+"""PDF diagnosis reports: cached layout objects, background rendering and a result cache"""
+import copy
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.units import inch
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+from prediction_cache import MemoryTier
+
+logger = logging.getLogger(__name__)
+
+# Fields of a /predict result that end up in the PDF
+REPORT_FIELDS = ('body_part', 'predicted_class', 'confidence', 'status', 'medical_info')
+# Bump when the PDF layout changes so cached reports are not served
+LAYOUT_VERSION = '1'
+
+DISCLAIMER = ("⚠️ MEDICAL DISCLAIMER: This report is for informational purposes only. "
+              "Always consult a licensed veterinarian for accurate diagnosis and treatment.")
+
+# Recommendation sections kept per process. Reports carry their medical info in the request body, so the
+# cache is an LRU rather than growing with every distinct one posted.
+MEDICAL_FLOWABLES_MAX_ENTRIES = 64
+
+_layout = None
+_medical_flowables = OrderedDict()
+
+
+def layout():
+    """Styles and the flowables every report shares, parsed once per process.
+
+    Layout mutates flowables (a paragraph split across pages keeps that
+    state), so reports build from shallow copies; see ``fresh``.
+    """
+    global _layout
+    if _layout is None:
+        styles = getSampleStyleSheet()
+        title_style = ParagraphStyle('CustomTitle', parent=styles['Heading1'], fontSize=24,
+                                     textColor=colors.HexColor('#2c3e50'), spaceAfter=30, alignment=TA_CENTER)
+        disclaimer_style = ParagraphStyle('Disclaimer', parent=styles['Normal'], fontSize=9,
+                                          textColor=colors.red, alignment=TA_CENTER)
+        _layout = {
+            'styles': styles,
+            'header': [Paragraph("🐄 Cattle Disease Detection Report", title_style), Spacer(1, 0.3*inch)],
+            'table_style': TableStyle([
+                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3498db')),
+                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                ('FONTSIZE', (0, 0), (-1, 0), 12),
+                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+                ('BACKGROUND', (0, 3), (-1, 3), colors.HexColor('#e74c3c')),
+                ('TEXTCOLOR', (0, 3), (-1, 3), colors.whitesmoke),
+                ('FONTNAME', (0, 3), (-1, 3), 'Helvetica-Bold'),
+                ('GRID', (0, 0), (-1, -1), 1, colors.black)
+            ]),
+            'footer': [Spacer(1, 0.5*inch), Paragraph(DISCLAIMER, disclaimer_style)]
+        }
+    return _layout
+
+
+def fresh(flowables):
+    return [copy.copy(flowable) for flowable in flowables]
+
+
+def medical_flowables(med_info):
+    """Recommendation section for one disease, cached by its content"""
+    key = hashlib.sha1(json.dumps(med_info, sort_keys=True).encode()).hexdigest()
+    flowables = _medical_flowables.get(key)
+    if flowables is not None:
+        _medical_flowables.move_to_end(key)
+    else:
+        styles = layout()['styles']
+        flowables = [Paragraph("⚕️ MEDICAL RECOMMENDATIONS", styles['Heading2']), Spacer(1, 0.2*inch),
+                     Paragraph("⚠️ IMMEDIATE ACTIONS:", styles['Heading3'])]
+        for action in med_info['immediate_actions']:
+            flowables.append(Paragraph(f"• {action}", styles['Normal']))
+        flowables.append(Spacer(1, 0.2*inch))
+        flowables.append(Paragraph("💊 RECOMMENDED MEDICINES:", styles['Heading3']))
+        for med in med_info['medicines']:
+            flowables.append(Paragraph(f"• {med['name']} ({med['type']}) - Brand: {med['brand']}", styles['Normal']))
+        flowables.append(Spacer(1, 0.2*inch))
+        _medical_flowables[key] = flowables
+        if len(_medical_flowables) > MEDICAL_FLOWABLES_MAX_ENTRIES:
+            _medical_flowables.popitem(last=False)
+    return flowables
+
+
+def render_report(prediction_data, user_name, generated_at=None):
+    """PDF bytes for one prediction result"""
+    parts = layout()
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4)
+    story = fresh(parts['header'])
+
+    generated_at = generated_at or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    data = [
+        ['Report Generated:', generated_at],
+        ['User:', user_name],
+        ['', ''],
+        ['DIAGNOSIS RESULTS', ''],
+        ['Body Part Detected:', prediction_data['body_part'].upper()],
+        ['Disease/Condition:', prediction_data['predicted_class']],
+        ['Confidence Level:', f"{prediction_data['confidence']*100:.2f}%"],
+        ['Status:', prediction_data['status']],
+    ]
+    table = Table(data, colWidths=[2.5*inch, 4*inch])
+    table.setStyle(parts['table_style'])
+    story.append(table)
+    story.append(Spacer(1, 0.5*inch))
+
+    if prediction_data.get('medical_info'):
+        story.extend(fresh(medical_flowables(prediction_data['medical_info'])))
+
+    story.extend(fresh(parts['footer']))
+    doc.build(story)
+    return buffer.getvalue()
+
+
+def report_key(prediction_data, user_name, prediction_id=None):
+    """Cache key: prediction ID plus a hash of everything the PDF shows"""
+    payload = {field: prediction_data.get(field) for field in REPORT_FIELDS}
+    payload['user'] = user_name
+    digest = hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()[:32]
+    return f"{prediction_id or '-'}:{digest}"
+
+
+class ReportJob:
+    def __init__(self, key, owner, future=None, pdf=None, executor=None):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.owner = owner
+        self.future = future
+        self.pdf = pdf
+        self.executor = executor  # pool rendering it, so a broken one is replaced only once
+        self.created = time.time()
+
+    @property
+    def status(self):
+        if self.pdf is not None:
+            return 'done'
+        if not self.future.done():
+            return 'pending'
+        return 'failed' if self.future.exception() is not None else 'done'
+
+    @property
+    def error(self):
+        if self.future is not None and self.future.done() and self.future.exception() is not None:
+            return str(self.future.exception())
+        return None
+
+    def result(self, timeout=None):
+        return self.pdf if self.pdf is not None else self.future.result(timeout)
+
+
+class ReportService:
+    """Renders reports off the request thread and caches the PDFs.
+
+    ``workers`` > 0 renders in that many worker processes (ReportLab is
+    pure Python, so threads would serialize on the GIL); 0 uses a single
+    background thread. Identical requests for a report that is already
+    rendering share one job.
+    """
+
+    def __init__(self, workers=2, cache_entries=256, cache_bytes=64 * 1024 * 1024, cache_ttl=3600, job_ttl=600):
+        self.workers = workers
+        self._context = None
+        if workers > 0:
+            # Never forked from the server: TensorFlow's thread pools are running by then, and a child forked
+            # mid-operation can inherit a held lock and hang. Workers fork from the forkserver, a fresh
+            # interpreter that has imported only this module (spawned where there is none). Under
+            # `python app.py` they also import app.py, which loads neither TensorFlow nor the models.
+            methods = multiprocessing.get_all_start_methods()
+            self._context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+            if self._context.get_start_method() == 'forkserver':
+                self._context.set_forkserver_preload(['reports'])
+        self._executor = self._new_executor()
+        self.cache = MemoryTier(max_entries=cache_entries, max_bytes=cache_bytes, ttl_seconds=cache_ttl)
+        self.job_ttl = job_ttl
+        self._jobs = {}
+        self._inflight = {}  # report key -> job rendering it
+        self._lock = threading.Lock()
+        self._stats = {'submitted': 0, 'cache_hits': 0, 'shared': 0, 'rendered': 0, 'failed': 0,
+                       'render_seconds': 0.0, 'pool_restarts': 0}
+
+    def _new_executor(self):
+        if self._context is None:
+            return ThreadPoolExecutor(1, thread_name_prefix='report')
+        return ProcessPoolExecutor(self.workers, mp_context=self._context)
+
+    def _replace_executor(self, broken):
+        """Swap in a fresh pool once a worker died; caller holds the lock.
+
+        A crashed or OOM-killed worker breaks a ProcessPoolExecutor for good,
+        so without this every later report would fail until a restart.
+        """
+        if self._executor is not broken:
+            return
+        logger.warning("⚠️ Report worker died; restarting the render pool")
+        broken.shutdown(wait=False)
+        self._executor = self._new_executor()
+        self._stats['pool_restarts'] += 1
+
+    def submit(self, prediction_data, user_name, owner, prediction_id=None):
+        key = report_key(prediction_data, user_name, prediction_id)
+        with self._lock:
+            self._expire()
+            self._stats['submitted'] += 1
+            pdf = self.cache.get(key, LAYOUT_VERSION)
+            if pdf is not None:
+                self._stats['cache_hits'] += 1
+                job = ReportJob(key, owner, pdf=pdf)
+            elif key in self._inflight and self._inflight[key].owner == owner:
+                self._stats['shared'] += 1
+                return self._inflight[key]
+            else:
+                data = {field: prediction_data.get(field) for field in REPORT_FIELDS}
+                executor = self._executor
+                try:
+                    future = executor.submit(render_report, data, user_name)
+                except BrokenProcessPool:
+                    self._replace_executor(executor)
+                    executor = self._executor
+                    future = executor.submit(render_report, data, user_name)
+                job = ReportJob(key, owner, future=future, executor=executor)
+                self._inflight[key] = job
+            self._jobs[job.id] = job
+        if job.future is not None:
+            # Registered outside the lock: it runs inline if the render already finished
+            started = time.perf_counter()
+            job.future.add_done_callback(lambda f: self._finished(job, time.perf_counter() - started))
+        return job
+
+    def _finished(self, job, elapsed):
+        with self._lock:
+            if self._inflight.get(job.key) is job:
+                del self._inflight[job.key]
+            if isinstance(job.future.exception(), BrokenProcessPool):
+                # Every job still queued on the dead pool lands here; they fail, later submits get the new pool
+                self._replace_executor(job.executor)
+                self.cache.discard(job.key)
+            if job.future.exception() is not None:
+                self._stats['failed'] += 1
+                logger.error(f"❌ Report {job.id} failed: {job.future.exception()}")
+                return
+            self._stats['rendered'] += 1
+            self._stats['render_seconds'] += elapsed
+            self.cache.put(job.key, job.future.result(), LAYOUT_VERSION)
+
+    def _expire(self):
+        cutoff = time.time() - self.job_ttl
+        for job_id in [j for j, job in self._jobs.items() if job.created < cutoff and job.status != 'pending']:
+            del self._jobs[job_id]
+
+    def job(self, job_id, owner=None):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None or (owner is not None and job.owner != owner):
+            return None
+        return job
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['workers'] = self.workers
+            stats['jobs'] = len(self._jobs)
+            stats['pending'] = len(self._inflight)
+            stats['cached_reports'] = len(self.cache)
+        return stats
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,148 @@
+"""Routing policies for the two-stage cascade: non-cattle gating, top-2 specialists and a low-res pre-filter"""
+import logging
+import threading
+from collections import Counter
+
+import numpy as np
+
+from batching import Routed
+
+logger = logging.getLogger(__name__)
+
+NON_CATTLE = 'non_cattle'
+PREFILTER_SIZE = (64, 64)
+
+# Combined confidence weights, as reported in /predict results
+BODY_PART_WEIGHT = 0.3
+DISEASE_WEIGHT = 0.7
+
+
+class RoutingPolicy:
+    """Decides which specialists run for each master row and counts every decision.
+
+    - ``non_cattle_threshold``: treat the image as non-cattle (no specialist)
+      once P(non_cattle) reaches it, even when another class has the argmax.
+    - ``top2_margin``: when the two most likely classes are both body parts
+      with specialists and within this margin, run both (each in its grouped
+      batch) and keep the one with the higher combined confidence.
+    - ``prefilter``: tiny low-resolution model scoring P(non_cattle); images
+      at or above ``prefilter_threshold`` skip the master and specialists.
+
+    A rule set to None is off; with all three off this is plain argmax routing.
+    The instance is the ``route`` callable of ``run_two_stage``/``FusedCascade``.
+    """
+
+    def __init__(self, class_names, has_specialist, non_cattle_threshold=None, top2_margin=None,
+                 prefilter=None, prefilter_threshold=0.95):
+        self.class_names = list(class_names)
+        self.has_specialist = has_specialist
+        self.non_cattle_threshold = non_cattle_threshold
+        self.top2_margin = top2_margin
+        self.prefilter = prefilter
+        self.prefilter_threshold = prefilter_threshold
+        self.non_cattle_index = self.class_names.index(NON_CATTLE) if NON_CATTLE in self.class_names else None
+        self._counts = Counter()
+        self._lock = threading.Lock()
+
+    def _count(self, **amounts):
+        with self._lock:
+            self._counts.update(amounts)
+
+    def body_part(self, master_row):
+        """``(body part, confidence)`` a result reports for this master row, after non-cattle gating"""
+        nc = self.non_cattle_index
+        if nc is not None and self.non_cattle_threshold is not None and master_row[nc] >= self.non_cattle_threshold:
+            return NON_CATTLE, float(master_row[nc])
+        index = int(np.argmax(master_row))
+        return self.class_names[index], float(master_row[index])
+
+    def __call__(self, master_row):
+        body_part, confidence = self.body_part(master_row)
+        if body_part == NON_CATTLE:
+            if int(np.argmax(master_row)) == self.non_cattle_index:
+                self._count(master_non_cattle=1)
+            else:
+                self._count(gated_non_cattle=1)
+            return None
+        if not self.has_specialist(body_part):
+            self._count(no_specialist=1)
+            return None
+        if self.top2_margin is not None:
+            second = int(np.argsort(master_row)[-2])
+            runner_up = self.class_names[second]
+            if (runner_up != NON_CATTLE and self.has_specialist(runner_up)
+                    and confidence - float(master_row[second]) <= self.top2_margin):
+                self._count(top2=1, specialist_passes=2)
+                return body_part, runner_up
+        self._count(single=1, specialist_passes=1)
+        return body_part
+
+    def select(self, master_row, rows):
+        """Pick the top-2 candidate with the higher combined confidence; a ``Routed`` if it is not the argmax"""
+        def score(key):
+            return (BODY_PART_WEIGHT * float(master_row[self.class_names.index(key)])
+                    + DISEASE_WEIGHT * float(np.max(rows[key])))
+
+        best = max(rows, key=score)
+        if best == self.class_names[int(np.argmax(master_row))]:
+            return rows[best]
+        self._count(top2_switched=1)
+        return Routed(best, rows[best])
+
+    def run(self, batch, cascade):
+        """``cascade(batch)`` (``run_two_stage`` contract) on the images the pre-filter lets through"""
+        self._count(images=len(batch))
+        if self.prefilter is None or self.non_cattle_index is None:
+            self._count(master_passes=len(batch))
+            return cascade(batch)
+
+        scores = np.asarray(self.prefilter.predict(batch, verbose=0)).reshape(len(batch), -1)[:, -1]
+        rejected = scores >= self.prefilter_threshold
+        self._count(prefilter_non_cattle=int(rejected.sum()), master_passes=int((~rejected).sum()))
+        if not rejected.any():
+            return cascade(batch)
+
+        # Rejected images get a master-shaped row that puts the pre-filter's score on non_cattle
+        master_out = np.empty((len(batch), len(self.class_names)), dtype=np.float32)
+        master_out[:] = ((1.0 - scores) / max(len(self.class_names) - 1, 1))[:, np.newaxis]
+        master_out[:, self.non_cattle_index] = scores
+        specialist_rows = [None] * len(batch)
+        failures = {}
+        kept = np.flatnonzero(~rejected)
+        if len(kept):
+            kept_master, kept_rows, kept_failures = cascade(batch[kept])
+            master_out[kept] = kept_master
+            for j, i in enumerate(kept):
+                specialist_rows[i] = kept_rows[j]
+                if j in kept_failures:
+                    failures[i] = kept_failures[j]
+        return master_out, specialist_rows, failures
+
+    def reset(self):
+        """Forget the decision counts (after warm-up passes)"""
+        with self._lock:
+            self._counts.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counts)
+        stats['rules'] = {
+            'non_cattle_threshold': self.non_cattle_threshold,
+            'top2_margin': self.top2_margin,
+            'prefilter_threshold': self.prefilter_threshold if self.prefilter is not None else None
+        }
+        return stats
+
+
+def build_prefilter(input_shape=(224, 224, 3), size=PREFILTER_SIZE, width=16):
+    """Tiny cattle / non-cattle classifier that downsamples the 224x224 model input to ``size`` itself"""
+    import tensorflow as tf
+
+    inputs = tf.keras.Input(shape=input_shape)
+    x = tf.keras.layers.Resizing(*size)(inputs)
+    x = tf.keras.layers.Conv2D(width, 3, strides=2, activation='relu')(x)
+    x = tf.keras.layers.Conv2D(width * 2, 3, strides=2, activation='relu')(x)
+    x = tf.keras.layers.Conv2D(width * 4, 3, strides=2, activation='relu')(x)
+    x = tf.keras.layers.GlobalAveragePooling2D()(x)
+    outputs = tf.keras.layers.Dense(1, activation='sigmoid')(x)
+    return tf.keras.Model(inputs, outputs, name='prefilter')
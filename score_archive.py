@@ -0,0 +1,360 @@
+"""Re-score an archive of field photos offline: pooled decoding, batched two-stage inference, resumable output.
+
+    python score_archive.py archive/ --output scores.jsonl
+    python score_archive.py archive/ --output scores.csv --decode-workers 8 --batch-size 32
+    python score_archive.py archive/ --output scores.parquet   # columnar, needs pyarrow
+
+Images under the directory are decoded at JPEG draft scale and resized by a
+pool of --decode-workers processes, then scored in batches of --batch-size by
+the cascade the app serves (``serving_cascade``: master, routed specialists,
+routing rules and fused serving). Results are appended as they are produced.
+After each flush, ``<output>.checkpoint`` records the images it covered.
+Running the same command again resumes after the last checkpoint, dropping
+anything an interrupted run wrote past it. The checkpoint also records the
+model fingerprint: a run is not resumed against changed models unless
+--restart is given, which starts over.
+"""
+import argparse
+import csv
+import io
+import json
+import logging
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from herd import IMAGE_EXTENSIONS
+from preprocessing import TARGET_SIZE, resize_rgb
+
+logger = logging.getLogger(__name__)
+
+# Output columns; 'json' columns hold a class -> probability mapping (JSON text in CSV and parquet)
+FIELDS = (
+    ('path', 'str'), ('success', 'bool'), ('error', 'str'), ('body_part', 'str'),
+    ('body_part_confidence', 'float'), ('predicted_class', 'str'), ('confidence', 'float'),
+    ('disease_confidence', 'float'), ('status', 'str'), ('specialist_used', 'str'), ('medical_info_key', 'str'),
+    ('master_probabilities', 'json'), ('specialist_probabilities', 'json'),
+)
+STAGES = ('walk', 'decode', 'decode_wait', 'preprocess', 'inference', 'results', 'write')
+
+
+def find_images(root):
+    """Image paths under ``root``, relative to it, in a stable order"""
+    paths = []
+    for directory, dirs, names in os.walk(root):
+        dirs.sort()
+        for name in sorted(names):
+            if name.lower().endswith(IMAGE_EXTENSIONS) and not name.startswith('.'):
+                paths.append(os.path.relpath(os.path.join(directory, name), root))
+    return paths
+
+
+def decode_chunk(root, paths, target_size=TARGET_SIZE):
+    """Decode worker: ``(path, uint8 pixels or None, error, seconds)`` per image"""
+    decoded = []
+    for path in paths:
+        start = time.perf_counter()
+        try:
+            pixels, error = np.asarray(resize_rgb(os.path.join(root, path), target_size)), None
+        except Exception as e:
+            pixels, error = None, str(e) or type(e).__name__
+        decoded.append((path, pixels, error, time.perf_counter() - start))
+    return decoded
+
+
+def decode_all(root, paths, workers, chunk_size=8, prefetch=64):
+    """Decoded images in order, with at most ``prefetch`` chunks in flight so memory stays bounded"""
+    chunks = (paths[i:i + chunk_size] for i in range(0, len(paths), chunk_size))
+    if workers <= 0:
+        for chunk in chunks:
+            yield from decode_chunk(root, chunk)
+        return
+    # Spawned, not forked: the parent holds TensorFlow's threads once the models are loaded
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(decode_chunk, root, chunk))
+            if len(pending) >= prefetch:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def output_row(path, result):
+    row = {'path': path}
+    for name, _ in FIELDS[1:]:
+        row[name] = result.get(name)
+    return row
+
+
+def flat(row):
+    """Row with the probability mappings as JSON text, for CSV and parquet"""
+    return {name: json.dumps(row[name]) if kind == 'json' and row[name] is not None else row[name]
+            for name, kind in FIELDS}
+
+
+class Checkpoint:
+    """``<output>.checkpoint``: a header (model fingerprint, routing settings, format) then one JSON line per flushed batch"""
+
+    def __init__(self, path, header, restart=False):
+        self.path = path
+        self.entries = []
+        if os.path.exists(path) and not restart:
+            with open(path, 'rb') as f:
+                lines = f.read().split(b'\n')
+            valid = 0
+            records = []
+            for line in lines:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    break  # a line the interrupted run did not finish
+                valid += len(line) + 1
+            if records and records[0] != header:
+                raise SystemExit(f"{path} was written with other models or settings ({records[0]}); "
+                                 f"pass --restart to score everything again")
+            self.entries = records[1:]
+            self._file = open(path, 'r+b')
+            self._file.truncate(valid)
+            self._file.seek(valid)
+        else:
+            self._file = open(path, 'wb')
+            self._append(header)
+
+    def done(self):
+        return {path for entry in self.entries for path in entry['paths']}
+
+    def _append(self, record):
+        self._file.write(json.dumps(record).encode() + b'\n')
+        self._file.flush()
+
+    def add(self, paths, **position):
+        entry = {'paths': paths, **position}
+        self.entries.append(entry)
+        self._append(entry)
+
+    def close(self):
+        self._file.close()
+
+
+class JSONLWriter:
+    """Appends rows to one file; each flush checkpoints the file size, which a resumed run truncates back to"""
+
+    def __init__(self, path, entries):
+        offset = entries[-1]['offset'] if entries else 0
+        self._file = open(path, 'r+b' if offset and os.path.exists(path) else 'wb')
+        self._file.truncate(offset)
+        self._file.seek(offset)
+
+    def encode(self, rows):
+        return b''.join(json.dumps(row).encode() + b'\n' for row in rows)
+
+    def write(self, rows):
+        self._file.write(self.encode(rows))
+        self._file.flush()
+        return {'offset': self._file.tell()}
+
+    def close(self):
+        self._file.close()
+        return None
+
+
+class CSVWriter(JSONLWriter):
+    def __init__(self, path, entries):
+        super().__init__(path, entries)
+        if self._file.tell() == 0:
+            self._file.write(','.join(name for name, _ in FIELDS).encode() + b'\r\n')
+
+    def encode(self, rows):
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=[name for name, _ in FIELDS])
+        writer.writerows(flat(row) for row in rows)
+        return buffer.getvalue().encode()
+
+
+class ParquetWriter:
+    """A directory of parquet files of ``part_rows`` rows each; a resumed run deletes parts not checkpointed"""
+
+    def __init__(self, path, entries, part_rows=4096):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit('Parquet output needs pyarrow (pip install pyarrow)')
+        self.pa, self.pq = pa, pq
+        types = {'str': pa.string(), 'bool': pa.bool_(), 'float': pa.float64(), 'json': pa.string()}
+        self.schema = pa.schema([(name, types[kind]) for name, kind in FIELDS])
+        self.path = path
+        self.part_rows = part_rows
+        os.makedirs(path, exist_ok=True)
+        committed = {entry['part'] for entry in entries}
+        for name in os.listdir(path):
+            if name.endswith('.parquet') and name not in committed:
+                os.remove(os.path.join(path, name))
+        self.parts = len(committed)
+        self._rows = []
+
+    def write(self, rows):
+        self._rows.extend(flat(row) for row in rows)
+        if len(self._rows) >= self.part_rows:
+            return self._flush()
+        return None
+
+    def _flush(self):
+        name = f'part-{self.parts:05d}.parquet'
+        table = self.pa.Table.from_pylist(self._rows, schema=self.schema)
+        self.pq.write_table(table, os.path.join(self.path, name + '.tmp'))
+        os.replace(os.path.join(self.path, name + '.tmp'), os.path.join(self.path, name))
+        self.parts += 1
+        self._rows = []
+        return {'part': name}
+
+    def close(self):
+        return self._flush() if self._rows else None
+
+
+WRITERS = {'jsonl': JSONLWriter, 'csv': CSVWriter, 'parquet': ParquetWriter}
+
+
+class StageTimer:
+    def __init__(self):
+        self.seconds = dict.fromkeys(STAGES, 0.0)
+
+    def time(self, stage):
+        timer = self
+
+        class Block:
+            def __enter__(self):
+                self.start = time.perf_counter()
+
+            def __exit__(self, *exc):
+                timer.seconds[stage] += time.perf_counter() - self.start
+        return Block()
+
+
+def print_report(timer, images, elapsed, workers):
+    print(f"\n{'stage':<14}{'seconds':>10}{'img/s':>12}{'share':>8}")
+    for stage in STAGES:
+        seconds, label = timer.seconds[stage], stage
+        if stage == 'decode' and workers > 1:
+            # Summed over the pool's processes, which decode in parallel
+            seconds, label = seconds / workers, f'decode (x{workers})'
+        rate = images / seconds if seconds else float('inf')
+        print(f"{label:<14}{seconds:10.2f}{rate:12.1f}{seconds / elapsed * 100 if elapsed else 0:7.1f}%")
+    print(f"{'total':<14}{elapsed:10.2f}{images / elapsed if elapsed else 0:12.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('root', help='directory of images (searched recursively)')
+    parser.add_argument('--output', required=True, help='.jsonl, .csv or .parquet (a directory of part files)')
+    parser.add_argument('--format', choices=sorted(WRITERS), help='default: from the --output extension')
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--decode-workers', type=int, default=os.cpu_count() or 1,
+                        help='decoding processes (0 = decode in this process)')
+    parser.add_argument('--part-rows', type=int, default=4096, help='rows per parquet part')
+    parser.add_argument('--limit', type=int, help='score at most this many new images')
+    parser.add_argument('--log-every', type=int, default=20, help='batches between progress lines')
+    parser.add_argument('--restart', action='store_true', help='ignore the checkpoint and score everything')
+    args = parser.parse_args()
+
+    output_format = args.format or os.path.splitext(args.output)[1].lstrip('.').lower()
+    if output_format not in WRITERS:
+        parser.error('--output must end in .jsonl, .csv or .parquet, or pass --format')
+
+    # Decode workers import this module, so the app (and TensorFlow) are only imported here
+    import app as cattle_app
+    from prediction_cache import files_fingerprint
+
+    timer = StageTimer()
+    with timer.time('walk'):
+        paths = find_images(args.root)
+    header = {'models': files_fingerprint(cattle_app.model_files()), 'routing': cattle_app.routing_settings(),
+              'format': output_format}
+    checkpoint = Checkpoint(args.output + '.checkpoint', header, restart=args.restart)
+    done = checkpoint.done()
+    todo = [path for path in paths if path not in done][:args.limit]
+    logger.info(f"📷 {len(paths)} images under {args.root}: {len(done)} already scored, {len(todo)} to go")
+    if not todo:
+        checkpoint.close()
+        return
+
+    # One version for the whole run: the checkpoint header pins the model files
+    cattle_app.serving_cascade(watch=False)
+    writer = (ParquetWriter(args.output, checkpoint.entries, args.part_rows) if output_format == 'parquet'
+              else WRITERS[output_format](args.output, checkpoint.entries))
+    batch = np.empty((args.batch_size,) + TARGET_SIZE[::-1] + (3,), dtype=np.float32)
+    uncommitted, rows, pending = [], [], []
+    scored = batches = 0
+    started = time.perf_counter()
+
+    def score_pending():
+        with timer.time('inference'):
+            master_out, specialist_rows, failures = cattle_app.run_cascade(batch[:len(pending)])
+        with timer.time('results'):
+            for j, path in enumerate(pending):
+                if j in failures:
+                    rows.append(output_row(path, {'success': False, 'error': str(failures[j])}))
+                else:
+                    rows.append(output_row(path, cattle_app.build_prediction_result(master_out[j],
+                                                                                    specialist_rows[j])))
+        pending.clear()
+
+    def flush():
+        nonlocal scored, batches
+        with timer.time('write'):
+            uncommitted.extend(row['path'] for row in rows)
+            position = writer.write(rows)
+            if position is not None:
+                checkpoint.add(uncommitted, **position)
+                uncommitted.clear()
+        scored += len(rows)
+        batches += 1
+        rows.clear()
+        if batches % args.log_every == 0:
+            rate = scored / (time.perf_counter() - started)
+            logger.info(f"📦 {scored}/{len(todo)} images ({rate:.1f} img/s)")
+
+    try:
+        decoded = decode_all(args.root, todo, args.decode_workers)
+        while True:
+            with timer.time('decode_wait'):
+                item = next(decoded, None)
+            if item is None:
+                break
+            path, pixels, error, seconds = item
+            timer.seconds['decode'] += seconds
+            if pixels is None:
+                logger.warning(f"⚠️ Skipping unreadable image {path}: {error}")
+                rows.append(output_row(path, {'success': False, 'error': error}))
+            else:
+                with timer.time('preprocess'):
+                    # Same float32 scaling as preprocess_into
+                    np.divide(pixels, np.float32(255.0), out=batch[len(pending)], dtype=np.float32,
+                              casting='unsafe')
+                pending.append(path)
+            if len(pending) == args.batch_size:
+                score_pending()
+                flush()
+        if pending:
+            score_pending()
+        if rows:
+            flush()
+        with timer.time('write'):
+            position = writer.close()
+            if position is not None:
+                checkpoint.add(uncommitted, **position)
+    finally:
+        checkpoint.close()
+
+    elapsed = time.perf_counter() - started
+    logger.info(f"✅ Scored {scored} images into {args.output}")
+    print_report(timer, scored, elapsed, args.decode_workers)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""Process startup: deferred heavy imports, timed loading phases and the readiness state behind /readyz"""
+import importlib
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class LazyModule:
+    """Stand-in for a module that is imported on first attribute access.
+
+    ``tf = LazyModule('tensorflow')`` keeps ``tf.keras...`` call sites as they
+    are while moving the import cost from module import to the first model load.
+    """
+
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+    def load(self):
+        module = self.__dict__['_module']
+        if module is None:
+            start = time.perf_counter()
+            module = importlib.import_module(self._name)
+            self.__dict__['_module'] = module
+            logger.info(f"📦 Imported {self._name} in {time.perf_counter() - start:.2f}s")
+        return module
+
+    @property
+    def loaded(self):
+        return self.__dict__['_module'] is not None
+
+    def __getattr__(self, name):
+        return getattr(self.load(), name)
+
+    def __repr__(self):
+        state = 'loaded' if self.loaded else 'not loaded'
+        return f"<lazy module '{self._name}' ({state})>"
+
+
+class Startup:
+    """Runs the model-loading phases on a background thread and records how long each took.
+
+    ``state`` goes pending -> loading -> ready, or failed when a phase raises.
+    A failed startup is retried by the next ``start()`` after ``retry_seconds``
+    (e.g. an inference server that was not up yet).
+    """
+
+    def __init__(self, retry_seconds=30.0):
+        self.retry_seconds = retry_seconds
+        self.state = 'pending'
+        self.phase = None
+        self.error = None
+        self.phases = []
+        self._started = None
+        self._finished = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def record(self, name, seconds):
+        self.phases.append({'name': name, 'seconds': round(seconds, 3)})
+        logger.info(f"⏱️ Startup phase {name}: {seconds * 1000:.0f}ms")
+
+    @contextmanager
+    def timed(self, name):
+        self.phase = name
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def start(self, phases):
+        """Run ``phases`` (a list of ``(name, fn)``) in the background unless already running or done"""
+        with self._lock:
+            if self.state in ('loading', 'ready'):
+                return self
+            if self.state == 'failed' and time.monotonic() - self._finished < self.retry_seconds:
+                return self
+            self.state = 'loading'
+            self.error = None
+            self._started = time.monotonic()
+            self._finished = None
+            self._thread = threading.Thread(target=self._run, args=(list(phases),), name='startup', daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self, phases):
+        try:
+            for name, fn in phases:
+                with self.timed(name):
+                    fn()
+        except Exception as e:
+            logger.error(f"❌ Startup failed in {self.phase}: {e}")
+            # Under the lock and with _finished first: start() reads both to time the retry
+            with self._lock:
+                self._finished = time.monotonic()
+                self.error = str(e)
+                self.state = 'failed'
+        else:
+            logger.info(f"✅ Startup complete in {time.monotonic() - self._started:.2f}s")
+            with self._lock:
+                self._finished = time.monotonic()
+                self.phase = None
+                self.state = 'ready'
+            self._ready.set()
+
+    def wait(self, timeout=None):
+        return self._ready.wait(timeout)
+
+    def status(self):
+        status = {'state': self.state, 'phase': self.phase, 'phases': list(self.phases)}
+        if self._started is not None:
+            status['elapsed_seconds'] = round((self._finished or time.monotonic()) - self._started, 3)
+        if self.error:
+            status['error'] = self.error
+        return status
@@ -0,0 +1,86 @@
+import threading
+import time
+
+import pytest
+
+from admission import AdmissionController, Rejected
+from app import rejected_error
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def queued(controller, klass, order):
+    def run():
+        ticket = controller.acquire(klass)
+        order.append(klass)
+        controller.release(ticket)
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def test_higher_priority_waiter_is_admitted_first():
+    controller = AdmissionController(max_concurrency=1, queue_slo=10, priorities={'vet': 0, 'user': 1})
+    held = controller.acquire('user')
+    order = []
+    threads = [queued(controller, 'user', order)]
+    wait_until(lambda: controller.stats()['waiting'].get('user') == 1)
+    threads.append(queued(controller, 'vet', order))
+    wait_until(lambda: controller.stats()['waiting'].get('vet') == 1)
+
+    controller.release(held)
+    for thread in threads:
+        thread.join(5)
+    assert order == ['vet', 'user']
+
+
+def test_empty_token_bucket_is_rate_limited():
+    controller = AdmissionController(rate=1.0, burst=2)
+    controller.check_rate('vet@example.com')
+    controller.check_rate('vet@example.com')
+    with pytest.raises(Rejected) as rejected:
+        controller.check_rate('vet@example.com')
+    assert rejected.value.reason == 'rate_limited' and rejected.value.retry_after >= 1
+    assert rejected_error(rejected.value)[1] == 429
+    controller.check_rate('other@example.com')
+
+
+def test_wait_beyond_the_slo_is_shed():
+    controller = AdmissionController(max_concurrency=1, queue_slo=0.05)
+    with controller.admit('user'):
+        time.sleep(0.2)  # teaches the controller a request holds its slot ~200ms
+    with controller.admit('user'):
+        with pytest.raises(Rejected) as rejected:
+            controller.acquire('user')
+    assert rejected.value.reason == 'slo'
+    assert rejected_error(rejected.value)[1] == 503
+
+
+def test_queued_request_times_out_at_the_slo():
+    controller = AdmissionController(max_concurrency=1, queue_slo=0.05)
+    with controller.admit('user'):
+        with pytest.raises(Rejected) as rejected:
+            controller.acquire('user')
+    assert rejected.value.reason == 'timeout'
+    assert rejected_error(rejected.value)[1] == 503
+    assert controller.stats()['waiting']['user'] == 0
+
+
+def test_bulk_work_stops_at_its_cap():
+    controller = AdmissionController(max_concurrency=4, class_limits={'bulk': 1})
+    first = controller.acquire('bulk')
+    order = []
+    thread = queued(controller, 'bulk', order)
+    wait_until(lambda: controller.stats()['waiting'].get('bulk') == 1)
+    with controller.admit('user'):
+        assert controller.stats()['running'] == {'bulk': 1, 'user': 1}
+    assert order == []
+
+    controller.release(first)
+    thread.join(5)
+    assert order == ['bulk']
@@ -0,0 +1,38 @@
+import queue
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from inference import IMG_SHAPE
+from inference_server import OUT_WIDTH, worker_main
+
+
+def constant_cascade():
+    def cascade(batch):
+        return np.full((len(batch), 3), 0.5, dtype=np.float32), [None] * len(batch), {}
+    return cascade
+
+
+def test_worker_survives_a_client_whose_segments_are_gone():
+    slots = 2
+    shm_in = shared_memory.SharedMemory(create=True, size=slots * int(np.prod(IMG_SHAPE)) * 4)
+    shm_out = shared_memory.SharedMemory(create=True, size=slots * OUT_WIDTH * 4)
+    requests, replies = queue.Queue(), queue.Queue()
+    try:
+        requests.put(('gone', 'r1', 0, 'psm_missing_in', 'psm_missing_out', slots))
+        requests.put(('live', 'r2', 1, shm_in.name, shm_out.name, slots))
+        requests.put(None)
+        worker_main(f'{__name__}:constant_cascade', requests, replies, 0, 0, 1, 0.0)
+
+        assert replies.get_nowait()[0] == 'ready'
+        gone, live = replies.get_nowait(), replies.get_nowait()
+        assert gone[:3] == ('done', 'gone', 'r1') and gone[-1] is not None
+        assert live == ('done', 'live', 'r2', 3, -1, None, None)
+        out = np.ndarray((slots, OUT_WIDTH), dtype=np.float32, buffer=shm_out.buf)
+        assert np.allclose(out[1, :3], 0.5)
+        del out
+    finally:
+        shm_in.close()
+        shm_in.unlink()
+        shm_out.close()
+        shm_out.unlink()
@@ -0,0 +1,19 @@
+import pytest
+
+from prediction_store import ALL_USERS, PredictionStore
+
+
+def prediction(n, email):
+    return {'prediction_id': f'p{n}', 'user_email': email, 'user_name': email, 'timestamp': f'2026-01-0{n} 10:00:00',
+            'body_part': 'tongue', 'diagnosis': 'Healthy Tongue', 'confidence': 0.9, 'status': 'Healthy'}
+
+
+def test_all_users_totals_are_not_a_user(tmp_path):
+    store = PredictionStore(str(tmp_path / 'predictions.db'))
+    store.add_many([prediction(1, 'a@example.com'), prediction(2, 'b@example.com')])
+    with pytest.raises(ValueError):
+        store.add(prediction(3, ALL_USERS))
+
+    assert store.count() == 2
+    assert store.user_summary('a@example.com')['total'] == 1
+    assert [user['user_email'] for user in store.users_page()] == ['a@example.com', 'b@example.com']
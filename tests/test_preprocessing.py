@@ -0,0 +1,28 @@
+import io
+
+import numpy as np
+from PIL import Image
+
+from preprocessing import open_image, preprocess_image
+
+
+def jpeg_bytes(size=(1600, 1200)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, (200, 120, 40)).save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+def test_fresh_jpeg_is_drafted():
+    image = open_image(io.BytesIO(jpeg_bytes()))
+    assert image.size == (400, 300)
+    assert preprocess_image(image).shape == (1, 224, 224, 3)
+
+
+def test_loaded_jpeg_is_returned_unchanged():
+    image = Image.open(io.BytesIO(jpeg_bytes()))
+    image.load()
+    assert open_image(image) is image
+    assert image.size == (1600, 1200)
+    batch = preprocess_image(image)
+    assert batch.shape == (1, 224, 224, 3)
+    assert np.allclose(batch[0, 0, 0], np.array([200, 120, 40]) / 255.0, atol=0.02)
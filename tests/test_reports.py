@@ -0,0 +1,33 @@
+import os
+import signal
+
+import pytest
+
+from reports import LAYOUT_VERSION, ReportService
+
+PREDICTION = {'body_part': 'tongue', 'predicted_class': 'Healthy Tongue', 'confidence': 0.97, 'status': 'Healthy'}
+
+
+@pytest.fixture
+def service():
+    service = ReportService(workers=1)
+    yield service
+    service.shutdown()
+
+
+def test_render_pool_recovers_after_worker_dies(service):
+    assert service.submit(PREDICTION, 'Vet', 'vet@example.com', 'p1').result(60).startswith(b'%PDF')
+
+    for process in list(service._executor._processes.values()):
+        os.kill(process.pid, signal.SIGKILL)
+
+    # A render caught on the dead pool fails cleanly and is not cached; the next one gets a fresh pool
+    first = service.submit(PREDICTION, 'Vet', 'vet@example.com', 'p2')
+    try:
+        first.result(60)
+    except Exception:
+        assert first.status == 'failed'
+        assert service.cache.get(first.key, LAYOUT_VERSION) is None
+        first = service.submit(PREDICTION, 'Vet', 'vet@example.com', 'p3')
+    assert first.result(60).startswith(b'%PDF')
+    assert service.stats()['pool_restarts'] == 1
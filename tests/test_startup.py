@@ -0,0 +1,24 @@
+from startup import Startup
+
+
+def boom():
+    raise RuntimeError('inference server not up')
+
+
+def test_failed_startup_is_retried_after_retry_seconds():
+    startup = Startup(retry_seconds=0)
+    startup.start([('models', boom)])
+    startup._thread.join(5)
+    assert startup.state == 'failed' and startup.status()['error'] == 'inference server not up'
+
+    startup.start([('models', lambda: None)])
+    assert startup.wait(5)
+    assert startup.state == 'ready'
+
+
+def test_failed_startup_waits_before_retrying():
+    startup = Startup(retry_seconds=60)
+    startup.start([('models', boom)])
+    startup._thread.join(5)
+    startup.start([('models', lambda: None)])
+    assert startup.state == 'failed'
@@ -0,0 +1,36 @@
+import io
+
+import numpy as np
+from PIL import Image
+
+from image_store import ImageStore
+from prediction_cache import content_key
+from preprocessing import preprocess_image
+from uploads import decode_upload, preview_source
+
+
+def photo_jpeg(size=(1600, 1200)):
+    pixels = np.random.default_rng(0).integers(0, 256, (size[1] // 8, size[0] // 8, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).resize(size, Image.BILINEAR).save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+def test_model_input_does_not_depend_on_preview_size(tmp_path):
+    data = photo_jpeg()
+    # What /predict_batch and score_archive.py feed the model
+    expected = preprocess_image(Image.open(io.BytesIO(data)))
+
+    stream = io.BytesIO(data)
+    image = decode_upload(stream)
+    assert np.array_equal(preprocess_image(image), expected)
+    assert preview_source(stream, image, 320) is image
+
+    preview = preview_source(stream, image, 640)
+    assert max(preview.size) >= 640
+    assert np.array_equal(preprocess_image(image), expected)
+
+    store = ImageStore(str(tmp_path), thumbnail_sizes=(96, 640))
+    digest = store.put(content_key(data), stream, image, preview)
+    assert np.array_equal(preprocess_image(store.model_input(digest)), expected)
+    assert max(Image.open(store.path(store.thumbnail_name(digest, 640, 'jpg'))).size) == 640
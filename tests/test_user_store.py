@@ -0,0 +1,45 @@
+import threading
+
+import pytest
+
+import user_store
+from user_store import SQLiteUserBackend, UserStore
+
+
+def test_login_timeout_cancels_the_queued_check(tmp_path, monkeypatch):
+    store = UserStore(SQLiteUserBackend(str(tmp_path / 'users.db')), hash_method='pbkdf2:sha256:1000', hash_workers=1)
+    store.register('vet@example.com', 'secret', 'Vet')
+    assert store.authenticate('vet@example.com', 'secret') is not None
+    checks = []
+    monkeypatch.setattr(user_store, 'check_password_hash', lambda *args: checks.append(args) or True)
+
+    release = threading.Event()
+    busy = store._hasher.submit(release.wait)
+    with pytest.raises(TimeoutError):
+        store.authenticate('vet@example.com', 'secret', timeout=0.05)
+    release.set()
+    busy.result()
+
+    assert store.authenticate('vet@example.com', 'secret', timeout=5) is not None
+    assert len(checks) == 1  # the timed-out check never ran
+    assert store.stats()['timed_out_logins'] == 1
+
+
+def test_only_email_addresses_can_register(tmp_path):
+    store = UserStore(SQLiteUserBackend(str(tmp_path / 'users.db')), hash_method='pbkdf2:sha256:1000')
+    for email in ('*', 'admin', ''):
+        with pytest.raises(ValueError):
+            store.register(email, 'secret', 'Nobody')
+        assert store.user(email) is None
+    assert store.register('vet@example.com', 'secret', 'Vet')
+
+
+def test_set_role_applies_to_cached_users(tmp_path):
+    store = UserStore(SQLiteUserBackend(str(tmp_path / 'users.db')), hash_method='pbkdf2:sha256:1000')
+    store.register('vet@example.com', 'secret', 'Vet')
+    assert store.user('vet@example.com')['role'] == 'user'
+    assert store.set_role('vet@example.com', 'vet')
+    assert store.user('vet@example.com')['role'] == 'vet'
+    assert not store.set_role('nobody@example.com', 'vet')
+    with pytest.raises(ValueError):
+        store.set_role('vet@example.com', 'owner')
@@ -0,0 +1,332 @@
+"""Train a classifier from a folder of images with a tf.data input pipeline instead of ImageDataGenerator.
+
+    python training_data.py data/master_body_part_data --output models/master_cattle_classifier.keras \\
+        --class-indices models/master_class_indices.json --cache /tmp/tfdata_cache
+    python training_data.py footrot_splits/train --validation-dir footrot_splits/val --flat-class-indices \\
+        --output models/footrot_mobilenet_final_model.keras --class-indices models/footrot_class_indices.json \\
+        --brightness-range 0.8 1.2 --channel-shift-range 0.2
+
+Folders are read like ``flow_from_directory``: one subdirectory per class,
+class indices in sorted order, and ``--validation-split`` taking the first
+fraction of each class's files. Images are decoded and resized in parallel
+and cached as uint8 (in memory, or on disk with --cache). Batches are then
+augmented with the notebooks' ImageDataGenerator ranges on the TF graph, and
+prefetched so the next batch is ready when the model asks for it. Training
+runs the notebooks' two phases: a frozen MobileNetV2 backbone, then fine-tuning
+from layer --fine-tune-at at a tenth of the learning rate. The notebooks call
+``train`` (or use ``ImageFolder(...).dataset`` with their own model) with the
+same arguments.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import math
+import os
+
+import numpy as np
+
+from preprocessing import TARGET_SIZE
+
+logger = logging.getLogger(__name__)
+
+# What tf.io.decode_image reads
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif')
+
+# The ImageDataGenerator settings the notebooks share; footrot.ipynb adds brightness and channel shifts
+NOTEBOOK_AUGMENTATION = {'rotation_range': 20, 'width_shift_range': 0.2, 'height_shift_range': 0.2,
+                         'shear_range': 0.2, 'zoom_range': 0.2, 'horizontal_flip': True}
+
+
+def find_images(directory, validation_split=0.0, subset=None):
+    """``(paths, labels, class_indices)`` listed the way ``flow_from_directory`` lists them"""
+    classes = sorted(name for name in os.listdir(directory) if os.path.isdir(os.path.join(directory, name)))
+    if not classes:
+        raise ValueError(f'{directory} has no class subdirectories')
+    class_indices = {name: i for i, name in enumerate(classes)}
+    start, stop = {None: (0.0, 1.0), 'validation': (0.0, validation_split),
+                   'training': (validation_split, 1.0)}[subset]
+    paths, labels = [], []
+    for name in classes:
+        files = []
+        for root, dirs, names in os.walk(os.path.join(directory, name)):
+            dirs.sort()
+            files.extend(os.path.join(root, f) for f in sorted(names) if f.lower().endswith(IMAGE_EXTENSIONS))
+        files = files[int(start * len(files)):int(stop * len(files))]
+        paths.extend(files)
+        labels.extend([class_indices[name]] * len(files))
+    return paths, np.asarray(labels, dtype=np.int32), class_indices
+
+
+def decode(contents, target_size=TARGET_SIZE):
+    """Decode an image on the TF graph; JPEGs at the DCT scale ``open_image``'s draft picks for ``target_size``"""
+    import tensorflow as tf
+
+    def jpeg():
+        shape = tf.image.extract_jpeg_shape(contents)
+        scale = tf.minimum(shape[1] // target_size[0], shape[0] // target_size[1])
+        # Largest of 1/1, 1/2, 1/4, 1/8 that keeps the image at least the target size
+        index = tf.reduce_sum(tf.cast(scale >= tf.constant([2, 4, 8], dtype=scale.dtype), tf.int32))
+        return tf.switch_case(index, [lambda ratio=ratio: tf.io.decode_jpeg(contents, channels=3, ratio=ratio)
+                                      for ratio in (1, 2, 4, 8)])
+
+    return tf.cond(tf.io.is_jpeg(contents), jpeg,
+                   lambda: tf.io.decode_image(contents, channels=3, expand_animations=False))
+
+
+class Augmentation:
+    """ImageDataGenerator's random transforms, applied to a whole uint8 batch at once on the TF graph.
+
+    Ranges mean what they mean for ImageDataGenerator: degrees for rotation
+    and shear, fractions of the image for shifts, ``[1 - z, 1 + z]`` per axis
+    for zoom, brightness factors, and channel shifts in 0-255 pixel units. Rotation,
+    shift, shear, zoom and flip are folded into one projective transform
+    per image, so each batch is resampled once, bilinearly, with ``fill_mode``
+    at the borders. Returns float32 in [0, 1], like ``rescale=1./255``.
+    """
+
+    def __init__(self, rotation_range=0, width_shift_range=0.0, height_shift_range=0.0, shear_range=0,
+                 zoom_range=0.0, horizontal_flip=False, brightness_range=None, channel_shift_range=0.0,
+                 fill_mode='nearest'):
+        self.rotation_range = rotation_range
+        self.width_shift_range = width_shift_range
+        self.height_shift_range = height_shift_range
+        self.shear_range = shear_range
+        self.zoom_range = zoom_range
+        self.horizontal_flip = horizontal_flip
+        self.brightness_range = tuple(brightness_range) if brightness_range else None
+        self.channel_shift_range = channel_shift_range
+        self.fill_mode = fill_mode.upper()
+
+    def __call__(self, images):
+        import tensorflow as tf
+
+        images = tf.cast(images, tf.float32)
+        shape = tf.shape(images)
+        batch, height, width = shape[0], tf.cast(shape[1], tf.float32), tf.cast(shape[2], tf.float32)
+
+        def uniform(low, high):
+            return tf.random.uniform([batch], low, high)
+
+        theta = uniform(-self.rotation_range, self.rotation_range) * (math.pi / 180)
+        shear = uniform(-self.shear_range, self.shear_range) * (math.pi / 180)
+        zoom_x = uniform(1 - self.zoom_range, 1 + self.zoom_range)
+        zoom_y = uniform(1 - self.zoom_range, 1 + self.zoom_range)
+        shift_x = uniform(-self.width_shift_range, self.width_shift_range) * width
+        shift_y = uniform(-self.height_shift_range, self.height_shift_range) * height
+        flip = tf.where(uniform(0, 1) < 0.5, -1.0, 1.0) if self.horizontal_flip else tf.ones([batch])
+
+        # rotation @ shear @ zoom @ flip, mapping output pixels to input pixels about the image centre
+        a00, a01 = tf.cos(theta) * zoom_x * flip, -tf.sin(theta + shear) * zoom_y
+        a10, a11 = tf.sin(theta) * zoom_x * flip, tf.cos(theta + shear) * zoom_y
+        cx, cy = (width - 1) / 2, (height - 1) / 2
+        transforms = tf.stack([a00, a01, cx + shift_x - a00 * cx - a01 * cy,
+                               a10, a11, cy + shift_y - a10 * cx - a11 * cy,
+                               tf.zeros([batch]), tf.zeros([batch])], axis=1)
+        images = tf.raw_ops.ImageProjectiveTransformV3(
+            images=images, transforms=transforms, output_shape=shape[1:3], fill_value=0.0,
+            interpolation='BILINEAR', fill_mode=self.fill_mode)
+
+        if self.brightness_range:
+            factor = uniform(*self.brightness_range)
+            images = tf.clip_by_value(images * factor[:, None, None, None], 0.0, 255.0)
+        if self.channel_shift_range:
+            # Same shift for every channel, clipped to each channel's own range, as ImageDataGenerator does
+            low = tf.reduce_min(images, axis=[1, 2], keepdims=True)
+            high = tf.reduce_max(images, axis=[1, 2], keepdims=True)
+            shift = uniform(-self.channel_shift_range, self.channel_shift_range)[:, None, None, None]
+            images = tf.clip_by_value(images + shift, low, high)
+        return images / 255.0
+
+
+class ImageFolder:
+    """A ``flow_from_directory`` replacement: ``dataset`` yields ``(images, one-hot labels)`` batches.
+
+    ``class_indices``, ``classes``, ``filenames``, ``samples`` and ``len()``
+    (steps per epoch) match the generator's, so notebook code that reads them
+    keeps working. ``cache`` is None (decode every epoch), ``'memory'`` or a
+    directory; on-disk caches are keyed by the file list, sizes, modification
+    times and image size, so a changed folder is decoded again.
+    """
+
+    def __init__(self, directory, image_size=TARGET_SIZE, batch_size=32, augment=None, shuffle=True, seed=None,
+                 cache=None, validation_split=0.0, subset=None, shuffle_buffer=1024):
+        paths, self.classes, self.class_indices = find_images(directory, validation_split, subset)
+        if not paths:
+            raise ValueError(f'No images under {directory}' + (f' for the {subset} subset' if subset else ''))
+        self.directory = directory
+        self.filenames = [os.path.relpath(path, directory) for path in paths]
+        self.samples = len(paths)
+        self.num_classes = len(self.class_indices)
+        self.image_size = tuple(image_size)
+        self.batch_size = batch_size
+        self.dataset = self._build(paths, augment, shuffle, seed, cache, subset, shuffle_buffer)
+
+    def __len__(self):
+        return math.ceil(self.samples / self.batch_size)
+
+    def _cache_file(self, cache, paths, subset):
+        os.makedirs(cache, exist_ok=True)
+        key = hashlib.sha1(json.dumps(self.image_size).encode())
+        for path in paths:
+            stat = os.stat(path)
+            key.update(f'{path}\0{stat.st_size}\0{stat.st_mtime_ns}\n'.encode())
+        name = os.path.basename(os.path.normpath(self.directory))
+        return os.path.join(cache, f"{name}-{subset or 'all'}-{key.hexdigest()[:16]}")
+
+    def _build(self, paths, augment, shuffle, seed, cache, subset, shuffle_buffer):
+        import tensorflow as tf
+
+        width, height = self.image_size
+        num_classes = self.num_classes
+
+        def load(path, label):
+            image = decode(tf.io.read_file(path), self.image_size)
+            # Bicubic with antialiasing is the closest graph op to the PIL BICUBIC resize /predict uses
+            image = tf.image.resize(image, (height, width), method='bicubic', antialias=True)
+            image = tf.cast(tf.clip_by_value(tf.round(image), 0.0, 255.0), tf.uint8)
+            return tf.ensure_shape(image, (height, width, 3)), label
+
+        dataset = tf.data.Dataset.from_tensor_slices((paths, self.classes))
+        if shuffle and not cache:
+            # Nothing is cached, so the whole file list can be reshuffled every epoch before decoding
+            dataset = dataset.shuffle(self.samples, seed=seed, reshuffle_each_iteration=True)
+        dataset = dataset.map(load, num_parallel_calls=tf.data.AUTOTUNE, deterministic=not shuffle)
+        if cache:
+            dataset = dataset.cache('' if cache == 'memory' else self._cache_file(cache, paths, subset))
+            if shuffle:
+                dataset = dataset.shuffle(min(shuffle_buffer, self.samples), seed=seed,
+                                          reshuffle_each_iteration=True)
+        dataset = dataset.batch(self.batch_size)
+        transform = augment or (lambda images: tf.cast(images, tf.float32) / 255.0)
+        dataset = dataset.map(lambda images, labels: (transform(images), tf.one_hot(labels, num_classes)),
+                              num_parallel_calls=tf.data.AUTOTUNE)
+        return dataset.prefetch(tf.data.AUTOTUNE)
+
+
+def class_index_config(class_indices, image_size=TARGET_SIZE, flat=False):
+    """Class-index JSON content in the layout of ``models/master_class_indices.json`` (``flat``: footrot's)"""
+    if flat:
+        return dict(class_indices)
+    names = sorted(class_indices, key=class_indices.get)
+    return {'class_indices': dict(class_indices), 'class_names': names, 'img_size': list(image_size),
+            'num_classes': len(names)}
+
+
+def write_class_indices(path, class_indices, image_size=TARGET_SIZE, flat=False):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(class_index_config(class_indices, image_size, flat), f, indent=2)
+
+
+def build_classifier(num_classes, image_size=TARGET_SIZE, weights='imagenet'):
+    """MobileNetV2 with the notebooks' GAP/Dense(512)/BN/Dense(256) head; the backbone starts frozen"""
+    import tensorflow as tf
+
+    base = tf.keras.applications.MobileNetV2(input_shape=tuple(image_size[::-1]) + (3,), include_top=False,
+                                             weights=weights)
+    base.trainable = False
+    model = tf.keras.Sequential([
+        base,
+        tf.keras.layers.GlobalAveragePooling2D(),
+        tf.keras.layers.Dropout(0.3),
+        tf.keras.layers.Dense(512, activation='relu'),
+        tf.keras.layers.BatchNormalization(),
+        tf.keras.layers.Dropout(0.4),
+        tf.keras.layers.Dense(256, activation='relu'),
+        tf.keras.layers.Dropout(0.3),
+        tf.keras.layers.Dense(num_classes, activation='softmax')
+    ])
+    return model, base
+
+
+def train(train_dir, output, class_indices_path, validation_dir=None, validation_split=0.2, image_size=TARGET_SIZE,
+          batch_size=32, epochs=30, fine_tune_epochs=20, fine_tune_at=100, learning_rate=1e-3, augmentation=None,
+          cache=None, flat_class_indices=False, weights='imagenet', seed=None):
+    """Train and save a classifier for ``train_dir``'s classes; returns ``(model, [history per phase])``"""
+    import tensorflow as tf
+
+    if seed is not None:
+        tf.keras.utils.set_random_seed(seed)
+    augment = Augmentation(**(NOTEBOOK_AUGMENTATION if augmentation is None else augmentation))
+    common = {'image_size': image_size, 'batch_size': batch_size, 'seed': seed, 'cache': cache}
+    if validation_dir:
+        training = ImageFolder(train_dir, augment=augment, **common)
+        validation = ImageFolder(validation_dir, shuffle=False, **common)
+    else:
+        training = ImageFolder(train_dir, augment=augment, validation_split=validation_split, subset='training',
+                               **common)
+        validation = ImageFolder(train_dir, shuffle=False, validation_split=validation_split, subset='validation',
+                                 **common)
+    if validation.class_indices != training.class_indices:
+        raise ValueError(f'Validation classes {sorted(validation.class_indices)} differ from the training classes '
+                         f'{sorted(training.class_indices)}')
+    write_class_indices(class_indices_path, training.class_indices, image_size, flat_class_indices)
+    logger.info(f"📊 {training.samples} training / {validation.samples} validation images, "
+                f"classes: {training.class_indices}")
+
+    model, base = build_classifier(training.num_classes, image_size, weights)
+    directory = os.path.dirname(output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    callbacks = [
+        tf.keras.callbacks.EarlyStopping(monitor='val_accuracy', patience=7, restore_best_weights=True),
+        tf.keras.callbacks.ReduceLROnPlateau(monitor='val_loss', factor=0.2, patience=3, min_lr=1e-7),
+        # Kept across both phases, so ``output`` ends up holding the best epoch of either
+        tf.keras.callbacks.ModelCheckpoint(output, monitor='val_accuracy', save_best_only=True),
+    ]
+    histories = []
+    phases = [(epochs, learning_rate, None), (fine_tune_epochs, learning_rate / 10, fine_tune_at)]
+    for phase_epochs, phase_rate, unfreeze_from in phases:
+        if not phase_epochs:
+            continue
+        if unfreeze_from is not None:
+            base.trainable = True
+            for layer in base.layers[:unfreeze_from]:
+                layer.trainable = False
+        model.compile(optimizer=tf.keras.optimizers.Adam(learning_rate=phase_rate),
+                      loss='categorical_crossentropy', metrics=['accuracy'])
+        histories.append(model.fit(training.dataset, validation_data=validation.dataset, epochs=phase_epochs,
+                                   callbacks=callbacks))
+    logger.info(f"✅ Saved {output} and {class_indices_path}")
+    return model, histories
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('train_dir', help='one subdirectory of images per class')
+    parser.add_argument('--output', required=True, help='.keras model path')
+    parser.add_argument('--class-indices', required=True, help='class-index JSON path')
+    parser.add_argument('--flat-class-indices', action='store_true',
+                        help='write {class: index} like footrot_class_indices.json instead of the master layout')
+    parser.add_argument('--validation-dir', help='default: --validation-split of train_dir')
+    parser.add_argument('--validation-split', type=float, default=0.2)
+    parser.add_argument('--image-size', type=int, nargs=2, default=list(TARGET_SIZE), metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--epochs', type=int, default=30)
+    parser.add_argument('--fine-tune-epochs', type=int, default=20, help='0 skips fine-tuning')
+    parser.add_argument('--fine-tune-at', type=int, default=100, help='first backbone layer unfrozen')
+    parser.add_argument('--learning-rate', type=float, default=1e-3)
+    parser.add_argument('--brightness-range', type=float, nargs=2)
+    parser.add_argument('--channel-shift-range', type=float, default=0.0)
+    parser.add_argument('--no-augment', action='store_true')
+    parser.add_argument('--cache', help="'memory' or a directory for decoded images (default: decode every epoch)")
+    parser.add_argument('--weights', default='imagenet', help="backbone weights ('none' for random)")
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    augmentation = {} if args.no_augment else dict(NOTEBOOK_AUGMENTATION, brightness_range=args.brightness_range,
+                                                     channel_shift_range=args.channel_shift_range)
+    train(args.train_dir, args.output, args.class_indices, validation_dir=args.validation_dir,
+          validation_split=args.validation_split, image_size=tuple(args.image_size), batch_size=args.batch_size,
+          epochs=args.epochs, fine_tune_epochs=args.fine_tune_epochs, fine_tune_at=args.fine_tune_at,
+          learning_rate=args.learning_rate, augmentation=augmentation, cache=args.cache,
+          flat_class_indices=args.flat_class_indices, weights=None if args.weights == 'none' else args.weights,
+          seed=args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""Test-time augmentation: K views of one image through the cascade, one batch per model, probabilities aggregated"""
+import threading
+
+import numpy as np
+from PIL import Image
+
+from batching import Routed
+from preprocessing import TARGET_SIZE, open_image
+
+AGGREGATIONS = ('mean', 'geometric')
+
+# (crop fraction, horizontal anchor, vertical anchor, mirrored) per view, in the order views are added.
+# The first view is the plain resize preprocess_image makes, so K=1 reproduces a normal prediction.
+VIEWS = (
+    (1.0, 0.5, 0.5, False),
+    (1.0, 0.5, 0.5, True),
+    (0.9, 0.5, 0.5, False),
+    (0.9, 0.5, 0.5, True),
+    (0.8, 0.0, 0.0, False),
+    (0.8, 1.0, 1.0, False),
+    (0.8, 1.0, 0.0, True),
+    (0.8, 0.0, 1.0, True),
+)
+
+
+def augment_into(image, out, start=0, target_size=TARGET_SIZE):
+    """Write views ``start`` to ``len(out)`` of ``image``, scaled to [0, 1], into the float32 (K, H, W, 3) ``out``"""
+    image = open_image(image, target_size)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    width, height = image.size
+    for i in range(start, len(out)):
+        fraction, x, y, mirrored = VIEWS[i]
+        crop_width, crop_height = width * fraction, height * fraction
+        left, top = (width - crop_width) * x, (height - crop_height) * y
+        pixels = np.asarray(image.resize(target_size, Image.BICUBIC,
+                                         box=(left, top, left + crop_width, top + crop_height)))
+        if mirrored:
+            pixels = pixels[:, ::-1]
+        np.divide(pixels, np.float32(255.0), out=out[i], dtype=np.float32, casting='unsafe')
+    return out
+
+
+def aggregate(probabilities, method='mean'):
+    """``(row, variance)``: the combined (C,) probabilities and the per-class variance across the (K, C) views"""
+    probabilities = np.asarray(probabilities, dtype=np.float64)
+    if method == 'geometric':
+        row = np.exp(np.log(np.clip(probabilities, 1e-7, 1.0)).mean(axis=0))
+        row /= row.sum()
+    else:
+        row = probabilities.mean(axis=0)
+    return row.astype(np.float32), probabilities.var(axis=0)
+
+
+class TestTimeAugmentation:
+    """Runs ``views`` augmented copies of an image through the master in one batch, then the routed
+    specialist over ``specialist_views.get(key, views)`` copies in one batch, and aggregates each.
+
+    Views are only preprocessed once, into a per-thread buffer; a specialist
+    that needs more views than the master gets the extra ones added in place.
+    The variance across views of the reported class's probability is the
+    uncertainty score. ``below_confidence`` is read by the caller: when set,
+    only results less confident than it are re-run with TTA.
+    """
+
+    def __init__(self, views=4, specialist_views=None, aggregation='mean', below_confidence=None,
+                 target_size=TARGET_SIZE):
+        if aggregation not in AGGREGATIONS:
+            raise ValueError(f"TTA aggregation must be one of {', '.join(AGGREGATIONS)}")
+        self.specialist_views = {key: self._check(k) for key, k in (specialist_views or {}).items()}
+        self.views = self._check(views)
+        self.aggregation = aggregation
+        self.below_confidence = below_confidence
+        self.target_size = tuple(target_size)
+        self._local = threading.local()
+
+    @staticmethod
+    def _check(views):
+        views = int(views)
+        if not 1 <= views <= len(VIEWS):
+            raise ValueError(f'TTA views must be between 1 and {len(VIEWS)}')
+        return views
+
+    def views_for(self, key):
+        return self.specialist_views.get(key, self.views)
+
+    def _buffer(self):
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None:
+            buffer = np.empty((len(VIEWS), self.target_size[1], self.target_size[0], 3), dtype=np.float32)
+            self._local.buffer = buffer
+        return buffer
+
+    def run(self, image, master_predict, specialist_predict, route):
+        """``(master_row, specialist_row, info)`` for one image; ``route`` as in ``run_two_stage``"""
+        buffer = self._buffer()
+        filled = self.views
+        augment_into(image, buffer[:filled], target_size=self.target_size)
+        master_row, master_variance = aggregate(master_predict(buffer[:filled]), self.aggregation)
+        info = {'views': self.views, 'aggregation': self.aggregation,
+                'body_part_uncertainty': float(master_variance[int(np.argmax(master_row))])}
+
+        decision = route(master_row)
+        if decision is None:
+            info['uncertainty'] = info['body_part_uncertainty']
+            return master_row, None, info
+        rows, variances = {}, {}
+        for key in decision if isinstance(decision, tuple) else (decision,):
+            views = self.views_for(key)
+            if views > filled:
+                augment_into(image, buffer[:views], start=filled, target_size=self.target_size)
+                filled = views
+            rows[key], variances[key] = aggregate(specialist_predict(key, buffer[:views]), self.aggregation)
+
+        if isinstance(decision, tuple):
+            specialist_row = route.select(master_row, rows)
+            key = specialist_row.body_part if isinstance(specialist_row, Routed) else decision[0]
+        else:
+            specialist_row = rows[decision]
+            key = decision
+        info['specialist_views'] = self.views_for(key)
+        info['uncertainty'] = float(variances[key][int(np.argmax(rows[key]))])
+        return master_row, specialist_row, info
@@ -0,0 +1,72 @@
+"""/predict upload handling: decode once from the spooled upload, small previews, content-addressed copies"""
+import base64
+import io
+import os
+import shutil
+import tempfile
+
+from PIL import Image
+
+from preprocessing import TARGET_SIZE, open_image
+
+PREVIEW_MODES = ('thumbnail', 'url', 'none')
+EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp', 'GIF': 'gif', 'BMP': 'bmp', 'TIFF': 'tif'}
+
+
+def decode_upload(stream, target_size=TARGET_SIZE):
+    """Decode an upload for the model, at the JPEG draft scale for ``target_size``.
+
+    Werkzeug spools large uploads to a temporary file, so PIL reads the file
+    object directly instead of a full in-memory copy of the bytes. The draft
+    scale depends only on ``target_size``, so /predict, /predict_batch and
+    score_archive.py resize the same pixels into the same model input.
+    """
+    image = open_image(Image.open(stream), target_size)
+    image.load()
+    return image
+
+
+def preview_source(stream, image, preview_size):
+    """Image to cut previews of ``preview_size`` from: the model decode when it is large enough.
+
+    Otherwise the upload is decoded again at a draft scale that is, leaving
+    the model decode (and so the prediction) independent of preview settings.
+    """
+    if max(image.size) >= preview_size or image.format != 'JPEG':
+        return image
+    stream.seek(0)
+    preview = Image.open(stream)
+    if preview.size == image.size:  # the model decode is already full size
+        return image
+    preview = open_image(preview, (preview_size, preview_size))
+    preview.load()
+    return preview
+
+
+def thumbnail_data_url(image, max_size, quality=80):
+    """``data:`` URL of a JPEG thumbnail no larger than ``max_size`` on either side"""
+    thumbnail = image.copy()
+    thumbnail.thumbnail((max_size, max_size), Image.BICUBIC)
+    if thumbnail.mode != 'RGB':
+        thumbnail = thumbnail.convert('RGB')
+    buffer = io.BytesIO()
+    thumbnail.save(buffer, format='JPEG', quality=quality)
+    return 'data:image/jpeg;base64,' + base64.b64encode(buffer.getvalue()).decode()
+
+
+def save_upload(stream, folder, key, image_format):
+    """Stream the original upload to ``folder/<sha256>.<ext>`` (once per content) and return the file name"""
+    name = f"{key.split(':', 1)[-1]}.{EXTENSIONS.get(image_format, 'bin')}"
+    path = os.path.join(folder, name)
+    if not os.path.exists(path):
+        os.makedirs(folder, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=folder, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                stream.seek(0)
+                shutil.copyfileobj(stream, f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    return name
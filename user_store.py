@@ -0,0 +1,287 @@
+"""Users and login sessions in SQLite, shared by every worker, behind a bounded in-process read-through cache"""
+import logging
+import os
+import re
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+logger = logging.getLogger(__name__)
+
+# Roles an account can hold; 'vet' and 'admin' are assigned by an admin (UserStore.set_role)
+ROLES = ('user', 'vet', 'admin')
+EMAIL_PATTERN = re.compile(r'[^@\s]+@[^@\s]+\.[^@\s]+')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    email TEXT PRIMARY KEY,
+    password TEXT NOT NULL,
+    name TEXT,
+    role TEXT NOT NULL DEFAULT 'user',
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    user_email TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires);
+"""
+
+
+class SQLiteUserBackend:
+    """Users and sessions tables in one SQLite file (WAL, one connection per thread).
+
+    Any object with the same methods can replace it, e.g. a Postgres or
+    Redis backend for workers on several hosts.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get_user(self, email):
+        row = self._connection().execute('SELECT email, password, name, role FROM users WHERE email = ?',
+                                         (email,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def add_user(self, email, password_hash, name, role):
+        """False when the email is already registered"""
+        cursor = self._connection().execute(
+            'INSERT OR IGNORE INTO users (email, password, name, role, created) VALUES (?, ?, ?, ?, ?)',
+            (email, password_hash, name, role, time.time()))
+        return cursor.rowcount == 1
+
+    def set_password(self, email, password_hash):
+        self._connection().execute('UPDATE users SET password = ? WHERE email = ?', (password_hash, email))
+
+    def set_role(self, email, role):
+        """False when there is no such user"""
+        return self._connection().execute('UPDATE users SET role = ? WHERE email = ?', (role, email)).rowcount == 1
+
+    def count_users(self):
+        return self._connection().execute('SELECT COUNT(*) FROM users').fetchone()[0]
+
+    def list_users(self, limit=50):
+        rows = self._connection().execute('SELECT email, name, role FROM users ORDER BY created LIMIT ?', (limit,))
+        return [dict(row) for row in rows]
+
+    def add_session(self, session_id, email, expires):
+        self._connection().execute('INSERT INTO sessions (id, user_email, expires) VALUES (?, ?, ?)',
+                                   (session_id, email, expires))
+
+    def get_session(self, session_id):
+        row = self._connection().execute('SELECT user_email, expires FROM sessions WHERE id = ?',
+                                         (session_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def delete_session(self, session_id):
+        self._connection().execute('DELETE FROM sessions WHERE id = ?', (session_id,))
+
+    def purge_sessions(self, now):
+        return self._connection().execute('DELETE FROM sessions WHERE expires < ?', (now,)).rowcount
+
+
+class _LRU:
+    """Thread-safe LRU of dicts bounded by entry count, each entry valid for ``ttl`` seconds"""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (value, stored_at)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self.ttl and time.monotonic() - entry[1] > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def valid_email(email):
+    """Whether ``email`` looks like an address; other keys (e.g. the prediction store's '*' totals) are reserved"""
+    return bool(email) and EMAIL_PATTERN.fullmatch(email) is not None
+
+
+class UserStore:
+    """Read-through cached users and server-side login sessions over a shared backend.
+
+    Misses are never cached, so a user registered by another worker can log
+    in at once; cached users and sessions are trusted for ``cache_ttl``
+    seconds, which bounds how long a logout or role change made by another
+    worker takes to apply here. Password hashing and verification run on a
+    small thread pool (hashlib releases the GIL), so a burst of logins uses
+    at most ``hash_workers`` cores. Stored hashes made with another method
+    or cost are upgraded on the next successful login.
+    """
+
+    def __init__(self, backend, cache_entries=10000, cache_ttl=30, session_lifetime=7 * 24 * 3600,
+                 hash_method=None, hash_workers=2):
+        self.backend = backend
+        self.session_lifetime = session_lifetime
+        self.hash_method = hash_method or None
+        self._users = _LRU(cache_entries, cache_ttl)
+        self._sessions = _LRU(cache_entries, cache_ttl)
+        self._hasher = ThreadPoolExecutor(hash_workers, thread_name_prefix='password-hash')
+        self._dummy_hash = None
+        self._lock = threading.Lock()
+        self._stats = {'user_hits': 0, 'user_misses': 0, 'session_hits': 0, 'session_misses': 0,
+                       'logins': 0, 'failed_logins': 0, 'timed_out_logins': 0, 'rehashed': 0}
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    # Passwords
+
+    def hash_password(self, password):
+        if self.hash_method:
+            return self._hasher.submit(generate_password_hash, password, self.hash_method).result()
+        return self._hasher.submit(generate_password_hash, password).result()
+
+    def _method_prefix(self):
+        # Unknown emails are checked against this hash too, so a miss costs as much as a wrong password
+        if self._dummy_hash is None:
+            self._dummy_hash = self.hash_password(secrets.token_hex(16))
+        return self._dummy_hash.split('$', 1)[0]
+
+    def authenticate(self, email, password, timeout=None):
+        """The user when the password matches, else None; raises TimeoutError when no hashing thread frees up"""
+        prefix = self._method_prefix()
+        user = self.user(email)
+        stored = user['password'] if user is not None else self._dummy_hash
+        check = self._hasher.submit(check_password_hash, stored, password)
+        try:
+            valid = check.result(timeout)
+        except FuturesTimeout:
+            # Nobody is waiting for it any more: keep a queued check from adding to the backlog
+            check.cancel()
+            self._count('timed_out_logins')
+            raise
+        if user is None or not valid:
+            self._count('failed_logins')
+            return None
+        self._count('logins')
+        if stored.split('$', 1)[0] != prefix:
+            self.backend.set_password(email, self.hash_password(password))
+            self._users.pop(email)
+            self._count('rehashed')
+        return user
+
+    # Users
+
+    def user(self, email):
+        if not valid_email(email):
+            return None
+        user = self._users.get(email)
+        if user is not None:
+            self._count('user_hits')
+            return user
+        self._count('user_misses')
+        user = self.backend.get_user(email)
+        if user is not None:
+            self._users.put(email, user)
+        return user
+
+    def register(self, email, password, name, role='user'):
+        """False when the email is already registered; ValueError when it is not an email address"""
+        if not valid_email(email):
+            raise ValueError(f'Not an email address: {email!r}')
+        return self.backend.add_user(email, self.hash_password(password), name, role)
+
+    def ensure_user(self, email, password, name, role='user'):
+        """Create the account unless it exists (seeding); hashes only when it is missing"""
+        if self.backend.get_user(email) is None:
+            self.register(email, password, name, role)
+
+    def set_role(self, email, role):
+        """False when there is no such user; ValueError for a role not in ROLES"""
+        if role not in ROLES:
+            raise ValueError(f'Unknown role: {role!r}')
+        changed = self.backend.set_role(email, role)
+        self._users.pop(email)
+        return changed
+
+    def count(self):
+        return self.backend.count_users()
+
+    def users(self, limit=50):
+        return {user['email']: user for user in self.backend.list_users(limit)}
+
+    # Sessions
+
+    def create_session(self, email):
+        session_id = secrets.token_urlsafe(24)
+        self.backend.add_session(session_id, email, time.time() + self.session_lifetime)
+        return session_id
+
+    def session_user(self, session_id):
+        """The user a live session belongs to, or None when it expired or was ended"""
+        if not session_id:
+            return None
+        record = self._sessions.get(session_id)
+        if record is None:
+            self._count('session_misses')
+            record = self.backend.get_session(session_id)
+            if record is None:
+                return None
+            self._sessions.put(session_id, record)
+        else:
+            self._count('session_hits')
+        if record['expires'] < time.time():
+            self.end_session(session_id)
+            return None
+        return self.user(record['user_email'])
+
+    def end_session(self, session_id):
+        self._sessions.pop(session_id)
+        self.backend.delete_session(session_id)
+
+    def purge_sessions(self):
+        return self.backend.purge_sessions(time.time())
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['cached_users'] = len(self._users)
+        stats['cached_sessions'] = len(self._sessions)
+        stats['hash_method'] = self._dummy_hash.split('$', 1)[0] if self._dummy_hash else self.hash_method
+        return stats